@@ -0,0 +1,241 @@
+"""Daily lab analytics rollups.
+
+completed_reports stores each report's results as a JSON blob, which makes
+dashboard queries over it expensive. This module keeps small per-day rollup
+tables instead, and /api/analytics reads only those:
+
+    analytics_daily           day -> reports, results
+    analytics_test_daily      (day, test) -> results, abnormal
+    analytics_delivery_daily  (day, channel, status) -> reports
+    analytics_doctor_daily    (day, doctor) -> reports
+
+compact() folds every completed_reports row above the watermark into the
+rollups and advances the watermark in the same transaction. The store calls
+it right after inserting reports, so the rollups stay current. Rows written
+by other code (the legacy app.py, imports) are picked up by the next call.
+
+    python analytics.py                  # catch up
+    python analytics.py --rebuild        # recompute everything
+    python analytics.py --from 2025-01-01 --to 2025-12-31
+"""
+import re
+import sys
+import json
+import argparse
+from collections import Counter
+
+import catalog
+
+WATERMARK = "completed_reports"
+
+# Whole words only: "Pale yellow" is not "low"
+_ABNORMAL_RE = re.compile(r"\b(positive|high|low|abnormal|reactive|detected)\b")
+_NEGATED_RE = re.compile(r"\b(non|not|no)[\s-]")
+
+_NUMBER = r"[-+]?\d*\.?\d+"
+
+
+def is_abnormal(value, normal_range=None):
+    """The keywords the report highlights, plus numeric values outside a
+    "lo-hi", "up to x", "< x" or "> x" normal range."""
+    text = str(value or "").strip().lower()
+    if not text:
+        return False
+    if _ABNORMAL_RE.search(text) and not _NEGATED_RE.search(text):
+        return True
+    match = re.fullmatch(rf"\s*({_NUMBER})\s*[^\d]*", text)
+    if not match or not normal_range:
+        return False
+    number = float(match.group(1))
+    bounds = str(normal_range).lower()
+    span = re.search(rf"({_NUMBER})\s*-\s*({_NUMBER})", bounds)
+    if span:
+        return not (float(span.group(1)) <= number <= float(span.group(2)))
+    upper = re.search(rf"(?:up to|upto|<|less than)\s*=?\s*({_NUMBER})", bounds)
+    if upper:
+        return number > float(upper.group(1))
+    lower = re.search(rf"(?:>|more than|above)\s*=?\s*({_NUMBER})", bounds)
+    if lower:
+        return number < float(lower.group(1))
+    return False
+
+
+def _watermark(cur):
+    row = cur.execute("SELECT last_id FROM analytics_watermark WHERE name = ?", (WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+
+def pending(conn):
+    """Number of completed_reports rows not yet in the rollups"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM completed_reports WHERE id > ?", (_watermark(conn),)
+    ).fetchone()[0]
+
+
+def compact(cur, normal_ranges=None, batch_size=1000, ranges=None):
+    """Fold completed_reports rows above the watermark into the rollups.
+
+    ranges (catalog.RangeIndex) gives each patient's age/sex range where the
+    catalog has one. Runs inside the caller's transaction; returns the number
+    of reports folded.
+    """
+    normal_ranges = normal_ranges or {}
+    last_id = _watermark(cur)
+    rows = cur.connection.execute('''
+        SELECT id, COALESCE(date(report_date), date(sample_date)), doctor_name, test_results, whatsapp_status, sms_status,
+               parent_report_id, patient_age, patient_gender
+        FROM completed_reports WHERE id > ? ORDER BY id
+    ''', (last_id,))
+
+    folded = 0
+    while True:
+        batch = rows.fetchmany(batch_size)
+        if not batch:
+            break
+        daily, tests, delivery, doctors = Counter(), Counter(), Counter(), Counter()
+        for report_id, day, doctor, test_results, whatsapp_status, sms_status, parent_report_id, age, gender in batch:
+            last_id = report_id
+            folded += 1
+            # An amendment corrects a report that is already counted
+            if parent_report_id is not None:
+                continue
+            # Rows from before report_date existed fall back to the sample date
+            day = day or "0000-00-00"
+            try:
+                results = json.loads(test_results or "{}")
+            except ValueError:
+                results = {}
+            if not isinstance(results, dict):
+                results = {}
+            daily[(day, 'reports')] += 1
+            daily[(day, 'results')] += len(results)
+            sex, age = catalog.parse_sex(gender), catalog.parse_age(age)
+            for test_name, value in results.items():
+                tests[(day, test_name, 'results')] += 1
+                band = ranges.resolve(test_name, sex, age) if ranges else None
+                if is_abnormal(value, band['text'] if band else normal_ranges.get(test_name)):
+                    tests[(day, test_name, 'abnormal')] += 1
+            delivery[(day, 'whatsapp', whatsapp_status or 'not_attempted')] += 1
+            delivery[(day, 'sms', sms_status or 'not_attempted')] += 1
+            doctors[(day, (doctor or '').strip() or 'Unspecified')] += 1
+
+        days = {day for day, _ in daily}
+        cur.executemany('''
+            INSERT INTO analytics_daily (day, reports, results) VALUES (?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                reports = reports + excluded.reports, results = results + excluded.results
+        ''', [(day, daily[(day, 'reports')], daily[(day, 'results')]) for day in days])
+        test_keys = {(day, test_name) for day, test_name, _ in tests}
+        cur.executemany('''
+            INSERT INTO analytics_test_daily (day, test_name, results, abnormal) VALUES (?, ?, ?, ?)
+            ON CONFLICT(day, test_name) DO UPDATE SET
+                results = results + excluded.results, abnormal = abnormal + excluded.abnormal
+        ''', [(day, name, tests[(day, name, 'results')], tests[(day, name, 'abnormal')]) for day, name in test_keys])
+        cur.executemany('''
+            INSERT INTO analytics_delivery_daily (day, channel, status, reports) VALUES (?, ?, ?, ?)
+            ON CONFLICT(day, channel, status) DO UPDATE SET reports = reports + excluded.reports
+        ''', [(*key, count) for key, count in delivery.items()])
+        cur.executemany('''
+            INSERT INTO analytics_doctor_daily (day, doctor_name, reports) VALUES (?, ?, ?)
+            ON CONFLICT(day, doctor_name) DO UPDATE SET reports = reports + excluded.reports
+        ''', [(*key, count) for key, count in doctors.items()])
+
+    if folded:
+        cur.execute('''
+            INSERT INTO analytics_watermark (name, last_id) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, updated_at = CURRENT_TIMESTAMP
+        ''', (WATERMARK, last_id))
+    return folded
+
+
+def reset(cur):
+    for table in ("analytics_daily", "analytics_test_daily", "analytics_delivery_daily", "analytics_doctor_daily"):
+        cur.execute(f"DELETE FROM {table}")
+    cur.execute("DELETE FROM analytics_watermark WHERE name = ?", (WATERMARK,))
+
+
+def summary(conn, start=None, end=None, categories=None, group="day", top=20):
+    """Dashboard numbers for [start, end] (inclusive ISO dates), from the rollups only"""
+    categories = categories or {}
+    where, params = "day >= ? AND day <= ?", [start or "0000-00-00", end or "9999-99-99"]
+    period = "substr(day, 1, 7)" if group == "month" else "day"
+
+    volume = [
+        {'period': period_key, 'reports': reports, 'results': results}
+        for period_key, reports, results in conn.execute(f'''
+            SELECT {period}, SUM(reports), SUM(results) FROM analytics_daily
+            WHERE {where} GROUP BY 1 ORDER BY 1
+        ''', params)
+    ]
+
+    per_test = conn.execute(f'''
+        SELECT test_name, SUM(results), SUM(abnormal) FROM analytics_test_daily
+        WHERE {where} GROUP BY test_name
+    ''', params).fetchall()
+    by_category = Counter()
+    for test_name, results, _ in per_test:
+        by_category[categories.get(test_name, 'OTHER TESTS')] += results
+    abnormal_rate = sorted((
+        {'test': test_name, 'results': results, 'abnormal': abnormal,
+         'rate': round(abnormal / results, 4) if results else 0.0}
+        for test_name, results, abnormal in per_test
+    ), key=lambda row: (-row['rate'], -row['results']))
+
+    delivery = {}
+    for channel, status, reports in conn.execute(f'''
+        SELECT channel, status, SUM(reports) FROM analytics_delivery_daily
+        WHERE {where} GROUP BY channel, status
+    ''', params):
+        delivery.setdefault(channel, {})[status] = reports
+    for counts in delivery.values():
+        attempted = counts.get('sent', 0) + counts.get('failed', 0)
+        counts['success_rate'] = round(counts.get('sent', 0) / attempted, 4) if attempted else None
+
+    doctors = [
+        {'doctor': doctor, 'reports': reports}
+        for doctor, reports in conn.execute(f'''
+            SELECT doctor_name, SUM(reports) FROM analytics_doctor_daily
+            WHERE {where} GROUP BY doctor_name ORDER BY 2 DESC LIMIT ?
+        ''', params + [int(top)])
+    ]
+
+    return {
+        'from': start,
+        'to': end,
+        'group': 'month' if group == 'month' else 'day',
+        'reports': volume,
+        'tests_by_category': [
+            {'category': category, 'results': results} for category, results in by_category.most_common()
+        ],
+        'abnormal_rate': abnormal_rate[:int(top)],
+        'delivery': delivery,
+        'doctor_referrals': doctors,
+    }
+
+
+def main(argv=None):
+    from datastore import PathologyStore
+
+    parser = argparse.ArgumentParser(description="Maintain and print the lab analytics rollups")
+    parser.add_argument("--db", help="database (default: DATA_DIR/pathology_reports.db)")
+    parser.add_argument("--rebuild", action="store_true", help="drop the rollups and recompute them")
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    parser.add_argument("--group", choices=("day", "month"), default="month")
+    args = parser.parse_args(argv)
+
+    store = PathologyStore(args.db)
+    # Normal ranges and categories come from the test catalog tables
+    catalog.CatalogRegistry(store).snapshot()
+    with store.transaction() as cur:
+        if args.rebuild:
+            reset(cur)
+        folded = compact(cur, store.normal_ranges, ranges=store.range_index)
+    print(f"Folded {folded} report(s) into the rollups")
+    print(json.dumps(store.analytics_summary(args.start, args.end, group=args.group), indent=2))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,653 @@
+"""Analyzer result ingestion (HL7 v2 ORU / ASTM E1394).
+
+Results arrive over a local TCP listener (MLLP-framed HL7 or ASTM
+ENQ/STX/ETX/EOT framing) or as files dropped into a directory. They are
+parsed incrementally, mapped onto the PathologyTestsForm catalog and written
+to completed_reports in batches by a background writer thread, so analyzer
+bursts never block the web app.
+
+Run standalone:
+    python analyzer_ingest.py --tcp 0.0.0.0:5100 --drop-dir ./analyzer_drop
+    python analyzer_ingest.py --replay recorded_run.hl7
+"""
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import argparse
+import threading
+import socketserver
+from datetime import datetime, date
+
+import app_logging
+from metrics import registry as metrics
+
+log = app_logging.get_logger("analyzer")
+
+# Framing / control bytes
+VT = 0x0B   # MLLP start block
+FS = 0x1C   # MLLP end block
+STX = 0x02
+ETX = 0x03
+EOT = 0x04
+ENQ = 0x05
+ACK = b"\x06"
+NAK = b"\x15"
+ETB = 0x17
+CR = 0x0D
+LF = 0x0A
+
+_DELIMITERS = re.compile(rb"[\r\n\x02\x03\x04\x05\x0b\x17\x1c]")
+_FRAME_END = re.compile(rb"[\x03\x17]")
+
+# Common analyzer / LOINC-ish short codes for the built-in catalog.
+DEFAULT_CODE_MAP = {
+    "GLU": "Glucose (F)/RI",
+    "GLUF": "Glucose (F)/RI",
+    "FBS": "Glucose (F)/RI",
+    "PPBS": "Post Prandial / after 2 Hrs",
+    "HBA1C": "HbA1c",
+    "A1C": "HbA1c",
+    "UREA": "Urea",
+    "BUN": "BUN",
+    "CREA": "Creatinine",
+    "CREAT": "Creatinine",
+    "UA": "S. Uric Acid",
+    "URIC": "S. Uric Acid",
+    "CHOL": "Cholesterol",
+    "TC": "Cholesterol",
+    "TG": "Triglyceride",
+    "TRIG": "Triglyceride",
+    "HDL": "HDL",
+    "HDLC": "HDL",
+    "LDL": "LDL",
+    "LDLC": "LDL",
+    "TBIL": "Bilirubin Total",
+    "BILT": "Bilirubin Total",
+    "DBIL": "Bilirubin (Conjugated)",
+    "BILD": "Bilirubin (Conjugated)",
+    "IBIL": "Bilirubin (Unconjugated)",
+    "AST": "SGOT/AST",
+    "GOT": "SGOT/AST",
+    "ALT": "SGPT/ALT",
+    "GPT": "SGPT/ALT",
+    "ALP": "Alk. Phosphatase",
+    "TP": "Total Protein",
+    "ALB": "Albumin",
+    "GLOB": "Globulin",
+    "AGR": "A/G Ratio",
+    "GGT": "GGT",
+    "CA": "S. Calcium",
+    "NA": "S. Sodium",
+    "K": "S. Potassium",
+    "CKMB": "CK-MB",
+    "PHOS": "S. Phosphorous",
+    "P": "S. Phosphorous",
+    "AMY": "S. Amylase",
+    "AMYL": "S. Amylase",
+    "TROPT": "TROP-T",
+    "HGB": "Haemoglobin",
+    "HB": "Haemoglobin",
+    "WBC": "Total leukocyte count",
+    "TLC": "Total leukocyte count",
+    "NEUT%": "Differential WBC count - Polymorphs",
+    "NE%": "Differential WBC count - Polymorphs",
+    "LYMPH%": "Differential WBC count - Lymphocytes",
+    "LY%": "Differential WBC count - Lymphocytes",
+    "EO%": "Differential WBC count - Eosinophils",
+    "MONO%": "Differential WBC count - Monocytes",
+    "MO%": "Differential WBC count - Monocytes",
+    "BASO%": "Differential WBC count - Basophiles",
+    "BA%": "Differential WBC count - Basophiles",
+    "AEC": "AEC",
+    "ESR": "E.S.R. (Westergren)",
+    "PLT": "Platelet Count",
+    "RBC": "RBC Count",
+    "RET": "Reticulocyte count",
+    "HCT": "Haematocrit/PCV",
+    "PCV": "Haematocrit/PCV",
+    "MCV": "MCV",
+    "MCH": "MCH",
+    "MCHC": "MCHC",
+    "PT": "Prothrombin Time",
+    "CRP": "CRP",
+    "ASO": "ASO Titer",
+    "RF": "R.A. factor",
+    "HBSAG": "HbsAg",
+    "HCV": "HCV",
+    "VDRL": "VDRL",
+    "NS1": "Dengue NS1",
+}
+
+GENDER_MAP = {"M": "Male", "F": "Female", "O": "Other", "U": "Other"}
+
+
+def _normalize_key(value):
+    return re.sub(r"[^A-Z0-9%]", "", str(value or "").upper())
+
+
+def _component(value, index, separator):
+    parts = value.split(separator)
+    return parts[index].strip() if index < len(parts) else ""
+
+
+def _field(fields, index):
+    return fields[index] if index < len(fields) else ""
+
+
+def _parse_ts_date(value):
+    """Parse an HL7/ASTM timestamp (YYYYMMDD[HHMM[SS]]) into a date."""
+    digits = re.sub(r"\D", "", value or "")[:8]
+    if len(digits) != 8:
+        return None
+    try:
+        return datetime.strptime(digits, "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _age_from_dob(dob, on_date):
+    if not dob:
+        return ""
+    on_date = on_date or date.today()
+    years = on_date.year - dob.year - ((on_date.month, on_date.day) < (dob.month, dob.day))
+    return str(max(years, 0))
+
+
+class AnalyteMapper:
+    """Map analyzer test codes / names onto the catalog test names."""
+
+    def __init__(self, tests, normal_ranges, code_map=None):
+        self.lookup = {}
+        for category_tests in tests.values():
+            for test_name in category_tests:
+                self.lookup[_normalize_key(test_name)] = test_name
+        for test_name in normal_ranges:
+            self.lookup.setdefault(_normalize_key(test_name), test_name)
+
+        catalog = set(self.lookup.values())
+        for code, test_name in DEFAULT_CODE_MAP.items():
+            if test_name in catalog:
+                self.lookup[_normalize_key(code)] = test_name
+        for code, test_name in (code_map or {}).items():
+            self.lookup[_normalize_key(code)] = test_name
+
+    @classmethod
+    def from_form(cls, form):
+        code_map = {}
+        code_map_path = os.getenv("ANALYZER_CODE_MAP", "").strip()
+        if code_map_path and os.path.exists(code_map_path):
+            with open(code_map_path, encoding="utf-8") as f:
+                code_map = json.load(f)
+        return cls(form.tests, form.normal_ranges, code_map)
+
+    def resolve(self, code, text=""):
+        return self.lookup.get(_normalize_key(code)) or self.lookup.get(_normalize_key(text))
+
+
+class AnalyzerStreamParser:
+    """Incremental parser for HL7 v2 and ASTM E1394 byte streams.
+
+    feed() accepts arbitrary chunks (split anywhere) and returns the bytes that
+    should be written back to the sender (ASTM ACK/NAK per frame, HL7 MLLP
+    ACKs). ASTM frames are checked against their checksum before their text
+    is used; a record split across ETB frames is joined. Completed
+    messages are handed to on_message as
+    {'patient_data': {...}, 'test_results': {...}, 'unmapped': [...], 'protocol': ...}.
+    """
+
+    def __init__(self, mapper, on_message):
+        self.mapper = mapper
+        self.on_message = on_message
+        self.bad_frames = 0
+        self._buffer = bytearray()
+        self._partial = bytearray()
+        # ASTM frame being received (frame number .. ETB/ETX) and its checksum trailer
+        self._frame = None
+        self._trailer = None
+        self._last_frame_number = None
+        self._message = None
+        self._protocol = None
+        self._field_sep = "|"
+        self._component_sep = "^"
+        self._control_id = ""
+        self._sender = ("", "")
+
+    # -- byte level -------------------------------------------------------
+
+    def feed(self, data):
+        replies = []
+        buf = self._buffer
+        buf += data
+        pos = 0
+        while pos < len(buf):
+            if self._frame is not None:
+                pos = self._feed_frame(buf, pos, replies)
+                continue
+            match = _DELIMITERS.search(buf, pos)
+            if not match:
+                break
+            delimiter = buf[match.start()]
+            self._partial += buf[pos:match.start()]
+            pos = match.end()
+
+            if delimiter in (CR, LF, ETB, ETX):
+                self._end_record()
+            elif delimiter == STX:
+                # A record left open by an ETB frame continues in this one
+                self._frame = bytearray()
+            elif delimiter == ENQ:
+                self._last_frame_number = None
+                replies.append(ACK)
+            elif delimiter == EOT:
+                self._end_record()
+                self._flush_message()
+                self._last_frame_number = None
+            elif delimiter == VT:
+                self._partial.clear()
+            elif delimiter == FS:
+                self._end_record()
+                control_id, sender = self._control_id, self._sender
+                if self._flush_message() and self._protocol == "hl7":
+                    replies.append(self.build_hl7_ack(control_id, sender))
+
+        del buf[:pos]
+        return replies
+
+    def _feed_frame(self, buf, pos, replies):
+        """Consume an ASTM frame up to the end of its checksum trailer (C1 C2 CR LF)"""
+        if self._trailer is None:
+            match = _FRAME_END.search(buf, pos)
+            if not match:
+                self._frame += buf[pos:]
+                return len(buf)
+            self._frame += buf[pos:match.end()]
+            self._trailer = bytearray()
+            pos = match.end()
+        while pos < len(buf):
+            byte = buf[pos]
+            if byte in (STX, EOT, ENQ):
+                # Sender left out the LF; the next frame has already started
+                self._end_frame(replies)
+                return pos
+            pos += 1
+            if byte == LF:
+                self._end_frame(replies)
+                return pos
+            self._trailer.append(byte)
+        return pos
+
+    def _end_frame(self, replies):
+        frame, trailer = self._frame, bytes(self._trailer).strip()
+        self._frame = self._trailer = None
+        # Checksum: sum of the frame number through ETB/ETX, modulo 256, as two hex digits
+        expected = f"{sum(frame) % 256:02X}".encode("ascii")
+        if trailer[:2].upper() != expected:
+            self.bad_frames += 1
+            log.warning("ASTM frame checksum mismatch; requesting a resend", extra={
+                'expected': expected.decode(), 'received': trailer[:2].decode("ascii", errors="replace"),
+            })
+            replies.append(NAK)
+            return
+        replies.append(ACK)
+        frame_number, terminator, text = frame[:1], frame[-1], frame[1:-1]
+        if frame_number == self._last_frame_number:
+            # Our ACK was lost and the sender repeated the frame
+            return
+        self._last_frame_number = frame_number
+        # Records end at a CR inside the frame; after ETB the last one continues in the next frame
+        *records, rest = bytes(text).split(b"\r")
+        for record in records:
+            self._partial += record
+            self._end_record()
+        self._partial += rest
+        if terminator == ETX:
+            self._end_record()
+
+    def close(self):
+        """Flush any trailing record/message (end of file or connection)."""
+        self._partial += self._buffer
+        self._buffer.clear()
+        self._end_record()
+        self._flush_message()
+
+    def _end_record(self):
+        if not self._partial:
+            return
+        record = self._partial.decode("utf-8", errors="replace").strip()
+        self._partial.clear()
+        if record:
+            self._handle_record(record)
+
+    # -- record level -----------------------------------------------------
+
+    def _handle_record(self, record):
+        if record.startswith("MSH") and len(record) > 4:
+            self._flush_message()
+            self._protocol = "hl7"
+            self._field_sep = record[3]
+            self._component_sep = record[4]
+            fields = record.split(self._field_sep)
+            self._control_id = _field(fields, 9)
+            self._sender = (_field(fields, 2), _field(fields, 3))
+            self._start_message()
+            return
+
+        if record[0] == "H" and len(record) > 2 and not record[1].isalnum():
+            self._flush_message()
+            self._protocol = "astm"
+            self._field_sep = record[1]
+            self._component_sep = record[3] if len(record) > 3 else "^"
+            self._start_message()
+            return
+
+        if self._message is None:
+            return
+
+        fields = record.split(self._field_sep)
+        handler = (self._handle_hl7 if self._protocol == "hl7" else self._handle_astm)
+        handler(fields[0], fields)
+
+    def _start_message(self):
+        self._message = {
+            "protocol": self._protocol,
+            "patient_data": {
+                "name": "", "age": "", "gender": "", "mobile": "",
+                "doctor": "", "opd_no": "", "sample_date": "",
+            },
+            "test_results": {},
+            "unmapped": [],
+            "_dob": None,
+        }
+
+    def _flush_message(self):
+        message, self._message = self._message, None
+        if not message or not (message["test_results"] or message["unmapped"]):
+            return message is not None
+        patient_data = message["patient_data"]
+        sample_date = _parse_ts_date(patient_data["sample_date"])
+        if sample_date:
+            patient_data["sample_date"] = sample_date.isoformat()
+        if not patient_data["age"]:
+            patient_data["age"] = _age_from_dob(message.pop("_dob"), sample_date)
+        message.pop("_dob", None)
+        self.on_message(message)
+        return True
+
+    def _person_name(self, value, given_first=False):
+        sep = self._component_sep
+        family, given = _component(value, 0, sep), _component(value, 1, sep)
+        if given_first:
+            family, given = given, family
+        return " ".join(part for part in (given, family) if part)
+
+    def _add_result(self, code, text, value, status=""):
+        if status in ("X", "D") or value == "":
+            return
+        test_name = self.mapper.resolve(code, text)
+        if test_name:
+            self._message["test_results"][test_name] = value
+        else:
+            self._message["unmapped"].append(code or text)
+
+    def _handle_hl7(self, segment, fields):
+        patient = self._message["patient_data"]
+        sep = self._component_sep
+        if segment == "PID":
+            patient["opd_no"] = _component(_field(fields, 3), 0, sep)
+            patient["name"] = self._person_name(_field(fields, 5))
+            self._message["_dob"] = _parse_ts_date(_field(fields, 7))
+            patient["gender"] = GENDER_MAP.get(_field(fields, 8)[:1].upper(), "")
+            patient["mobile"] = re.sub(r"\D", "", _component(_field(fields, 13), 0, sep))
+        elif segment == "PV1" and not patient["doctor"]:
+            patient["doctor"] = self._doctor_name(_field(fields, 8))
+        elif segment == "OBR":
+            patient["sample_date"] = patient["sample_date"] or _field(fields, 7)
+            patient["doctor"] = self._doctor_name(_field(fields, 16)) or patient["doctor"]
+        elif segment == "OBX":
+            identifier = _field(fields, 3)
+            self._add_result(
+                _component(identifier, 0, sep),
+                _component(identifier, 1, sep),
+                _field(fields, 5).strip(),
+                _field(fields, 11).strip(),
+            )
+
+    def _doctor_name(self, value):
+        sep = self._component_sep
+        name = " ".join(
+            part for part in (_component(value, 2, sep), _component(value, 1, sep)) if part
+        )
+        return name or _component(value, 0, sep)
+
+    def _handle_astm(self, record_type, fields):
+        patient = self._message["patient_data"]
+        sep = self._component_sep
+        if record_type == "P":
+            patient["opd_no"] = _field(fields, 2) or _field(fields, 3)
+            patient["name"] = self._person_name(_field(fields, 5))
+            self._message["_dob"] = _parse_ts_date(_field(fields, 7))
+            patient["gender"] = GENDER_MAP.get(_field(fields, 8)[:1].upper(), "")
+            patient["mobile"] = re.sub(r"\D", "", _field(fields, 12))
+            patient["doctor"] = self._doctor_name(_field(fields, 13))
+        elif record_type == "O":
+            patient["sample_date"] = _field(fields, 7) or _field(fields, 6) or patient["sample_date"]
+        elif record_type == "R":
+            identifier = _field(fields, 2)
+            code = _component(identifier, 3, sep) or identifier.strip(sep)
+            self._add_result(code, _component(identifier, 4, sep), _field(fields, 3).strip())
+        elif record_type == "L":
+            self._flush_message()
+
+    @staticmethod
+    def build_hl7_ack(control_id, sender=("", "")):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        ack = (
+            f"MSH|^~\\&|UJJIVAN-LIS|UJJIVAN|{sender[0]}|{sender[1]}|{timestamp}||ACK^R01|"
+            f"ACK{control_id}|P|2.5\rMSA|AA|{control_id}\r"
+        )
+        return bytes([VT]) + ack.encode("utf-8") + bytes([FS, CR])
+
+
+class ResultBatchWriter:
+    """Background writer that drains parsed messages into completed_reports in batches."""
+
+    def __init__(self, form, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.form = form
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stored = 0
+        self.skipped = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="analyzer-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, message):
+        patient_data = message["patient_data"]
+        if not message["test_results"] or not patient_data.get("name"):
+            self.skipped += 1
+            log.warning("Analyzer message skipped (no patient name or mapped results)", extra={
+                'protocol': message['protocol'], 'unmapped': message['unmapped'],
+            })
+            return
+        # Blocks the analyzer connection (not the web app) if the writer falls behind.
+        self.queue.put(message)
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        # Same QC hold as the web endpoints: results on a rejected analyte are not stored
+        qc_blocked = set(self.form.qc_held_tests())
+        rows = []
+        stored = []
+        for message in batch:
+            held = sorted(qc_blocked.intersection(name for name, value in message["test_results"].items() if value))
+            if held:
+                self.skipped += 1
+                metrics.inc("reports_held_total", endpoint="analyzer")
+                log.warning("Analyzer message held: QC failed", extra={
+                    'protocol': message['protocol'], 'qc_blocked': held,
+                })
+                continue
+            rows.append(self.form.build_completed_report_row(
+                message["patient_data"],
+                message["test_results"],
+                None,
+                None,
+                f"Imported from analyzer ({message['protocol']}); notification not sent.",
+                None,
+                "SMS not attempted.",
+            ))
+            stored.append(message)
+        success, error = self.form.store_completed_reports_batch(rows)
+        if success:
+            self.stored += len(rows)
+            base_url = self.form.get_public_base_url() if stored else None
+            for message in stored:
+                self.form.raise_critical_alerts(message["patient_data"], message["test_results"], base_url)
+        else:
+            log.error("Analyzer batch failed", extra={'reports': len(rows), 'error': error})
+        for _ in batch:
+            self.queue.task_done()
+        metrics.set_gauge("analyzer_queue_depth", self.queue.qsize())
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+class AnalyzerTCPHandler(socketserver.BaseRequestHandler):
+    """One analyzer connection: stream bytes through a parser and write back ACKs."""
+
+    def handle(self):
+        parser = AnalyzerStreamParser(self.server.mapper, self.server.writer.submit)
+        self.request.settimeout(self.server.idle_timeout)
+        try:
+            while True:
+                chunk = self.request.recv(65536)
+                if not chunk:
+                    break
+                for reply in parser.feed(chunk):
+                    self.request.sendall(reply)
+        except OSError as e:
+            log.warning("Analyzer connection closed: %s", e, extra={'client': self.client_address[0]})
+        finally:
+            parser.close()
+
+
+class AnalyzerTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, mapper, writer, idle_timeout=300):
+        self.mapper = mapper
+        self.writer = writer
+        self.idle_timeout = idle_timeout
+        super().__init__(address, AnalyzerTCPHandler)
+
+
+def ingest_file(path, mapper, writer, chunk_size=65536):
+    """Stream a recorded HL7/ASTM file through the parser."""
+    parser = AnalyzerStreamParser(mapper, writer.submit)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+
+
+def watch_drop_directory(drop_dir, mapper, writer, interval=2.0, stop_event=None):
+    """Poll a directory for dropped result files; move them to processed/ or failed/."""
+    processed_dir = os.path.join(drop_dir, "processed")
+    failed_dir = os.path.join(drop_dir, "failed")
+    os.makedirs(processed_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        for entry in sorted(os.scandir(drop_dir), key=lambda e: e.name):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            try:
+                ingest_file(entry.path, mapper, writer)
+                shutil.move(entry.path, os.path.join(processed_dir, entry.name))
+            except Exception:
+                log.exception("Analyzer file failed", extra={'file': entry.name})
+                shutil.move(entry.path, os.path.join(failed_dir, entry.name))
+        stop_event.wait(interval)
+
+
+def main(argv=None, form=None):
+    """CLI entry point. form defaults to the app's module-level PathologyTestsForm."""
+    parser = argparse.ArgumentParser(description="Ingest HL7 v2 / ASTM E1394 analyzer results")
+    parser.add_argument("--tcp", default=os.getenv("ANALYZER_TCP_ADDRESS", ""),
+                        help="host:port to listen on, e.g. 0.0.0.0:5100")
+    parser.add_argument("--drop-dir", default=os.getenv("ANALYZER_DROP_DIR", ""),
+                        help="directory polled for result files")
+    parser.add_argument("--replay", nargs="*", default=[], help="recorded message files to ingest once")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("ANALYZER_BATCH_SIZE", "200")))
+    args = parser.parse_args(argv)
+
+    app_logging.configure_logging()
+    if form is None:
+        # Importing the app builds its form; reuse it rather than building a second one
+        from hospital_system_final import pathology_form as form
+    mapper = AnalyteMapper.from_form(form)
+    writer = ResultBatchWriter(form, batch_size=args.batch_size).start()
+
+    for path in args.replay:
+        ingest_file(path, mapper, writer)
+
+    if not args.tcp and not args.drop_dir:
+        writer.stop()
+        log.info("Replay complete", extra={'stored': writer.stored, 'skipped': writer.skipped})
+        return
+
+    if args.drop_dir:
+        os.makedirs(args.drop_dir, exist_ok=True)
+        threading.Thread(
+            target=watch_drop_directory,
+            args=(args.drop_dir, mapper, writer),
+            name="analyzer-drop-dir",
+            daemon=True,
+        ).start()
+        log.info("Watching for analyzer files", extra={'drop_dir': os.path.abspath(args.drop_dir)})
+
+    try:
+        if args.tcp:
+            host, _, port = args.tcp.rpartition(":")
+            server = AnalyzerTCPServer((host or "0.0.0.0", int(port)), mapper, writer)
+            log.info("Analyzer listener started", extra={'host': host or '0.0.0.0', 'port': int(port)})
+            server.serve_forever()
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from tkinter import ttk, messagebox
 import webbrowser
 import os
 from datetime import datetime
-import sqlite3
+from datastore import PathologyStore
 import json
 import threading
 import time
@@ -14,6 +14,7 @@ from flask import render_template_string
 import base64
 import tempfile
 import urllib.parse
+import catalog
 import subprocess
 import sys
 import platform
@@ -57,120 +58,10 @@ class PathologyTestsForm(tk.Tk):
         self.whatsapp_access_token = os.getenv("WHATSAPP_ACCESS_TOKEN", "").strip()
         
         # Test normal ranges dictionary
-        self.normal_ranges = {
-            "Glucose (F)/RI": "70-110 mg/dl",
-            "Post Prandial / after 2 Hrs": "Up to 140 mg/dl",
-            "HbA1c": "4.5-6.5 %",
-            "Urea": "10-40 mg/dl",
-            "Creatinine": "0.6-1.4 mg/dl",
-            "S. Uric Acid": "2.8-7.0 mg/dl",
-            "BUN": "5-20 mg/dl",
-            "Cholesterol": "150-200 mg/dl",
-            "Triglyceride": "0-170 mg/dl",
-            "HDL": "30-96 (F)/30-70 (M) mg/dl",
-            "LDL": "<100 mg/dl",
-            "Bilirubin Total": "0.1-1.2 mg/dl",
-            "Bilirubin (Conjugated)": "0.0-0.3 mg/dl",
-            "Bilirubin (Unconjugated)": "0.1-1.0 mg/dl",
-            "SGOT/AST": "0-35 U/L",
-            "SGPT/ALT": "0-40 U/L",
-            "Alk. Phosphatase": "175-575 U/L",
-            "Total Protein": "6.5-8.0 gm/dl",
-            "Albumin": "3.5-5.0 gm/dl",
-            "Globulin": "2.3-3.5 gm/dl",
-            "A/G Ratio": "1.0-2.5",
-            "GGT": "8-60 U/L",
-            "S. Calcium": "8.8-11.0 mg/dl",
-            "S. Sodium": "138-148 meq/l",
-            "S. Potassium": "3.8-4.8 meq/l",
-            "Urine Protein (24 Hrs)": "24-120 mg/24 Hrs",
-            "Urine micro protein (albumin)": "28-150 mg/24 Hrs",
-            "CK-MB": "0-24 U/L",
-            "S. Phosphorous": "2.7-4.5 mg/dl",
-            "S. Amylase": "0-110 U/L",
-            "TROP-T": "Negative",
-            "Haemoglobin": "14-18 gm% (M)/12-15 gm% (F)",
-            "Total leukocyte count": "4000-10,000/cu mm",
-            "Differential WBC count - Polymorphs": "40-75%",
-            "Differential WBC count - Lymphocytes": "20-45%",
-            "Differential WBC count - Eosinophils": "1-6%",
-            "Differential WBC count - Monocytes": "0-10%",
-            "Differential WBC count - Basophiles": "0-1%",
-            "AEC": "40-500 No/cu mm",
-            "E.S.R. (Westergren)": "0-12 mm (F), 0-10 mm (M)",
-            "Platelet Count": "1.5-4.5 lac/cu mm",
-            "RBC Count": "F=3.5-5.0, M=4.2-5.5 million/cu mm",
-            "Reticulocyte count": "2-5% of RBC",
-            "Haematocrit/PCV": "M=39-49%, F=33-43%",
-            "MCV": "76-100 fl",
-            "MCH": "29.5 ± 2.5 pg",
-            "MCHC": "32.5 ± 2.5 gm/dl",
-            "Malaria Parasite": "Negative",
-            "BLOOD GROUP": "Rh = Positive/Negative",
-            "Bleeding Time": "2-7 Min.",
-            "Clotting Time": "6 Min.",
-            "Prothrombin Time": "10-14 Sec.",
-            "PERIPHERAL BLOOD SMEAR - RBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - WBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - PLATELET": "Adequate",
-            "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE": "Negative",
-            "HbsAg": "Negative",
-            "HIV (1+2)": "Negative",
-            "HCV": "Negative",
-            "VDRL": "Non-reactive",
-            "ASO Titer": "<200 IU/ml",
-            "R.A. factor": "<20 IU/ml",
-            "CRP": "<6 mg/L",
-            "Gravindex (PREGNANCY)": "Negative",
-            "WIDAL TEST - S. Typhi, 'O'": "Negative (<1:80)",
-            "WIDAL TEST - S. Typhi, 'H'": "Negative (<1:160)",
-            "WIDAL TEST - S. Paratyphi, 'AH'": "Negative (<1:80)",
-            "WIDAL TEST - S. Paratyphi, 'BH'": "Negative (<1:80)",
-            "Dengue NS1": "Negative",
-            "Typhi Dot": "Negative"
-        }
+        self.normal_ranges = catalog.default_normal_ranges()
         
         # Pathology tests data
-        self.tests = {
-            "BIOCHEMISTRY": [
-                "Glucose (F)/RI", "Post Prandial / after 2 Hrs", "HbA1c"
-            ],
-            "RENAL FUNCTION": [
-                "Urea", "Creatinine", "S. Uric Acid", "BUN"
-            ],
-            "LIPID PROFILE": [
-                "Cholesterol", "Triglyceride", "HDL", "LDL"
-            ],
-            "LIVER FUNCTION": [
-                "Bilirubin Total", "Bilirubin (Conjugated)", "Bilirubin (Unconjugated)", 
-                "SGOT/AST", "SGPT/ALT", "Alk. Phosphatase", "Total Protein", 
-                "Albumin", "Globulin", "A/G Ratio", "GGT"
-            ],
-            "ELECTROLYTES": [
-                "S. Calcium", "S. Sodium", "S. Potassium"
-            ],
-            "OTHER TESTS": [
-                "Urine Protein (24 Hrs)", "Urine micro protein (albumin)", 
-                "CK-MB", "S. Phosphorous", "S. Amylase", "TROP-T"
-            ],
-            "HAEMATOLOGY": [
-                "Haemoglobin", "Total leukocyte count", "Differential WBC count - Polymorphs",
-                "Differential WBC count - Lymphocytes", "Differential WBC count - Eosinophils",
-                "Differential WBC count - Monocytes", "Differential WBC count - Basophiles",
-                "AEC", "E.S.R. (Westergren)", "Platelet Count", "RBC Count", 
-                "Reticulocyte count", "Haematocrit/PCV", "MCV", "MCH", "MCHC",
-                "Malaria Parasite", "BLOOD GROUP", "Bleeding Time", "Clotting Time",
-                "Prothrombin Time", "PERIPHERAL BLOOD SMEAR - RBC", 
-                "PERIPHERAL BLOOD SMEAR - WBC", "PERIPHERAL BLOOD SMEAR - PLATELET",
-                "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE"
-            ],
-            "SEROLOGY": [
-                "HbsAg", "HIV (1+2)", "HCV", "VDRL", "ASO Titer", "R.A. factor", 
-                "CRP", "Gravindex (PREGNANCY)", "WIDAL TEST - S. Typhi, 'O'",
-                "WIDAL TEST - S. Typhi, 'H'", "WIDAL TEST - S. Paratyphi, 'AH'",
-                "WIDAL TEST - S. Paratyphi, 'BH'", "Dengue NS1", "Typhi Dot"
-            ]
-        }
+        self.tests = catalog.default_tests()
         
         # GUI Setup
         self.setup_gui()
@@ -252,48 +143,10 @@ class PathologyTestsForm(tk.Tk):
             messagebox.showerror("Error", "Reports folder not found!")
 
     def init_database(self):
-        """Initialize SQLite database for storing reports"""
+        """Open the unified database through datastore.PathologyStore (migrated on open)"""
         try:
-            self.conn = sqlite3.connect('pathology_reports.db', check_same_thread=False)
-            self.cursor = self.conn.cursor()
-            
-            # Create table for form submissions
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS form_submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    selected_tests TEXT,
-                    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create table for completed reports
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS completed_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    test_results TEXT,
-                    pdf_path TEXT,
-                    whatsapp_status TEXT,
-                    whatsapp_error TEXT,
-                    report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            self.conn.commit()
-            print("Database initialized successfully")
+            self.store = PathologyStore()
+            print(f"Database initialized successfully ({self.store.db_path})")
             
         except Exception as e:
             print(f"Error initializing database: {e}")
@@ -1393,14 +1246,8 @@ class PathologyTestsForm(tk.Tk):
     def store_completed_report(self, patient_data, test_results, report_path, whatsapp_success, whatsapp_message):
         """Store completed report in database"""
         try:
-            test_results_json = json.dumps(test_results)
             whatsapp_status = "sent" if whatsapp_success else "failed"
-            
-            self.cursor.execute('''
-                INSERT INTO completed_reports 
-                (patient_name, patient_age, patient_gender, patient_mobile, doctor_name, opd_no, sample_date, test_results, pdf_path, whatsapp_status, whatsapp_error)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            row = (
                 patient_data.get('name', ''),
                 patient_data.get('age', ''),
                 patient_data.get('gender', ''),
@@ -1408,13 +1255,19 @@ class PathologyTestsForm(tk.Tk):
                 patient_data.get('doctor', ''),
                 patient_data.get('opd_no', ''),
                 patient_data.get('sample_date', ''),
-                test_results_json,
+                json.dumps(test_results),
                 report_path,
                 whatsapp_status,
-                whatsapp_message
-            ))
-            
-            self.conn.commit()
+                whatsapp_message,
+                "not_attempted",
+                None,
+            )
+            # Registers the patient and results like every other entry point
+            self.store.insert_completed_reports(
+                [row],
+                self.normal_ranges,
+                {test: category for category, tests in self.tests.items() for test in tests},
+            )
             print(f"✅ Report stored in database. WhatsApp: {whatsapp_status}")
             return True
             
@@ -1679,7 +1532,7 @@ if __name__ == "__main__":
     # Handle window close
     def on_closing():
         try:
-            app.conn.close()
+            app.store.close()
         except:
             pass
         app.destroy()
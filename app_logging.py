@@ -0,0 +1,259 @@
+"""Structured JSON logging with request ids, spans, sampling and PII redaction.
+
+Log records are handed to a QueueHandler, so request threads never block on
+stdout. A QueueListener thread formats them as one JSON object per line.
+
+    configure_logging()                 # once per process
+    log = get_logger("submit")
+    with request_scope(request_id):     # or start_request()/end_request()
+        with span("generate_pdf", engine="weasyprint"):
+            ...
+
+Environment:
+    LOG_LEVEL            INFO by default
+    LOG_FORMAT           json (default) or text
+    LOG_SAMPLE_RATE      fraction of requests whose INFO/DEBUG logs are kept (1.0)
+    LOG_SLOW_SPAN_MS     spans slower than this are always logged as WARNING (1000)
+    LOG_PII              set to true to disable redaction (local debugging only)
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import zlib
+import queue
+import atexit
+import logging
+import functools
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+ROOT_LOGGER = "pathology"
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_span_stack = contextvars.ContextVar("span_stack", default=())
+_sampled = contextvars.ContextVar("sampled", default=True)
+# Further per-request context vars registered through carry_context_var()
+_carried_vars = []
+
+_listener = None
+
+# Fields whose values are never written to logs unless LOG_PII is enabled.
+PII_KEYS = {
+    "patient_name", "patient", "mobile", "patient_mobile", "phone",
+    "email", "patient_email", "to", "numbers",
+}
+_PHONE_RE = re.compile(r"(?<![\d-])\+?(\d{10,13})(?![\d-])")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def redact_value(value):
+    """Mask a PII value, keeping just enough to correlate (last 2 digits)."""
+    text = str(value or "")
+    digits = re.sub(r"\D", "", text)
+    if len(digits) >= 6 and len(digits) >= len(text.replace(" ", "")) - 2:
+        return f"***{digits[-2:]}"
+    return "[redacted]" if text else text
+
+
+def redact_text(text):
+    text = _EMAIL_RE.sub("[email]", text)
+    return _PHONE_RE.sub(lambda m: f"***{m.group(1)[-2:]}", text)
+
+
+class RedactionFilter(logging.Filter):
+    def __init__(self, enabled=True):
+        super().__init__()
+        self.enabled = enabled
+
+    def filter(self, record):
+        if not self.enabled:
+            return True
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        record.msg = redact_text(str(record.msg))
+        for key in (PII_KEYS & set(vars(record))) - _STANDARD_ATTRS:
+            setattr(record, key, redact_value(getattr(record, key)))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drop INFO/DEBUG records of unsampled requests; warnings always pass."""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        stack = _span_stack.get()
+        if stack and not hasattr(record, "span"):
+            record.span = stack[-1]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def configure_logging():
+    """Install the queue handler/listener once per process (idempotent)."""
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:
+        return logger
+
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").strip().lower() == "text":
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(RedactionFilter(
+        enabled=os.getenv("LOG_PII", "false").strip().lower() not in ("1", "true", "yes", "on")))
+    logger.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+    return logger
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def restart_after_fork():
+    """The listener thread does not survive fork(); start a fresh one."""
+    global _listener
+    _listener = None
+    logging.getLogger(ROOT_LOGGER).handlers = []
+    configure_logging()
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def start_request(request_id=None):
+    """Bind a request id (and the sampling decision) to the current context."""
+    request_id = (request_id or "").strip()[:64] or uuid.uuid4().hex
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    # Hash the id so every log line of one request is either kept or dropped.
+    sampled = sample_rate >= 1.0 or (zlib.crc32(request_id.encode()) % 10000) / 10000 < sample_rate
+    return (
+        _request_id.set(request_id),
+        _sampled.set(sampled),
+        _span_stack.set(()),
+    )
+
+
+def end_request(tokens):
+    request_token, sampled_token, span_token = tokens
+    _span_stack.reset(span_token)
+    _sampled.reset(sampled_token)
+    _request_id.reset(request_token)
+
+
+@contextmanager
+def request_scope(request_id=None):
+    tokens = start_request(request_id)
+    try:
+        yield _request_id.get()
+    finally:
+        end_request(tokens)
+
+
+_span_logger = logging.getLogger(f"{ROOT_LOGGER}.span")
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a stage and log it with its parent span and request id."""
+    parent = _span_stack.get()
+    token = _span_stack.set(parent + (name,))
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        _span_stack.reset(token)
+        slow = duration_ms >= float(os.getenv("LOG_SLOW_SPAN_MS", "1000"))
+        _span_logger.log(
+            logging.WARNING if slow or status == "error" else logging.INFO,
+            "span %s finished in %.2f ms", name, duration_ms,
+            extra=dict(fields, span=name, parent_span=parent[-1] if parent else None,
+                       duration_ms=duration_ms, status=status, slow=slow),
+        )
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def carry_context_var(var):
+    """Have bind_context also carry var (e.g. the request's branch) into other threads."""
+    _carried_vars.append(var)
+
+
+def bind_context(func):
+    """Carry the caller's request id and span into another thread (thread pools)."""
+    request_id, spans, sampled = _request_id.get(), _span_stack.get(), _sampled.get()
+    carried = [(var, var.get()) for var in _carried_vars]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tokens = (_request_id.set(request_id), _sampled.set(sampled), _span_stack.set(spans))
+        carried_tokens = [(var, var.set(value)) for var, value in carried]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            for var, token in reversed(carried_tokens):
+                var.reset(token)
+            end_request(tokens)
+    return wrapper
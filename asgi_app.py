@@ -0,0 +1,444 @@
+"""ASGI entry point with async WhatsApp/SMS delivery.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+
+POST /submit-report is served natively on the event loop. The report is
+rendered in a small thread pool, because PDF rendering is CPU bound. Then
+WhatsApp (text, with the template fallback) and Fast2SMS are called
+concurrently through one pooled aiohttp.ClientSession. A slow provider only
+holds a socket, not a thread, so one worker can keep hundreds of
+notification calls in flight. Every other route is the regular Flask app,
+served through asgiref's WsgiToAsgi on a thread pool.
+
+Environment:
+    ASYNC_HTTP_MAX_CONNECTIONS   connection pool size of the shared session (500)
+    ASYNC_RENDER_WORKERS         threads for rendering/DB work (BATCH_RENDER_WORKERS)
+"""
+import os
+import json
+import time
+import asyncio
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+    print("aiohttp not available. Install aiohttp to use the async server.")
+
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+    ASGIREF_AVAILABLE = True
+except ImportError:
+    WsgiToAsgi = WsgiToAsgiInstance = None
+    ASGIREF_AVAILABLE = False
+    print("asgiref not available. Install asgiref to use the async server.")
+
+import app_logging
+import branches
+from app_logging import span
+from metrics import registry as metrics
+
+log = app_logging.get_logger("asgi")
+
+WHATSAPP_TIMEOUT = 20
+FAST2SMS_TIMEOUT = 12
+
+
+class ProviderResponse:
+    """Fully read aiohttp response with the requests-style attributes the
+    form's response parsers use (status_code, text, json())."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncNotifier:
+    """Async counterpart of the form's WhatsApp/Fast2SMS senders.
+
+    Request building and response interpretation are shared with the sync
+    code in hospital_system_final.py; only the transport differs.
+    """
+
+    def __init__(self, form, max_connections=500):
+        self.form = form
+        self.max_connections = max_connections
+        self._session = None
+
+    @property
+    def session(self):
+        # Created lazily: a ClientSession must belong to the running loop
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+            )
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method, url, timeout, **kwargs):
+        async with self.session.request(
+            method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+        ) as response:
+            return ProviderResponse(response.status, await response.text())
+
+    async def deliver(self, patient_data, pdf_url):
+        """Async version of PathologyTestsForm.deliver_report_notifications"""
+        form = self.form
+        mobile = patient_data.get('mobile', '')
+        sms_message_text = form.create_sms_message(patient_data, pdf_url)
+        started = time.perf_counter()
+        timings = {}
+
+        sms_success = None
+        sms_message = "SMS not attempted."
+        if form.fast2sms_enabled and form.fast2sms_send_always:
+            # Both channels are independent: run them side by side
+            (whatsapp_success, whatsapp_message), (sms_success, sms_message) = await self.dispatch([
+                ('whatsapp', self.send_whatsapp(mobile, patient_data, pdf_url)),
+                ('sms', self.send_sms(mobile, sms_message_text)),
+            ], timings)
+        else:
+            # SMS is only a fallback here, so it has to wait for WhatsApp
+            whatsapp_success, whatsapp_message = await self._timed(
+                'whatsapp', self.send_whatsapp(mobile, patient_data, pdf_url), timings
+            )
+            if form.fast2sms_enabled and not whatsapp_success:
+                sms_success, sms_message = await self._timed(
+                    'sms', self.send_sms(mobile, sms_message_text), timings
+                )
+        timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+
+        return {
+            'whatsapp_success': whatsapp_success,
+            'whatsapp_message': whatsapp_message,
+            'whatsapp_manual_url': form.build_manual_whatsapp_url(patient_data, pdf_url),
+            'sms_success': sms_success,
+            'sms_message': sms_message,
+            'timings_ms': dict(timings),
+        }
+
+    async def dispatch(self, channels, timings):
+        """Await [(name, coroutine)] under the form's NOTIFY_DEADLINE_SECONDS"""
+        deadline = self.form.notify_deadline
+        tasks = [asyncio.ensure_future(self._timed(name, coro, timings)) for name, coro in channels]
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        results = []
+        for (name, _), task in zip(channels, tasks):
+            if task in pending:
+                # Unlike the thread pool, a task can be stopped: cancel it
+                task.cancel()
+                timings.setdefault(name, round(deadline * 1000, 2))
+                log.warning("Notification channel missed the deadline", extra={
+                    'channel': name,
+                    'deadline_s': deadline,
+                })
+                results.append((False, f"{name} delivery timed out after {deadline:g}s"))
+            elif task.exception() is not None:
+                results.append((False, f"{name} delivery failed: {task.exception()}"))
+            else:
+                results.append(task.result())
+        return results
+
+    async def _timed(self, name, coro, timings):
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    async def send_whatsapp(self, mobile_number, patient_data, report_url):
+        form = self.form
+        with span("send_whatsapp_message"):
+            try:
+                formatted_mobile, mobile_error = form.validate_mobile_number(mobile_number)
+                if mobile_error:
+                    return False, mobile_error
+
+                message = form.create_whatsapp_message(patient_data, report_url)
+                api_success, api_message = await self._send_whatsapp_text(
+                    formatted_mobile, message, report_url, patient_data
+                )
+                if api_success:
+                    return True, api_message
+                return False, form._server_mode_whatsapp_failure(api_message)
+            except Exception as e:
+                log.exception("WhatsApp error")
+                return False, f"WhatsApp preparation failed: {str(e)}"
+
+    async def _send_whatsapp_text(self, mobile_number, message, report_url, patient_data):
+        form = self.form
+        if not form.whatsapp_phone_number_id or not form.whatsapp_access_token:
+            return False, "WhatsApp Cloud API is not configured"
+
+        url, headers = form._whatsapp_messages_endpoint()
+        payload = form._build_whatsapp_text_payload(mobile_number, message)
+        with span("whatsapp_text_api"):
+            try:
+                with metrics.timer("notification_api_seconds", provider="whatsapp_text"):
+                    response = await self.request("POST", url, WHATSAPP_TIMEOUT, json=payload, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                form._record_notification("whatsapp_text", False, "request_error")
+                return False, f"Cloud API request failed: {str(e)}"
+
+        if response.status_code in (200, 201):
+            form._record_notification("whatsapp_text", True)
+            return True, "WhatsApp message sent via Cloud API"
+
+        error_code, error_message = form._extract_cloud_api_error(response)
+        form._record_notification("whatsapp_text", False, error_code or f"http_{response.status_code}")
+
+        # The template is only sent when the text was refused, so it cannot be
+        # started speculatively without risking a duplicate message.
+        if form._wants_template_fallback(error_code, error_message):
+            template_success, template_message = await self._send_whatsapp_template(
+                mobile_number, patient_data or {}, report_url
+            )
+            if template_success:
+                return True, template_message
+            return False, (
+                f"Cloud text message blocked ({error_message}). "
+                f"Template fallback failed: {template_message}"
+            )
+
+        return False, form._describe_cloud_api_error(response.status_code, error_code, error_message)
+
+    async def _send_whatsapp_template(self, mobile_number, patient_data, report_url):
+        form = self.form
+        url, headers, payload = form._build_whatsapp_template_request(mobile_number, patient_data, report_url)
+        with span("whatsapp_template_api"):
+            try:
+                with metrics.timer("notification_api_seconds", provider="whatsapp_template"):
+                    response = await self.request("POST", url, WHATSAPP_TIMEOUT, json=payload, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                form._record_notification("whatsapp_template", False, "request_error")
+                return False, f"Template API request failed: {str(e)}"
+        return form._whatsapp_template_result(response)
+
+    async def send_sms(self, mobile_number, message):
+        form = self.form
+        if not form.fast2sms_enabled:
+            return False, "Fast2SMS is disabled."
+        if not form.fast2sms_api_key:
+            return False, "Fast2SMS API key is missing."
+
+        mobile_clean, mobile_error = form._fast2sms_number(mobile_number)
+        if mobile_error:
+            return False, mobile_error
+
+        params, headers = form._build_fast2sms_request(mobile_clean, message)
+        with span("send_sms"):
+            try:
+                with metrics.timer("notification_api_seconds", provider="fast2sms"):
+                    response = await self.request(
+                        "GET", form.fast2sms_api_url, FAST2SMS_TIMEOUT, params=params, headers=headers
+                    )
+                    if response.status_code in (401, 403):
+                        params_with_auth = dict(params, authorization=form.fast2sms_api_key)
+                        response = await self.request(
+                            "GET",
+                            form.fast2sms_api_url,
+                            FAST2SMS_TIMEOUT,
+                            params=params_with_auth,
+                            headers={"cache-control": "no-cache"},
+                        )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                form._record_notification("fast2sms", False, "request_error")
+                return False, f"Fast2SMS API request failed: {str(e)}"
+
+        if response.status_code >= 400:
+            form._record_notification("fast2sms", False, f"http_{response.status_code}")
+            return False, f"Fast2SMS API request failed: HTTP {response.status_code} for url: {form.fast2sms_api_url}"
+
+        try:
+            response_json = response.json()
+        except ValueError:
+            form._record_notification("fast2sms", False, "invalid_response")
+            return False, f"Fast2SMS returned non-JSON response: {response.text}"
+        return form._parse_fast2sms_response(response_json)
+
+
+if ASGIREF_AVAILABLE:
+    class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+        # asgiref defaults to thread_sensitive=True, which runs every WSGI
+        # request on one shared thread; Flask is thread safe, so use a pool.
+        run_wsgi_app = sync_to_async(
+            WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False
+        )
+
+    class PooledWsgiToAsgi(WsgiToAsgi):
+        async def __call__(self, scope, receive, send):
+            await PooledWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(
+                scope, receive, send
+            )
+
+
+class AsyncReportApp:
+    """ASGI app: async /submit-report, Flask for everything else."""
+
+    CORS_HEADERS = [
+        (b'access-control-allow-origin', b'*'),
+        (b'access-control-allow-headers', b'Content-Type,Authorization,X-Branch'),
+        (b'access-control-allow-methods', b'GET,PUT,POST,DELETE,OPTIONS'),
+    ]
+
+    def __init__(self, form):
+        if not (AIOHTTP_AVAILABLE and ASGIREF_AVAILABLE):
+            raise RuntimeError("The async server needs aiohttp and asgiref (pip install aiohttp asgiref uvicorn)")
+        self.form = form
+        self.wsgi_app = PooledWsgiToAsgi(form.flask_app)
+        self.notifier = AsyncNotifier(
+            form, max_connections=int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "500"))
+        )
+        self.render_pool = ThreadPoolExecutor(
+            max_workers=max(1, int(os.getenv("ASYNC_RENDER_WORKERS", str(form.batch_workers)))),
+            thread_name_prefix="report-render",
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/submit-report':
+            await self.submit_report(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.notifier.aclose()
+                self.render_pool.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_blocking(self, func, *args):
+        """Run sync form code (rendering, SQLite) off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.render_pool, app_logging.bind_context(func), *args)
+
+    async def submit_report(self, scope, receive, send):
+        headers = {
+            key.decode('latin-1').title(): value.decode('latin-1')
+            for key, value in scope.get('headers', [])
+        }
+        started = time.perf_counter()
+        query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        branch, _ = self.form.resolve_request_branch(headers, (query.get('branch') or [''])[0])
+        with app_logging.request_scope(headers.get('X-Request-Id')) as request_id:
+            if branch is None:
+                status, payload = 404, {'success': False, 'message': 'Unknown or inactive branch'}
+            else:
+                # Letterhead and messaging credentials of this branch, as in the Flask before_request
+                with branches.use(branch), span("submit_report"):
+                    status, payload = await self.handle_submit_report(scope, receive, headers)
+            log.info("Request completed", extra={
+                'method': 'POST',
+                'route': '/submit-report',
+                'status': status,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+
+        body = json.dumps(payload).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-request-id', request_id.encode()),
+            ] + self.CORS_HEADERS,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def handle_submit_report(self, scope, receive, headers):
+        """Same contract as the Flask /submit-report route; returns (status, body)"""
+        form = self.form
+        try:
+            content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type != 'application/json' and not content_type.endswith('+json'):
+                return 400, {'success': False, 'message': 'Content-Type must be application/json'}
+
+            raw_body = await read_body(receive)
+            try:
+                data = json.loads(raw_body) if raw_body else None
+            except ValueError:
+                data = None
+            if not data or not isinstance(data, dict):
+                return 400, {'success': False, 'message': 'No JSON data received'}
+
+            patient_data = data.get('patient_data', {})
+            test_results = data.get('test_results', {})
+
+            log.info("Report submission received", extra={
+                'patient_name': patient_data.get('name') if isinstance(patient_data, dict) else None,
+                'mobile': patient_data.get('mobile') if isinstance(patient_data, dict) else None,
+                'test_count': len(test_results) if isinstance(test_results, dict) else 0,
+            })
+
+            server = scope.get('server') or ('localhost', None)
+            host = headers.get('Host') or (f"{server[0]}:{server[1]}" if server[1] else server[0])
+            base_url = form.get_public_base_url(headers=headers, host=host, scheme=scope.get('scheme'))
+
+            # Derived tests, validation, QC hold and critical-value alerts, as in the Flask route
+            test_results, extras, error = await self.run_blocking(form.prepare_report_submission, data, base_url)
+            if error:
+                return error
+
+            metrics.add_gauge("report_queue_depth", 1)
+            try:
+                rendered = await self.run_blocking(
+                    form.render_report_files, patient_data, test_results, base_url
+                )
+                delivery = await self.notifier.deliver(patient_data, rendered['pdf_url'])
+            finally:
+                metrics.add_gauge("report_queue_depth", -1)
+
+            response = await self.run_blocking(
+                form.finalize_report_submission, patient_data, test_results, rendered, delivery
+            )
+            response.update(extras)
+            return 200, response
+        except Exception as e:
+            log.exception("Error in form submission")
+            return 500, {'success': False, 'message': f'Server Error: {str(e)}'}
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def create_app(form=None):
+    if form is None:
+        from hospital_system_final import pathology_form as form
+    return AsyncReportApp(form)
+
+
+app = create_app() if AIOHTTP_AVAILABLE and ASGIREF_AVAILABLE else None
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=int(os.getenv("PORT", "10000")))
@@ -0,0 +1,163 @@
+"""Benchmark for the vectorized cohort engine (cohort.py).
+
+Builds a ResultFrame of synthetic rows directly as NumPy arrays (10M by
+default) and times the three query kinds. With --db-rows it also stores
+that many results through PathologyStore and times the cold load from
+SQLite and an incremental refresh after new writes. With --baseline-rows it
+times the same distribution query as a plain Python loop, for comparison.
+
+    python benchmarks/bench_cohort.py
+    python benchmarks/bench_cohort.py --rows 1000000 --db-rows 200000 --baseline-rows 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+
+from cohort import ResultFrame, ResultCache, age_band_labels, AGE_BAND_EDGES
+
+TESTS = ["Glucose (F)/RI", "Dengue NS1", "Haemoglobin"] + [f"Test {i}" for i in range(97)]
+
+
+def synthetic_frame(rows, seed=7):
+    rng = np.random.default_rng(seed)
+    frame = ResultFrame()
+    for name in TESTS:
+        frame._code(name)
+    test = rng.integers(0, len(TESTS), rows, dtype=np.int32)
+    value = rng.normal(100, 25, rows)
+    value[rng.random(rows) < 0.02] = np.nan  # qualitative results
+    abnormal = rng.random(rows) < 0.12
+    day = np.datetime64("2024-01-01") + rng.integers(0, 730, rows).astype("timedelta64[D]")
+    age = rng.integers(0, 95, rows).astype(np.float32)
+    gender = rng.integers(0, 4, rows, dtype=np.int8)
+    frame.extend([(test, value, abnormal, day, age, gender)])
+    return frame
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(samples), 2), "min_ms": round(min(samples), 2)}
+
+
+def python_distribution(frame, test_name, limit):
+    """The same grouping and percentiles with plain Python lists"""
+    code = frame.test_codes[test_name]
+    labels = age_band_labels()
+    groups = {}
+    tests, values = frame.test[:limit].tolist(), frame.value[:limit].tolist()
+    ages, genders = frame.age[:limit].tolist(), frame.gender[:limit].tolist()
+    for t, v, a, g in zip(tests, values, ages, genders):
+        if t != code or v != v:
+            continue
+        band = sum(1 for edge in AGE_BAND_EDGES if a >= edge)
+        groups.setdefault((labels[band], g), []).append(v)
+    return {key: statistics.quantiles(sorted(vals), n=20) for key, vals in groups.items() if len(vals) > 1}
+
+
+def db_load(rows):
+    from datastore import PathologyStore
+
+    store = PathologyStore(os.path.join(tempfile.mkdtemp(prefix="cohort-bench-"), "bench.db"))
+    rng = random.Random(3)
+
+    def write(count, offset):
+        with store.transaction() as cur:
+            for i in range(0, count, 10):
+                patient_id = store.upsert_patient(cur, {
+                    'name': f"Patient {offset + i}", 'mobile': f"9{offset + i:09d}",
+                    'age': str(rng.randint(1, 90)), 'gender': rng.choice(["Male", "Female"]),
+                })
+                store.add_lab_results(cur, patient_id, {
+                    name: f"{rng.gauss(100, 25):.1f}" for name in rng.sample(TESTS, 10)
+                }, result_date=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+
+    write(rows, 0)
+    cache = ResultCache(store)
+    started = time.perf_counter()
+    cache.get()
+    cold_ms = (time.perf_counter() - started) * 1000
+    write(max(rows // 100, 10), rows)
+    started = time.perf_counter()
+    frame = cache.get()
+    incremental_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    cache.get()
+    unchanged_ms = (time.perf_counter() - started) * 1000
+    return {
+        "rows": len(frame),
+        "cold_load_ms": round(cold_ms, 1),
+        "incremental_load_ms": round(incremental_ms, 1),
+        "unchanged_check_ms": round(unchanged_ms, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cohort queries on synthetic results")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db-rows", type=int, default=0, help="also time loading this many rows from SQLite")
+    parser.add_argument("--baseline-rows", type=int, default=0, help="also time a pure-Python distribution")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    frame = synthetic_frame(args.rows)
+    print(f"built {len(frame):,} rows in {time.perf_counter() - started:.1f}s "
+          f"({sum(getattr(frame, c).nbytes for c in ResultFrame.COLUMNS) / 1e6:.0f} MB)")
+
+    queries = {
+        "distribution_by_age_gender": lambda: frame.distribution("Glucose (F)/RI", ("age_band", "gender")),
+        "distribution_by_month": lambda: frame.distribution("Haemoglobin", ("month",)),
+        "positivity_by_week": lambda: frame.positivity("Dengue NS1", "week"),
+        "positivity_by_week_gender": lambda: frame.positivity("Dengue NS1", "week", ("gender",)),
+        "histogram_40_bins": lambda: frame.histogram("Glucose (F)/RI", 40),
+        "distribution_one_quarter": lambda: frame.distribution(
+            "Glucose (F)/RI", ("age_band",), start="2025-01-01", end="2025-03-31"),
+    }
+    results = {"rows": len(frame), "queries": {}}
+    for name, query in queries.items():
+        results["queries"][name] = timed(query, args.repeat)
+        print(f"{name:<30} median={results['queries'][name]['median_ms']}ms")
+
+    if args.baseline_rows:
+        limit = min(args.baseline_rows, len(frame))
+        part = _slice(frame, limit)
+        vectorized = timed(lambda: part.distribution("Glucose (F)/RI", ("age_band", "gender")), args.repeat)
+        python = timed(lambda: python_distribution(frame, "Glucose (F)/RI", limit), 1)
+        results["baseline"] = {"rows": limit, "numpy": vectorized, "python": python}
+        print(f"distribution on {limit:,} rows: numpy {vectorized['median_ms']}ms, "
+              f"python {python['median_ms']}ms ({python['median_ms'] / max(vectorized['median_ms'], 0.001):.0f}x)")
+
+    if args.db_rows:
+        results["sqlite_load"] = db_load(args.db_rows)
+        print("sqlite load", results["sqlite_load"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def _slice(frame, limit):
+    part = ResultFrame()
+    part.test_names, part.test_codes = frame.test_names, frame.test_codes
+    part.extend([tuple(getattr(frame, c)[:limit] for c in ResultFrame.COLUMNS)])
+    return part
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""End-to-end latency of critical-value alerts under routine report load.
+
+Runs the app over local HTTP against the WhatsApp/Fast2SMS stub from
+bench_submit.py. Concurrent clients submit routine reports (WhatsApp and
+SMS both sent through the notification pool), and every --critical-every-th
+report carries a critical potassium. Alert latency is taken from
+critical_alerts.latency_ms: the time from submission to the alert being sent.
+
+Three pool setups are compared:
+
+    fifo        alerts queued like any other notification (the old pool)
+    priority    alerts jump the queue, no reserved workers
+    reserved    alerts jump the queue and have NOTIFY_CRITICAL_WORKERS of their own
+
+    python benchmarks/bench_critical_alerts.py
+    python benchmarks/bench_critical_alerts.py -n 400 -c 32 --notify-workers 4 --stub-latency-ms 300
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_submit import PATIENT, HTTPRunner, percentile, start_local_http_server, start_stub_server
+
+DOCTOR = "Dr. Bench"
+ROUTINE_RESULTS = {"Glucose (F)/RI": "98", "Urea": "28", "Creatinine": "0.9"}
+
+
+class FifoExecutor(ThreadPoolExecutor):
+    """The pre-priority pool: accepts the priority argument and ignores it"""
+
+    def submit(self, fn, *args, priority=None, **kwargs):
+        return super().submit(fn, *args, **kwargs)
+
+
+def run_setup(name, form, args):
+    if name == "fifo":
+        form.notify_executor = FifoExecutor(max_workers=args.notify_workers, thread_name_prefix="notify")
+    else:
+        form.notify_critical_workers = args.critical_workers if name == "reserved" else 0
+        form.notify_executor = form.create_notify_executor()
+    server, base_url = start_local_http_server(form.flask_app)
+    runner = HTTPRunner(base_url)
+    first_alert = form.store.conn.execute("SELECT COALESCE(MAX(id), 0) FROM critical_alerts").fetchone()[0]
+
+    counter = [0]
+    lock = threading.Lock()
+
+    def next_body():
+        with lock:
+            counter[0] += 1
+            index = counter[0]
+        results = dict(ROUTINE_RESULTS)
+        if index % args.critical_every == 0:
+            results["S. Potassium"] = "2.1"
+        return json.dumps({
+            "patient_data": dict(PATIENT, name=f"Alert Bench {name} {index}", doctor=DOCTOR),
+            "test_results": results,
+        }).encode()
+
+    latencies, errors = [], [0]
+    remaining = [args.requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            t0 = time.perf_counter()
+            try:
+                status, _ = runner.request("POST", "/submit-report", next_body())
+                ok = status < 400
+            except Exception:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    # Alerts may still be in flight once the last report returned
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        with form.store.lock:
+            queued = form.store.conn.execute(
+                "SELECT COUNT(*) FROM critical_alerts WHERE id > ? AND status = 'queued'", (first_alert,)
+            ).fetchone()[0]
+        if not queued:
+            break
+        time.sleep(0.1)
+    with form.store.lock:
+        rows = form.store.conn.execute(
+            "SELECT status, latency_ms FROM critical_alerts WHERE id > ?", (first_alert,)
+        ).fetchall()
+    server.shutdown()
+    form.notify_executor.shutdown(wait=False)
+
+    alert_ms = sorted(latency for status, latency in rows if status == "sent" and latency is not None)
+    report_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "reports": len(latencies) + errors[0],
+        "errors": errors[0],
+        "reports_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "report_p95_ms": round(percentile(report_ms, 95), 1) if report_ms else None,
+        "alerts": len(rows),
+        "alerts_sent": len(alert_ms),
+        "alert_p50_ms": round(percentile(alert_ms, 50), 1) if alert_ms else None,
+        "alert_p95_ms": round(percentile(alert_ms, 95), 1) if alert_ms else None,
+        "alert_max_ms": round(alert_ms[-1], 1) if alert_ms else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Critical-value alert latency under load")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="reports per setup")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--critical-every", type=int, default=10, help="every Nth report has a critical value")
+    parser.add_argument("--notify-workers", type=int, default=4)
+    parser.add_argument("--critical-workers", type=int, default=2)
+    parser.add_argument("--stub-latency-ms", type=float, default=200.0)
+    parser.add_argument("--setup", action="append", choices=("fifo", "priority", "reserved"))
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="pathology-alert-bench-")
+    stub = start_stub_server(args.stub_latency_ms)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "WHATSAPP_API_URL": f"{stub_url}/",
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_ACCESS_TOKEN": "bench",
+        "FAST2SMS_API_URL": f"{stub_url}/dev/bulkV2",
+        "FAST2SMS_API_KEY": "bench",
+        "FAST2SMS_ENABLED": "true",
+        # Routine WhatsApp and SMS both go through the notification pool
+        "FAST2SMS_SEND_ALWAYS": "true",
+        "NOTIFY_WORKERS": str(args.notify_workers),
+        "DOCTOR_CONTACTS": json.dumps({DOCTOR: "9812345678"}),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR"),
+    })
+    sys.path.insert(0, ROOT_DIR)
+    from hospital_system_final import PathologyTestsForm
+
+    results = {}
+    try:
+        form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+        for name in args.setup or ("fifo", "priority", "reserved"):
+            results[name] = run_setup(name, form, args)
+            row = results[name]
+            print(f"{name:<9} reports={row['reports']} err={row['errors']} {row['reports_per_s']} rep/s "
+                  f"report_p95={row['report_p95_ms']}ms | alerts={row['alerts_sent']}/{row['alerts']} "
+                  f"p50={row['alert_p50_ms']}ms p95={row['alert_p95_ms']}ms max={row['alert_max_ms']}ms")
+    finally:
+        stub.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "setups": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""PDF engine registry throughput and per-engine latency (see pdf_engines.py).
+
+Renders --reports synthetic reports through pdf_engines.EngineRegistry with
+--concurrency threads and prints each engine's stats. With wkhtmltopdf it
+also times the old way, one wkhtmltopdf process per report, for comparison
+with the persistent workers.
+
+    python benchmarks/bench_pdf_engines.py
+    PDF_ENGINES=wkhtmltopdf WKHTMLTOPDF_WORKERS=4 python benchmarks/bench_pdf_engines.py -n 200 -c 4
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF engine registry throughput")
+    parser.add_argument("-n", "--reports", type=int, default=50)
+    parser.add_argument("-c", "--concurrency", type=int, default=2)
+    parser.add_argument("--skip-one-shot", action="store_true", help="do not time one process per report")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="pathology-pdf-engines-bench-")
+    os.environ.update({"DATA_DIR": data_dir, "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR")})
+    sys.path.insert(0, ROOT_DIR)
+    from hospital_system_final import PathologyTestsForm
+
+    results = {}
+    try:
+        form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+        registry = form.pdf_engines
+        print(f"engines: {registry.available() or 'none'} (routing={registry.routing})")
+        if not registry.available():
+            return 0
+        html = form.generate_pdf_html(
+            {"name": "Engine Bench", "age": "40", "gender": "Male", "mobile": "9800000000",
+             "doctor": "Dr. Bench", "opd_no": "E1", "sample_date": "2025-11-04"},
+            {"Haemoglobin": "13.1", "Total leukocyte count": "7200", "Urea": "28", "Creatinine": "0.9"},
+        )
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            engines = list(pool.map(
+                lambda i: registry.render(html, os.path.join(data_dir, f"registry_{i}.pdf")), range(args.reports)
+            ))
+        elapsed = time.perf_counter() - started
+        results['registry'] = {
+            'seconds': round(elapsed, 3), 'reports_per_second': round(args.reports / elapsed, 2),
+            'failed': engines.count(None), 'engines': registry.stats(),
+        }
+        print(f"registry  {elapsed:.2f}s {args.reports / elapsed:.1f} reports/s, {engines.count(None)} failed")
+        for row in results['registry']['engines']:
+            print(f"  {row['engine']:<12} jobs={row['jobs']} failures={row['failures']} "
+                  f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms workers={row['workers']}")
+
+        wkhtmltopdf = registry.engine("wkhtmltopdf")
+        if wkhtmltopdf and not args.skip_one_shot:
+            source = os.path.join(data_dir, "report.html")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(html)
+
+            def one_shot(i):
+                subprocess.run(
+                    [wkhtmltopdf.binary, "--quiet", *wkhtmltopdf.OPTIONS, source,
+                     os.path.join(data_dir, f"one_shot_{i}.pdf")],
+                    stdin=subprocess.DEVNULL, check=True, timeout=120,
+                )
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                list(pool.map(one_shot, range(args.reports)))
+            elapsed = time.perf_counter() - started
+            results['one_shot'] = {'seconds': round(elapsed, 3), 'reports_per_second': round(args.reports / elapsed, 2)}
+            print(f"one-shot  {elapsed:.2f}s {args.reports / elapsed:.1f} reports/s (process per report)")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Report PDF size, stage by stage (see pdf_optimize.py).
+
+Renders a synthetic report and prints the size of its letterhead logos before
+and after optimization. With WeasyPrint it also prints the PDF size with no
+optimization and after each stage (fonts, images, compression), against
+REPORT_PDF_TARGET_KB.
+
+    python benchmarks/bench_pdf_size.py
+    python benchmarks/bench_pdf_size.py --tests 40 --output pdf_size.json
+"""
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report PDF size per optimization stage")
+    parser.add_argument("--tests", type=int, default=20, help="results on the report")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="pathology-pdf-size-bench-")
+    os.environ.update({"DATA_DIR": data_dir, "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR")})
+    sys.path.insert(0, ROOT_DIR)
+    from hospital_system_final import PathologyTestsForm
+    import pdf_optimize
+    import report_bundle
+
+    results = {'target_kb': pdf_optimize.REPORT_PDF_TARGET_KB, 'logos': []}
+    try:
+        form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+        assets = form.report_assets
+        for name, width, height in assets.logos:
+            started = time.perf_counter()
+            uri = assets.logo(name, width, height)
+            first = time.perf_counter() - started
+            started = time.perf_counter()
+            assets.logo(name, width, height)
+            cached = time.perf_counter() - started
+            original = os.path.getsize(os.path.join(ROOT_DIR, name))
+            optimized = len(base64.b64decode(uri.split(",", 1)[1])) if uri else None
+            results['logos'].append({
+                'logo': name, 'original_bytes': original, 'optimized_bytes': optimized,
+                'first_ms': round(first * 1000, 2), 'cached_ms': round(cached * 1000, 4),
+            })
+            print(f"{name:<20} {original / 1024:8.1f} KB -> "
+                  f"{(f'{optimized / 1024:.1f} KB' if optimized else 'skipped (no Pillow)'):>10} "
+                  f"first {first * 1000:.1f} ms, cached {cached * 1000:.3f} ms")
+
+        names = [test for tests in form.tests.values() for test in tests][:args.tests]
+        html = form.generate_pdf_html(
+            {"name": "Size Bench", "age": "40", "gender": "Female", "mobile": "9800000000",
+             "doctor": "Dr. Bench", "opd_no": "S1", "sample_date": "2025-11-04"},
+            {test: "5.0" for test in names},
+        )
+        results['html_bytes'] = len(html.encode("utf-8"))
+        print(f"report HTML {results['html_bytes'] / 1024:.1f} KB ({len(names)} results)")
+
+        if not report_bundle.WEASYPRINT_AVAILABLE:
+            print("WeasyPrint not available: PDF stages skipped")
+        else:
+            results['stages'] = pdf_optimize.measure(html, assets)
+            for row in results['stages']:
+                print(f"{row['stage']:<12} {row['bytes'] / 1024:8.1f} KB  saved {row['saved'] / 1024:7.1f} KB  "
+                      f"{row['percent_of_original']}% of original")
+            final = results['stages'][-1]['bytes']
+            print(f"final {final / 1024:.1f} KB, target {pdf_optimize.REPORT_PDF_TARGET_KB} KB: "
+                  f"{'ok' if final <= pdf_optimize.REPORT_PDF_TARGET_KB * 1024 else 'OVER'}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Merged multi-report bundles versus rendering every report on its own.
+
+Builds --reports synthetic report documents with generate_pdf_html, then
+times two ways of producing one file with all of them:
+
+    separate    each report rendered as its own WeasyPrint document (own CSS
+                parse and fonts), pages concatenated into one PDF
+    bundle      report_bundle.render_bundle: one compiled stylesheet, shared
+                fonts, chunked layout, one PDF
+
+Without WeasyPrint both produce HTML (the separate files versus one streamed
+bundle), which only shows the size difference.
+
+    python benchmarks/bench_report_bundle.py
+    python benchmarks/bench_report_bundle.py --reports 500 --chunk 50 --output bundle.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS = {
+    "Haemoglobin": (9.0, 17.0), "Total leukocyte count": (3500, 12000), "Platelet Count": (1.2, 4.8),
+    "Glucose (F)/RI": (70, 180), "Urea": (12, 60), "Creatinine": (0.5, 1.9), "S. Potassium": (3.4, 5.2),
+    "Cholesterol": (140, 260), "HDL": (30, 80), "SGPT/ALT": (10, 80),
+}
+
+
+def synthetic_reports(form, count, seed=11):
+    rng = random.Random(seed)
+    for index in range(count):
+        patient = {
+            "name": f"Bundle Patient {index}", "age": str(rng.randint(1, 90)),
+            "gender": rng.choice(["Male", "Female"]), "mobile": f"98{index:08d}",
+            "doctor": "Dr. Bench", "opd_no": f"B{index}", "sample_date": "2025-11-04",
+        }
+        results = {
+            test: f"{rng.uniform(low, high):.1f}"
+            for test, (low, high) in rng.sample(sorted(RESULTS.items()), rng.randint(4, len(RESULTS)))
+        }
+        yield form.generate_pdf_html(patient, results)
+
+
+def render_separate(htmls, output_base):
+    import report_bundle
+    started = time.perf_counter()
+    if report_bundle.WEASYPRINT_AVAILABLE:
+        from weasyprint import HTML
+        documents = [HTML(string=html, encoding="utf-8").render() for html in htmls]
+        pages = [page for document in documents for page in document.pages]
+        path = f"{output_base}.pdf"
+        documents[0].copy(pages).write_pdf(path)
+        page_count = len(pages)
+    else:
+        path, page_count, size = f"{output_base}_separate", None, 0
+        os.makedirs(path, exist_ok=True)
+        for index, html in enumerate(htmls):
+            with open(os.path.join(path, f"{index}.html"), "w", encoding="utf-8") as f:
+                f.write(html)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path) if os.path.isfile(path) else sum(
+        os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+    )
+    return {
+        "reports": len(htmls), "pages": page_count, "seconds": round(elapsed, 3),
+        "pages_per_second": round(page_count / elapsed, 2) if page_count else None,
+        "reports_per_second": round(len(htmls) / elapsed, 2), "bytes": size,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-report bundle rendering")
+    parser.add_argument("-n", "--reports", type=int, default=500)
+    parser.add_argument("--chunk", type=int, default=50, help="reports laid out per chunk")
+    parser.add_argument("--skip-separate", action="store_true")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="pathology-bundle-bench-")
+    os.environ.update({"DATA_DIR": data_dir, "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR")})
+    sys.path.insert(0, ROOT_DIR)
+    from hospital_system_final import PathologyTestsForm
+    import report_bundle
+
+    results = {}
+    try:
+        form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+        started = time.perf_counter()
+        htmls = list(synthetic_reports(form, args.reports))
+        results["html_generation_seconds"] = round(time.perf_counter() - started, 3)
+        print(f"engine={'weasyprint' if report_bundle.WEASYPRINT_AVAILABLE else 'html'} "
+              f"reports={args.reports} html generation {results['html_generation_seconds']}s")
+
+        if not args.skip_separate:
+            results["separate"] = render_separate(htmls, os.path.join(data_dir, "separate"))
+        results["bundle"] = report_bundle.render_bundle(
+            iter(htmls), os.path.join(data_dir, "bundle"), chunk_size=args.chunk,
+            progress=lambda stats: print(f"  bundle: {stats['reports']} reports, {stats['pages']} pages, "
+                                         f"{stats['seconds']}s"),
+        )
+        for name in ("separate", "bundle"):
+            row = results.get(name)
+            if row:
+                print(f"{name:<9} {row['seconds']}s {row['reports_per_second']} rep/s "
+                      f"pages={row['pages']} pages/s={row.get('pages_per_second')} size={row['bytes'] / 1024:.0f} KB")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
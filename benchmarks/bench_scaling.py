@@ -0,0 +1,156 @@
+"""Load test for the gunicorn production profile across worker counts.
+
+Starts `gunicorn -c gunicorn.conf.py hospital_system_final:app` once per
+worker count, drives /submit-report over keep-alive HTTP and prints the
+throughput and speedup for each. It also checks that /metrics counted every
+report, i.e. that the per-worker snapshots are merged. WhatsApp and Fast2SMS
+are stubbed as in bench_submit.py.
+
+    python benchmarks/bench_scaling.py                         # 1, 2 and 4 workers
+    python benchmarks/bench_scaling.py --workers 1,4 --min-speedup 2.5
+    python benchmarks/bench_scaling.py --threads 4 --stub-latency-ms 250 -c 64
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_submit import ROOT_DIR, PATIENT, SMALL_TESTS, HTTPRunner, start_stub_server, summarize, print_row
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready in time")
+
+
+def counted_reports(base_url):
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    for line in text.splitlines():
+        if line.startswith('reports_submitted_total{endpoint="submit-report"}'):
+            return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def run_workers(worker_count, args, stub_url, body):
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix="pathology-scale-")
+    metrics_dir = os.path.join(data_dir, "metrics")
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(worker_count),
+        GUNICORN_THREADS=str(args.threads),
+        DATA_DIR=data_dir,
+        METRICS_MULTIPROC_DIR=metrics_dir,
+        WHATSAPP_API_URL=f"{stub_url}/",
+        WHATSAPP_PHONE_NUMBER_ID="bench",
+        WHATSAPP_ACCESS_TOKEN="bench",
+        FAST2SMS_API_URL=f"{stub_url}/dev/bulkV2",
+        FAST2SMS_API_KEY="bench",
+        FAST2SMS_ENABLED="true",
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "hospital_system_final:app"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url, process)
+        runner = HTTPRunner(base_url)
+        for _ in range(args.warmup):
+            runner.request("POST", "/submit-report", body)
+        latencies, errors, elapsed = runner.run("POST", "/submit-report", body, args.requests, args.concurrency)
+        summary = summarize(latencies, errors, elapsed)
+        time.sleep(1.5)  # let every worker flush its metrics snapshot
+        summary["reports_counted"] = counted_reports(base_url)
+        summary["reports_expected"] = args.requests + args.warmup - errors
+        return summary
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how /submit-report scales with gunicorn workers")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("-n", "--requests", type=int, default=400)
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--stub-latency-ms", type=float, default=100.0)
+    parser.add_argument("--min-speedup", type=float, default=0.0,
+                        help="fail unless the largest worker count reaches this speedup over the smallest")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    stub = start_stub_server(args.stub_latency_ms)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    body = json.dumps({
+        "patient_data": PATIENT,
+        "test_results": {test: "12.5" for test in SMALL_TESTS},
+    }).encode()
+
+    results = {}
+    try:
+        for worker_count in [int(w) for w in args.workers.split(",") if w.strip()]:
+            summary = run_workers(worker_count, args, stub_url, body)
+            results[worker_count] = summary
+            print_row(f"workers={worker_count}", summary)
+    finally:
+        stub.shutdown()
+
+    counts = sorted(results)
+    base = results[counts[0]]["throughput_rps"] or 0
+    status = 0
+    print()
+    for worker_count in counts:
+        summary = results[worker_count]
+        speedup = round(summary["throughput_rps"] / base, 2) if base else None
+        summary["speedup"] = speedup
+        merged = summary["reports_counted"] == summary["reports_expected"]
+        print(f"workers={worker_count:<3} speedup={speedup}x  metrics counted "
+              f"{summary['reports_counted']}/{summary['reports_expected']} reports"
+              f"{'' if merged else '  (MISMATCH)'}")
+        if not merged:
+            status = 1
+    if args.min_speedup and (results[counts[-1]]["speedup"] or 0) < args.min_speedup:
+        print(f"Speedup below --min-speedup {args.min_speedup}")
+        status = 1
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
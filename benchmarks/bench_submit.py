@@ -0,0 +1,390 @@
+"""Benchmark / load test for the report submission path.
+
+Drives PathologyTestsForm(enable_gui=False, auto_start_server=False).flask_app
+either in-process with the Flask test client or over HTTP with a local load
+generator. WhatsApp Cloud API and Fast2SMS are replaced by a local stub server,
+so no real messages are sent.
+
+    python benchmarks/bench_submit.py                          # test client, sequential
+    python benchmarks/bench_submit.py --mode http -c 16        # local HTTP server, 16 workers
+    python benchmarks/bench_submit.py --target http://127.0.0.1:8000 -c 32   # external server
+    python benchmarks/bench_submit.py --output results.json --baseline benchmarks/baseline.json
+    python benchmarks/bench_submit.py --update-baseline
+
+Each scenario reports p50/p95/p99 latency (ms), throughput (req/s) and errors.
+With --baseline the run fails (exit code 1) when a scenario's p95 grows or its
+throughput drops by more than --tolerance compared with the stored baseline.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import http.client
+import urllib.parse
+import platform
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+
+PATIENT = {
+    "name": "Bench Patient",
+    "age": "42",
+    "gender": "Female",
+    "mobile": "9876543210",
+    "doctor": "Dr. Bench",
+    "opd_no": "OPD-BENCH",
+    "sample_date": "2026-01-01",
+}
+SMALL_TESTS = ["Glucose (F)/RI", "Urea", "Creatinine"]
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answers like the WhatsApp Cloud API (POST) and Fast2SMS (GET)."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40 ms to every stubbed call.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        time.sleep(self.server.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        self.server.calls["whatsapp"] += 1
+        self._reply({"messaging_product": "whatsapp", "messages": [{"id": "wamid.bench"}]})
+
+    def do_GET(self):
+        self.server.calls["fast2sms"] += 1
+        self._reply({"return": True, "request_id": "bench"})
+
+
+class StubProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 2048
+
+
+def start_stub_server(latency_ms):
+    server = StubProviderServer(("127.0.0.1", 0), StubProviderHandler)
+    server.latency = latency_ms / 1000.0
+    server.calls = {"whatsapp": 0, "fast2sms": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if count else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if count else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if count else None,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else None,
+        "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+def build_scenarios(form):
+    """Return [(name, method, path, body_bytes_or_None), ...]."""
+    all_tests = [test for tests in form.tests.values() for test in tests]
+    selections = {"small": SMALL_TESTS, "large": all_tests}
+    scenarios = [("home", "GET", "/", None)]
+    for size, tests in selections.items():
+        query = urllib.parse.urlencode({
+            "patient_data": json.dumps(PATIENT),
+            "selected_tests": json.dumps(tests),
+        })
+        scenarios.append((f"fillable_form_{size}", "GET", f"/fillable-form?{query}", None))
+    for size, tests in selections.items():
+        body = json.dumps({
+            # Distinct names so the small/large report files never share a filename.
+            "patient_data": dict(PATIENT, name=f"{PATIENT['name']} {size}"),
+            "test_results": {test: "12.5" for test in tests},
+        }).encode()
+        scenarios.append((f"submit_report_{size}", "POST", "/submit-report", body))
+    return scenarios
+
+
+class TestClientRunner:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body):
+        if method == "POST":
+            response = self.client.post(path, data=body, content_type="application/json")
+        else:
+            response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+    def run(self, method, path, body, total, concurrency):
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(total):
+            t0 = time.perf_counter()
+            status, _ = self.request(method, path, body)
+            if status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - t0)
+        return latencies, errors, time.perf_counter() - started
+
+
+class HTTPRunner:
+    """Closed-loop load generator: `concurrency` keep-alive connections."""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            self._local.conn = conn
+        return conn
+
+    def request(self, method, path, body):
+        headers = {"Content-Type": "application/json"} if body else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def run(self, method, path, body, total, concurrency):
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        remaining = [total]
+
+        def worker():
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                t0 = time.perf_counter()
+                try:
+                    status, _ = self.request(method, path, body)
+                    ok = status < 400
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        return latencies, errors[0], time.perf_counter() - started
+
+
+def start_local_http_server(flask_app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = make_server("127.0.0.1", port, flask_app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def run_benchmark(args):
+    data_dir = tempfile.mkdtemp(prefix="pathology-bench-")
+    stub = start_stub_server(args.stub_latency_ms)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    # Configure the app before it is imported (module import builds an instance).
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "WHATSAPP_API_URL": f"{stub_url}/",
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_ACCESS_TOKEN": "bench",
+        "FAST2SMS_API_URL": f"{stub_url}/dev/bulkV2",
+        "FAST2SMS_API_KEY": "bench",
+        "FAST2SMS_ENABLED": "true",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    sys.path.insert(0, ROOT_DIR)
+    from hospital_system_final import PathologyTestsForm
+
+    form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+    server = None
+    try:
+        if args.target:
+            runner = HTTPRunner(args.target)
+            mode = "target"
+        elif args.mode == "http":
+            server, base_url = start_local_http_server(form.flask_app)
+            runner = HTTPRunner(base_url)
+            mode = "http"
+        else:
+            runner = TestClientRunner(form.flask_app)
+            mode = "client"
+
+        scenarios = build_scenarios(form)
+        if args.scenario:
+            scenarios = [s for s in scenarios if s[0] in args.scenario]
+
+        results = {}
+        report_files = {}
+        for name, method, path, body in scenarios:
+            for _ in range(args.warmup):
+                status, payload = runner.request(method, path, body)
+            latencies, errors, elapsed = runner.run(method, path, body, args.requests, args.concurrency)
+            results[name] = summarize(latencies, errors, elapsed)
+            if name.startswith("submit_report_"):
+                status, payload = runner.request(method, path, body)
+                try:
+                    pdf_url = json.loads(payload)["pdf_url"]
+                    report_files[name.replace("submit_report_", "")] = urllib.parse.urlparse(pdf_url).path
+                except (ValueError, KeyError):
+                    pass
+            print_row(name, results[name])
+
+        for size, path in report_files.items():
+            name = f"view_report_{size}"
+            if args.scenario and name not in args.scenario:
+                continue
+            latencies, errors, elapsed = runner.run("GET", path, None, args.requests, args.concurrency)
+            results[name] = summarize(latencies, errors, elapsed)
+            print_row(name, results[name])
+
+        return {
+            "meta": {
+                "mode": mode,
+                "target": args.target or None,
+                "requests_per_scenario": args.requests,
+                "concurrency": args.concurrency if mode != "client" else 1,
+                "stub_latency_ms": args.stub_latency_ms,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "stub_calls": dict(stub.calls),
+            },
+            "scenarios": results,
+        }
+    finally:
+        if server is not None:
+            server.shutdown()
+        stub.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_row(name, summary):
+    print(
+        f"{name:<22} n={summary['requests']:<5} err={summary['errors']:<4} "
+        f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms "
+        f"{summary['throughput_rps']} req/s"
+    )
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Return a list of human-readable regressions."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{name}: errors {previous.get('errors', 0)} -> {current['errors']}")
+        if previous.get("p95_ms") and current["p95_ms"] and \
+                current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous.get("throughput_rps") and current["throughput_rps"] and \
+                current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report submission path")
+    parser.add_argument("--mode", choices=("client", "http"), default="client")
+    parser.add_argument("--target", default="", help="benchmark an already running server instead")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="HTTP mode workers")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--scenario", action="append", help="only run the named scenario(s)")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0,
+                        help="artificial latency of the WhatsApp/Fast2SMS stub")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this baseline JSON")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help=f"store this run as the baseline ({os.path.relpath(DEFAULT_BASELINE, ROOT_DIR)})")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression before failing (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline or DEFAULT_BASELINE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline or DEFAULT_BASELINE}")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("mode") != results["meta"]["mode"]:
+            print("Warning: baseline was recorded in a different mode; comparison may be meaningless")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("Performance regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
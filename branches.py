@@ -0,0 +1,226 @@
+"""Branches (collection centres) served by one deployment.
+
+Each branch has its own letterhead, contacts, catalog adjustments and
+messaging credentials, stored in the branches table. A field left empty
+falls back to the main branch, and the main branch falls back to the
+environment (HOSPITAL_PHONE, WHATSAPP_ACCESS_TOKEN, ...), so a
+single-branch install needs no configuration at all. A credential may be
+given as "env:BRANCH_SECRET_..." to keep the secret itself out of the
+database; only variables with that prefix can be referenced, so the admin
+API cannot read any other part of the environment.
+
+A request is resolved to its branch once: from the X-Branch header, a
+?branch= parameter or the Host name (branches.hosts). The branch is then
+available to everything the request runs, thread pools included, through
+current(). BranchRegistry keeps every branch in memory. Triggers on the
+branches table bump a generation number; the registry compares it at most
+every BRANCH_CONFIG_CHECK_SECONDS and reloads when a branch changed, in
+this or any other worker process.
+
+    catalog = {"disabled_tests": ["TROP-T"], "normal_ranges": {"Urea": "15-40 mg/dl"}}
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import app_logging
+
+DEFAULT_BRANCH_CODE = "main"
+BRANCH_CONFIG_CHECK_SECONDS = float(os.getenv("BRANCH_CONFIG_CHECK_SECONDS", "2"))
+SECRET_ENV_PREFIX = "BRANCH_SECRET_"
+
+PROFILE_FIELDS = ("name", "address", "phone", "email", "report_email")
+SECRET_FIELDS = ("whatsapp_access_token", "fast2sms_api_key")
+CREDENTIAL_FIELDS = ("whatsapp_phone_number_id",) + SECRET_FIELDS
+FIELDS = ("code",) + PROFILE_FIELDS + CREDENTIAL_FIELDS + ("hosts", "catalog", "active")
+
+_current = contextvars.ContextVar("branch", default=None)
+app_logging.carry_context_var(_current)
+
+
+class Branch:
+    """Resolved configuration of one branch"""
+
+    def __init__(self, config, fallback=None):
+        self.id = config.get('id')
+        self.code = config.get('code') or DEFAULT_BRANCH_CODE
+        self.active = bool(config.get('active', True))
+        for field in PROFILE_FIELDS + CREDENTIAL_FIELDS:
+            value = str(config.get(field) or '').strip()
+            if value.startswith("env:"):
+                name = value[4:].strip()
+                value = os.getenv(name, "").strip() if name.startswith(SECRET_ENV_PREFIX) else ''
+            setattr(self, field, value or (getattr(fallback, field) if fallback else ''))
+        self.hosts = [str(host).strip().lower() for host in _json(config.get('hosts'), []) if str(host).strip()]
+        catalog = _json(config.get('catalog'), {})
+        fallback_catalog = fallback.catalog if fallback else {}
+        self.catalog = {
+            'disabled_tests': set(catalog.get('disabled_tests') or ()) | set(fallback_catalog.get('disabled_tests') or ()),
+            'normal_ranges': {**fallback_catalog.get('normal_ranges', {}), **(catalog.get('normal_ranges') or {})},
+        }
+
+    def offers(self, test_name):
+        return test_name not in self.catalog['disabled_tests']
+
+    def tests(self, tests):
+        """{category: [tests]} without the tests this branch does not offer"""
+        if not self.catalog['disabled_tests']:
+            return tests
+        return {category: [test for test in names if self.offers(test)] for category, names in tests.items()}
+
+    def normal_ranges(self, normal_ranges):
+        """The catalog's normal ranges with this branch's overrides"""
+        if not self.catalog['normal_ranges']:
+            return normal_ranges
+        return {**normal_ranges, **self.catalog['normal_ranges']}
+
+    def public(self):
+        """Settings safe to show in the admin API (secrets masked)"""
+        data = {'id': self.id, 'code': self.code, 'active': self.active, 'hosts': self.hosts}
+        for field in PROFILE_FIELDS + ('whatsapp_phone_number_id',):
+            data[field] = getattr(self, field)
+        for field in SECRET_FIELDS:
+            value = getattr(self, field)
+            data[field] = f"...{value[-4:]}" if len(value) > 8 else ("set" if value else "")
+        data['catalog'] = {
+            'disabled_tests': sorted(self.catalog['disabled_tests']),
+            'normal_ranges': self.catalog['normal_ranges'],
+        }
+        return data
+
+
+class BranchRegistry:
+    """In-memory branch configuration, reloaded when the branches table changes"""
+
+    def __init__(self, store, defaults, check_interval=BRANCH_CONFIG_CHECK_SECONDS):
+        self.store = store
+        self.defaults = Branch(dict(defaults, code=DEFAULT_BRANCH_CODE))
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = 0.0
+        self._by_code = {}
+        self._by_host = {}
+        self._default = self.defaults
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._generation is not None and now - self._checked_at < self.check_interval:
+                return
+            generation = self.store.branch_generation()
+            self._checked_at = now
+            if generation == self._generation:
+                return
+            rows = self.store.list_branches()
+            main = next((row for row in rows if row['code'] == DEFAULT_BRANCH_CODE), {'code': DEFAULT_BRANCH_CODE})
+            default = Branch(main, self.defaults)
+            by_code = {default.code: default}
+            for row in rows:
+                if row['code'] != DEFAULT_BRANCH_CODE:
+                    by_code[row['code']] = Branch(row, default)
+            self._by_code = by_code
+            self._by_host = {host: branch for branch in by_code.values() if branch.active for host in branch.hosts}
+            self._default = default
+            self._generation = generation
+
+    def invalidate(self):
+        """Reload on the next lookup (called after this process changed a branch)"""
+        with self._lock:
+            self._generation = None
+
+    def default(self):
+        self._refresh()
+        return self._default
+
+    def get(self, code):
+        self._refresh()
+        branch = self._by_code.get(str(code or '').strip().lower())
+        return branch if branch is not None and branch.active else None
+
+    def all(self):
+        self._refresh()
+        return list(self._by_code.values())
+
+    def by_id(self, branch_id):
+        """Branch a stored row belongs to (inactive ones included); the main branch if unknown"""
+        self._refresh()
+        return next((branch for branch in self._by_code.values() if branch.id == branch_id), self._default)
+
+    def resolve(self, code=None, host=None):
+        """Branch for a request: explicit code first, then the Host name.
+
+        Returns (branch, explicit); branch is None for an unknown code.
+        """
+        self._refresh()
+        if code:
+            return self.get(code), True
+        host = str(host or '').split(':')[0].strip().lower()
+        if host in self._by_host:
+            return self._by_host[host], True
+        return self._default, False
+
+
+def current():
+    """Branch of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+def activate(branch):
+    return _current.set(branch)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def use(branch):
+    token = activate(branch)
+    try:
+        yield branch
+    finally:
+        deactivate(token)
+
+
+def normalize_config(data):
+    """Admin API payload -> branches row values; raises ValueError"""
+    code = str(data.get('code') or '').strip().lower()
+    if not code or not code.replace('-', '').replace('_', '').isalnum():
+        raise ValueError("code must be letters, digits, '-' or '_'")
+    row = {'code': code}
+    for field in PROFILE_FIELDS + CREDENTIAL_FIELDS:
+        if field in data:
+            row[field] = str(data[field] or '').strip() or None
+            if row[field] and row[field].startswith("env:") and not row[field][4:].strip().startswith(SECRET_ENV_PREFIX):
+                raise ValueError(f"{field}: only env:{SECRET_ENV_PREFIX}... variables can be referenced")
+    if 'hosts' in data:
+        hosts = data['hosts'] or []
+        if isinstance(hosts, str):
+            hosts = [host for host in hosts.split(',')]
+        if not isinstance(hosts, list):
+            raise ValueError("hosts must be a list of host names")
+        row['hosts'] = json.dumps([str(host).strip().lower() for host in hosts if str(host).strip()])
+    if 'catalog' in data:
+        catalog = data['catalog'] or {}
+        if not isinstance(catalog, dict) or not isinstance(catalog.get('disabled_tests', []), list) \
+                or not isinstance(catalog.get('normal_ranges', {}), dict):
+            raise ValueError("catalog must be {\"disabled_tests\": [...], \"normal_ranges\": {...}}")
+        row['catalog'] = json.dumps(catalog)
+    if 'active' in data:
+        row['active'] = 1 if data['active'] else 0
+    return row
+
+
+def _json(value, default):
+    if isinstance(value, (list, dict)):
+        return value
+    try:
+        return json.loads(value) if value else default
+    except (TypeError, ValueError):
+        return default
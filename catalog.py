@@ -0,0 +1,484 @@
+"""Test catalog: categories, tests, units and reference ranges.
+
+The catalog lives in the database (migration 12), so adding a test or
+changing a range is an admin API call rather than a code deploy:
+
+    catalog_categories   name, display_order
+    catalog_tests        name, category, unit, normal_range (report text), display_order, active
+    catalog_ranges       one band per row: sex (M/F, NULL for both), age_min/age_max
+                         in years (NULL for open), low/high bounds and its report text
+
+A new database is seeded from DEFAULT_CATALOG. Every worker reads an
+immutable CatalogSnapshot held by CatalogRegistry. Triggers on the catalog
+tables bump catalog_version; the registry compares it at most every
+CATALOG_CHECK_SECONDS and swaps in a freshly built snapshot when it changed,
+so requests never query the catalog tables and never see half an update.
+
+    snapshot = registry.snapshot()
+    snapshot.tests            {category: [test, ...]} in display order
+    snapshot.normal_ranges    {test: report text}
+    snapshot.units            {test: unit}
+    snapshot.bands            {test: [band, ...]}
+    snapshot.ranges.resolve(test, sex, age)   the band for one patient (RangeIndex)
+"""
+import os
+import re
+import time
+import threading
+
+from result_trends import parse_numeric
+
+CATALOG_CHECK_SECONDS = float(os.getenv("CATALOG_CHECK_SECONDS", "2"))
+
+SEXES = ("M", "F")
+
+# RangeIndex age slots: one per day in the first year, then one per month
+MAX_AGE_YEARS = 120
+_DAY_SLOTS = 366
+AGE_SLOTS = _DAY_SLOTS + (MAX_AGE_YEARS - 1) * 12
+
+# (category, [(test, normal range text, unit), ...]) in display order
+DEFAULT_CATALOG = [
+    ("BIOCHEMISTRY", [
+        ("Glucose (F)/RI", "70-110 mg/dl", "mg/dl"),
+        ("Post Prandial / after 2 Hrs", "Up to 140 mg/dl", "mg/dl"),
+        ("HbA1c", "4.5-6.5 %", "%"),
+    ]),
+    ("RENAL FUNCTION", [
+        ("Urea", "10-40 mg/dl", "mg/dl"),
+        ("Creatinine", "0.6-1.4 mg/dl", "mg/dl"),
+        ("S. Uric Acid", "2.8-7.0 mg/dl", "mg/dl"),
+        ("BUN", "5-20 mg/dl", "mg/dl"),
+    ]),
+    ("LIPID PROFILE", [
+        ("Cholesterol", "150-200 mg/dl", "mg/dl"),
+        ("Triglyceride", "0-170 mg/dl", "mg/dl"),
+        ("HDL", "30-96 (F)/30-70 (M) mg/dl", "mg/dl"),
+        ("LDL", "<100 mg/dl", "mg/dl"),
+    ]),
+    ("LIVER FUNCTION", [
+        ("Bilirubin Total", "0.1-1.2 mg/dl", "mg/dl"),
+        ("Bilirubin (Conjugated)", "0.0-0.3 mg/dl", "mg/dl"),
+        ("Bilirubin (Unconjugated)", "0.1-1.0 mg/dl", "mg/dl"),
+        ("SGOT/AST", "0-35 U/L", "U/L"),
+        ("SGPT/ALT", "0-40 U/L", "U/L"),
+        ("Alk. Phosphatase", "175-575 U/L", "U/L"),
+        ("Total Protein", "6.5-8.0 gm/dl", "gm/dl"),
+        ("Albumin", "3.5-5.0 gm/dl", "gm/dl"),
+        ("Globulin", "2.3-3.5 gm/dl", "gm/dl"),
+        ("A/G Ratio", "1.0-2.5", ""),
+        ("GGT", "8-60 U/L", "U/L"),
+    ]),
+    ("ELECTROLYTES", [
+        ("S. Calcium", "8.8-11.0 mg/dl", "mg/dl"),
+        ("S. Sodium", "138-148 meq/l", "meq/l"),
+        ("S. Potassium", "3.8-4.8 meq/l", "meq/l"),
+    ]),
+    ("OTHER TESTS", [
+        ("Urine Protein (24 Hrs)", "24-120 mg/24 Hrs", "mg/24 Hrs"),
+        ("Urine micro protein (albumin)", "28-150 mg/24 Hrs", "mg/24 Hrs"),
+        ("CK-MB", "0-24 U/L", "U/L"),
+        ("S. Phosphorous", "2.7-4.5 mg/dl", "mg/dl"),
+        ("S. Amylase", "0-110 U/L", "U/L"),
+        ("TROP-T", "Negative", ""),
+    ]),
+    ("HAEMATOLOGY", [
+        ("Haemoglobin", "14-18 gm% (M)/12-15 gm% (F)", "gm%"),
+        ("Total leukocyte count", "4000-10,000/cu mm", "/cu mm"),
+        ("Differential WBC count - Polymorphs", "40-75%", "%"),
+        ("Differential WBC count - Lymphocytes", "20-45%", "%"),
+        ("Differential WBC count - Eosinophils", "1-6%", "%"),
+        ("Differential WBC count - Monocytes", "0-10%", "%"),
+        ("Differential WBC count - Basophiles", "0-1%", "%"),
+        ("AEC", "40-500 No/cu mm", "No/cu mm"),
+        ("E.S.R. (Westergren)", "0-12 mm (F), 0-10 mm (M)", "mm"),
+        ("Platelet Count", "1.5-4.5 lac/cu mm", "lac/cu mm"),
+        ("RBC Count", "F=3.5-5.0, M=4.2-5.5 million/cu mm", "million/cu mm"),
+        ("Reticulocyte count", "2-5% of RBC", "% of RBC"),
+        ("Haematocrit/PCV", "M=39-49%, F=33-43%", "%"),
+        ("MCV", "76-100 fl", "fl"),
+        ("MCH", "29.5 ± 2.5 pg", "pg"),
+        ("MCHC", "32.5 ± 2.5 gm/dl", "gm/dl"),
+        ("Malaria Parasite", "Negative", ""),
+        ("BLOOD GROUP", "Rh = Positive/Negative", ""),
+        ("Bleeding Time", "2-7 Min.", "Min."),
+        ("Clotting Time", "6 Min.", "Min."),
+        ("Prothrombin Time", "10-14 Sec.", "Sec."),
+        ("PERIPHERAL BLOOD SMEAR - RBC", "Normal morphology", ""),
+        ("PERIPHERAL BLOOD SMEAR - WBC", "Normal morphology", ""),
+        ("PERIPHERAL BLOOD SMEAR - PLATELET", "Adequate", ""),
+        ("PERIPHERAL BLOOD SMEAR - HAEMOPARASITE", "Negative", ""),
+    ]),
+    ("SEROLOGY", [
+        ("HbsAg", "Negative", ""),
+        ("HIV (1+2)", "Negative", ""),
+        ("HCV", "Negative", ""),
+        ("VDRL", "Non-reactive", ""),
+        ("ASO Titer", "<200 IU/ml", "IU/ml"),
+        ("R.A. factor", "<20 IU/ml", "IU/ml"),
+        ("CRP", "<6 mg/L", "mg/L"),
+        ("Gravindex (PREGNANCY)", "Negative", ""),
+        ("WIDAL TEST - S. Typhi, 'O'", "Negative (<1:80)", ""),
+        ("WIDAL TEST - S. Typhi, 'H'", "Negative (<1:160)", ""),
+        ("WIDAL TEST - S. Paratyphi, 'AH'", "Negative (<1:80)", ""),
+        ("WIDAL TEST - S. Paratyphi, 'BH'", "Negative (<1:80)", ""),
+        ("Dengue NS1", "Negative", ""),
+        ("Typhi Dot", "Negative", ""),
+    ]),
+]
+
+# Ranges that differ by sex: (sex, low, high, report text)
+DEFAULT_SEX_BANDS = {
+    "HDL": [("M", 30, 70, "30-70 mg/dl"), ("F", 30, 96, "30-96 mg/dl")],
+    "Haemoglobin": [("M", 14, 18, "14-18 gm%"), ("F", 12, 15, "12-15 gm%")],
+    "E.S.R. (Westergren)": [("M", 0, 10, "0-10 mm"), ("F", 0, 12, "0-12 mm")],
+    "RBC Count": [("M", 4.2, 5.5, "4.2-5.5 million/cu mm"), ("F", 3.5, 5.0, "3.5-5.0 million/cu mm")],
+    "Haematocrit/PCV": [("M", 39, 49, "39-49%"), ("F", 33, 43, "33-43%")],
+}
+
+# Typical paediatric ranges (age in years); adult bands have no age limits and
+# apply once no child band covers the patient. Review them for your population.
+DEFAULT_AGE_BANDS = {
+    "Haemoglobin": [
+        (0, 1 / 12, 14, 24, "14-24 gm%"),
+        (1 / 12, 0.5, 9.5, 14, "9.5-14 gm%"),
+        (0.5, 6, 11, 14, "11-14 gm%"),
+        (6, 12, 11.5, 15.5, "11.5-15.5 gm%"),
+    ],
+    "Total leukocyte count": [
+        (0, 1 / 12, 9000, 30000, "9000-30,000/cu mm"),
+        (1 / 12, 2, 6000, 17500, "6000-17,500/cu mm"),
+        (2, 6, 5000, 15500, "5000-15,500/cu mm"),
+        (6, 12, 4500, 13500, "4500-13,500/cu mm"),
+    ],
+    "Creatinine": [
+        (0, 1, 0.2, 0.4, "0.2-0.4 mg/dl"),
+        (1, 12, 0.3, 0.7, "0.3-0.7 mg/dl"),
+    ],
+}
+
+_NUM = r"(\d+(?:,\d{3})*(?:\.\d+)?)"
+_BETWEEN_RE = re.compile(rf"\s*{_NUM}\s*-\s*{_NUM}\s*[^\d(=]*")
+_PLUS_MINUS_RE = re.compile(rf"\s*{_NUM}\s*±\s*{_NUM}\s*[^\d(=]*")
+_UPPER_RE = re.compile(rf"\s*(?:<|up to)\s*{_NUM}\s*[^\d(=]*", re.IGNORECASE)
+
+
+def _number(text):
+    return float(text.replace(",", ""))
+
+
+def parse_range(text):
+    """(low, high) of a single numeric range text, or None ("14-18 gm% (M)/..." is not single)"""
+    text = str(text or "")
+    match = _BETWEEN_RE.fullmatch(text)
+    if match:
+        return _number(match.group(1)), _number(match.group(2))
+    match = _PLUS_MINUS_RE.fullmatch(text)
+    if match:
+        centre, spread = _number(match.group(1)), _number(match.group(2))
+        return round(centre - spread, 6), round(centre + spread, 6)
+    match = _UPPER_RE.fullmatch(text)
+    if match:
+        return None, _number(match.group(1))
+    return None
+
+
+_AGE_RE = re.compile(r"\s*(\d+(?:\.\d+)?)\s*([a-z]*)", re.IGNORECASE)
+_AGE_UNITS = {"d": 365.25, "w": 365.25 / 7, "m": 12.0}
+
+
+def parse_age(value):
+    """Age in years from "40", "40 yrs", "6 months", "10 days"; None when missing"""
+    match = _AGE_RE.match(str(value or ""))
+    if not match:
+        return None
+    # "m"/"mo"/"months" are months; a bare number or "y"/"yrs" is years
+    return float(match.group(1)) / _AGE_UNITS.get(match.group(2)[:1].lower(), 1.0)
+
+
+def parse_sex(value):
+    text = str(value or "").strip().lower()
+    if text in ("m", "male"):
+        return "M"
+    if text in ("f", "female"):
+        return "F"
+    return None
+
+
+def age_slot(age):
+    if age < 1:
+        return max(int(age * 365.25), 0)
+    return min(_DAY_SLOTS + int((age - 1) * 12), AGE_SLOTS)
+
+
+def _slot_age(slot):
+    return slot / 365.25 if slot < _DAY_SLOTS else 1 + (slot - _DAY_SLOTS) / 12
+
+
+def flag(band, value):
+    """"H" or "L" when a numeric value is outside the band, else None"""
+    number = parse_numeric(value)
+    if band is None or number is None:
+        return None
+    if band['low'] is not None and number < band['low']:
+        return "L"
+    if band['high'] is not None and number > band['high']:
+        return "H"
+    return None
+
+
+def seed_age_bands(conn):
+    """Add DEFAULT_AGE_BANDS to catalog tests that have no age-limited band yet"""
+    for name, bands in DEFAULT_AGE_BANDS.items():
+        row = conn.execute('''
+            SELECT t.id FROM catalog_tests t
+            WHERE t.name = ? AND NOT EXISTS (
+                SELECT 1 FROM catalog_ranges r
+                WHERE r.test_id = t.id AND (r.age_min IS NOT NULL OR r.age_max IS NOT NULL)
+            )
+        ''', (name,)).fetchone()
+        if row:
+            conn.executemany(
+                "INSERT INTO catalog_ranges (test_id, age_min, age_max, low, high, text) VALUES (?, ?, ?, ?, ?, ?)",
+                [(row[0],) + band for band in bands],
+            )
+
+
+class RangeIndex:
+    """Reference range bands laid out for O(1) lookup by sex and age.
+
+    Built once per catalog snapshot. For every test and sex (M, F, unknown)
+    it keeps the band for an unknown age and, when any band has age limits,
+    a table with the winning band for every age slot, so resolving a report
+    row is two dict lookups and a list index. A sex-specific band beats one
+    for both sexes; a narrower age band beats a wider one (child over adult).
+    """
+
+    def __init__(self, bands):
+        self._index = {}
+        for test_name, test_bands in bands.items():
+            aged = any(band['age_min'] is not None or band['age_max'] is not None for band in test_bands)
+            self._index[test_name] = {
+                sex: (
+                    [self._pick(test_bands, sex, _slot_age(slot)) for slot in range(AGE_SLOTS + 1)] if aged else None,
+                    self._pick(test_bands, sex, None),
+                )
+                for sex in SEXES + (None,)
+            }
+
+    @staticmethod
+    def _pick(bands, sex, age):
+        best, best_key = None, None
+        for band in bands:
+            if band['sex'] is not None and band['sex'] != sex:
+                continue
+            low, high = band['age_min'], band['age_max']
+            if age is None:
+                # Unknown age: adult ranges (bands open towards old age)
+                if high is not None:
+                    continue
+            elif (low is not None and age < low) or (high is not None and age >= high):
+                continue
+            span = (high if high is not None else MAX_AGE_YEARS + 1) - (low or 0)
+            key = (span, band['sex'] is None)
+            if best_key is None or key < best_key:
+                best, best_key = band, key
+        return best
+
+    def resolve(self, test_name, sex=None, age=None):
+        """Band for a patient (sex "M"/"F"/None, age in years or None); None if the catalog has none"""
+        entry = self._index.get(test_name)
+        if entry is None:
+            return None
+        by_age, any_age = entry.get(sex, entry[None])
+        if by_age is None or age is None:
+            return any_age
+        return by_age[age_slot(age)]
+
+
+def default_tests():
+    """{category: [test, ...]} of DEFAULT_CATALOG (the standalone apps and seeding)"""
+    return {category: [test[0] for test in tests] for category, tests in DEFAULT_CATALOG}
+
+
+def default_normal_ranges():
+    return {name: normal_range for _, tests in DEFAULT_CATALOG for name, normal_range, _ in tests}
+
+
+def default_bands(name, normal_range):
+    """Seed bands of one test: its sex-specific bands, or one band parsed from the range text"""
+    if name in DEFAULT_SEX_BANDS:
+        return [
+            {'sex': sex, 'age_min': None, 'age_max': None, 'low': low, 'high': high, 'text': text}
+            for sex, low, high, text in DEFAULT_SEX_BANDS[name]
+        ]
+    bounds = parse_range(normal_range)
+    if bounds is None:
+        return []
+    return [{'sex': None, 'age_min': None, 'age_max': None, 'low': bounds[0], 'high': bounds[1], 'text': normal_range}]
+
+
+def seed(conn):
+    """Fill empty catalog tables from DEFAULT_CATALOG"""
+    if conn.execute("SELECT 1 FROM catalog_tests LIMIT 1").fetchone():
+        return
+    for category_order, (category, tests) in enumerate(DEFAULT_CATALOG, start=1):
+        category_id = conn.execute(
+            "INSERT INTO catalog_categories (name, display_order) VALUES (?, ?)", (category, category_order)
+        ).lastrowid
+        for test_order, (name, normal_range, unit) in enumerate(tests, start=1):
+            test_id = conn.execute('''
+                INSERT INTO catalog_tests (name, category_id, unit, normal_range, display_order)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, category_id, unit, normal_range, test_order)).lastrowid
+            conn.executemany('''
+                INSERT INTO catalog_ranges (test_id, sex, age_min, age_max, low, high, text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(test_id, band['sex'], band['age_min'], band['age_max'], band['low'], band['high'], band['text'])
+                  for band in default_bands(name, normal_range)])
+
+
+def band_text(band, unit=""):
+    """Report text for a band entered without one"""
+    def number(value):
+        return f"{value:g}"
+    if band['low'] is not None and band['high'] is not None:
+        text = f"{number(band['low'])}-{number(band['high'])}"
+    elif band['high'] is not None:
+        text = f"<{number(band['high'])}"
+    elif band['low'] is not None:
+        text = f">{number(band['low'])}"
+    else:
+        return ""
+    return f"{text} {unit}".strip()
+
+
+class CatalogSnapshot:
+    """One version of the catalog; never modified once built"""
+
+    def __init__(self, version, categories, tests, ranges):
+        self.version = version
+        category_names = {row['id']: row['name'] for row in categories}
+        self.tests = {row['name']: [] for row in sorted(categories, key=lambda r: (r['display_order'], r['id']))}
+        self.normal_ranges = {}
+        self.units = {}
+        self.category_by_name = {}
+        names = {}
+        for row in sorted(tests, key=lambda r: (r['display_order'], r['id'])):
+            names[row['id']] = row['name']
+            if not row['active']:
+                continue
+            category = category_names.get(row['category_id'], "OTHER TESTS")
+            self.tests.setdefault(category, []).append(row['name'])
+            self.category_by_name[row['name']] = category
+            self.normal_ranges[row['name']] = row['normal_range'] or "Not specified"
+            self.units[row['name']] = row['unit'] or ""
+        # Categories whose tests are all retired are not offered
+        self.tests = {category: members for category, members in self.tests.items() if members}
+        self.bands = {}
+        for row in ranges:
+            name = names.get(row['test_id'])
+            if name in self.category_by_name:
+                band = {key: row[key] for key in ('sex', 'age_min', 'age_max', 'low', 'high', 'text')}
+                band['text'] = band['text'] or band_text(band, self.units[name])
+                self.bands.setdefault(name, []).append(band)
+        self.ranges = RangeIndex(self.bands)
+
+    def describe(self):
+        """JSON for GET /api/catalog"""
+        return {
+            'version': self.version,
+            'categories': [{
+                'name': category,
+                'tests': [{
+                    'name': name,
+                    'unit': self.units[name],
+                    'normal_range': self.normal_ranges[name],
+                    'ranges': self.bands.get(name, []),
+                } for name in tests],
+            } for category, tests in self.tests.items()],
+        }
+
+
+class CatalogRegistry:
+    """Versioned in-memory catalog, reloaded when the catalog tables change"""
+
+    def __init__(self, store, check_interval=CATALOG_CHECK_SECONDS):
+        self.store = store
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snapshot = None
+
+    def snapshot(self):
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+            version = self.store.catalog_version()
+            self._checked_at = now
+            if self._snapshot is None or self._snapshot.version != version:
+                snapshot = CatalogSnapshot(version, *self.store.load_catalog())
+                # Stored results and analytics flag abnormal values with the same catalog
+                self.store.set_reference_data(snapshot.normal_ranges, snapshot.category_by_name, snapshot.ranges)
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def invalidate(self):
+        """Check the version on the next lookup (called after this process changed the catalog)"""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+def _bound(value, field):
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+
+
+def normalize_test(data):
+    """Admin API payload -> (test values, bands or None); raises ValueError"""
+    name = str(data.get('name') or '').strip()
+    category = str(data.get('category') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    values = {'name': name}
+    if category:
+        values['category'] = category
+    for field in ('unit', 'normal_range'):
+        if field in data:
+            values[field] = str(data[field] or '').strip()
+    if 'display_order' in data:
+        try:
+            values['display_order'] = int(data['display_order'])
+        except (TypeError, ValueError):
+            raise ValueError("display_order must be an integer")
+    if 'active' in data:
+        values['active'] = 1 if data['active'] else 0
+
+    bands = None
+    if 'ranges' in data:
+        if not isinstance(data['ranges'], list):
+            raise ValueError("ranges must be a list of bands")
+        bands = []
+        for band in data['ranges']:
+            if not isinstance(band, dict):
+                raise ValueError("each range band must be an object")
+            sex = str(band.get('sex') or '').strip().upper()[:1] or None
+            if sex is not None and sex not in SEXES:
+                raise ValueError("sex must be M, F or empty")
+            row = {'sex': sex, 'text': str(band.get('text') or '').strip() or None}
+            for field in ('age_min', 'age_max', 'low', 'high'):
+                row[field] = _bound(band.get(field), field)
+            if row['low'] is not None and row['high'] is not None and row['low'] > row['high']:
+                raise ValueError(f"low is above high in a {name} range")
+            if row['age_min'] is not None and row['age_max'] is not None and row['age_min'] >= row['age_max']:
+                raise ValueError(f"age_min must be below age_max in a {name} range")
+            bands.append(row)
+    return values, bands
@@ -0,0 +1,343 @@
+"""Vectorized cohort analytics over stored lab results.
+
+lab_results is loaded once into NumPy columns and then extended with only
+the rows added since the last load (lab_results is append-only). The
+columns are test code, numeric value, abnormal flag, day, age and gender.
+Group-bys, percentiles, histograms and positivity rates then run on whole
+arrays.
+
+    python cohort.py distribution "Glucose (F)/RI" --by age_band,gender
+    python cohort.py positivity "Dengue NS1" --freq week
+    python cohort.py histogram "Haemoglobin" --bins 20
+
+The same queries are served by GET /api/cohort (see hospital_system_final).
+benchmarks/bench_cohort.py times them on 10M synthetic rows.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+
+import app_logging
+
+log = app_logging.get_logger("cohort")
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    log.warning("numpy not available. Cohort analytics disabled.")
+
+from analytics import is_abnormal
+from result_trends import parse_numeric
+
+AGE_BAND_EDGES = (0, 1, 5, 13, 18, 30, 45, 60, 75)
+GENDERS = ("M", "F", "O", "U")
+PERCENTILES = (5, 25, 50, 75, 95)
+GROUP_KEYS = ("age_band", "gender", "month", "week")
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_AGE_RE = re.compile(r"\s*(\d{1,3}(?:\.\d+)?)")
+
+
+def gender_code(value):
+    text = str(value or "").strip().lower()
+    if text in ("m", "male"):
+        return 0
+    if text in ("f", "female"):
+        return 1
+    return 2 if text else 3
+
+
+def age_band_labels(edges=AGE_BAND_EDGES):
+    labels = [f"{low}-{high - 1}" for low, high in zip(edges, edges[1:])]
+    return ["unknown"] + labels + [f"{edges[-1]}+"]
+
+
+class ResultFrame:
+    """Columnar copy of lab_results. Tests are dictionary-encoded to ints"""
+
+    CHUNK = 50000
+
+    def __init__(self):
+        self.test_names = []
+        self.test_codes = {}
+        self.last_id = 0
+        self.test = np.empty(0, dtype=np.int32)
+        self.value = np.empty(0, dtype=np.float64)
+        self.abnormal = np.empty(0, dtype=bool)
+        self.day = np.empty(0, dtype="datetime64[D]")
+        self.age = np.empty(0, dtype=np.float32)
+        self.gender = np.empty(0, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.test)
+
+    def _code(self, test_name):
+        code = self.test_codes.get(test_name)
+        if code is None:
+            code = self.test_codes[test_name] = len(self.test_names)
+            self.test_names.append(test_name)
+        return code
+
+    def encode_rows(self, rows, normal_ranges=None):
+        """rows: (id, test_name, value, normal_range, date, age, gender) -> column chunk"""
+        normal_ranges = normal_ranges or {}
+        tests, values, flags, days, ages, genders = [], [], [], [], [], []
+        for row_id, test_name, value, normal_range, result_date, age, gender in rows:
+            tests.append(self._code(test_name))
+            number = parse_numeric(value)
+            values.append(np.nan if number is None else number)
+            flags.append(is_abnormal(value, normal_range or normal_ranges.get(test_name)))
+            date = _DATE_RE.match(str(result_date or ""))
+            days.append(date.group(0) if date else "NaT")
+            age_match = _AGE_RE.match(str(age or ""))
+            ages.append(float(age_match.group(1)) if age_match else np.nan)
+            genders.append(gender_code(gender))
+            self.last_id = max(self.last_id, row_id)
+        return (
+            np.asarray(tests, dtype=np.int32),
+            np.asarray(values, dtype=np.float64),
+            np.asarray(flags, dtype=bool),
+            np.asarray(days, dtype="datetime64[D]"),
+            np.asarray(ages, dtype=np.float32),
+            np.asarray(genders, dtype=np.int8),
+        )
+
+    COLUMNS = ("test", "value", "abnormal", "day", "age", "gender")
+
+    def extend(self, chunks):
+        """Append column chunks with one concatenate per column"""
+        if not chunks:
+            return
+        for i, column in enumerate(self.COLUMNS):
+            setattr(self, column, np.concatenate([getattr(self, column)] + [chunk[i] for chunk in chunks]))
+
+    # -- selection and grouping -------------------------------------------------
+
+    def mask(self, test_name, start=None, end=None):
+        code = self.test_codes.get(test_name)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        selected = self.test == code
+        if start:
+            selected &= self.day >= np.datetime64(start, "D")
+        if end:
+            selected &= self.day <= np.datetime64(end, "D")
+        return selected
+
+    def group_codes(self, selected, by, edges=AGE_BAND_EDGES):
+        """One int per selected row combining the group keys, plus a label function"""
+        columns, labelers = [], []
+        for key in by:
+            if key == "age_band":
+                ages = self.age[selected]
+                codes = np.where(np.isnan(ages), 0, np.digitize(ages, edges))
+                labels = age_band_labels(edges)
+                columns.append((codes, len(labels)))
+                labelers.append(lambda code, labels=labels: labels[code])
+            elif key == "gender":
+                columns.append((self.gender[selected].astype(np.int64), len(GENDERS)))
+                labelers.append(lambda code: GENDERS[code])
+            elif key in ("month", "week"):
+                days = self.day[selected]
+                unit = "M" if key == "month" else "W"
+                if key == "week":
+                    # datetime64[W] weeks start on Thursday (the epoch); shift to Monday
+                    days = days + np.timedelta64(3, "D")
+                periods = days.astype(f"datetime64[{unit}]")
+                valid = ~np.isnat(periods)
+                origin = periods[valid].min() if valid.any() else np.datetime64(0, unit)
+                codes = np.where(valid, (periods - origin).astype(np.int64) + 1, 0)
+                columns.append((codes, int(codes.max()) + 1 if len(codes) else 1))
+                if key == "week":
+                    labelers.append(lambda code, origin=origin: "unknown" if code == 0 else str(
+                        (origin + np.timedelta64(int(code) - 1, "W")).astype("datetime64[D]") - np.timedelta64(3, "D")
+                    ))
+                else:
+                    labelers.append(lambda code, origin=origin: "unknown" if code == 0 else str(
+                        origin + np.timedelta64(int(code) - 1, "M")
+                    ))
+            else:
+                raise ValueError(f"Unknown group key {key!r}; use {', '.join(GROUP_KEYS)}")
+
+        combined = np.zeros(int(selected.sum()), dtype=np.int64)
+        for codes, size in columns:
+            combined = combined * size + codes
+        sizes = [size for _, size in columns]
+
+        def label(code):
+            parts = []
+            for size, labeler in zip(reversed(sizes), reversed(labelers)):
+                parts.append(labeler(int(code % size)))
+                code //= size
+            return dict(zip(by, reversed(parts)))
+
+        return combined, label
+
+    # -- queries -------------------------------------------------------------------
+
+    def distribution(self, test_name, by=(), start=None, end=None, percentiles=PERCENTILES):
+        """count/mean/std/min/max and percentiles of numeric values per group"""
+        selected = self.mask(test_name, start, end) & ~np.isnan(self.value)
+        values = self.value[selected]
+        groups, label = self.group_codes(selected, by)
+
+        # Sort by (group, value) once; every group is then a contiguous run
+        order = np.lexsort((values, groups))
+        values, groups = values[order], groups[order]
+        unique, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+        sums = np.add.reduceat(values, starts) if len(values) else np.empty(0)
+        squares = np.add.reduceat(values * values, starts) if len(values) else np.empty(0)
+        means = sums / np.maximum(counts, 1)
+        stds = np.sqrt(np.maximum(squares / np.maximum(counts, 1) - means * means, 0))
+
+        # Linear-interpolated percentiles straight from positions in the sorted runs
+        quantiles = {}
+        for p in percentiles:
+            position = starts + (counts - 1) * (p / 100.0)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts + counts - 1)
+            fraction = position - low
+            quantiles[p] = values[low] * (1 - fraction) + values[high] * fraction if len(values) else np.empty(0)
+
+        rows = []
+        for i, code in enumerate(unique):
+            row = label(code)
+            row.update({
+                'count': int(counts[i]),
+                'mean': round(float(means[i]), 4),
+                'std': round(float(stds[i]), 4),
+                'min': float(values[starts[i]]),
+                'max': float(values[starts[i] + counts[i] - 1]),
+            })
+            row.update({f"p{p}": round(float(quantiles[p][i]), 4) for p in percentiles})
+            rows.append(row)
+        return rows
+
+    def positivity(self, test_name, freq="week", by=(), start=None, end=None):
+        """Share of abnormal/positive results per period (and group)"""
+        selected = self.mask(test_name, start, end)
+        groups, label = self.group_codes(selected, (freq,) + tuple(by))
+        totals = np.bincount(groups)
+        positives = np.bincount(groups, weights=self.abnormal[selected].astype(np.float64), minlength=len(totals))
+        rows = []
+        for code in np.nonzero(totals)[0]:
+            row = label(code)
+            row.update({
+                'results': int(totals[code]),
+                'positive': int(positives[code]),
+                'positive_rate': round(float(positives[code] / totals[code]), 4),
+            })
+            rows.append(row)
+        return rows
+
+    def histogram(self, test_name, bins=20, value_range=None, start=None, end=None):
+        selected = self.mask(test_name, start, end) & ~np.isnan(self.value)
+        counts, edges = np.histogram(self.value[selected], bins=bins, range=value_range)
+        return {'edges': [round(float(e), 4) for e in edges], 'counts': counts.tolist()}
+
+
+class ResultCache:
+    """A ResultFrame kept in step with lab_results.
+
+    Each query first reads MAX(id), a rowid lookup. Only rows above the
+    cached id are loaded, so new writes invalidate the cache by appending
+    to it rather than forcing a full reload.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.frame = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed")
+        with self.lock:
+            if self.frame is None:
+                self.frame = ResultFrame()
+            with self.store.lock:
+                latest = self.store.conn.execute("SELECT MAX(id) FROM lab_results").fetchone()[0] or 0
+            if latest > self.frame.last_id:
+                self._load(self.frame.last_id)
+            return self.frame
+
+    def _load(self, after_id):
+        with self.store.lock:
+            cursor = self.store.conn.execute('''
+                SELECT r.id, r.test_name, r.result_value, r.normal_range,
+                       COALESCE(r.result_date, date(r.created_at)),
+                       COALESCE(c.patient_age, p.age), COALESCE(c.patient_gender, p.gender)
+                FROM lab_results r
+                JOIN patient_master p ON p.id = r.patient_id
+                LEFT JOIN completed_reports c ON c.id = r.report_id
+                WHERE r.id > ? AND r.result_value IS NOT NULL AND r.result_value != ''
+                ORDER BY r.id
+            ''', (after_id,))
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(ResultFrame.CHUNK)
+                if not rows:
+                    break
+                chunks.append(self.frame.encode_rows(rows, self.store.normal_ranges))
+            # Rows filtered out above still count as seen
+            latest = self.store.conn.execute("SELECT MAX(id) FROM lab_results").fetchone()[0] or 0
+            self.frame.last_id = max(self.frame.last_id, latest)
+        self.frame.extend(chunks)
+
+    def query(self, kind, test_name, by=(), freq="week", start=None, end=None, bins=20):
+        frame = self.get()
+        started = time.perf_counter()
+        if kind == "distribution":
+            result = frame.distribution(test_name, by, start, end)
+        elif kind == "positivity":
+            result = frame.positivity(test_name, freq, by, start, end)
+        elif kind == "histogram":
+            result = frame.histogram(test_name, bins, start=start, end=end)
+        else:
+            raise ValueError(f"Unknown query {kind!r}; use distribution, positivity or histogram")
+        return {
+            'query': kind,
+            'test': test_name,
+            'by': list(by),
+            'rows_loaded': len(frame),
+            'query_ms': round((time.perf_counter() - started) * 1000, 3),
+            'result': result,
+        }
+
+
+def parse_group_keys(value):
+    return tuple(key.strip() for key in str(value or "").split(",") if key.strip())
+
+
+def main(argv=None):
+    from datastore import PathologyStore
+
+    parser = argparse.ArgumentParser(description="Cohort queries over stored lab results")
+    parser.add_argument("query", choices=("distribution", "positivity", "histogram"))
+    parser.add_argument("test", help="test name, e.g. 'Glucose (F)/RI'")
+    parser.add_argument("--db", help="database (default: DATA_DIR/pathology_reports.db)")
+    parser.add_argument("--by", default="", help=f"comma separated group keys: {', '.join(GROUP_KEYS)}")
+    parser.add_argument("--freq", choices=("week", "month"), default="week")
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    parser.add_argument("--bins", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("Install numpy to run cohort queries")
+        return 1
+    store = PathologyStore(args.db)
+    cache = ResultCache(store)
+    result = cache.query(args.query, args.test, parse_group_keys(args.by), args.freq, args.start, args.end, args.bins)
+    print(json.dumps(result, indent=2))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Fold the legacy SQLite files into the unified pathology database.
+
+Reads pathology_reports.db (its legacy tables), hospital.db, data.db and
+database/pathology.db in batches via fetchmany, so large files never have to
+fit in memory. Each patient row is merged into patient_master, matched on
+normalized mobile number plus a fuzzy name match (see patient_index). Each
+test value is copied into lab_results, and reports in the target are linked
+to their patient. The source files are opened read-only.
+
+Every imported row is recorded in import_sources. Re-running the tool, or
+resuming after an interruption, therefore only picks up rows it has not
+seen yet.
+
+    python consolidate_db.py                               # the four checked-in files
+    python consolidate_db.py --target /tmp/unified.db old1.db old2.db
+    python consolidate_db.py --dry-run
+"""
+import os
+import sys
+import shutil
+import tempfile
+import sqlite3
+import argparse
+
+import patient_index
+from datastore import BASE_DIR, DEFAULT_DB_PATH, PathologyStore, parse_test_results
+
+DEFAULT_SOURCES = [
+    os.path.join(BASE_DIR, "pathology_reports.db"),
+    os.path.join(BASE_DIR, "hospital.db"),
+    os.path.join(BASE_DIR, "data.db"),
+    os.path.join(BASE_DIR, "database", "pathology.db"),
+]
+
+# Column names used for the same field across the legacy schemas
+PATIENT_COLUMNS = {
+    'name': ('patient_name', 'name'),
+    'mobile': ('patient_mobile', 'mobile_number', 'phone_number', 'mobile'),
+    'opd_no': ('opd_no', 'opd_number'),
+    'age': ('patient_age', 'age'),
+    'gender': ('patient_gender', 'gender'),
+    'doctor': ('doctor_name', 'referred_by'),
+    'sample_date': ('sample_date',),
+}
+SEEN_AT_COLUMNS = ('report_date', 'submission_date', 'created_at', 'sample_date')
+RESULT_COLUMNS = {
+    'test_name': ('test_name', 'test'),
+    'result_value': ('result_value', 'result'),
+    'normal_range': ('normal_range', 'normal_value'),
+    'test_category': ('test_category', 'category'),
+}
+
+# Tables the unified schema owns or that hold no patient data
+SKIPPED_TABLES = {
+    'patient_master', 'lab_results', 'import_sources', 'schema_version',
+    'patient_messages', 'sqlite_sequence',
+}
+
+
+def _pick(row, names):
+    for name in names:
+        if name in row.keys() and row[name] not in (None, ''):
+            return row[name]
+    return None
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def plan_tables(conn):
+    """Source tables in import order: patient tables first, then the result
+    tables that reference them through patient_id."""
+    patient_tables, result_tables = [], []
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"):
+        if table in SKIPPED_TABLES:
+            continue
+        columns = set(_columns(conn, table))
+        if 'patient_id' in columns and 'test_name' in columns:
+            result_tables.append(table)
+        elif columns & set(PATIENT_COLUMNS['name']):
+            patient_tables.append(table)
+    return patient_tables + result_tables
+
+
+def row_results(row):
+    """(test_name, value, normal_range, category) tuples carried by a patient row"""
+    if 'test_results' in row.keys():
+        return [(name, value, None, None) for name, value in parse_test_results(row['test_results']).items()]
+    if 'test' in row.keys() and row['test']:
+        # data.db: one name/test/result entry per row
+        return [(row['test'], row['result'] if 'result' in row.keys() else None, None, None)]
+    # Legacy reports.test_data only lists the tests ordered, without values
+    return []
+
+
+class Consolidator:
+    def __init__(self, store, batch_size=500):
+        self.store = store
+        self.batch_size = batch_size
+        self.stats = {}
+
+    def _already_imported(self, cur, source_db, table, source_id):
+        return cur.execute(
+            "SELECT patient_id FROM import_sources WHERE source_db = ? AND source_table = ? AND source_id = ?",
+            (source_db, table, source_id),
+        ).fetchone()
+
+    def _record(self, cur, source_db, table, source_id, patient_id):
+        cur.execute(
+            "INSERT INTO import_sources (source_db, source_table, source_id, patient_id) VALUES (?, ?, ?, ?)",
+            (source_db, table, source_id, patient_id),
+        )
+
+    def import_file(self, path):
+        source_db = os.path.basename(path)
+        source = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        source.row_factory = sqlite3.Row
+        try:
+            for table in plan_tables(source):
+                self.import_table(source, source_db, table)
+        finally:
+            source.close()
+
+    def import_table(self, source, source_db, table):
+        stats = self.stats.setdefault(f"{source_db}:{table}", {'rows': 0, 'imported': 0, 'skipped': 0, 'results': 0})
+        is_result_table = 'patient_id' in _columns(source, table)
+        rows = source.execute(f'SELECT rowid AS source_rowid, * FROM "{table}" ORDER BY rowid')
+        while True:
+            batch = rows.fetchmany(self.batch_size)
+            if not batch:
+                break
+            with self.store.transaction() as cur:
+                for row in batch:
+                    stats['rows'] += 1
+                    if self._already_imported(cur, source_db, table, row['source_rowid']):
+                        stats['skipped'] += 1
+                        continue
+                    if is_result_table:
+                        patient_id = self._import_result_row(cur, source_db, table, row, stats)
+                    else:
+                        patient_id = self._import_patient_row(cur, source_db, table, row, stats)
+                    if patient_id is None:
+                        stats['skipped'] += 1
+                        continue
+                    self._record(cur, source_db, table, row['source_rowid'], patient_id)
+                    stats['imported'] += 1
+
+    def _import_patient_row(self, cur, source_db, table, row, stats):
+        patient = {field: _pick(row, names) for field, names in PATIENT_COLUMNS.items()}
+        if not (patient['name'] or patient['mobile'] or patient['opd_no']):
+            return None
+        seen_at = _pick(row, SEEN_AT_COLUMNS)
+        patient_id = self.store.upsert_patient(cur, patient, seen_at=seen_at)
+        result_date = (patient['sample_date'] or seen_at or '')[:10] or None
+        stats['results'] += self.store.add_lab_results(
+            cur, patient_id, row_results(row), result_date=result_date, source=f"{source_db}:{table}",
+        )
+        return patient_id
+
+    def _import_result_row(self, cur, source_db, table, row, stats):
+        # patient_id points at the legacy patients table of the same file
+        owner = cur.execute(
+            "SELECT patient_id FROM import_sources WHERE source_db = ? AND source_table = 'patients' AND source_id = ?",
+            (source_db, row['patient_id']),
+        ).fetchone()
+        if owner is None:
+            return None
+        result = {field: _pick(row, names) for field, names in RESULT_COLUMNS.items()}
+        stats['results'] += self.store.add_lab_results(cur, owner[0], [(
+            result['test_name'], result['result_value'], result['normal_range'], result['test_category'],
+        )], source=f"{source_db}:{table}")
+        return owner[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consolidate legacy SQLite files into the unified database")
+    parser.add_argument("sources", nargs="*", help="source databases (default: the four checked-in files)")
+    parser.add_argument("--target", help="unified database (default: DATA_DIR/pathology_reports.db)")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per fetchmany/transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be imported, change nothing")
+    args = parser.parse_args(argv)
+
+    target = args.target or DEFAULT_DB_PATH
+    scratch_dir = None
+    if args.dry_run:
+        # Run against a throwaway copy so later batches still see earlier ones
+        scratch_dir = tempfile.mkdtemp(prefix="consolidate-dry-run-")
+        copy_path = os.path.join(scratch_dir, os.path.basename(target))
+        if os.path.exists(target):
+            with sqlite3.connect(target) as src, sqlite3.connect(copy_path) as dst:
+                src.backup(dst)
+        target = copy_path
+
+    store = PathologyStore(target)
+    consolidator = Consolidator(store, batch_size=args.batch_size)
+    for path in args.sources or DEFAULT_SOURCES:
+        if not os.path.exists(path):
+            print(f"Skipping {path}: not found")
+            continue
+        consolidator.import_file(path)
+
+    # Reports already in the target point at the patients they were merged into
+    with store.transaction() as cur:
+        linked = patient_index.link_completed_reports(cur, os.path.basename(store.db_path))
+
+    for name, stats in consolidator.stats.items():
+        print(f"{name:<40} rows={stats['rows']:<6} imported={stats['imported']:<6} "
+              f"skipped={stats['skipped']:<6} results={stats['results']}")
+    with store.lock:
+        patients = store.conn.execute("SELECT COUNT(*) FROM patient_master").fetchone()[0]
+        results = store.conn.execute("SELECT COUNT(*) FROM lab_results").fetchone()[0]
+    print(f"{'(dry run) ' if args.dry_run else ''}patient_master={patients} lab_results={results} "
+          f"reports_linked={linked}")
+    store.close()
+    if scratch_dir:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Critical-value rules checked when a report is submitted.
+
+normal_ranges says what is abnormal; these rules mark the much smaller set
+of results that are dangerous and must reach the referring doctor at once
+(panic values). Numeric limits use the units of the catalog's normal range:
+
+    "S. Potassium": {"low": 2.8, "high": 6.2}     # meq/l
+    "TROP-T": {"positive": True}                   # any positive/reactive result
+
+CRITICAL_VALUE_RULES (JSON) overrides or extends DEFAULT_RULES; an entry
+set to null removes one. Doctors are looked up in DOCTOR_CONTACTS (JSON,
+{"Dr. A Sharma": "98XXXXXXXX"}) by normalized name; alerts for unknown
+doctors go to CRITICAL_ALERT_MOBILE, the lab's on-call number.
+"""
+import os
+import re
+import json
+
+import app_logging
+from patient_index import normalize_name
+from result_trends import parse_numeric
+
+log = app_logging.get_logger("critical_values")
+
+DEFAULT_RULES = {
+    "S. Potassium": {"low": 2.8, "high": 6.2},
+    "S. Sodium": {"low": 120, "high": 160},
+    "S. Calcium": {"low": 6.0, "high": 13.0},
+    "Glucose (F)/RI": {"low": 40, "high": 450},
+    "Post Prandial / after 2 Hrs": {"low": 40, "high": 450},
+    "Haemoglobin": {"low": 7.0},
+    "Platelet Count": {"low": 0.2},
+    "Total leukocyte count": {"low": 2000, "high": 30000},
+    "Creatinine": {"high": 7.0},
+    "Bilirubin Total": {"high": 15.0},
+    "TROP-T": {"positive": True},
+    "Malaria Parasite": {"positive": True},
+}
+
+_POSITIVE_RE = re.compile(r"\b(positive|reactive|detected|seen|present)\b")
+_NEGATED_RE = re.compile(r"\b(non|not|no)[\s-]")
+
+
+def load_rules():
+    rules = {name: dict(rule) for name, rule in DEFAULT_RULES.items()}
+    try:
+        overrides = json.loads(os.getenv("CRITICAL_VALUE_RULES", "") or "{}")
+    except ValueError:
+        log.warning("CRITICAL_VALUE_RULES is not valid JSON; using the default critical values")
+        overrides = {}
+    for name, rule in overrides.items():
+        if rule:
+            rules[name] = dict(rule)
+        else:
+            rules.pop(name, None)
+    return rules
+
+
+def load_doctor_contacts():
+    try:
+        contacts = json.loads(os.getenv("DOCTOR_CONTACTS", "") or "{}")
+    except ValueError:
+        log.warning("DOCTOR_CONTACTS is not valid JSON; critical alerts go to CRITICAL_ALERT_MOBILE")
+        contacts = {}
+    return {normalize_name(name): str(mobile) for name, mobile in contacts.items() if mobile}
+
+
+RULES = load_rules()
+DOCTOR_CONTACTS = load_doctor_contacts()
+
+
+def check(test_name, value, rules=None):
+    """'low'/'high'/'positive' when value is critical, else None"""
+    rule = (RULES if rules is None else rules).get(test_name)
+    if not rule:
+        return None
+    text = str(value or "").strip().lower()
+    if not text:
+        return None
+    if rule.get("positive") and _POSITIVE_RE.search(text) and not _NEGATED_RE.search(text):
+        return "positive"
+    number = parse_numeric(value)
+    if number is None:
+        return None
+    if rule.get("low") is not None and number < rule["low"]:
+        return "low"
+    if rule.get("high") is not None and number > rule["high"]:
+        return "high"
+    return None
+
+
+def check_report(test_results, rules=None):
+    """[(test_name, value, reason)] for the critical results in one report"""
+    critical = []
+    for test_name, value in test_results.items():
+        reason = check(test_name, value, rules)
+        if reason:
+            critical.append((test_name, value, reason))
+    return critical
+
+
+def describe_rule(test_name, reason, rules=None):
+    rule = (RULES if rules is None else rules).get(test_name) or {}
+    if reason == "low":
+        return f"< {rule.get('low'):g}"
+    if reason == "high":
+        return f"> {rule.get('high'):g}"
+    return "positive"
+
+
+def doctor_mobile(doctor_name, contacts=None):
+    contacts = DOCTOR_CONTACTS if contacts is None else contacts
+    return contacts.get(normalize_name(doctor_name))
@@ -0,0 +1,819 @@
+"""Data-access layer for the unified pathology database.
+
+All entry points go through PathologyStore instead of opening their own
+sqlite3 connections: the Flask/Tk app, the ASGI server, analyzer ingestion,
+the older app.py and single_app.py launchers, render_app.py, init_db.py and
+consolidate_db.py. Patients from every source end up in patient_master.
+They are matched on normalized mobile number plus a fuzzy name match (see
+patient_index). Each completed report references its patient through
+patient_id, and test values end up in lab_results.
+
+    store = PathologyStore()                 # DATA_DIR/pathology_reports.db, migrated
+    with store.transaction() as cur:
+        patient_id = store.upsert_patient(cur, {"name": "...", "mobile": "..."})
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import analytics
+import app_logging
+import catalog
+import delta_check
+import migrations
+import patient_index
+import qc
+import result_trends
+
+log = app_logging.get_logger("datastore")
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_DB_PATH = os.path.join(os.getenv("DATA_DIR", BASE_DIR), "pathology_reports.db")
+DEFAULT_COUNTRY_CODE = re.sub(r"\D", "", os.getenv("WHATSAPP_DEFAULT_COUNTRY_CODE", "91")) or "91"
+# The branch created by migration 11; rows written without a branch belong to it
+MAIN_BRANCH_ID = 1
+
+COMPLETED_REPORT_COLUMNS = (
+    "patient_name", "patient_age", "patient_gender", "patient_mobile", "doctor_name", "opd_no",
+    "sample_date", "test_results", "pdf_path", "whatsapp_status", "whatsapp_error", "sms_status", "sms_error",
+)
+
+_PATIENT_UPSERT_SQL = '''
+    INSERT INTO patient_master
+    (dedupe_key, patient_name, name_normalized, mobile, mobile_normalized, opd_no, age, gender, doctor_name,
+     first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(dedupe_key) DO UPDATE SET
+        {updates},
+        first_seen = MIN(patient_master.first_seen, excluded.first_seen),
+        last_seen = MAX(patient_master.last_seen, excluded.last_seen)
+'''.format(updates=",\n        ".join(
+    # The most recent non-empty value wins; older records only fill gaps
+    f"{column} = CASE WHEN COALESCE(excluded.{column}, '') != '' "
+    f"AND (excluded.last_seen >= patient_master.last_seen OR COALESCE(patient_master.{column}, '') = '') "
+    f"THEN excluded.{column} ELSE patient_master.{column} END"
+    for column in ("patient_name", "name_normalized", "mobile", "opd_no", "age", "gender", "doctor_name")
+))
+
+
+def normalize_mobile(value, country_code=DEFAULT_COUNTRY_CODE):
+    """Digits in international format (91XXXXXXXXXX), or '' when unusable"""
+    digits = re.sub(r"\D", "", str(value or ""))
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        digits = f"{country_code}{digits}"
+    return digits if 8 <= len(digits) <= 15 else ""
+
+
+def parse_test_results(value):
+    """completed_reports.test_results JSON -> {test: value}; tolerant of legacy rows"""
+    if isinstance(value, dict):
+        return value
+    try:
+        data = json.loads(value or "{}")
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class PathologyStore:
+    def __init__(self, db_path=None, country_code=DEFAULT_COUNTRY_CODE):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self.country_code = country_code
+        # Reference data from the test catalog (set_reference_data)
+        self.normal_ranges = {}
+        self.test_categories = {}
+        self.range_index = None
+        self.lock = threading.Lock()
+        self.applied_migrations = []
+        self.conn = self._connect()
+        self.applied_migrations = migrations.migrate(self.conn, self.db_path, migrations.PATHOLOGY_MIGRATIONS)
+
+    def _connect(self):
+        # One shared connection per process; WAL lets gunicorn workers write concurrently
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError as e:
+            log.warning("Could not enable WAL mode: %s", e, extra={'db_path': self.db_path})
+        return conn
+
+    def set_reference_data(self, normal_ranges, test_categories, range_index=None):
+        """Normal ranges, age/sex range bands and categories used for stored results and analytics"""
+        self.normal_ranges = dict(normal_ranges)
+        self.test_categories = dict(test_categories)
+        self.range_index = range_index
+
+    def reference_range(self, test_name, normal_ranges=None, sex=None, age=None):
+        """Range text stored with a result: the patient's age/sex band where the catalog has one"""
+        band = self.range_index.resolve(test_name, sex, age) if self.range_index else None
+        return band['text'] if band else (normal_ranges or {}).get(test_name)
+
+    def reopen(self):
+        """New connection and lock for a forked worker (never share across processes)"""
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            cur = self.conn.cursor()
+            try:
+                yield cur
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def database_size(self):
+        """Size of the SQLite database including its WAL/journal files"""
+        total = 0
+        for suffix in ('', '-wal', '-journal'):
+            try:
+                total += os.path.getsize(self.db_path + suffix)
+            except OSError:
+                pass
+        return total
+
+    # -- patients and results ------------------------------------------------
+
+    def upsert_patient(self, cur, patient, seen_at=None):
+        """Insert or merge a patient; returns the patient_master id.
+
+        patient uses the submission keys: name, mobile, opd_no, age, gender, doctor.
+        """
+        key, mobile_normalized, name_normalized = self._match_patient(cur, patient)
+        seen_at = seen_at or patient.get('sample_date') or _now()
+        cur.execute(_PATIENT_UPSERT_SQL, (
+            key,
+            _clean(patient.get('name')),
+            name_normalized or None,
+            _clean(patient.get('mobile')),
+            mobile_normalized,
+            _clean((patient.get('opd_no') or '').upper()),
+            _clean(patient.get('age')),
+            _clean(patient.get('gender')),
+            _clean(patient.get('doctor')),
+            seen_at,
+            seen_at,
+        ))
+        return cur.execute("SELECT id FROM patient_master WHERE dedupe_key = ?", (key,)).fetchone()[0]
+
+    def _match_patient(self, cur, patient):
+        """(dedupe_key, mobile_normalized, name_normalized) for a submitted patient"""
+        mobile_normalized = normalize_mobile(patient.get('mobile'), self.country_code)
+        name_normalized = patient_index.normalize_name(patient.get('name'))
+        key = patient_index.dedupe_key(mobile_normalized, name_normalized, patient.get('opd_no'))
+        if mobile_normalized:
+            # Family members share a number; pick the record whose name matches
+            candidates = cur.execute(
+                "SELECT dedupe_key, name_normalized FROM patient_master WHERE mobile_normalized = ?",
+                (mobile_normalized,),
+            ).fetchall()
+            match = patient_index.best_match(name_normalized, candidates)
+            if match is not None:
+                key = match[0]
+        return key, mobile_normalized, name_normalized
+
+    def find_patient_id(self, patient):
+        """patient_master id of a submitted patient without creating one, or None"""
+        with self.lock:
+            cur = self.conn.cursor()
+            key = self._match_patient(cur, patient)[0]
+            row = cur.execute("SELECT id FROM patient_master WHERE dedupe_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def add_lab_results(self, cur, patient_id, results, result_date=None, source=None,
+                        report_id=None, normal_ranges=None, categories=None, branch_id=MAIN_BRANCH_ID,
+                        age=None, gender=None):
+        """results: {test_name: value} or [(test_name, value, normal_range, category)]
+
+        For a dict, each result stores the range for the patient's age and gender.
+        """
+        if isinstance(results, dict):
+            sex, age = catalog.parse_sex(gender), catalog.parse_age(age)
+            results = [
+                (name, value, self.reference_range(name, normal_ranges, sex, age), (categories or {}).get(name))
+                for name, value in results.items()
+            ]
+        rows = [
+            (patient_id, report_id, str(name).strip(), _clean(value), normal_range, category, result_date, source)
+            for name, value, normal_range, category in results
+            if str(name or '').strip()
+        ]
+        flags = self._delta_flags(cur, patient_id, rows, result_date)
+        cur.executemany('''
+            INSERT INTO lab_results
+            (patient_id, report_id, test_name, result_value, normal_range, test_category, result_date, source,
+             delta_flag, branch_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row + (flags.get(row[2]), branch_id) for row in rows])
+        result_trends.append_results(cur, patient_id, [
+            (test_name, value, date, report) for _, report, test_name, value, _, _, date, _ in rows
+        ])
+        return len(rows)
+
+    def _delta_flags(self, cur, patient_id, rows, result_date):
+        """{test_name: delta_check text} against the stored series, before they are updated"""
+        test_names = [
+            row[2] for row in rows if row[3] and (delta_check.DEFAULT_PERCENT or row[2] in delta_check.RULES)
+        ]
+        if not test_names:
+            return {}
+        series = {
+            test_name: json.loads(points)
+            for test_name, points in cur.execute(f'''
+                SELECT test_name, points FROM result_series
+                WHERE patient_id = ? AND test_name IN ({", ".join("?" for _ in test_names)})
+            ''', [patient_id] + test_names)
+        }
+        flags = delta_check.check_report(
+            {row[2]: row[3] for row in rows if row[2] in series}, series, result_date
+        )
+        return {test_name: delta_check.describe(flag) for test_name, flag in flags.items()}
+
+    # -- completed reports -----------------------------------------------------
+
+    def insert_completed_reports(self, rows, normal_ranges=None, categories=None, branch_id=MAIN_BRANCH_ID):
+        """Store completed_reports rows (COMPLETED_REPORT_COLUMNS order) in one
+        transaction, registering each patient and result and updating the
+        analytics rollups. Returns the report ids.
+        """
+        normal_ranges = normal_ranges or self.normal_ranges
+        categories = categories or self.test_categories
+        columns = COMPLETED_REPORT_COLUMNS + ("patient_id", "branch_id")
+        insert_sql = (
+            f"INSERT INTO completed_reports ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        )
+        report_ids = []
+        with self.transaction() as cur:
+            for row in rows:
+                record = dict(zip(COMPLETED_REPORT_COLUMNS, row))
+                result_date = record['sample_date'] or _now()[:10]
+                patient_id = self.upsert_patient(cur, {
+                    'name': record['patient_name'],
+                    'mobile': record['patient_mobile'],
+                    'opd_no': record['opd_no'],
+                    'age': record['patient_age'],
+                    'gender': record['patient_gender'],
+                    'doctor': record['doctor_name'],
+                }, seen_at=_now())
+                cur.execute(insert_sql, tuple(row) + (patient_id, branch_id))
+                report_id = cur.lastrowid
+                report_ids.append(report_id)
+
+                self.add_lab_results(
+                    cur, patient_id, parse_test_results(record['test_results']),
+                    result_date=result_date, source='completed_reports', report_id=report_id,
+                    normal_ranges=normal_ranges, categories=categories, branch_id=branch_id,
+                    age=record['patient_age'], gender=record['patient_gender'],
+                )
+                # consolidate_db.py must not import this report a second time
+                cur.execute(
+                    "INSERT INTO import_sources (source_db, source_table, source_id, patient_id) VALUES (?, ?, ?, ?)",
+                    (os.path.basename(self.db_path), 'completed_reports', report_id, patient_id),
+                )
+            analytics.compact(cur, normal_ranges, ranges=self.range_index)
+        return report_ids
+
+    def report_versions(self, report_id):
+        """Every version of the report report_id belongs to, oldest first, each
+        with its full results rebuilt from the original plus the stored
+        changes. [] when the report does not exist.
+        """
+        columns = ("id", "parent_report_id", "version", "amendment_reason", "amended_by", "report_date",
+                   "patient_id") + tuple(
+            column for column in COMPLETED_REPORT_COLUMNS if column not in ("whatsapp_error", "sms_error")
+        )
+        with self.lock:
+            found = self.conn.execute(
+                "SELECT COALESCE(parent_report_id, id) FROM completed_reports WHERE id = ?", (report_id,)
+            ).fetchone()
+            if found is None:
+                return []
+            rows = self.conn.execute(f'''
+                SELECT {', '.join(columns)} FROM completed_reports
+                WHERE id = ? OR parent_report_id = ?
+                ORDER BY version, id
+            ''', (found[0], found[0])).fetchall()
+            changes = self.conn.execute('''
+                SELECT c.report_id, c.test_name, c.old_value, c.new_value
+                FROM report_changes c JOIN completed_reports r ON r.id = c.report_id
+                WHERE r.parent_report_id = ?
+                ORDER BY c.id
+            ''', (found[0],)).fetchall()
+
+        by_report = {}
+        for changed_report, test_name, old_value, new_value in changes:
+            by_report.setdefault(changed_report, []).append({'test': test_name, 'old': old_value, 'new': new_value})
+        versions, results = [], {}
+        for row in rows:
+            version = dict(zip(columns, row))
+            if version['parent_report_id'] is None:
+                results = parse_test_results(version['test_results'])
+            else:
+                results = dict(results)
+                for change in by_report.get(version['id'], []):
+                    if change['new'] is None:
+                        results.pop(change['test'], None)
+                    else:
+                        results[change['test']] = change['new']
+            version['test_results'] = results
+            version['changes'] = by_report.get(version['id'], [])
+            versions.append(version)
+        return versions
+
+    def amend_report(self, report_id, row, changes, reason=None, expected_version=None,
+                     normal_ranges=None, categories=None, amended_by=None):
+        """Store a corrected version of a report.
+
+        row is the corrected report (COMPLETED_REPORT_COLUMNS order); only
+        changes ({test_name: (old_value, new_value)}, new_value None when the
+        test was removed) are kept for it. The corrected values replace the
+        old ones in lab_results and the trend series. Raises ValueError for an
+        unknown report or when expected_version is no longer the latest one.
+        """
+        normal_ranges = normal_ranges or self.normal_ranges
+        categories = categories or self.test_categories
+        record = dict(zip(COMPLETED_REPORT_COLUMNS, row), test_results=None)
+        columns = COMPLETED_REPORT_COLUMNS + ("patient_id", "parent_report_id", "version", "amendment_reason",
+                                              "amended_by", "branch_id")
+        with self.transaction() as cur:
+            found = cur.execute(
+                "SELECT COALESCE(parent_report_id, id) FROM completed_reports WHERE id = ?", (report_id,)
+            ).fetchone()
+            if found is None:
+                raise ValueError(f"Report {report_id} not found")
+            root_id = found[0]
+            chain = cur.execute(
+                "SELECT id, patient_id, version, report_date FROM completed_reports WHERE id = ? OR parent_report_id = ?",
+                (root_id, root_id),
+            ).fetchall()
+            branch_id = cur.execute("SELECT branch_id FROM completed_reports WHERE id = ?", (root_id,)).fetchone()[0]
+            latest = max(version for _, _, version, _ in chain)
+            if expected_version is not None and expected_version != latest:
+                raise ValueError(f"Report was amended in the meantime (now version {latest})")
+
+            patient_id = self.upsert_patient(cur, {
+                'name': record['patient_name'],
+                'mobile': record['patient_mobile'],
+                'opd_no': record['opd_no'],
+                'age': record['patient_age'],
+                'gender': record['patient_gender'],
+                'doctor': record['doctor_name'],
+            }, seen_at=_now())
+            cur.execute(
+                f"INSERT INTO completed_reports ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                tuple(record[column] for column in COMPLETED_REPORT_COLUMNS)
+                + (patient_id, root_id, latest + 1, _clean(reason), _clean(amended_by), branch_id),
+            )
+            new_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO report_changes (report_id, test_name, old_value, new_value) VALUES (?, ?, ?, ?)",
+                [(new_id, test_name, old, new) for test_name, (old, new) in changes.items()],
+            )
+
+            # Old values of the changed tests go; a corrected patient takes the other results along
+            report_ids = [chain_id for chain_id, _, _, _ in chain]
+            owners = sorted({owner for _, owner, _, _ in chain if owner is not None})
+            where = (
+                f"patient_id IN ({', '.join('?' for _ in owners)}) "
+                f"AND report_id IN ({', '.join('?' for _ in report_ids)})"
+            )
+            affected = cur.execute(
+                f"SELECT DISTINCT patient_id, test_name FROM lab_results WHERE {where}", owners + report_ids
+            ).fetchall() if owners else []
+            if affected:
+                names = list(changes)
+                cur.execute(
+                    f"DELETE FROM lab_results WHERE {where} AND test_name IN ({', '.join('?' for _ in names)})",
+                    owners + report_ids + names,
+                )
+                cur.execute(f"UPDATE lab_results SET patient_id = ? WHERE {where}", [patient_id] + owners + report_ids)
+                moved = {(owner, test_name) for owner, test_name in affected if owner != patient_id}
+                for owner in {owner for owner, _ in affected}:
+                    result_trends.refresh_series(cur, owner, sorted(
+                        test_name for pair_owner, test_name in affected if pair_owner == owner
+                    ))
+                if moved:
+                    result_trends.refresh_series(cur, patient_id, sorted({test_name for _, test_name in moved}))
+
+            original_date = next(report_date for chain_id, _, _, report_date in chain if chain_id == root_id)
+            self.add_lab_results(
+                cur, patient_id, {test_name: new for test_name, (_, new) in changes.items() if new is not None},
+                result_date=record['sample_date'] or str(original_date or _now())[:10],
+                source='completed_reports', report_id=new_id,
+                normal_ranges=normal_ranges, categories=categories, branch_id=branch_id,
+                age=record['patient_age'], gender=record['patient_gender'],
+            )
+            cur.execute(
+                "INSERT INTO import_sources (source_db, source_table, source_id, patient_id) VALUES (?, ?, ?, ?)",
+                (os.path.basename(self.db_path), 'completed_reports', new_id, patient_id),
+            )
+            analytics.compact(cur, normal_ranges, ranges=self.range_index)
+        return {'report_id': new_id, 'parent_report_id': root_id, 'version': latest + 1}
+
+    def bundle_reports(self, day, doctor=None, branch_id=None, limit=None):
+        """(report id, branch id) of the original reports issued on day, oldest first.
+
+        doctor matches the referring doctor ignoring case and surrounding spaces.
+        """
+        conditions = ["parent_report_id IS NULL", "COALESCE(date(report_date), date(sample_date)) = ?"]
+        params = [day]
+        if doctor:
+            conditions.append("LOWER(TRIM(doctor_name)) = LOWER(TRIM(?))")
+            params.append(doctor)
+        if branch_id is not None:
+            conditions.append("branch_id = ?")
+            params.append(branch_id)
+        sql = f"SELECT id, branch_id FROM completed_reports WHERE {' AND '.join(conditions)} ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # -- patient lookup ----------------------------------------------------------
+
+    def search_patients(self, query, limit=10):
+        """Prefix search for form autocomplete: digits match the mobile number,
+        anything else the name. Both are range scans on an index."""
+        query = str(query or '').strip()
+        digits = re.sub(r"\D", "", query)
+        if len(digits) >= 3 and len(digits) >= len(query.replace(' ', '')) - 1:
+            prefixes = {digits, f"{self.country_code}{digits}"}
+            where = " OR ".join("(p.mobile_normalized >= ? AND p.mobile_normalized < ?)" for _ in prefixes)
+            params = [bound for prefix in prefixes for bound in _prefix_range(prefix)]
+        else:
+            name = patient_index.normalize_name(query)
+            if len(name) < 2:
+                return []
+            where = "p.name_normalized >= ? AND p.name_normalized < ?"
+            params = list(_prefix_range(name))
+
+        with self.lock:
+            rows = self.conn.execute(f'''
+                SELECT p.id, p.patient_name, p.mobile, p.age, p.gender, p.doctor_name, p.opd_no, p.last_seen,
+                       (SELECT COUNT(*) FROM completed_reports r
+                        WHERE r.patient_id = p.id AND r.parent_report_id IS NULL) AS report_count
+                FROM patient_master p
+                WHERE {where}
+                ORDER BY p.last_seen DESC
+                LIMIT ?
+            ''', params + [int(limit)]).fetchall()
+        keys = ('id', 'name', 'mobile', 'age', 'gender', 'doctor', 'opd_no', 'last_seen', 'report_count')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def result_series(self, patient_id, test_names):
+        """Precomputed {test_name: points} for a report render (primary-key lookups only)"""
+        test_names = list(test_names)
+        if not test_names:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(f'''
+                SELECT test_name, points FROM result_series
+                WHERE patient_id = ? AND test_name IN ({", ".join("?" for _ in test_names)})
+            ''', [patient_id] + test_names).fetchall()
+        return {test_name: json.loads(points) for test_name, points in rows}
+
+    def patient_trends(self, patient_id, test_names=None, limit=None):
+        """Full per-test history from lab_results, oldest first, via idx_lab_results_trend"""
+        where, params = "patient_id = ? AND result_value IS NOT NULL AND result_value != ''", [patient_id]
+        if test_names:
+            where += f" AND test_name IN ({', '.join('?' for _ in test_names)})"
+            params += list(test_names)
+        with self.lock:
+            rows = self.conn.execute(f'''
+                SELECT test_name, result_value, result_date, report_id, normal_range
+                FROM lab_results WHERE {where}
+                ORDER BY test_name, result_date, id
+            ''', params).fetchall()
+        trends = {}
+        for test_name, value, result_date, report_id, normal_range in rows:
+            series = trends.setdefault(test_name, {'normal_range': None, 'points': []})
+            series['points'].append(result_trends.make_point(result_date, value, report_id))
+            series['normal_range'] = normal_range or series['normal_range']
+        if limit:
+            for series in trends.values():
+                series['points'] = series['points'][-limit:]
+        return trends
+
+    def analytics_summary(self, start=None, end=None, group="day", top=20):
+        """Dashboard numbers from the rollups, catching up on any rows written elsewhere"""
+        with self.transaction() as cur:
+            if analytics.pending(cur):
+                analytics.compact(cur, self.normal_ranges, ranges=self.range_index)
+        with self.lock:
+            return analytics.summary(self.conn, start, end, self.test_categories, group, top)
+
+    def record_qc_run(self, analyte, values, operator=None):
+        """Store a control run ({level: value}) and evaluate the Westgard rules"""
+        with self.transaction() as cur:
+            return qc.record_run(cur, analyte, values, operator)
+
+    def set_qc_target(self, analyte, level, mean, sd):
+        with self.transaction() as cur:
+            qc.set_target(cur, analyte, level, mean, sd)
+
+    def qc_status(self):
+        with self.lock:
+            return qc.status_summary(self.conn)
+
+    def qc_chart(self, analyte, level, limit=qc.QC_CHART_POINTS):
+        """(points, mean, sd) for a Levey-Jennings chart"""
+        with self.lock:
+            points = qc.chart_points(self.conn, analyte, level, limit)
+            limits = qc.control_limits(qc.load_state(self.conn, analyte, level))
+        mean, sd = limits or (None, None)
+        return points, mean, sd
+
+    def qc_blocked(self, test_names=None):
+        """Analytes whose latest control run failed; their reports are held"""
+        with self.lock:
+            return qc.blocked_analytes(self.conn, test_names)
+
+    def create_critical_alerts(self, alerts):
+        """Log alerts (dicts of critical_alerts columns) as queued; returns their ids"""
+        columns = ("ack_token", "patient_name", "patient_mobile", "opd_no", "doctor_name", "recipient",
+                   "test_name", "result_value", "reason", "branch_id", "created_at")
+        created_at = _now()
+        ids = []
+        with self.transaction() as cur:
+            for alert in alerts:
+                alert = dict(alert, branch_id=alert.get('branch_id') or MAIN_BRANCH_ID)
+                cur.execute(
+                    f"INSERT INTO critical_alerts ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    tuple(alert.get(column) for column in columns[:-1]) + (created_at,),
+                )
+                ids.append(cur.lastrowid)
+        return ids
+
+    def mark_critical_alert(self, alert_id, status, error=None, latency_ms=None):
+        with self.transaction() as cur:
+            cur.execute('''
+                UPDATE critical_alerts SET status = ?, error = ?, latency_ms = ?, sent_at = ?
+                WHERE id = ? AND status != 'acknowledged'
+            ''', (status, error, latency_ms, _now(), alert_id))
+
+    def acknowledge_critical_alert(self, alert_id=None, token=None, by=None):
+        """Record who acknowledged an alert; returns the alert or None if unknown"""
+        with self.transaction() as cur:
+            where, key = ("ack_token = ?", token) if token else ("id = ?", alert_id)
+            cur.execute(f'''
+                UPDATE critical_alerts SET status = 'acknowledged', acknowledged_at = ?, acknowledged_by = ?
+                WHERE {where} AND acknowledged_at IS NULL
+            ''', (_now(), _clean(by), key))
+            row = cur.execute(
+                f"SELECT id, patient_name, test_name, result_value, acknowledged_at, acknowledged_by "
+                f"FROM critical_alerts WHERE {where}", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "patient_name", "test_name", "result_value", "acknowledged_at", "acknowledged_by"), row))
+
+    def list_critical_alerts(self, status=None, limit=100, branch_id=None):
+        """Newest first; status 'open' means not yet acknowledged. branch_id None lists every branch."""
+        columns = ("id", "branch_id", "patient_name", "opd_no", "doctor_name", "recipient", "test_name",
+                   "result_value", "reason", "status", "error", "created_at", "sent_at", "latency_ms",
+                   "acknowledged_at", "acknowledged_by")
+        conditions, params = [], []
+        if status == "open":
+            conditions.append("status != 'acknowledged'")
+        elif status:
+            conditions.append("status = ?")
+            params.append(status)
+        if branch_id is not None:
+            conditions.append("branch_id = ?")
+            params.append(branch_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM critical_alerts {where} ORDER BY id DESC LIMIT ?",
+                params + [int(limit)],
+            ).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_patient(self, patient_id):
+        """Patient record plus its completed reports (newest first), or None"""
+        with self.lock:
+            row = self.conn.execute('''
+                SELECT id, patient_name, mobile, age, gender, doctor_name, opd_no, first_seen, last_seen
+                FROM patient_master WHERE id = ?
+            ''', (patient_id,)).fetchone()
+            if row is None:
+                return None
+            reports = self.conn.execute('''
+                SELECT id, opd_no, sample_date, report_date, pdf_path, whatsapp_status, sms_status,
+                       parent_report_id, version
+                FROM completed_reports WHERE patient_id = ?
+                ORDER BY report_date DESC
+            ''', (patient_id,)).fetchall()
+        patient = dict(zip(
+            ('id', 'name', 'mobile', 'age', 'gender', 'doctor', 'opd_no', 'first_seen', 'last_seen'), row
+        ))
+        report_keys = ('id', 'opd_no', 'sample_date', 'report_date', 'pdf_path', 'whatsapp_status', 'sms_status',
+                       'parent_report_id', 'version')
+        patient['reports'] = [dict(zip(report_keys, r)) for r in reports]
+        return patient
+
+    # -- branches ----------------------------------------------------------------------
+
+    def branch_generation(self):
+        """Bumped by triggers whenever a branch is added, changed or removed"""
+        with self.lock:
+            row = self.conn.execute("SELECT generation FROM branch_config_generation WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def list_branches(self):
+        columns = ("id", "code", "name", "address", "phone", "email", "report_email", "whatsapp_phone_number_id",
+                   "whatsapp_access_token", "fast2sms_api_key", "hosts", "catalog", "active", "updated_at")
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM branches ORDER BY id").fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def save_branch(self, values):
+        """Create a branch or update the given fields of an existing one (by code); returns its id"""
+        fields = [field for field in values if field != 'code']
+        with self.transaction() as cur:
+            row = cur.execute("SELECT id FROM branches WHERE code = ?", (values['code'],)).fetchone()
+            if row is None:
+                columns = ['code'] + fields
+                cur.execute(
+                    f"INSERT INTO branches ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [values[column] for column in columns],
+                )
+                return cur.lastrowid
+            cur.execute(
+                f"UPDATE branches SET {''.join(f'{field} = ?, ' for field in fields)}updated_at = ? WHERE id = ?",
+                [values[field] for field in fields] + [_now(), row[0]],
+            )
+            return row[0]
+
+    # -- test catalog ----------------------------------------------------------------
+
+    def catalog_version(self):
+        """Bumped by triggers whenever a category, test or range changes"""
+        with self.lock:
+            row = self.conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def load_catalog(self):
+        """(categories, tests, ranges) rows for a CatalogSnapshot"""
+        queries = (
+            ("SELECT id, name, display_order FROM catalog_categories",
+             ("id", "name", "display_order")),
+            ("SELECT id, name, category_id, unit, normal_range, display_order, active FROM catalog_tests",
+             ("id", "name", "category_id", "unit", "normal_range", "display_order", "active")),
+            ("SELECT test_id, sex, age_min, age_max, low, high, text FROM catalog_ranges ORDER BY id",
+             ("test_id", "sex", "age_min", "age_max", "low", "high", "text")),
+        )
+        with self.lock:
+            return tuple(
+                [dict(zip(columns, row)) for row in self.conn.execute(sql).fetchall()]
+                for sql, columns in queries
+            )
+
+    def save_catalog_category(self, name, display_order=None):
+        """Create a category or move an existing one; returns its id"""
+        with self.transaction() as cur:
+            return self._catalog_category(cur, name, display_order)
+
+    def _catalog_category(self, cur, name, display_order=None):
+        row = cur.execute("SELECT id, display_order FROM catalog_categories WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            if display_order is None:
+                display_order = cur.execute(
+                    "SELECT COALESCE(MAX(display_order), 0) + 1 FROM catalog_categories"
+                ).fetchone()[0]
+            cur.execute("INSERT INTO catalog_categories (name, display_order) VALUES (?, ?)", (name, display_order))
+            return cur.lastrowid
+        if display_order is not None and display_order != row[1]:
+            cur.execute("UPDATE catalog_categories SET display_order = ? WHERE id = ?", (display_order, row[0]))
+        return row[0]
+
+    def save_catalog_test(self, values, bands=None):
+        """Create a test or update the given fields of an existing one (by name).
+
+        bands, when given, replace the test's range bands. Returns the test id;
+        raises ValueError for a new test without a category.
+        """
+        with self.transaction() as cur:
+            row = cur.execute("SELECT id FROM catalog_tests WHERE name = ?", (values['name'],)).fetchone()
+            fields = {field: value for field, value in values.items() if field not in ('name', 'category')}
+            if values.get('category'):
+                fields['category_id'] = self._catalog_category(cur, values['category'])
+            if row is None:
+                if 'category_id' not in fields:
+                    raise ValueError("category is required for a new test")
+                if 'display_order' not in fields:
+                    fields['display_order'] = cur.execute(
+                        "SELECT COALESCE(MAX(display_order), 0) + 1 FROM catalog_tests WHERE category_id = ?",
+                        (fields['category_id'],),
+                    ).fetchone()[0]
+                columns = ['name'] + list(fields)
+                cur.execute(
+                    f"INSERT INTO catalog_tests ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [values['name']] + list(fields.values()),
+                )
+                test_id = cur.lastrowid
+            else:
+                test_id = row[0]
+                cur.execute(
+                    f"UPDATE catalog_tests SET {''.join(f'{field} = ?, ' for field in fields)}updated_at = ? WHERE id = ?",
+                    list(fields.values()) + [_now(), test_id],
+                )
+            if bands is not None:
+                cur.execute("DELETE FROM catalog_ranges WHERE test_id = ?", (test_id,))
+                cur.executemany('''
+                    INSERT INTO catalog_ranges (test_id, sex, age_min, age_max, low, high, text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [(test_id, band['sex'], band['age_min'], band['age_max'], band['low'], band['high'], band['text'])
+                      for band in bands])
+            return test_id
+
+    # -- form submissions (app.py, single_app.py) ----------------------------------
+
+    def insert_form_submission(self, patient_data, selected_tests):
+        """A patient form with the tests selected for it, before any results are entered"""
+        with self.transaction() as cur:
+            cur.execute('''
+                INSERT INTO form_submissions
+                (patient_name, patient_age, patient_gender, patient_mobile, doctor_name, opd_no, sample_date,
+                 selected_tests)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                patient_data.get('name'),
+                patient_data.get('age'),
+                patient_data.get('gender'),
+                patient_data.get('mobile'),
+                patient_data.get('doctor'),
+                patient_data.get('opd_no'),
+                patient_data.get('sample_date'),
+                json.dumps(selected_tests),
+            ))
+            return cur.lastrowid
+
+    # -- patient messages ----------------------------------------------------------
+
+    def insert_patient_message(self, data):
+        with self.transaction() as cur:
+            cur.execute('''
+                INSERT INTO patient_messages
+                (patient_name, patient_email, patient_mobile, subject, message, message_type, status, branch_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data.get('name'),
+                data.get('email'),
+                data.get('mobile'),
+                data.get('subject'),
+                data.get('message'),
+                data.get('message_type', 'general'),
+                'unread',
+                data.get('branch_id') or MAIN_BRANCH_ID,
+            ))
+            return cur.lastrowid
+
+    # -- quick results (render_app.py) ---------------------------------------------
+
+    def add_quick_result(self, name, test, result):
+        """A single name/test/result entry, as posted by render_app.py"""
+        with self.transaction() as cur:
+            patient_id = self.upsert_patient(cur, {'name': name})
+            self.add_lab_results(cur, patient_id, [(test, result, None, None)],
+                                 result_date=_now()[:10], source='render_app')
+            return patient_id
+
+    def list_quick_results(self):
+        with self.lock:
+            return self.conn.execute('''
+                SELECT r.id, p.patient_name, r.test_name, r.result_value
+                FROM lab_results r JOIN patient_master p ON p.id = r.patient_id
+                WHERE r.source = 'render_app'
+                ORDER BY r.id
+            ''').fetchall()
+
+
+def _prefix_range(prefix):
+    """[low, high) bounds matching every string that starts with prefix"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _clean(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _now():
+    from datetime import datetime
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
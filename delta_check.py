@@ -0,0 +1,148 @@
+"""Delta checks: compare a new result with the same patient's previous value.
+
+A result is flagged when it moved more than the analyte's threshold since
+the previous result inside the rule's time window, e.g. Creatinine up 50%
+(or 0.3 mg/dl) within 48 hours. The previous value comes from
+result_series, which the report render already reads for the sparklines,
+so a check is a dict lookup and a subtraction per result.
+
+Rules are {test_name: {"percent": p, "absolute": a, "hours": h}}. Any
+threshold may be left out; "hours" limits how old the previous value may
+be. DELTA_CHECK_RULES (JSON) overrides or extends DEFAULT_RULES, and
+DELTA_CHECK_DEFAULT_PERCENT applies a plain percentage rule to every other
+numeric test.
+
+Results are dated by the report's sample date, which has no time of day, so
+the window works in whole days: two dates one calendar day apart are 24
+hours apart. A 24 hour rule (TROP-T) therefore compares with results from
+the same or the previous calendar day, which may be up to 47 hours earlier
+in real time, and a 48 hour rule reaches two calendar days back. Only when
+both dates carry a time is the real interval used.
+"""
+import os
+import json
+from datetime import datetime
+
+import app_logging
+from result_trends import parse_numeric
+
+log = app_logging.get_logger("delta_check")
+
+DEFAULT_RULES = {
+    "Creatinine": {"percent": 50, "absolute": 0.3, "hours": 48},
+    "Urea": {"percent": 100, "hours": 72},
+    "Haemoglobin": {"absolute": 2.0, "hours": 72},
+    "Platelet Count": {"percent": 50, "hours": 72},
+    "Total leukocyte count": {"percent": 100, "hours": 72},
+    "S. Potassium": {"absolute": 1.0, "hours": 48},
+    "S. Sodium": {"absolute": 8, "hours": 48},
+    "S. Calcium": {"absolute": 1.5, "hours": 72},
+    "Bilirubin Total": {"percent": 100, "hours": 168},
+    "SGPT/ALT": {"percent": 200, "hours": 168},
+    "TROP-T": {"percent": 50, "hours": 24},
+}
+
+
+def load_rules():
+    rules = {name: dict(rule) for name, rule in DEFAULT_RULES.items()}
+    try:
+        overrides = json.loads(os.getenv("DELTA_CHECK_RULES", "") or "{}")
+    except ValueError:
+        log.warning("DELTA_CHECK_RULES is not valid JSON; using the default delta rules")
+        overrides = {}
+    for name, rule in overrides.items():
+        if rule:
+            rules[name] = dict(rule)
+        else:
+            rules.pop(name, None)
+    return rules
+
+
+RULES = load_rules()
+DEFAULT_PERCENT = float(os.getenv("DELTA_CHECK_DEFAULT_PERCENT", "0"))
+
+
+def _parse_time(value):
+    text = str(value or "").strip().replace("T", " ")
+    for fmt, width in (("%Y-%m-%d %H:%M:%S", 19), ("%Y-%m-%d %H:%M", 16), ("%Y-%m-%d", 10)):
+        try:
+            return datetime.strptime(text[:width], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def previous_point(points, result_date):
+    """Newest numeric point dated on or before result_date (points are date-sorted)"""
+    for point in reversed(points or []):
+        if point.get('value') is None:
+            continue
+        if result_date and point.get('date') and point['date'] > result_date:
+            continue
+        return point
+    return None
+
+
+def check(test_name, value, result_date, points, rules=None):
+    """Flag dict when value moved past the test's threshold, else None"""
+    rules = RULES if rules is None else rules
+    rule = rules.get(test_name)
+    if rule is None:
+        if not DEFAULT_PERCENT:
+            return None
+        rule = {"percent": DEFAULT_PERCENT}
+    current = parse_numeric(value)
+    if current is None:
+        return None
+    previous = previous_point(points, result_date)
+    if previous is None:
+        return None
+
+    hours = None
+    # Whole days when either date has no time of day (see the module docstring)
+    then, now = _parse_time(previous.get('date')), _parse_time(result_date)
+    if then and now:
+        hours = (now - then).total_seconds() / 3600
+    if rule.get("hours") is not None and (hours is None or hours > rule["hours"]):
+        return None
+
+    change = current - previous['value']
+    percent = change / abs(previous['value']) * 100 if previous['value'] else None
+    reasons = []
+    if rule.get("percent") is not None and percent is not None and abs(percent) >= rule["percent"]:
+        reasons.append(f"{rule['percent']:g}%")
+    if rule.get("absolute") is not None and abs(change) >= rule["absolute"]:
+        reasons.append(f"{rule['absolute']:g}")
+    if not reasons:
+        return None
+    return {
+        'test': test_name,
+        'current': current,
+        'previous': previous['value'],
+        'previous_text': previous.get('text'),
+        'previous_date': previous.get('date'),
+        'change': round(change, 4),
+        'percent': round(percent, 1) if percent is not None else None,
+        'hours': round(hours, 1) if hours is not None else None,
+        'threshold': " or ".join(reasons),
+    }
+
+
+def check_report(test_results, series, result_date, rules=None):
+    """{test_name: flag} for the results of one report; series is {test_name: points}"""
+    flags = {}
+    for test_name, value in test_results.items():
+        flag = check(test_name, value, result_date, series.get(test_name), rules)
+        if flag:
+            flags[test_name] = flag
+    return flags
+
+
+def describe(flag):
+    """Short text for the report and lab_results.delta_flag"""
+    if flag['percent'] is not None:
+        change = f"{flag['percent']:+g}%"
+    else:
+        change = f"{flag['change']:+g}"
+    since = f" ({flag['previous_date']})" if flag.get('previous_date') else ""
+    return f"{change} vs {flag['previous_text'] or flag['previous']}{since}"
@@ -0,0 +1,169 @@
+"""Calculated (derived) tests: Globulin, A/G Ratio, LDL, BUN, red cell indices.
+
+A derived test is an arithmetic expression over other tests, written with
+the catalog names in braces:
+
+    "A/G Ratio": {"formula": "{Albumin} / {Globulin}", "decimals": 2}
+
+Formulas are parsed once, checked against a small whitelist of syntax
+(numbers, + - * / **, comparisons, min/max/abs/round) and compiled into
+plain Python functions. They are then sorted so a derived test that uses
+another one (A/G Ratio uses Globulin) runs after it. A dependency cycle or
+a bad formula fails at import time, not on a patient's report.
+
+A value typed in by staff is always kept; only missing derived tests are
+filled in. DERIVED_TEST_FORMULAS (JSON) overrides or extends the defaults,
+and an entry set to null removes one.
+"""
+import os
+import re
+import ast
+import json
+from graphlib import TopologicalSorter, CycleError
+
+import app_logging
+from result_trends import parse_numeric
+
+log = app_logging.get_logger("derived_tests")
+
+DEFAULT_FORMULAS = {
+    "Globulin": {"formula": "{Total Protein} - {Albumin}", "decimals": 2},
+    "A/G Ratio": {"formula": "{Albumin} / {Globulin}", "decimals": 2},
+    # Friedewald; not valid once triglycerides reach 400 mg/dl
+    "LDL": {"formula": "{Cholesterol} - {HDL} - {Triglyceride} / 5", "when": "{Triglyceride} < 400", "decimals": 0},
+    "BUN": {"formula": "{Urea} / 2.14", "decimals": 1},
+    "Bilirubin (Unconjugated)": {"formula": "{Bilirubin Total} - {Bilirubin (Conjugated)}", "decimals": 2},
+    "MCV": {"formula": "{Haematocrit/PCV} * 10 / {RBC Count}", "decimals": 1},
+    "MCH": {"formula": "{Haemoglobin} * 10 / {RBC Count}", "decimals": 1},
+    "MCHC": {"formula": "{Haemoglobin} * 100 / {Haematocrit/PCV}", "decimals": 1},
+}
+
+_REFERENCE_RE = re.compile(r"\{([^{}]+)\}")
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.And, ast.Or,
+)
+_FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round}
+
+
+class Formula:
+    """One derived test compiled to a function of its input values"""
+
+    def __init__(self, name, formula, decimals=2, when=None):
+        self.name = name
+        self.formula = formula
+        self.decimals = int(decimals)
+        self.when = when
+        self.inputs = []
+        # Substitute both expressions first so the formula and guard share one argument list
+        sources = [self._substitute(formula)] + ([self._substitute(when)] if when else [])
+        functions = [self._compile(source) for source in sources]
+        self.func = functions[0]
+        self.guard = functions[1] if when else None
+
+    def _substitute(self, expression):
+        """'{A} - {B}' -> 'x0 - x1', recording A and B as inputs"""
+        def placeholder(match):
+            test_name = match.group(1).strip()
+            if test_name not in self.inputs:
+                self.inputs.append(test_name)
+            return f"x{self.inputs.index(test_name)}"
+
+        return _REFERENCE_RE.sub(placeholder, expression)
+
+    def _compile(self, source):
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"{self.name}: invalid formula {self.formula!r} ({e.msg})")
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"{self.name}: {type(node).__name__} is not allowed in {self.formula!r}")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS):
+                raise ValueError(f"{self.name}: only {', '.join(_FUNCTIONS)} may be called")
+            if isinstance(node, ast.Name) and node.id not in _FUNCTIONS and not re.fullmatch(r"x\d+", node.id):
+                raise ValueError(f"{self.name}: unknown name {node.id!r}; put test names in braces")
+        arguments = ", ".join(f"x{i}" for i in range(len(self.inputs)))
+        return eval(f"lambda {arguments}: ({source})", {"__builtins__": {}, **_FUNCTIONS})
+
+    def evaluate(self, values):
+        """Formatted result from {test_name: float}, or None when an input is missing"""
+        args = [values.get(name) for name in self.inputs]
+        if any(arg is None for arg in args):
+            return None
+        try:
+            if self.guard is not None and not self.guard(*args):
+                return None
+            result = self.func(*args)
+        except (ZeroDivisionError, OverflowError, ValueError, TypeError):
+            return None
+        return f"{result:.{self.decimals}f}"
+
+
+class FormulaEngine:
+    """Derived tests in dependency order"""
+
+    def __init__(self, definitions):
+        formulas = {
+            name: Formula(name, spec["formula"], spec.get("decimals", 2), spec.get("when"))
+            for name, spec in definitions.items()
+        }
+        graph = {name: [dep for dep in formula.inputs if dep in formulas] for name, formula in formulas.items()}
+        try:
+            order = list(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            raise ValueError(f"Derived tests depend on each other in a cycle: {' -> '.join(e.args[1])}")
+        self.formulas = [formulas[name] for name in order]
+        self.by_name = formulas
+
+    def inputs_for(self, test_name):
+        formula = self.by_name.get(test_name)
+        return list(formula.inputs) if formula else []
+
+    def apply(self, test_results, only=None):
+        """Fill in missing derived tests. Returns (results, names calculated).
+
+        only limits the derived tests considered (e.g. the tests selected for
+        this patient); None means every derived test whose inputs are present.
+        """
+        results = dict(test_results)
+        values = {}
+        for test_name, value in results.items():
+            number = parse_numeric(value)
+            if number is not None:
+                values[test_name] = number
+        calculated = []
+        for formula in self.formulas:
+            entered = results.get(formula.name)
+            if entered is not None and str(entered).strip():
+                continue
+            if only is not None and formula.name not in only:
+                continue
+            value = formula.evaluate(values)
+            if value is None:
+                continue
+            results[formula.name] = value
+            values[formula.name] = float(value)
+            calculated.append(formula.name)
+        return results, calculated
+
+
+def load_definitions():
+    definitions = {name: dict(spec) for name, spec in DEFAULT_FORMULAS.items()}
+    try:
+        overrides = json.loads(os.getenv("DERIVED_TEST_FORMULAS", "") or "{}")
+    except ValueError:
+        log.warning("DERIVED_TEST_FORMULAS is not valid JSON; using the default formulas")
+        overrides = {}
+    for name, spec in overrides.items():
+        if not spec:
+            definitions.pop(name, None)
+        elif isinstance(spec, str):
+            definitions[name] = {"formula": spec}
+        else:
+            definitions[name] = dict(spec)
+    return definitions
+
+
+ENGINE = FormulaEngine(load_definitions())
@@ -0,0 +1,80 @@
+"""Production gunicorn profile.
+
+    gunicorn -c gunicorn.conf.py hospital_system_final:app
+
+The app is preloaded in the master, so the report catalog and templates are
+built once and shared copy-on-write. post_fork then gives every worker its
+own SQLite connection, HTTP session, log listener and metrics snapshot.
+
+Environment:
+    PORT                       listen port (10000)
+    WEB_CONCURRENCY            worker processes (2 x CPUs + 1, capped at 8)
+    GUNICORN_WORKER_CLASS      gthread (default) or gevent
+    GUNICORN_THREADS           threads per gthread worker (8)
+    GUNICORN_TIMEOUT           seconds before a silent worker is killed (120)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds a worker gets to finish on restart (90)
+    GUNICORN_MAX_REQUESTS      recycle workers after this many requests (1000)
+"""
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# Most of a request is spent waiting on WhatsApp/Fast2SMS, so threads are cheap
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+
+# A PDF render plus the notification deadline (NOTIFY_DEADLINE_SECONDS) must
+# fit in the timeout; on restart, in-flight renders get graceful_timeout
+# to finish before the worker is killed.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "90"))
+keepalive = 5
+
+# WeasyPrint keeps font and image caches; recycle workers to bound memory
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+# /metrics merges per-worker snapshots from this directory. It has to be set
+# before the app is preloaded, so it is done here rather than in a hook.
+# An operator-supplied directory may hold other files, so only stale
+# snapshots are removed from it; the default one belongs to this file.
+_metrics_dir = os.getenv("METRICS_MULTIPROC_DIR", "").strip() or os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+if _metrics_dir:
+    os.makedirs(_metrics_dir, exist_ok=True)
+    for _entry in os.scandir(_metrics_dir):
+        if _entry.name.startswith("metrics_") and _entry.name.endswith(".json") and _entry.is_file():
+            try:
+                os.remove(_entry.path)
+            except OSError:
+                pass
+else:
+    _metrics_dir = os.path.join(tempfile.gettempdir(), f"pathology-metrics-{bind.rsplit(':', 1)[-1]}")
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+    os.environ["METRICS_MULTIPROC_DIR"] = _metrics_dir
+
+
+def post_fork(server, worker):
+    import app_logging
+    from metrics import registry
+
+    app_logging.restart_after_fork()
+    registry.reset_after_fork()
+
+    # Only present when the app was preloaded in the master
+    module = sys.modules.get("hospital_system_final")
+    form = getattr(module, "pathology_form", None)
+    if form is not None:
+        form.reopen_after_fork()
+
+
+def worker_exit(server, worker):
+    from metrics import registry
+
+    registry.flush()
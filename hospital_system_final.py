@@ -17,36 +17,52 @@ import time
 import re
 import requests
 from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import copy_current_request_context, has_request_context, g
 from flask import render_template_string
 import base64
+from html import escape
 import urllib.parse
 import subprocess
 import sys
 import platform
 import smtplib
+import app_logging
+# Before the modules below, which log while reading their configuration
+app_logging.configure_logging()
+from metrics import registry as metrics
+from datastore import PathologyStore, normalize_mobile, MAIN_BRANCH_ID
+import result_trends
+import cohort
+import qc
+import delta_check
+import derived_tests
+import critical_values
+import branches
+import catalog
+import report_bundle
+import pdf_optimize
+import pdf_engines
+import secrets
+from notify_queue import PriorityExecutor, CRITICAL
+from app_logging import traced
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DATA_DIR = os.getenv("DATA_DIR", BASE_DIR)
 
-# PDF generation libraries (optional)
-try:
-    import pdfkit
-    PDFKIT_AVAILABLE = True
-except ImportError:
-    PDFKIT_AVAILABLE = False
-    print("pdfkit not available. Using HTML reports.")
-
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except Exception as e:
-    WEASYPRINT_AVAILABLE = False
-    print(f"weasyprint not available ({e}). Using HTML reports.")
+log = app_logging.get_logger("app")
 
 TkBase = tk.Tk if TK_AVAILABLE else object
 
+# Submission patient_data keys -> completed_reports columns
+REPORT_PATIENT_FIELDS = {
+    'name': 'patient_name', 'age': 'patient_age', 'gender': 'patient_gender', 'mobile': 'patient_mobile',
+    'doctor': 'doctor_name', 'opd_no': 'opd_no', 'sample_date': 'sample_date',
+}
+
 class PathologyTestsForm(TkBase):
     def __init__(self, enable_gui=True, auto_start_server=True):
         self.enable_gui = enable_gui and TK_AVAILABLE
@@ -54,7 +70,6 @@ class PathologyTestsForm(TkBase):
 
         if self.enable_gui:
             super().__init__()
-            self.title("UJJIVAN Hospital Pathology System")
             self.geometry("600x450")
             self.configure(bg="#f0e1c6")
         
@@ -64,6 +79,11 @@ class PathologyTestsForm(TkBase):
         self.temp_dir = os.path.join(self.data_dir, 'reports', 'temp')
         self.db_path = os.path.join(self.data_dir, 'pathology_reports.db')
 
+        # Letterhead logos, downscaled once to their printed size (see pdf_optimize.py)
+        self.report_assets = pdf_optimize.AssetCache(self.root_dir, os.path.join(self.data_dir, 'reports', 'assets'))
+        # Detected once; subprocess engines keep their workers between reports
+        self.pdf_engines = pdf_engines.EngineRegistry()
+
         # Create necessary directories
         os.makedirs(self.reports_dir, exist_ok=True)
         os.makedirs(self.temp_dir, exist_ok=True)
@@ -79,8 +99,6 @@ class PathologyTestsForm(TkBase):
         self.whatsapp_api_url = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v17.0/").strip()
         if not self.whatsapp_api_url.endswith("/"):
             self.whatsapp_api_url += "/"
-        self.whatsapp_phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "").strip()
-        self.whatsapp_access_token = os.getenv("WHATSAPP_ACCESS_TOKEN", "").strip()
         self.whatsapp_default_country_code = re.sub(
             r"\D", "", os.getenv("WHATSAPP_DEFAULT_COUNTRY_CODE", "91")
         ) or "91"
@@ -98,10 +116,7 @@ class PathologyTestsForm(TkBase):
             "yes",
             "on",
         )
-        self.fast2sms_api_key = os.getenv(
-            "FAST2SMS_API_KEY",
-            "h78RGZEINSaQV2wyvWu3cdfzBqYMtH5lTOsr4ejA0bCPxJ19XkkIftcr0isUQ54Co3hqxaG7zTFSlVRw",
-        ).strip()
+        self.fast2sms_api_url = os.getenv("FAST2SMS_API_URL", "https://www.fast2sms.com/dev/bulkV2").strip()
         self.fast2sms_route = os.getenv("FAST2SMS_ROUTE", "q").strip()
         self.fast2sms_language = os.getenv("FAST2SMS_LANGUAGE", "english").strip()
         self.fast2sms_send_always = os.getenv("FAST2SMS_SEND_ALWAYS", "true").strip().lower() in (
@@ -111,125 +126,95 @@ class PathologyTestsForm(TkBase):
             "on",
         )
         
-        # Hospital Contact Configuration
-        self.hospital_phone = os.getenv("HOSPITAL_PHONE", "0120-1234567").strip()
-        self.hospital_email = os.getenv("HOSPITAL_EMAIL", "support@ujjivanhospital.com").strip()
-        
-        # Test normal ranges dictionary
-        self.normal_ranges = {
-            "Glucose (F)/RI": "70-110 mg/dl",
-            "Post Prandial / after 2 Hrs": "Up to 140 mg/dl",
-            "HbA1c": "4.5-6.5 %",
-            "Urea": "10-40 mg/dl",
-            "Creatinine": "0.6-1.4 mg/dl",
-            "S. Uric Acid": "2.8-7.0 mg/dl",
-            "BUN": "5-20 mg/dl",
-            "Cholesterol": "150-200 mg/dl",
-            "Triglyceride": "0-170 mg/dl",
-            "HDL": "30-96 (F)/30-70 (M) mg/dl",
-            "LDL": "<100 mg/dl",
-            "Bilirubin Total": "0.1-1.2 mg/dl",
-            "Bilirubin (Conjugated)": "0.0-0.3 mg/dl",
-            "Bilirubin (Unconjugated)": "0.1-1.0 mg/dl",
-            "SGOT/AST": "0-35 U/L",
-            "SGPT/ALT": "0-40 U/L",
-            "Alk. Phosphatase": "175-575 U/L",
-            "Total Protein": "6.5-8.0 gm/dl",
-            "Albumin": "3.5-5.0 gm/dl",
-            "Globulin": "2.3-3.5 gm/dl",
-            "A/G Ratio": "1.0-2.5",
-            "GGT": "8-60 U/L",
-            "S. Calcium": "8.8-11.0 mg/dl",
-            "S. Sodium": "138-148 meq/l",
-            "S. Potassium": "3.8-4.8 meq/l",
-            "Urine Protein (24 Hrs)": "24-120 mg/24 Hrs",
-            "Urine micro protein (albumin)": "28-150 mg/24 Hrs",
-            "CK-MB": "0-24 U/L",
-            "S. Phosphorous": "2.7-4.5 mg/dl",
-            "S. Amylase": "0-110 U/L",
-            "TROP-T": "Negative",
-            "Haemoglobin": "14-18 gm% (M)/12-15 gm% (F)",
-            "Total leukocyte count": "4000-10,000/cu mm",
-            "Differential WBC count - Polymorphs": "40-75%",
-            "Differential WBC count - Lymphocytes": "20-45%",
-            "Differential WBC count - Eosinophils": "1-6%",
-            "Differential WBC count - Monocytes": "0-10%",
-            "Differential WBC count - Basophiles": "0-1%",
-            "AEC": "40-500 No/cu mm",
-            "E.S.R. (Westergren)": "0-12 mm (F), 0-10 mm (M)",
-            "Platelet Count": "1.5-4.5 lac/cu mm",
-            "RBC Count": "F=3.5-5.0, M=4.2-5.5 million/cu mm",
-            "Reticulocyte count": "2-5% of RBC",
-            "Haematocrit/PCV": "M=39-49%, F=33-43%",
-            "MCV": "76-100 fl",
-            "MCH": "29.5 ± 2.5 pg",
-            "MCHC": "32.5 ± 2.5 gm/dl",
-            "Malaria Parasite": "Negative",
-            "BLOOD GROUP": "Rh = Positive/Negative",
-            "Bleeding Time": "2-7 Min.",
-            "Clotting Time": "6 Min.",
-            "Prothrombin Time": "10-14 Sec.",
-            "PERIPHERAL BLOOD SMEAR - RBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - WBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - PLATELET": "Adequate",
-            "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE": "Negative",
-            "HbsAg": "Negative",
-            "HIV (1+2)": "Negative",
-            "HCV": "Negative",
-            "VDRL": "Non-reactive",
-            "ASO Titer": "<200 IU/ml",
-            "R.A. factor": "<20 IU/ml",
-            "CRP": "<6 mg/L",
-            "Gravindex (PREGNANCY)": "Negative",
-            "WIDAL TEST - S. Typhi, 'O'": "Negative (<1:80)",
-            "WIDAL TEST - S. Typhi, 'H'": "Negative (<1:160)",
-            "WIDAL TEST - S. Paratyphi, 'AH'": "Negative (<1:80)",
-            "WIDAL TEST - S. Paratyphi, 'BH'": "Negative (<1:80)",
-            "Dengue NS1": "Negative",
-            "Typhi Dot": "Negative"
+        # Letterhead, contacts and messaging credentials of the main branch.
+        # Other collection centres override them from the branches table (branches.py).
+        self.branch_defaults = {
+            'name': os.getenv("HOSPITAL_NAME", "UJJIVAN Hospital").strip(),
+            'address': os.getenv("HOSPITAL_ADDRESS", "Vidyut Nagar, Gautam Budh Nagar, Uttar Pradesh - 201008").strip(),
+            'phone': os.getenv("HOSPITAL_PHONE", "0120-1234567").strip(),
+            'email': os.getenv("HOSPITAL_EMAIL", "support@ujjivanhospital.com").strip(),
+            'report_email': os.getenv("HOSPITAL_REPORT_EMAIL", "pathology@ujjivanhospital.com").strip(),
+            'whatsapp_phone_number_id': os.getenv("WHATSAPP_PHONE_NUMBER_ID", "").strip(),
+            'whatsapp_access_token': os.getenv("WHATSAPP_ACCESS_TOKEN", "").strip(),
+            'fast2sms_api_key': os.getenv(
+                "FAST2SMS_API_KEY",
+                "h78RGZEINSaQV2wyvWu3cdfzBqYMtH5lTOsr4ejA0bCPxJ19XkkIftcr0isUQ54Co3hqxaG7zTFSlVRw",
+            ).strip(),
         }
+
+        # Trend sparklines next to each result in the report (previous values)
+        self.report_trends_enabled = os.getenv("REPORT_TREND_SPARKLINES", "true").strip().lower() in (
+            "1",
+            "true",
+            "yes",
+            "on",
+        )
+        self.report_trend_points = max(2, int(os.getenv("REPORT_TREND_POINTS", "6")))
+
+        # Calculated tests (Globulin, A/G Ratio, LDL, ...) left blank are filled in
+        self.derived_tests_enabled = os.getenv("DERIVED_TESTS", "true").strip().lower() in (
+            "1",
+            "true",
+            "yes",
+            "on",
+        )
+        self.derived_tests = derived_tests.ENGINE
+
+        # Delta checks against the patient's previous result (see delta_check.py)
+        self.delta_checks_enabled = os.getenv("DELTA_CHECKS", "true").strip().lower() in (
+            "1",
+            "true",
+            "yes",
+            "on",
+        )
+
+        # Hold reports whose analytes failed their latest control run (see qc.py)
+        self.qc_block_release = os.getenv("QC_BLOCK_RELEASE", "true").strip().lower() in (
+            "1",
+            "true",
+            "yes",
+            "on",
+        )
+
+        # Bulk submission configuration (/submit-reports)
+        self.batch_max_items = int(os.getenv("BATCH_SUBMIT_MAX_ITEMS", "1000"))
+        self.batch_workers = max(1, int(os.getenv("BATCH_RENDER_WORKERS", str(min(8, (os.cpu_count() or 1) * 2)))))
+
+        # Notification dispatch: WhatsApp and SMS run side by side on a shared
+        # pool and must both finish within one deadline per report
+        self.notify_deadline = float(os.getenv("NOTIFY_DEADLINE_SECONDS", "30"))
+        self.notify_workers = max(2, int(os.getenv("NOTIFY_WORKERS", "16")))
+        self.notify_critical_workers = max(0, int(os.getenv("NOTIFY_CRITICAL_WORKERS", "2")))
+        self.notify_executor = self.create_notify_executor()
+
+        # Critical (panic) values go straight to the referring doctor, ahead of
+        # routine notifications (see critical_values.py)
+        self.critical_alerts_enabled = os.getenv("CRITICAL_ALERTS", "true").strip().lower() in (
+            "1",
+            "true",
+            "yes",
+            "on",
+        )
+        self.critical_alert_mobile = os.getenv("CRITICAL_ALERT_MOBILE", "").strip()
+
+        # Branch and catalog changes need "Authorization: Bearer <ADMIN_API_TOKEN>";
+        # without a token they are refused
+        self.admin_api_token = os.getenv("ADMIN_API_TOKEN", "").strip()
+        # Patient records need a staff token: STAFF_API_TOKENS="asha:<token>,ravi:<token>".
+        # The name is recorded as who acted; the admin token is accepted too.
+        self.staff_api_tokens = {}
+        for item in os.getenv("STAFF_API_TOKENS", "").split(","):
+            name, _, token = item.partition(":")
+            if name.strip() and token.strip():
+                self.staff_api_tokens[name.strip()] = token.strip()
+
+        # Keep-alive connections to the WhatsApp/Fast2SMS APIs
+        self.http_session = self.create_http_session()
         
-        # Pathology tests data
-        self.tests = {
-            "BIOCHEMISTRY": [
-                "Glucose (F)/RI", "Post Prandial / after 2 Hrs", "HbA1c"
-            ],
-            "RENAL FUNCTION": [
-                "Urea", "Creatinine", "S. Uric Acid", "BUN"
-            ],
-            "LIPID PROFILE": [
-                "Cholesterol", "Triglyceride", "HDL", "LDL"
-            ],
-            "LIVER FUNCTION": [
-                "Bilirubin Total", "Bilirubin (Conjugated)", "Bilirubin (Unconjugated)", 
-                "SGOT/AST", "SGPT/ALT", "Alk. Phosphatase", "Total Protein", 
-                "Albumin", "Globulin", "A/G Ratio", "GGT"
-            ],
-            "ELECTROLYTES": [
-                "S. Calcium", "S. Sodium", "S. Potassium"
-            ],
-            "OTHER TESTS": [
-                "Urine Protein (24 Hrs)", "Urine micro protein (albumin)", 
-                "CK-MB", "S. Phosphorous", "S. Amylase", "TROP-T"
-            ],
-            "HAEMATOLOGY": [
-                "Haemoglobin", "Total leukocyte count", "Differential WBC count - Polymorphs",
-                "Differential WBC count - Lymphocytes", "Differential WBC count - Eosinophils",
-                "Differential WBC count - Monocytes", "Differential WBC count - Basophiles",
-                "AEC", "E.S.R. (Westergren)", "Platelet Count", "RBC Count", 
-                "Reticulocyte count", "Haematocrit/PCV", "MCV", "MCH", "MCHC",
-                "Malaria Parasite", "BLOOD GROUP", "Bleeding Time", "Clotting Time",
-                "Prothrombin Time", "PERIPHERAL BLOOD SMEAR - RBC", 
-                "PERIPHERAL BLOOD SMEAR - WBC", "PERIPHERAL BLOOD SMEAR - PLATELET",
-                "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE"
-            ],
-            "SEROLOGY": [
-                "HbsAg", "HIV (1+2)", "HCV", "VDRL", "ASO Titer", "R.A. factor", 
-                "CRP", "Gravindex (PREGNANCY)", "WIDAL TEST - S. Typhi, 'O'",
-                "WIDAL TEST - S. Typhi, 'H'", "WIDAL TEST - S. Paratyphi, 'AH'",
-                "WIDAL TEST - S. Paratyphi, 'BH'", "Dengue NS1", "Typhi Dot"
-            ]
-        }
+        # Test catalog (categories, tests, units, ranges) from the database (catalog.py)
+        self.catalog = catalog.CatalogRegistry(self.store)
+        self.catalog.snapshot()
+        self.branch_registry = branches.BranchRegistry(self.store, self.branch_defaults)
         # Start Flask server
         self.flask_app = Flask(__name__)
         self.setup_flask_routes()
@@ -243,8 +228,10 @@ class PathologyTestsForm(TkBase):
         
     def setup_gui(self):
         """Setup the main GUI window"""
+        branch = self.current_branch()
+        self.title(f"{branch.name} Pathology System")
         # Main title
-        title_label = tk.Label(self, text=" UJJIVAN HOSPITAL", 
+        title_label = tk.Label(self, text=f" {branch.name.upper()}", 
                               font=("Arial", 24, "bold"), bg="#f0e1c6", fg="#003366")
         title_label.pack(pady=(20,5))
         
@@ -252,7 +239,7 @@ class PathologyTestsForm(TkBase):
                                  font=("Arial", 16), bg="#f0e1c6", fg="#003366")
         subtitle_label.pack(pady=(0,5))
         
-        address_label = tk.Label(self, text="Vidyut Nagar, Gautam Budh Nagar, Uttar Pradesh - 201008", 
+        address_label = tk.Label(self, text=branch.address, 
                                 font=("Arial", 10), bg="#f0e1c6")
         address_label.pack(pady=(0,20))
         
@@ -314,88 +301,118 @@ class PathologyTestsForm(TkBase):
             messagebox.showerror("Error", "Reports folder not found!")
 
     def init_database(self):
-        """Initialize SQLite database for storing reports and messages"""
+        """Open the unified database and apply any pending schema migrations"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.cursor = self.conn.cursor()
-            
-            # Create table for form submissions
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS form_submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    selected_tests TEXT,
-                    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create table for completed reports
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS completed_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    test_results TEXT,
-                    pdf_path TEXT,
-                    whatsapp_status TEXT,
-                    whatsapp_error TEXT,
-                    sms_status TEXT DEFAULT 'not_attempted',
-                    sms_error TEXT,
-                    report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Add SMS columns for existing databases created before SMS integration.
-            self.cursor.execute("PRAGMA table_info(completed_reports)")
-            existing_columns = {col[1] for col in self.cursor.fetchall()}
-            if "test_results" not in existing_columns:
-                self.cursor.execute("ALTER TABLE completed_reports ADD COLUMN test_results TEXT")
-            if "pdf_path" not in existing_columns:
-                self.cursor.execute("ALTER TABLE completed_reports ADD COLUMN pdf_path TEXT")
-            if "whatsapp_status" not in existing_columns:
-                self.cursor.execute("ALTER TABLE completed_reports ADD COLUMN whatsapp_status TEXT")
-            if "whatsapp_error" not in existing_columns:
-                self.cursor.execute("ALTER TABLE completed_reports ADD COLUMN whatsapp_error TEXT")
-            if "sms_status" not in existing_columns:
-                self.cursor.execute(
-                    "ALTER TABLE completed_reports ADD COLUMN sms_status TEXT DEFAULT 'not_attempted'"
-                )
-            if "sms_error" not in existing_columns:
-                self.cursor.execute("ALTER TABLE completed_reports ADD COLUMN sms_error TEXT")
-            
-            # Create table for patient messages
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS patient_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_email TEXT,
-                    patient_mobile TEXT,
-                    subject TEXT,
-                    message TEXT,
-                    message_type TEXT,
-                    status TEXT DEFAULT 'unread',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    replied_at TIMESTAMP,
-                    reply_message TEXT
-                )
-            ''')
+            self.store = PathologyStore(self.db_path)
+            self.cohort_cache = cohort.ResultCache(self.store)
+            if self.store.applied_migrations:
+                log.info("Applied database migrations", extra={'migrations': self.store.applied_migrations})
+            log.info("Database initialized", extra={'db_path': self.db_path})
             
-            self.conn.commit()
-            print("Database initialized successfully")
-            
-        except Exception as e:
-            print(f"Error initializing database: {e}")
+        except Exception:
+            log.exception("Error initializing database")
+
+    def create_http_session(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.notify_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def reopen_after_fork(self):
+        """Give a forked worker its own SQLite connection, HTTP session and threads.
+
+        With gunicorn --preload this object is built in the master process;
+        a SQLite connection or pooled socket must never be used by two
+        processes, and thread pools do not survive fork().
+        """
+        self.store.reopen()
+        self.cohort_cache = cohort.ResultCache(self.store)
+        self.catalog = catalog.CatalogRegistry(self.store)
+        self.branch_registry = branches.BranchRegistry(self.store, self.branch_defaults)
+        self.http_session = self.create_http_session()
+        self.notify_executor = self.create_notify_executor()
+
+    def create_notify_executor(self):
+        """Notification pool: critical alerts first, with reserved workers of their own"""
+        return PriorityExecutor(
+            max_workers=self.notify_workers, reserved=self.notify_critical_workers, thread_name_prefix="notify"
+        )
+
+    def current_branch(self):
+        """Branch of the request being handled; the main branch outside a request (GUI, background jobs)"""
+        branch = branches.current()
+        if branch is not None:
+            return branch
+        registry = getattr(self, 'branch_registry', None)
+        return registry.default() if registry is not None else branches.Branch(self.branch_defaults)
+
+    def branch_id(self):
+        return self.current_branch().id or MAIN_BRANCH_ID
+
+    def resolve_request_branch(self, headers, query_branch=None, host=None):
+        """(branch, explicit) for a request; branch is None for an unknown branch code"""
+        return self.branch_registry.resolve(
+            code=(headers.get('X-Branch') or query_branch or '').strip(),
+            host=host or headers.get('Host'),
+        )
+
+    # The current catalog snapshot; swapped atomically when the catalog tables change
+    @property
+    def tests(self):
+        return self.catalog.snapshot().tests
+
+    @property
+    def normal_ranges(self):
+        return self.catalog.snapshot().normal_ranges
+
+    @property
+    def test_category_by_name(self):
+        return self.catalog.snapshot().category_by_name
+
+    def reference_ranges(self, patient_data, test_names):
+        """{test: (range text, band)} for the patient's age and sex.
+
+        band (catalog.RangeIndex) drives the H/L flag; a branch's own range
+        text overrides the catalog bands.
+        """
+        ranges = self.catalog.snapshot().ranges
+        normal_ranges = self.normal_ranges
+        branch_ranges = self.current_branch().catalog['normal_ranges']
+        sex = catalog.parse_sex(patient_data.get('gender'))
+        age = catalog.parse_age(patient_data.get('age'))
+        resolved = {}
+        for test_name in test_names:
+            if test_name in branch_ranges:
+                text = branch_ranges[test_name]
+                bounds = catalog.parse_range(text)
+                band = {'low': bounds[0], 'high': bounds[1], 'text': text} if bounds else None
+            else:
+                band = ranges.resolve(test_name, sex, age)
+                text = band['text'] if band else normal_ranges.get(test_name, "Not specified")
+            resolved[test_name] = (text, band)
+        return resolved
+
+    # Contacts and credentials follow the branch of the current request
+    @property
+    def hospital_phone(self):
+        return self.current_branch().phone
+
+    @property
+    def hospital_email(self):
+        return self.current_branch().email
+
+    @property
+    def whatsapp_phone_number_id(self):
+        return self.current_branch().whatsapp_phone_number_id
+
+    @property
+    def whatsapp_access_token(self):
+        return self.current_branch().whatsapp_access_token
+
+    @property
+    def fast2sms_api_key(self):
+        return self.current_branch().fast2sms_api_key
 
     def setup_flask_routes(self):
         """Setup Flask routes for handling form submissions and file serving"""
@@ -428,6 +445,7 @@ class PathologyTestsForm(TkBase):
                 return f"Error: {str(e)}", 400
 
         @self.flask_app.route('/submit-report', methods=['POST'])
+        @traced("submit_report")
         def submit_report():
             """Handle report submission with WhatsApp integration"""
             try:
@@ -446,110 +464,74 @@ class PathologyTestsForm(TkBase):
                     }), 400
                     
                 patient_data = data.get('patient_data', {})
-                test_results = data.get('test_results', {})
-                
-                print(f"Received submission for: {patient_data.get('name', 'Unknown')}")
-                print(f"Mobile Number: {patient_data.get('mobile', 'Not provided')}")
-                print(f"Test results received: {len(test_results)} tests")
-                
-                # Validate required fields
-                required_fields = ['name', 'age', 'gender', 'mobile']
-                for field in required_fields:
-                    if not patient_data.get(field):
-                        return jsonify({
-                            'success': False,
-                            'message': f'Missing required field: {field}'
-                        }), 400
-                
-                # Generate report files
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                patient_name_clean = patient_data.get('name', 'Unknown').replace(' ', '_').replace('/', '_').replace('\\', '_')
                 
-                # Generate HTML report
-                html_content = self.generate_pdf_html(patient_data, test_results)
-                html_filename = f"Pathology_Report_{patient_name_clean}_{timestamp}.html"
-                html_filepath = os.path.join(self.reports_dir, html_filename)
-                
-                with open(html_filepath, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
+                log.info("Report submission received", extra={
+                    'patient_name': patient_data.get('name') if isinstance(patient_data, dict) else None,
+                    'mobile': patient_data.get('mobile') if isinstance(patient_data, dict) else None,
+                    'test_count': len(data.get('test_results') or {}),
+                })
                 
-                # Try to generate PDF if possible
-                pdf_generated = False
+                # Derived tests, validation, QC hold and critical-value alerts
                 base_url = self.get_public_base_url()
-                pdf_url = f"{base_url}/view-report/{urllib.parse.quote(html_filename)}"
-                
-                if PDFKIT_AVAILABLE or WEASYPRINT_AVAILABLE:
-                    pdf_filename = f"Pathology_Report_{patient_name_clean}_{timestamp}.pdf"
-                    pdf_filepath = os.path.join(self.reports_dir, pdf_filename)
+                test_results, extras, error = self.prepare_report_submission(data, base_url)
+                if error:
+                    status, body = error
+                    return jsonify(body), status
+
+                metrics.add_gauge("report_queue_depth", 1)
+                try:
+                    # Generate report files (HTML, plus PDF when an engine is available)
+                    rendered = self.render_report_files(patient_data, test_results, base_url)
+                    pdf_url = rendered['pdf_url']
+
+                    # Send WhatsApp message and SMS with report link
+                    delivery = self.deliver_report_notifications(patient_data, pdf_url)
+                finally:
+                    metrics.add_gauge("report_queue_depth", -1)
+                response = self.finalize_report_submission(patient_data, test_results, rendered, delivery)
+                response.update(extras)
+                return jsonify(response)
                     
-                    if self.generate_pdf(html_content, pdf_filepath):
-                        pdf_generated = True
-                        pdf_url = f"{base_url}/view-report/{urllib.parse.quote(pdf_filename)}"
-                        print(f"PDF saved to: {pdf_filepath}")
-                
-                # Send WhatsApp message with report link
-                whatsapp_success, whatsapp_message = self.send_whatsapp_message(
-                    patient_data.get('mobile', ''), 
-                    patient_data,
-                    pdf_url
-                )
-                whatsapp_manual_url = None
-                manual_mobile, manual_mobile_error = self.validate_mobile_number(patient_data.get('mobile', ''))
-                if not manual_mobile_error:
-                    whatsapp_manual_url = self.build_whatsapp_web_url(
-                        manual_mobile,
-                        self.create_whatsapp_message(patient_data, pdf_url),
-                    )
+            except Exception as e:
+                log.exception("Error in form submission")
+                return jsonify({
+                    'success': False,
+                    'message': f'Server Error: {str(e)}'
+                }), 500
 
-                # Send SMS (always by default, or only when WhatsApp fails if FAST2SMS_SEND_ALWAYS=false)
-                sms_success = None
-                sms_message = "SMS not attempted."
-                should_send_sms = self.fast2sms_enabled and (self.fast2sms_send_always or not whatsapp_success)
-                if should_send_sms:
-                    sms_success, sms_message = self.send_sms_via_fast2sms(
-                        patient_data.get('mobile', ''),
-                        self.create_sms_message(patient_data, pdf_url)
-                    )
+        @self.flask_app.route('/submit-reports', methods=['POST'])
+        @traced("submit_reports")
+        def submit_reports():
+            """Handle bulk report submission (JSON array or NDJSON stream)"""
+            try:
+                submissions, parse_error = self.parse_batch_submissions()
+                if parse_error:
+                    return jsonify({
+                        'success': False,
+                        'message': parse_error
+                    }), 400
 
-                delivery_success = bool(whatsapp_success) or bool(sms_success)
-                delivery_status = "sent" if delivery_success else "failed"
-                response_message = (
-                    "Report submitted and notification sent successfully!"
-                    if delivery_success
-                    else "Report submitted, but message delivery failed."
-                )
-                
-                # Store in database
-                report_path = pdf_filepath if pdf_generated else html_filepath
-                db_success = self.store_completed_report(
-                    patient_data, 
-                    test_results, 
-                    report_path, 
-                    whatsapp_success, 
-                    whatsapp_message,
-                    sms_success,
-                    sms_message
-                )
-                
+                if len(submissions) > self.batch_max_items:
+                    return jsonify({
+                        'success': False,
+                        'message': f'Batch too large: {len(submissions)} items (max {self.batch_max_items})'
+                    }), 413
+
+                notify = request.args.get('notify', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+                results = self.process_report_batch(submissions, self.get_public_base_url(), notify=notify)
+
+                accepted = sum(1 for item in results if item['status'] == 'stored')
                 return jsonify({
-                    'success': True,
-                    'message': response_message,
-                    'delivery_status': delivery_status,
-                    'delivery_success': delivery_success,
-                    'whatsapp_status': 'sent' if whatsapp_success else 'failed',
-                    'whatsapp_message': whatsapp_message,
-                    'whatsapp_manual_url': whatsapp_manual_url,
-                    'sms_status': 'not_attempted' if sms_success is None else ('sent' if sms_success else 'failed'),
-                    'sms_message': sms_message,
-                    'pdf_path': report_path,
-                    'pdf_url': pdf_url,
-                    'report_type': 'pdf' if pdf_generated else 'html'
-                })
-                    
+                    'success': accepted > 0,
+                    'message': f'{accepted} of {len(results)} reports stored',
+                    'total': len(results),
+                    'stored': accepted,
+                    'failed': len(results) - accepted,
+                    'results': results
+                }), 200 if accepted else 422
+
             except Exception as e:
-                print(f"Error in form submission: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("Error in batch submission")
                 return jsonify({
                     'success': False,
                     'message': f'Server Error: {str(e)}'
@@ -614,24 +596,11 @@ class PathologyTestsForm(TkBase):
                 
                 # Store message in database
                 try:
-                    self.cursor.execute('''
-                        INSERT INTO patient_messages 
-                        (patient_name, patient_email, patient_mobile, subject, message, message_type, status)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        data.get('name'),
-                        data.get('email'),
-                        data.get('mobile'),
-                        data.get('subject'),
-                        data.get('message'),
-                        data.get('message_type', 'general'),
-                        'unread'
-                    ))
-                    self.conn.commit()
-                    message_id = self.cursor.lastrowid
-                    print(f"Patient message stored: ID {message_id}")
+                    with metrics.timer("db_write_seconds", operation="insert_message"):
+                        message_id = self.store.insert_patient_message(dict(data, branch_id=self.branch_id()))
+                    log.info("Patient message stored", extra={'message_id': message_id})
                 except Exception as db_error:
-                    print(f"Database error: {db_error}")
+                    log.error("Database error storing patient message: %s", db_error)
                     return jsonify({
                         'success': False,
                         'message': 'Failed to store message'
@@ -644,29 +613,405 @@ class PathologyTestsForm(TkBase):
                 })
                 
             except Exception as e:
-                print(f"Error in message submission: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("Error in message submission")
                 return jsonify({
                     'success': False,
                     'message': f'Server Error: {str(e)}'
                 }), 500
 
+        @self.flask_app.route('/metrics')
+        def metrics_endpoint():
+            """Prometheus scrape endpoint (merged across workers)"""
+            return Response(
+                metrics.render(extra_gauges={'db_size_bytes': self.get_database_size()}),
+                mimetype='text/plain; version=0.0.4; charset=utf-8'
+            )
+
+        @self.flask_app.route('/api/pdf-engines')
+        def pdf_engine_stats():
+            """Detected PDF engines with their health, latency and failures"""
+            return jsonify({
+                'success': True,
+                'routing': self.pdf_engines.routing,
+                'engines': self.pdf_engines.stats(),
+            })
+
+        @self.flask_app.route('/api/patients/search')
+        def search_patients():
+            """Autocomplete for the patient form: ?q=<name or mobile prefix>"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            try:
+                limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+            except ValueError:
+                limit = 10
+            with metrics.timer("db_read_seconds", operation="search_patients"):
+                patients = self.store.search_patients(request.args.get('q', ''), limit)
+            return jsonify({'success': True, 'patients': patients})
+
+        @self.flask_app.route('/api/patients/<int:patient_id>')
+        def get_patient(patient_id):
+            """Patient master record with all of their reports"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            patient = self.store.get_patient(patient_id)
+            if patient is None:
+                return jsonify({'success': False, 'message': 'Patient not found'}), 404
+            return jsonify({'success': True, 'patient': patient})
+
+        @self.flask_app.route('/api/patients/<int:patient_id>/trends')
+        def patient_trends(patient_id):
+            """Per-test result history: ?tests=HbA1c,Urea&limit=20"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            tests = [t.strip() for t in request.args.get('tests', '').split(',') if t.strip()]
+            try:
+                limit = max(int(request.args.get('limit', 0)), 0) or None
+            except ValueError:
+                limit = None
+            with metrics.timer("db_read_seconds", operation="patient_trends"):
+                trends = self.store.patient_trends(patient_id, tests, limit)
+            if not trends and self.store.get_patient(patient_id) is None:
+                return jsonify({'success': False, 'message': 'Patient not found'}), 404
+            return jsonify({'success': True, 'patient_id': patient_id, 'trends': trends})
+
+        @self.flask_app.route('/api/analytics')
+        def analytics_endpoint():
+            """Lab dashboard: ?from=YYYY-MM-DD&to=YYYY-MM-DD&group=day|month&top=20"""
+            start, end = request.args.get('from'), request.args.get('to')
+            for value in (start, end):
+                if value and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+                    return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+            try:
+                top = min(max(int(request.args.get('top', 20)), 1), 500)
+            except ValueError:
+                top = 20
+            with metrics.timer("db_read_seconds", operation="analytics"):
+                data = self.store.analytics_summary(start, end, request.args.get('group', 'day'), top)
+            return jsonify({'success': True, **data})
+
+        @self.flask_app.route('/api/cohort')
+        def cohort_endpoint():
+            """Cohort query: ?query=distribution|positivity|histogram&test=&by=age_band,gender&freq=week&from=&to=&bins=20"""
+            if not cohort.NUMPY_AVAILABLE:
+                return jsonify({'success': False, 'message': 'Cohort analytics need numpy'}), 501
+            test_name = (request.args.get('test') or '').strip()
+            if not test_name:
+                return jsonify({'success': False, 'message': 'test is required'}), 400
+            start, end = request.args.get('from'), request.args.get('to')
+            for value in (start, end):
+                if value and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+                    return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+            try:
+                bins = min(max(int(request.args.get('bins', 20)), 1), 200)
+            except ValueError:
+                bins = 20
+            try:
+                with metrics.timer("db_read_seconds", operation="cohort"):
+                    data = self.cohort_cache.query(
+                        request.args.get('query', 'distribution'),
+                        test_name,
+                        by=cohort.parse_group_keys(request.args.get('by')),
+                        freq='month' if request.args.get('freq') == 'month' else 'week',
+                        start=start,
+                        end=end,
+                        bins=bins,
+                    )
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({'success': True, **data})
+
+        @self.flask_app.route('/api/qc/runs', methods=['POST'])
+        def record_qc_run():
+            """Control run: {"analyte": "...", "results": {"L1": 5.2, "L2": 12.9}, "operator": "..."}"""
+            # A passing run releases held reports, so runs need the same token as the catalog
+            denied = self.admin_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True) or {}
+            analyte = str(data.get('analyte') or '').strip()
+            if analyte not in self.test_category_by_name:
+                return jsonify({'success': False, 'message': f'Unknown analyte: {analyte or "(missing)"}'}), 400
+            operator = str(data.get('operator') or '').strip()
+            if not operator:
+                return jsonify({'success': False, 'message': 'operator is required'}), 400
+            values = data.get('results')
+            if not isinstance(values, dict) or not values:
+                return jsonify({'success': False, 'message': 'results must map control level to value'}), 400
+            try:
+                values = {str(level).strip(): float(value) for level, value in values.items()}
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Control values must be numeric'}), 400
+            with metrics.timer("db_write_seconds", operation="qc_run"):
+                run = self.store.record_qc_run(analyte, values, operator)
+            metrics.inc("qc_runs_total", status=run['status'])
+            if run['status'] == 'rejected':
+                log.warning("QC run rejected", extra={'analyte': analyte, 'violations': run['violations']})
+            return jsonify({'success': True, 'release_blocked': run['status'] == 'rejected', **run})
+
+        @self.flask_app.route('/api/qc/targets', methods=['POST'])
+        def set_qc_target():
+            """Fixed control limits: {"analyte", "level", "mean", "sd"}; mean null clears them"""
+            denied = self.admin_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True) or {}
+            analyte = str(data.get('analyte') or '').strip()
+            level = str(data.get('level') or '').strip()
+            if analyte not in self.test_category_by_name or not level:
+                return jsonify({'success': False, 'message': 'A catalog analyte and a level are required'}), 400
+            try:
+                mean = None if data.get('mean') is None else float(data['mean'])
+                sd = None if mean is None else float(data.get('sd'))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'mean and sd must be numeric'}), 400
+            if sd is not None and sd <= 0:
+                return jsonify({'success': False, 'message': 'sd must be positive'}), 400
+            self.store.set_qc_target(analyte, level, mean, sd)
+            return jsonify({'success': True})
+
+        @self.flask_app.route('/api/qc/status')
+        def qc_status():
+            with metrics.timer("db_read_seconds", operation="qc_status"):
+                status = self.store.qc_status()
+            return jsonify({
+                'success': True,
+                'release_blocking': self.qc_block_release,
+                'blocked': sorted({row['analyte'] for row in status if row['status'] == 'rejected'}),
+                'controls': status,
+            })
+
+        @self.flask_app.route('/qc/levey-jennings')
+        def levey_jennings_chart():
+            """SVG chart: ?analyte=...&level=L1&points=30"""
+            analyte = (request.args.get('analyte') or '').strip()
+            level = (request.args.get('level') or '').strip()
+            if not analyte or not level:
+                return jsonify({'success': False, 'message': 'analyte and level are required'}), 400
+            try:
+                limit = min(max(int(request.args.get('points', qc.QC_CHART_POINTS)), 2), 500)
+            except ValueError:
+                limit = qc.QC_CHART_POINTS
+            points, mean, sd = self.store.qc_chart(analyte, level, limit)
+            svg = qc.levey_jennings_svg(points, mean, sd, title=f"{analyte} - {level}")
+            return Response(svg, mimetype='image/svg+xml')
+
+        @self.flask_app.route('/critical/ack/<token>', methods=['GET', 'POST'])
+        def acknowledge_critical_link(token):
+            """Acknowledgement link sent with each critical-value alert"""
+            # The secret link is the credential; it only ever reaches the alert's recipient
+            alert = self.store.acknowledge_critical_alert(token=token, by='link')
+            if alert is None:
+                return "Unknown or expired alert link", 404
+            return (
+                f"<h3>Critical result acknowledged</h3><p>{escape(alert['patient_name'] or '')}: "
+                f"{escape(alert['test_name'])} {escape(alert['result_value'] or '')}</p>"
+                f"<p>Acknowledged at {escape(alert['acknowledged_at'] or '')}</p>"
+            )
+
+        @self.flask_app.route('/api/critical-alerts')
+        def list_critical_alerts():
+            """?status=open|queued|sent|failed|acknowledged&limit=100"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            try:
+                limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            except ValueError:
+                limit = 100
+            # A branch's own host or code sees its alerts; the main deployment sees every branch
+            branch_id = self.branch_id() if g.get('branch_explicit') else None
+            alerts = self.store.list_critical_alerts(request.args.get('status'), limit, branch_id)
+            return jsonify({'success': True, 'alerts': alerts})
+
+        @self.flask_app.route('/api/critical-alerts/<int:alert_id>/ack', methods=['POST'])
+        def acknowledge_critical_alert(alert_id):
+            """Acknowledge an alert as the staff member the token belongs to"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            alert = self.store.acknowledge_critical_alert(alert_id=alert_id, by=g.auth_user)
+            if alert is None:
+                return jsonify({'success': False, 'message': 'Alert not found'}), 404
+            return jsonify({'success': True, 'alert': alert})
+
+        @self.flask_app.route('/api/reports/<int:report_id>/versions')
+        def report_versions(report_id):
+            """All versions of a report with the tests each amendment changed"""
+            versions = self.store.report_versions(report_id)
+            if not versions:
+                return jsonify({'success': False, 'message': 'Report not found'}), 404
+            return jsonify({'success': True, 'report_id': versions[0]['id'], 'versions': versions})
+
+        @self.flask_app.route('/api/reports/bundle')
+        def report_bundle_route():
+            """?date=YYYY-MM-DD (today), &doctor=..., &limit=...: one file with all those reports"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            day = (request.args.get('date') or datetime.now().strftime('%Y-%m-%d')).strip()
+            try:
+                datetime.strptime(day, '%Y-%m-%d')
+                limit = int(request.args['limit']) if request.args.get('limit') else None
+            except ValueError:
+                return jsonify({'success': False, 'message': 'date must be YYYY-MM-DD and limit a number'}), 400
+            # A branch's own host or code bundles its reports; the main deployment bundles every branch
+            branch_id = self.branch_id() if g.get('branch_explicit') else None
+            try:
+                status, body = self.render_report_bundle(
+                    day, self.get_public_base_url(), (request.args.get('doctor') or '').strip() or None,
+                    branch_id, limit,
+                )
+            except Exception as e:
+                log.exception("Error rendering report bundle")
+                return jsonify({'success': False, 'message': f'Server Error: {str(e)}'}), 500
+            return jsonify(body), status
+
+        @self.flask_app.route('/api/reports/<int:report_id>/amend', methods=['POST'])
+        def amend_report(report_id):
+            """Corrected results for a stored report; see amend_report()"""
+            denied = self.staff_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+            try:
+                status, body = self.amend_report(report_id, data, self.get_public_base_url(), g.auth_user)
+            except Exception as e:
+                log.exception("Error amending report")
+                return jsonify({'success': False, 'message': f'Server Error: {str(e)}'}), 500
+            return jsonify(body), status
+
+        @self.flask_app.route('/api/catalog')
+        def get_catalog():
+            """Categories, tests, units and range bands of the current catalog version"""
+            return jsonify({'success': True, **self.catalog.snapshot().describe()})
+
+        @self.flask_app.route('/api/catalog/tests', methods=['POST'])
+        def save_catalog_test():
+            """Add or change a test: {"name", "category", "unit", "normal_range", "display_order",
+            "active", "ranges": [{"sex", "age_min", "age_max", "low", "high", "text"}]}"""
+            denied = self.admin_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+            try:
+                values, bands = catalog.normalize_test(data)
+                test_id = self.store.save_catalog_test(values, bands)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            self.catalog.invalidate()
+            snapshot = self.catalog.snapshot()
+            log.info("Catalog test saved", extra={'test_name': values['name'], 'catalog_version': snapshot.version})
+            return jsonify({'success': True, 'id': test_id, 'version': snapshot.version})
+
+        @self.flask_app.route('/api/catalog/categories', methods=['POST'])
+        def save_catalog_category():
+            """Add or reorder a category: {"name", "display_order"}"""
+            denied = self.admin_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True) or {}
+            name = str(data.get('name') or '').strip()
+            if not name:
+                return jsonify({'success': False, 'message': 'name is required'}), 400
+            try:
+                display_order = None if data.get('display_order') is None else int(data['display_order'])
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'display_order must be an integer'}), 400
+            category_id = self.store.save_catalog_category(name, display_order)
+            self.catalog.invalidate()
+            return jsonify({'success': True, 'id': category_id, 'version': self.catalog.snapshot().version})
+
+        @self.flask_app.route('/api/branches')
+        def list_branches():
+            """Every branch with its resolved settings (secrets masked)"""
+            return jsonify({
+                'success': True,
+                'current': self.current_branch().code,
+                'branches': [branch.public() for branch in self.branch_registry.all()],
+            })
+
+        @self.flask_app.route('/api/branches', methods=['POST'])
+        def save_branch():
+            """Create or update a branch: {"code", "name", "address", "phone", "email", "hosts", "catalog", ...}"""
+            denied = self.admin_auth_error()
+            if denied:
+                return denied
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+            try:
+                values = branches.normalize_config(data)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            unknown = set((data.get('catalog') or {}).get('disabled_tests') or ()) - set(self.test_category_by_name)
+            if unknown:
+                return jsonify({'success': False, 'message': f"Unknown tests: {', '.join(sorted(unknown))}"}), 400
+            branch_id = self.store.save_branch(values)
+            self.branch_registry.invalidate()
+            log.info("Branch configuration saved", extra={'branch': values['code'], 'branch_id': branch_id})
+            branch = self.branch_registry.get(values['code'])
+            return jsonify({'success': True, 'branch': branch.public() if branch else {'id': branch_id, **values}})
+
         @self.flask_app.route('/static/<path:filename>')
         def serve_static(filename):
             """Serve static files"""
             return send_from_directory('static', filename)
 
+        @self.flask_app.before_request
+        def start_request_trace():
+            g.log_tokens = app_logging.start_request(request.headers.get('X-Request-ID'))
+            g.request_started = time.perf_counter()
+
+        @self.flask_app.before_request
+        def resolve_branch():
+            """Resolve the branch once; everything the request runs reads it via current_branch()"""
+            branch, g.branch_explicit = self.resolve_request_branch(
+                request.headers, request.args.get('branch'), request.host
+            )
+            if branch is None:
+                return jsonify({'success': False, 'message': 'Unknown or inactive branch'}), 404
+            g.branch_token = branches.activate(branch)
+
+        @self.flask_app.teardown_request
+        def end_request_trace(exc):
+            branch_token = g.pop('branch_token', None)
+            if branch_token:
+                branches.deactivate(branch_token)
+            tokens = g.pop('log_tokens', None)
+            if tokens:
+                app_logging.end_request(tokens)
+
         @self.flask_app.after_request
         def after_request(response):
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-            response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+            request_id = app_logging.current_request_id()
+            if request_id:
+                response.headers['X-Request-ID'] = request_id
+                log.info("Request completed", extra={
+                    'method': request.method,
+                    # The URL rule, not the path: report file names carry the patient name
+                    'route': request.url_rule.rule if request.url_rule else None,
+                    'status': response.status_code,
+                    'duration_ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 2),
+                })
+            # Patient records are for the lab's own pages, never other origins
+            if not request.path.startswith('/api/patients/'):
+                response.headers.add('Access-Control-Allow-Origin', '*')
+                response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Branch')
+                response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
             return response
 
     def get_main_web_form(self):
         """Return the main web form HTML"""
         today_date = datetime.now().strftime('%Y-%m-%d')
+        branch = self.current_branch()
         
         html = f'''
         <!DOCTYPE html>
@@ -674,7 +1019,7 @@ class PathologyTestsForm(TkBase):
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>UJJIVAN Hospital - Pathology System</title>
+            <title>{escape(branch.name)} - Pathology System</title>
             <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
             <style>
                 body {{
@@ -818,15 +1163,24 @@ class PathologyTestsForm(TkBase):
                         min-width: auto;
                     }}
                 }}
+                .patient-suggestions {{
+                    position: absolute;
+                    z-index: 10;
+                    left: 12px;
+                    right: 12px;
+                    max-height: 260px;
+                    overflow-y: auto;
+                    box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+                }}
             </style>
         </head>
         <body>
             <div class="container">
                 <div class="hospital-card">
                     <div class="hospital-header">
-                        <h1>🏥 UJJIVAN HOSPITAL</h1>
+                        <h1>🏥 {escape(branch.name.upper())}</h1>
                         <h3>Pathology Laboratory System</h3>
-                        <p class="text-muted">Vidyut Nagar, Gautam Budh Nagar, Uttar Pradesh - 201008</p>
+                        <p class="text-muted">{escape(branch.address)}</p>
                     </div>
                     
                     <div class="info-box">
@@ -845,9 +1199,10 @@ class PathologyTestsForm(TkBase):
                     </div>
                     
                     <div class="row">
-                        <div class="col-md-6 mb-3">
+                        <div class="col-md-6 mb-3 position-relative">
                             <label class="form-label required-field">Patient Name</label>
-                            <input type="text" class="form-control" id="patientName" placeholder="Enter full name" required>
+                            <input type="text" class="form-control" id="patientName" placeholder="Enter full name" autocomplete="off" required>
+                            <div class="patient-suggestions list-group" id="nameSuggestions"></div>
                         </div>
                         <div class="col-md-3 mb-3">
                             <label class="form-label required-field">Age</label>
@@ -865,9 +1220,10 @@ class PathologyTestsForm(TkBase):
                     </div>
                     
                     <div class="row">
-                        <div class="col-md-4 mb-3">
+                        <div class="col-md-4 mb-3 position-relative">
                             <label class="form-label required-field">Mobile Number</label>
-                            <input type="tel" class="form-control" id="patientMobile" placeholder="10 digit mobile" required>
+                            <input type="tel" class="form-control" id="patientMobile" placeholder="10 digit mobile" autocomplete="off" required>
+                            <div class="patient-suggestions list-group" id="mobileSuggestions"></div>
                             <small class="text-muted">WhatsApp reports will be sent to this number</small>
                         </div>
                         <div class="col-md-4 mb-3">
@@ -891,8 +1247,8 @@ class PathologyTestsForm(TkBase):
                     <div class="row">
         '''
         
-        # Add test categories
-        for category, tests in self.tests.items():
+        # Add test categories (only the tests this branch offers)
+        for category, tests in branch.tests(self.tests).items():
             html += f'''
                 <div class="col-md-6">
                     <div class="test-category">
@@ -1001,6 +1357,65 @@ class PathologyTestsForm(TkBase):
                 function goToContactForm() {
                     window.location.href = '/contact-hospital';
                 }
+
+                // Repeat patients: suggest existing records while typing name or mobile
+                let suggestTimer = null;
+                let suggestRequest = 0;
+
+                function attachPatientSuggestions(inputId, listId) {
+                    const input = document.getElementById(inputId);
+                    const list = document.getElementById(listId);
+                    input.addEventListener('input', () => {
+                        clearTimeout(suggestTimer);
+                        suggestTimer = setTimeout(() => loadSuggestions(input.value, list), 200);
+                    });
+                    input.addEventListener('blur', () => setTimeout(() => { list.innerHTML = ''; }, 200));
+                }
+
+                async function loadSuggestions(query, list) {
+                    const requestId = ++suggestRequest;
+                    list.innerHTML = '';
+                    if (query.trim().length < 2) {
+                        return;
+                    }
+                    try {
+                        // Suggestions need a staff token (STAFF_API_TOKENS) saved in this browser
+                        const staffToken = localStorage.getItem('staffApiToken');
+                        if (!staffToken) {
+                            return;
+                        }
+                        const response = await fetch('/api/patients/search?q=' + encodeURIComponent(query), {
+                            headers: { 'Authorization': 'Bearer ' + staffToken }
+                        });
+                        const data = await response.json();
+                        if (requestId !== suggestRequest || !data.success) {
+                            return;
+                        }
+                        data.patients.forEach(patient => {
+                            const item = document.createElement('button');
+                            item.type = 'button';
+                            item.className = 'list-group-item list-group-item-action';
+                            item.textContent = `${patient.name || ''} · ${patient.mobile || ''} · ` +
+                                `${patient.age || '?'}/${patient.gender || '?'} · ${patient.report_count} report(s)`;
+                            item.addEventListener('mousedown', () => fillPatient(patient, list));
+                            list.appendChild(item);
+                        });
+                    } catch (error) {
+                        // Suggestions are optional; typing continues as normal
+                    }
+                }
+
+                function fillPatient(patient, list) {
+                    document.getElementById('patientName').value = patient.name || '';
+                    document.getElementById('patientAge').value = patient.age || '';
+                    document.getElementById('patientGender').value = patient.gender || '';
+                    document.getElementById('patientMobile').value = (patient.mobile || '').replace(/\\D/g, '').slice(-10);
+                    document.getElementById('doctorName').value = patient.doctor || '';
+                    list.innerHTML = '';
+                }
+
+                attachPatientSuggestions('patientName', 'nameSuggestions');
+                attachPatientSuggestions('patientMobile', 'mobileSuggestions');
             </script>
         </body>
         </html>
@@ -1009,13 +1424,14 @@ class PathologyTestsForm(TkBase):
 
     def get_contact_form_html(self):
         """Return the contact/messaging form HTML for patients"""
+        branch = self.current_branch()
         html = '''
         <!DOCTYPE html>
         <html lang="en">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Contact UJJIVAN Hospital</title>
+            <title>Contact ''' + escape(branch.name) + '''</title>
             <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
             <style>
                 body {
@@ -1130,7 +1546,7 @@ class PathologyTestsForm(TkBase):
             <div class="container">
                 <div class="contact-card">
                     <div class="contact-header">
-                        <h1>💬 Contact UJJIVAN Hospital</h1>
+                        <h1>💬 Contact ''' + escape(branch.name) + '''</h1>
                         <p>Send us a message and we'll respond within 24 hours</p>
                     </div>
                     
@@ -1144,8 +1560,8 @@ class PathologyTestsForm(TkBase):
                     
                     <div class="info-box">
                         <h5>📞 Quick Contact:</h5>
-                        <p><strong>Phone:</strong> 0120-1234567</p>
-                        <p><strong>Email:</strong> support@ujjivanhospital.com</p>
+                        <p><strong>Phone:</strong> ''' + escape(branch.phone) + '''</p>
+                        <p><strong>Email:</strong> ''' + escape(branch.email) + '''</p>
                         <p><strong>WhatsApp:</strong> Reply to the report message you received</p>
                     </div>
                     
@@ -1298,8 +1714,12 @@ class PathologyTestsForm(TkBase):
         '''
         return html
 
-    def get_public_base_url(self):
-        """Resolve public base URL for patient-facing links."""
+    def get_public_base_url(self, headers=None, host=None, scheme=None):
+        """Resolve public base URL for patient-facing links.
+
+        Outside a Flask request (the ASGI entry point) pass the request
+        headers, host and scheme explicitly.
+        """
         explicit_base_url = os.getenv("PUBLIC_BASE_URL", "").strip().rstrip("/")
         if explicit_base_url:
             return explicit_base_url
@@ -1307,10 +1727,12 @@ class PathologyTestsForm(TkBase):
         # If inside an HTTP request, derive the public host from headers.
         # This supports reverse proxies (Render, Nginx, etc.).
         try:
-            forwarded_proto = request.headers.get("X-Forwarded-Proto", "").split(",")[0].strip()
-            forwarded_host = request.headers.get("X-Forwarded-Host", "").split(",")[0].strip()
-            host = forwarded_host or request.host
-            scheme = forwarded_proto or request.scheme or "http"
+            if headers is None:
+                headers, host, scheme = request.headers, request.host, request.scheme
+            forwarded_proto = headers.get("X-Forwarded-Proto", "").split(",")[0].strip()
+            forwarded_host = headers.get("X-Forwarded-Host", "").split(",")[0].strip()
+            host = forwarded_host or host
+            scheme = forwarded_proto or scheme or "http"
             if host:
                 return f"{scheme}://{host}".rstrip("/")
         except Exception:
@@ -1323,6 +1745,8 @@ class PathologyTestsForm(TkBase):
     def generate_exact_format_html_form(self, patient_data, selected_tests):
         """Generate the fillable form for entering test results"""
         today_date = datetime.now().strftime('%Y-%m-%d')
+        branch = self.current_branch()
+        reference_ranges = self.reference_ranges(patient_data, selected_tests)
         
         html = f'''
         <!DOCTYPE html>
@@ -1330,7 +1754,7 @@ class PathologyTestsForm(TkBase):
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Enter Test Results - UJJIVAN Hospital</title>
+            <title>Enter Test Results - {escape(branch.name)}</title>
             <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
             <style>
                 body {{
@@ -1501,8 +1925,13 @@ class PathologyTestsForm(TkBase):
                 '''
                 
                 for test_name in tests:
-                    normal_range = self.normal_ranges.get(test_name, "Not specified")
+                    normal_range = reference_ranges.get(test_name, ("Not specified", None))[0]
                     test_id = f"test_{test_name.replace(' ', '_').replace('-', '_').replace('/', '_')}"
+                    placeholder = "Enter result"
+                    derived_attr = ""
+                    if self.derived_tests_enabled and test_name in self.derived_tests.by_name:
+                        placeholder = f"Calculated from {', '.join(self.derived_tests.inputs_for(test_name))} if left blank"
+                        derived_attr = ' data-derived="1"'
                     
                     html += f'''
                             <div class="col-md-6 mb-3">
@@ -1510,7 +1939,7 @@ class PathologyTestsForm(TkBase):
                                     {test_name}
                                 </label>
                                 <input type="text" class="form-control" id="{test_id}" 
-                                       name="{test_name}" placeholder="Enter result">
+                                       name="{test_name}" placeholder="{escape(placeholder)}"{derived_attr}>
                                 <small class="normal-range">Normal: {normal_range}</small>
                             </div>
                     '''
@@ -1543,9 +1972,12 @@ class PathologyTestsForm(TkBase):
                     
                     // Collect all test results
                     const inputs = document.querySelectorAll('#resultsForm input[name]');
+                    const calculateTests = [];
                     inputs.forEach(input => {{
                         if (input.value.trim()) {{
                             testResults[input.name] = input.value.trim();
+                        }} else if (input.dataset.derived) {{
+                            calculateTests.push(input.name);
                         }}
                     }});
                     
@@ -1567,7 +1999,8 @@ class PathologyTestsForm(TkBase):
                             }},
                             body: JSON.stringify({{
                                 patient_data: patientData,
-                                test_results: testResults
+                                test_results: testResults,
+                                calculate_tests: calculateTests
                             }})
                         }});
                         
@@ -1631,8 +2064,98 @@ class PathologyTestsForm(TkBase):
         '''
         return html
 
-    def generate_pdf_html(self, patient_data, test_results):
-        """Generate HTML content for PDF report"""
+    @traced("load_report_trends")
+    def load_report_trends(self, patient_data, test_results):
+        """Stored series for the tests in this report ({} for a new patient)"""
+        if not (self.report_trends_enabled or self.delta_checks_enabled):
+            return {}
+        try:
+            patient_id = self.store.find_patient_id(patient_data)
+            if patient_id is None:
+                return {}
+            return self.store.result_series(patient_id, test_results.keys())
+        except Exception as e:
+            log.warning("Could not load result trends: %s", e)
+            return {}
+
+    def render_trend(self, points, current_value):
+        """Sparkline of the previous values plus this one, with the last value for comparison"""
+        if not self.report_trends_enabled:
+            return ""
+        previous = [p for p in points if p.get('value') is not None][-(self.report_trend_points - 1):]
+        current = result_trends.parse_numeric(current_value)
+        if not previous or current is None:
+            return ""
+        last = previous[-1]
+        if current > last['value']:
+            arrow = "&uarr;"
+        elif current < last['value']:
+            arrow = "&darr;"
+        else:
+            arrow = "&rarr;"
+        svg = result_trends.sparkline_svg([p['value'] for p in previous] + [current])
+        when = f" ({escape(last['date'])})" if last.get('date') else ""
+        return f'<div class="trend">{svg} {arrow} prev {escape(last["text"])}{when}</div>'
+
+    def render_delta(self, flag):
+        if not flag:
+            return ""
+        return f'<div class="delta">&#916; {escape(delta_check.describe(flag))}</div>'
+
+    def render_amendment(self, amendment):
+        """Banner at the top of an amended report"""
+        if not amendment:
+            return ""
+        removed = [
+            f"{escape(test_name)} (was {escape(str(old))})"
+            for test_name, old in amendment['changes'].items() if test_name not in amendment['results']
+        ]
+        lines = [
+            f"<strong>AMENDED REPORT</strong> - version {amendment['version']}, "
+            f"replaces report #{amendment['parent_report_id']} issued {escape(str(amendment.get('original_date') or ''))}",
+            f"Reason: {escape(amendment.get('reason') or '')}",
+        ]
+        if amendment.get('amended_by'):
+            lines.append(f"Amended by: {escape(amendment['amended_by'])}")
+        if removed:
+            lines.append(f"Removed: {', '.join(removed)}")
+        return f'<div class="amended-banner">{"<br>".join(lines)}</div>'
+
+    def render_amended_value(self, test_name, amendment):
+        if not amendment or test_name not in amendment['changes']:
+            return ""
+        old = amendment['changes'][test_name]
+        was = f", was {escape(str(old))}" if old not in (None, "") else ", added"
+        return f'<div class="amended">Amended{was}</div>'
+
+    @traced("generate_pdf_html")
+    def generate_pdf_html(self, patient_data, test_results, amendment=None, stored=None):
+        """Generate HTML content for PDF report
+
+        amendment (amend_report) marks the report AMENDED and its changed tests.
+        stored ({"report_ids", "day"}) re-renders a stored report: only results
+        from before it count as previous results.
+        """
+        branch = self.current_branch()
+        reference_ranges = self.reference_ranges(patient_data, test_results)
+        trends = self.load_report_trends(patient_data, test_results)
+        # Earlier versions of this report are not "previous results"
+        excluded = set(amendment['report_ids']) if amendment else set()
+        if stored:
+            excluded |= set(stored['report_ids'])
+        if excluded:
+            trends = {
+                test_name: [
+                    p for p in points
+                    if p.get('report_id') not in excluded and (not stored or str(p.get('date') or '') <= stored['day'])
+                ]
+                for test_name, points in trends.items()
+            }
+        deltas = {}
+        if self.delta_checks_enabled:
+            deltas = delta_check.check_report(
+                test_results, trends, patient_data.get('sample_date') or datetime.now().strftime('%Y-%m-%d')
+            )
         html_content = f'''<!DOCTYPE html>
         <html>
         <head>
@@ -1650,6 +2173,9 @@ class PathologyTestsForm(TkBase):
                     padding-bottom: 10px; 
                     margin-bottom: 20px; 
                 }}
+                .letterhead-logos {{
+                    margin-bottom: 5px;
+                }}
                 .header h1 {{
                     color: #003366;
                     margin-bottom: 5px;
@@ -1715,6 +2241,36 @@ class PathologyTestsForm(TkBase):
                 .normal {{
                     color: #28a745;
                 }}
+                .range-flag {{
+                    font-size: 11px;
+                    font-weight: bold;
+                    border: 1px solid #dc3545;
+                    padding: 0 3px;
+                }}
+                .trend {{
+                    font-size: 10px;
+                    color: #666;
+                    margin-top: 3px;
+                }}
+                .delta {{
+                    font-size: 10px;
+                    color: #b35900;
+                    font-weight: bold;
+                    margin-top: 2px;
+                }}
+                .amended-banner {{
+                    border: 2px solid #dc3545;
+                    color: #dc3545;
+                    padding: 8px 12px;
+                    margin-bottom: 15px;
+                    font-size: 13px;
+                }}
+                .amended {{
+                    font-size: 10px;
+                    color: #dc3545;
+                    font-style: italic;
+                    margin-top: 2px;
+                }}
                 @media print {{
                     body {{ margin: 0; padding: 10px; }}
                 }}
@@ -1731,15 +2287,16 @@ class PathologyTestsForm(TkBase):
         </head>
         <body>
             <div class="header">
-                <h1>UJJIVAN HOSPITAL</h1>
+                {self.report_assets.letterhead_html()}
+                <h1>{escape(branch.name.upper())}</h1>
                 <div class="hospital-info">
                     <p>Pathology Laboratory</p>
-                    <p>Vidyut Nagar, Gautam Budh Nagar, Uttar Pradesh - 201008</p>
-                    <p>Phone: 0120-1234567 | Email: pathology@ujjivanhospital.com</p>
+                    <p>{escape(branch.address)}</p>
+                    <p>Phone: {escape(branch.phone)} | Email: {escape(branch.report_email or branch.email)}</p>
                 </div>
-                <h2>PATHOLOGY REPORT</h2>
+                <h2>PATHOLOGY REPORT{' - AMENDED' if amendment else ''}</h2>
             </div>
-            
+            {self.render_amendment(amendment)}
             <div class="patient-info">
                 <p><strong>Patient Name:</strong> {patient_data.get('name', '')}</p>
                 <p><strong>Age/Gender:</strong> {patient_data.get('age', '')}/{patient_data.get('gender', '')}</p>
@@ -1794,20 +2351,22 @@ class PathologyTestsForm(TkBase):
                 '''
                 
                 for test_name, result in tests:
-                    normal_range = self.normal_ranges.get(test_name, "Not specified")
+                    normal_range, band = reference_ranges[test_name]
                     
-                    # Check for abnormal values
+                    # Check for abnormal values: outside the patient's range, or a positive finding
                     status_class = "normal"
+                    range_flag = catalog.flag(band, result)
                     result_str = str(result).lower()
-                    if any(word in result_str for word in ['positive', 'high', 'low', 'abnormal', 'reactive', 'detected']):
+                    if range_flag or any(word in result_str for word in ['positive', 'high', 'low', 'abnormal', 'reactive', 'detected']):
                         status_class = "abnormal"
+                    flag_html = f' <span class="range-flag">{range_flag}</span>' if range_flag else ''
                     
                     html_content += f'''
                         <tr>
                             <td>{serial_no}</td>
                             <td><strong>{test_name}</strong></td>
                             <td><span class="normal-range">{normal_range}</span></td>
-                            <td class="{status_class}"><strong>{result}</strong></td>
+                            <td class="{status_class}"><strong>{result}</strong>{flag_html}{self.render_trend(trends.get(test_name, []), result)}{self.render_delta(deltas.get(test_name))}{self.render_amended_value(test_name, amendment)}</td>
                         </tr>
                     '''
                     serial_no += 1
@@ -1830,70 +2389,75 @@ class PathologyTestsForm(TkBase):
                 <p>Report generated on: ''' + datetime.now().strftime('%d-%m-%Y %H:%M:%S') + '''</p>
             </div>
             
-            <div class="watermark">UJJIVAN HOSPITAL</div>
+            <div class="watermark">''' + escape(branch.name.upper()) + '''</div>
         </body>
         </html>
         '''
         return html_content
 
+    @traced("generate_pdf")
     def generate_pdf(self, html_content, output_path):
-        """Generate PDF from HTML content using available methods"""
+        """Render the PDF with the fastest healthy engine (see pdf_engines.py)"""
         try:
-            # Try WeasyPrint first (better quality)
-            if WEASYPRINT_AVAILABLE:
-                try:
-                    HTML(string=html_content, encoding='utf-8').write_pdf(output_path)
-                    print(f"PDF generated with WeasyPrint: {output_path}")
-                    return True
-                except Exception as e:
-                    print(f"WeasyPrint failed: {e}")
-            
-            # Try pdfkit next
-            if PDFKIT_AVAILABLE:
-                try:
-                    options = {
-                        'page-size': 'A4',
-                        'margin-top': '0.5in',
-                        'margin-right': '0.5in',
-                        'margin-bottom': '0.5in',
-                        'margin-left': '0.5in',
-                        'encoding': "UTF-8",
-                        'no-outline': None,
-                        'quiet': ''
-                    }
-                    
-                    # Try to find wkhtmltopdf
-                    possible_paths = [
-                        '/usr/bin/wkhtmltopdf',
-                        '/usr/local/bin/wkhtmltopdf',
-                        'C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe',
-                        'C:/wkhtmltopdf/bin/wkhtmltopdf.exe'
-                    ]
-                    
-                    config = None
-                    for path in possible_paths:
-                        if os.path.exists(path):
-                            config = pdfkit.configuration(wkhtmltopdf=path)
-                            break
-                    
-                    if config:
-                        pdfkit.from_string(html_content, output_path, options=options, configuration=config)
-                    else:
-                        pdfkit.from_string(html_content, output_path, options=options)
-                    
-                    print(f"PDF generated with pdfkit: {output_path}")
-                    return True
-                    
-                except Exception as e:
-                    print(f"pdfkit failed: {e}")
-            
-            print("PDF generation not available. Saving as HTML instead.")
-            return False
-            
-        except Exception as e:
-            print(f"PDF generation error: {e}")
+            engine = self.pdf_engines.render(html_content, output_path)
+        except Exception:
+            log.exception("PDF generation error")
+            engine = None
+        if engine is None:
+            metrics.inc("report_pdf_html_fallback_total")
+            log.warning("Every PDF engine failed; saving the report as HTML", extra={
+                'engines': self.pdf_engines.available(),
+            })
             return False
+        self.record_pdf_size(output_path, engine)
+        return True
+
+    def record_pdf_size(self, output_path, engine):
+        """Log and count the size of a generated PDF against REPORT_PDF_TARGET_KB"""
+        size = os.path.getsize(output_path)
+        metrics.inc("report_pdf_bytes_total", size, engine=engine)
+        if size > pdf_optimize.REPORT_PDF_TARGET_KB * 1024:
+            metrics.inc("report_pdf_over_target_total", engine=engine)
+            log.warning("PDF larger than target", extra={
+                'engine': engine, 'bytes': size, 'target_kb': pdf_optimize.REPORT_PDF_TARGET_KB,
+            })
+        else:
+            log.info("PDF generated", extra={'engine': engine, 'bytes': size})
+
+    def build_completed_report_row(
+        self,
+        patient_data,
+        test_results,
+        report_path,
+        whatsapp_success,
+        whatsapp_message,
+        sms_success,
+        sms_message,
+    ):
+        """Build the completed_reports row (datastore.COMPLETED_REPORT_COLUMNS order) for one report"""
+        if whatsapp_success is None:
+            whatsapp_status = "not_attempted"
+        else:
+            whatsapp_status = "sent" if whatsapp_success else "failed"
+        sms_status = "not_attempted" if sms_success is None else ("sent" if sms_success else "failed")
 
+        return (
+            patient_data.get('name'),
+            patient_data.get('age'),
+            patient_data.get('gender'),
+            patient_data.get('mobile'),
+            patient_data.get('doctor'),
+            patient_data.get('opd_no'),
+            patient_data.get('sample_date'),
+            json.dumps(test_results),
+            report_path,
+            whatsapp_status,
+            whatsapp_message,
+            sms_status,
+            sms_message
+        )
+
+    @traced("store_completed_report")
     def store_completed_report(
         self,
         patient_data,
@@ -1906,37 +2470,740 @@ class PathologyTestsForm(TkBase):
     ):
         """Store completed report in database"""
         try:
-            whatsapp_status = "sent" if whatsapp_success else "failed"
-            sms_status = "not_attempted" if sms_success is None else ("sent" if sms_success else "failed")
-            
-            self.cursor.execute('''
-                INSERT INTO completed_reports 
-                (patient_name, patient_age, patient_gender, patient_mobile, doctor_name, opd_no, sample_date, test_results, pdf_path, whatsapp_status, whatsapp_error, sms_status, sms_error)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                patient_data.get('name'),
-                patient_data.get('age'),
-                patient_data.get('gender'),
-                patient_data.get('mobile'),
-                patient_data.get('doctor'),
-                patient_data.get('opd_no'),
-                patient_data.get('sample_date'),
-                json.dumps(test_results),
+            row = self.build_completed_report_row(
+                patient_data,
+                test_results,
                 report_path,
-                whatsapp_status,
+                whatsapp_success,
                 whatsapp_message,
-                sms_status,
-                sms_message
-            ))
-            
-            self.conn.commit()
-            print(f"Report stored in database. WhatsApp: {whatsapp_status}, SMS: {sms_status}")
+                sms_success,
+                sms_message,
+            )
+
+            with metrics.timer("db_write_seconds", operation="insert_report"):
+                self.store.insert_completed_reports([row], branch_id=self.branch_id())
+            log.info("Report stored in database", extra={'whatsapp_status': row[9], 'sms_status': row[11]})
             return True
             
         except Exception as e:
-            print(f"Error storing report: {e}")
+            log.exception("Error storing report")
             return False
 
+    @traced("store_completed_reports_batch")
+    def store_completed_reports_batch(self, rows):
+        """Store many completed report rows in a single transaction"""
+        if not rows:
+            return True, None
+        try:
+            with metrics.timer("db_write_seconds", operation="insert_report_batch"):
+                self.store.insert_completed_reports(rows, branch_id=self.branch_id())
+            log.info("Batch stored in database", extra={'report_count': len(rows)})
+            return True, None
+
+        except Exception as e:
+            log.exception("Error storing report batch")
+            return False, str(e)
+
+    def get_database_size(self):
+        """Size of the SQLite database including its WAL/journal files"""
+        return self.store.database_size()
+
+    def bearer_token(self):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        return token.strip() if scheme.lower() == 'bearer' else ''
+
+    def admin_auth_error(self):
+        """(response, status) when the request may not change admin settings, else None"""
+        if not self.admin_api_token:
+            return jsonify({'success': False, 'message': 'Admin API disabled: ADMIN_API_TOKEN is not set'}), 403
+        if not secrets.compare_digest(self.bearer_token().encode('utf-8'), self.admin_api_token.encode('utf-8')):
+            log.warning("Admin request refused", extra={'route': request.url_rule.rule if request.url_rule else None})
+            return jsonify({'success': False, 'message': 'Admin token required'}), 401
+        g.auth_user = 'admin'
+        return None
+
+    def staff_auth_error(self):
+        """(response, status) unless the request carries a staff (or the admin) token, else None.
+
+        The token's name ("admin" for ADMIN_API_TOKEN) is left in g.auth_user.
+        """
+        if not (self.admin_api_token or self.staff_api_tokens):
+            return jsonify({'success': False, 'message': 'Staff API disabled: STAFF_API_TOKENS is not set'}), 403
+        token = self.bearer_token().encode('utf-8')
+        tokens = dict(self.staff_api_tokens, **({'admin': self.admin_api_token} if self.admin_api_token else {}))
+        user = None
+        for name, staff_token in tokens.items():
+            # Every token is compared, so the time taken does not reveal which one matched
+            if secrets.compare_digest(token, staff_token.encode('utf-8')):
+                user = name
+        if user is None:
+            log.warning("Staff request refused", extra={'route': request.url_rule.rule if request.url_rule else None})
+            return jsonify({'success': False, 'message': 'Staff token required'}), 401
+        g.auth_user = user
+        return None
+
+    def validate_submission(self, patient_data):
+        """Return an error message if required patient fields are missing"""
+        if not isinstance(patient_data, dict):
+            return 'patient_data must be an object'
+        required_fields = ['name', 'age', 'gender', 'mobile']
+        for field in required_fields:
+            if not patient_data.get(field):
+                return f'Missing required field: {field}'
+        return None
+
+    def validate_offered_tests(self, test_results):
+        """Return an error message if the current branch does not offer some of the tests"""
+        if not isinstance(test_results, dict):
+            return None
+        branch = self.current_branch()
+        not_offered = [name for name in test_results if not branch.offers(name)]
+        if not_offered:
+            return f"Not offered at {branch.name}: {', '.join(not_offered)}"
+        return None
+
+    def prepare_report_submission(self, data, base_url, endpoint='submit-report'):
+        """Checks shared by the Flask and ASGI /submit-report before anything is rendered.
+
+        Fills in derived tests, validates the patient, applies the QC hold and
+        queues critical-value alerts. Returns (test_results, extras, error):
+        extras go into the response, error is (status, body) or None.
+        """
+        patient_data = data.get('patient_data', {})
+        test_results, calculated_tests = self.calculate_derived_tests(
+            data.get('test_results', {}), data.get('calculate_tests')
+        )
+
+        validation_error = self.validate_submission(patient_data)
+        if validation_error:
+            return test_results, {}, (400, {'success': False, 'message': validation_error})
+
+        not_offered = self.validate_offered_tests(test_results)
+        if not_offered:
+            return test_results, {}, (400, {'success': False, 'message': not_offered})
+
+        qc_blocked = self.qc_held_tests(test_results)
+        if qc_blocked:
+            metrics.inc("reports_held_total", endpoint=endpoint)
+            return test_results, {}, (409, {
+                'success': False,
+                'message': self.qc_hold_message(qc_blocked),
+                'qc_blocked': qc_blocked
+            })
+
+        return test_results, {
+            'calculated_tests': calculated_tests,
+            'critical_alerts': self.raise_critical_alerts(patient_data, test_results, base_url),
+        }, None
+
+    def raise_critical_alerts(self, patient_data, test_results, base_url):
+        """Log and queue an alert for each critical result, ahead of routine notifications.
+
+        Sending happens on the notification pool; the report render does not wait for it.
+        """
+        if not self.critical_alerts_enabled or not isinstance(test_results, dict):
+            return []
+        critical = critical_values.check_report(test_results)
+        if not critical:
+            return []
+        queued_at = time.perf_counter()
+        doctor = patient_data.get('doctor') or ''
+        recipient = critical_values.doctor_mobile(doctor) or self.critical_alert_mobile
+        alerts = [{
+            'ack_token': secrets.token_urlsafe(16),
+            'patient_name': patient_data.get('name'),
+            'patient_mobile': patient_data.get('mobile'),
+            'opd_no': patient_data.get('opd_no'),
+            'doctor_name': doctor,
+            'recipient': recipient or None,
+            'test_name': test_name,
+            'result_value': str(value),
+            'reason': reason,
+            'branch_id': self.branch_id(),
+        } for test_name, value, reason in critical]
+        alert_ids = self.store.create_critical_alerts(alerts)
+
+        summary = []
+        for alert_id, alert in zip(alert_ids, alerts):
+            log.warning("Critical result", extra={
+                'alert_id': alert_id,
+                'test': alert['test_name'],
+                'reason': alert['reason'],
+                'doctor': doctor,
+            })
+            if recipient:
+                message = self.create_critical_alert_message(patient_data, alert, base_url)
+                task = functools.partial(self.send_critical_alert, alert_id, recipient, message, queued_at)
+                self.notify_executor.submit(app_logging.bind_context(task), priority=CRITICAL)
+                status = 'queued'
+            else:
+                self.store.mark_critical_alert(alert_id, 'undeliverable', 'No contact for the referring doctor')
+                metrics.inc("critical_alerts_total", outcome="undeliverable")
+                status = 'undeliverable'
+            summary.append({'id': alert_id, 'test': alert['test_name'], 'value': alert['result_value'],
+                            'reason': alert['reason'], 'status': status})
+        return summary
+
+    def create_critical_alert_message(self, patient_data, alert, base_url):
+        rule = critical_values.describe_rule(alert['test_name'], alert['reason'])
+        branch = self.current_branch()
+        normal_ranges = branch.normal_ranges(self.normal_ranges)
+        return (
+            f"CRITICAL RESULT - {branch.name} Lab\n"
+            f"Patient: {patient_data.get('name', '')} ({patient_data.get('age', '')}/{patient_data.get('gender', '')}), "
+            f"OPD {patient_data.get('opd_no') or 'N/A'}, Mob {patient_data.get('mobile', '')}\n"
+            f"{alert['test_name']}: {alert['result_value']} (critical {rule}; "
+            f"normal {normal_ranges.get(alert['test_name'], 'N/A')})\n"
+            f"Please acknowledge: {base_url}/critical/ack/{alert['ack_token']}"
+        )
+
+    def send_critical_alert(self, alert_id, recipient, message, queued_at):
+        """WhatsApp to the doctor, SMS if that fails; records outcome and latency"""
+        mobile, mobile_error = self.validate_mobile_number(recipient)
+        if mobile_error:
+            success, detail = False, mobile_error
+        else:
+            success, detail = self.send_whatsapp_via_cloud_api(mobile, message)
+            if not success and self.fast2sms_enabled:
+                sms_success, sms_detail = self.send_sms_via_fast2sms(mobile, message)
+                if sms_success:
+                    success, detail = True, sms_detail
+                else:
+                    detail = f"{detail}; SMS: {sms_detail}"
+        latency = time.perf_counter() - queued_at
+        metrics.observe("critical_alert_latency_seconds", latency)
+        metrics.inc("critical_alerts_total", outcome="sent" if success else "failed")
+        self.store.mark_critical_alert(
+            alert_id, 'sent' if success else 'failed', None if success else detail, round(latency * 1000, 2)
+        )
+        if not success:
+            log.error("Critical alert not delivered", extra={'alert_id': alert_id, 'error': detail})
+        return success, detail
+
+    def calculate_derived_tests(self, test_results, requested=None):
+        """Fill in calculated tests that were requested but left blank.
+
+        A derived test is requested by sending it with an empty value or by
+        naming it in requested (calculate_tests). Returns (results, calculated).
+        """
+        if not isinstance(test_results, dict) or not self.derived_tests_enabled:
+            return test_results, []
+        blank = {name for name, value in test_results.items() if not ('' if value is None else str(value).strip())}
+        wanted = blank | (set(requested) if isinstance(requested, list) else set())
+        if not wanted:
+            return test_results, []
+        results, calculated = self.derived_tests.apply(test_results, only=wanted)
+        # Requested derived tests that could not be calculated are left out of the report
+        results = {
+            name: value for name, value in results.items()
+            if ('' if value is None else str(value).strip()) or name not in self.derived_tests.by_name
+        }
+        return results, calculated
+
+    def qc_held_tests(self, test_results=None):
+        """Tests in test_results (all when None) whose latest QC run was rejected"""
+        if not self.qc_block_release:
+            return []
+        if test_results is None:
+            return self.store.qc_blocked()
+        if not isinstance(test_results, dict):
+            return []
+        return self.store.qc_blocked(name for name, value in test_results.items() if value)
+
+    def qc_hold_message(self, tests):
+        return f"Report held: QC failed for {', '.join(tests)}. Run passing controls before releasing."
+
+    def stored_report_html(self, versions):
+        """Report HTML of the latest version of a stored report (report_versions chain)"""
+        current = versions[-1]
+        patient_data = {key: current[column] for key, column in REPORT_PATIENT_FIELDS.items()}
+        report_ids = {version['id'] for version in versions}
+        amendment = None
+        if len(versions) > 1:
+            amendment = {
+                'version': current['version'],
+                'parent_report_id': versions[0]['id'],
+                'original_date': versions[0]['report_date'],
+                'reason': current['amendment_reason'],
+                'amended_by': current['amended_by'],
+                'changes': {change['test']: change['old'] for change in current['changes']},
+                'results': current['test_results'],
+                'report_ids': report_ids,
+            }
+        day = str(versions[0]['report_date'] or current['sample_date'] or '')[:10]
+        return self.generate_pdf_html(
+            patient_data, current['test_results'], amendment, stored={'report_ids': report_ids, 'day': day}
+        )
+
+    def render_report_bundle(self, day, base_url, doctor=None, branch_id=None, limit=None):
+        """One PDF (or HTML) of every report issued on day, e.g. for one referring doctor.
+
+        Returns (status, body). Each report keeps the letterhead of its branch;
+        amended reports are rendered at their latest version.
+        """
+        limit = min(int(limit or report_bundle.BUNDLE_MAX_REPORTS), report_bundle.BUNDLE_MAX_REPORTS)
+        rows = self.store.bundle_reports(day, doctor, branch_id, limit + 1)
+        if not rows:
+            return 404, {'success': False, 'message': f'No reports on {day}' + (f' for {doctor}' if doctor else '')}
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+
+        def report_htmls():
+            for report_id, report_branch_id in rows:
+                with branches.use(self.branch_registry.by_id(report_branch_id)):
+                    yield self.stored_report_html(self.store.report_versions(report_id))
+
+        doctor_tag = re.sub(r'[^A-Za-z0-9]+', '_', doctor).strip('_') if doctor else 'All'
+        file_base = f"Report_Bundle_{doctor_tag}_{day}_{datetime.now().strftime('%H%M%S')}"
+
+        def progress(stats):
+            log.info("Report bundle progress", extra={
+                'reports': stats['reports'], 'pages': stats['pages'], 'pages_per_second': stats.get('pages_per_second'),
+            })
+
+        with app_logging.span("render_report_bundle", reports=len(rows)):
+            stats = report_bundle.render_bundle(
+                report_htmls(), os.path.join(self.reports_dir, file_base),
+                progress=progress, use_pdf='weasyprint' in self.pdf_engines.available(),
+            )
+        metrics.observe("report_bundle_seconds", stats['seconds'], engine=stats['engine'])
+        filename = os.path.basename(stats.pop('path'))
+        return 200, {
+            'success': True,
+            'url': f"{base_url}/view-report/{urllib.parse.quote(filename)}",
+            'truncated': truncated,
+            **stats,
+        }
+
+    def render_report_files(self, patient_data, test_results, base_url, file_tag=None, amendment=None):
+        """Write the HTML report (and PDF when possible) and return paths/URLs"""
+        file_tag = file_tag or datetime.now().strftime("%Y%m%d_%H%M%S")
+        patient_name_clean = str(patient_data.get('name', 'Unknown')).replace(' ', '_').replace('/', '_').replace('\\', '_')
+
+        # Generate HTML report
+        with metrics.timer("report_html_render_seconds"):
+            html_content = self.generate_pdf_html(patient_data, test_results, amendment)
+        html_filename = f"Pathology_Report_{patient_name_clean}_{file_tag}.html"
+        html_filepath = os.path.join(self.reports_dir, html_filename)
+
+        with open(html_filepath, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+
+        # Try to generate PDF if possible
+        pdf_generated = False
+        report_path = html_filepath
+        pdf_url = f"{base_url}/view-report/{urllib.parse.quote(html_filename)}"
+
+        if self.pdf_engines.available():
+            pdf_filename = f"Pathology_Report_{patient_name_clean}_{file_tag}.pdf"
+            pdf_filepath = os.path.join(self.reports_dir, pdf_filename)
+
+            if self.generate_pdf(html_content, pdf_filepath):
+                pdf_generated = True
+                report_path = pdf_filepath
+                pdf_url = f"{base_url}/view-report/{urllib.parse.quote(pdf_filename)}"
+
+        return {
+            'html_filepath': html_filepath,
+            'report_path': report_path,
+            'pdf_url': pdf_url,
+            'pdf_generated': pdf_generated,
+        }
+
+    def deliver_report_notifications(self, patient_data, pdf_url):
+        """Send WhatsApp (and SMS when configured) for a generated report
+
+        With FAST2SMS_SEND_ALWAYS the two channels are independent, so they
+        run concurrently under one NOTIFY_DEADLINE_SECONDS deadline. Otherwise
+        SMS is a fallback and has to wait for the WhatsApp outcome.
+        """
+        mobile = patient_data.get('mobile', '')
+        started = time.perf_counter()
+        timings = {}
+
+        send_whatsapp = functools.partial(self.send_whatsapp_message, mobile, patient_data, pdf_url)
+        send_sms = functools.partial(
+            self.send_sms_via_fast2sms, mobile, self.create_sms_message(patient_data, pdf_url)
+        )
+
+        sms_success = None
+        sms_message = "SMS not attempted."
+        if self.fast2sms_enabled and self.fast2sms_send_always:
+            (whatsapp_success, whatsapp_message), (sms_success, sms_message) = self.dispatch_notifications(
+                [('whatsapp', send_whatsapp), ('sms', send_sms)], timings
+            )
+        else:
+            whatsapp_success, whatsapp_message = self._timed_channel('whatsapp', send_whatsapp, timings)
+            if self.fast2sms_enabled and not whatsapp_success:
+                sms_success, sms_message = self._timed_channel('sms', send_sms, timings)
+        timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+
+        return {
+            'whatsapp_success': whatsapp_success,
+            'whatsapp_message': whatsapp_message,
+            'whatsapp_manual_url': self.build_manual_whatsapp_url(patient_data, pdf_url),
+            'sms_success': sms_success,
+            'sms_message': sms_message,
+            'timings_ms': dict(timings),
+        }
+
+    def dispatch_notifications(self, channels, timings):
+        """Run [(name, func)] on the notification executor with a shared deadline.
+
+        Returns the (success, message) of each channel in order. A channel
+        that misses the deadline is reported as failed; its call is left to
+        finish in the background, so the message may still arrive.
+        """
+        deadline = time.monotonic() + self.notify_deadline
+        futures = []
+        for name, func in channels:
+            task = functools.partial(self._timed_channel, name, func, timings)
+            if has_request_context():
+                task = copy_current_request_context(task)
+            futures.append((name, self.notify_executor.submit(app_logging.bind_context(task))))
+
+        results = []
+        for name, future in futures:
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                timings.setdefault(name, round(self.notify_deadline * 1000, 2))
+                log.warning("Notification channel missed the deadline", extra={
+                    'channel': name,
+                    'deadline_s': self.notify_deadline,
+                })
+                results.append((False, f"{name} delivery timed out after {self.notify_deadline:g}s"))
+            except Exception as e:
+                log.exception("Notification channel failed", extra={'channel': name})
+                results.append((False, f"{name} delivery failed: {str(e)}"))
+        return results
+
+    def _timed_channel(self, name, func, timings):
+        channel_started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            timings[name] = round((time.perf_counter() - channel_started) * 1000, 2)
+
+    def build_manual_whatsapp_url(self, patient_data, pdf_url):
+        """wa.me link the front desk can open when automatic delivery fails"""
+        manual_mobile, manual_mobile_error = self.validate_mobile_number(patient_data.get('mobile', ''))
+        if manual_mobile_error:
+            return None
+        return self.build_whatsapp_web_url(
+            manual_mobile,
+            self.create_whatsapp_message(patient_data, pdf_url),
+        )
+
+    def finalize_report_submission(self, patient_data, test_results, rendered, delivery, endpoint='submit-report'):
+        """Store a delivered report and build the /submit-report response body"""
+        whatsapp_success = delivery['whatsapp_success']
+        whatsapp_message = delivery['whatsapp_message']
+        sms_success = delivery['sms_success']
+        sms_message = delivery['sms_message']
+
+        delivery_success = bool(whatsapp_success) or bool(sms_success)
+        delivery_status = "sent" if delivery_success else "failed"
+        response_message = (
+            "Report submitted and notification sent successfully!"
+            if delivery_success
+            else "Report submitted, but message delivery failed."
+        )
+
+        # Store in database
+        report_path = rendered['report_path']
+        self.store_completed_report(
+            patient_data,
+            test_results,
+            report_path,
+            whatsapp_success,
+            whatsapp_message,
+            sms_success,
+            sms_message
+        )
+        metrics.inc("reports_submitted_total", endpoint=endpoint)
+
+        return {
+            'success': True,
+            'message': response_message,
+            'delivery_status': delivery_status,
+            'delivery_success': delivery_success,
+            'whatsapp_status': 'sent' if whatsapp_success else 'failed',
+            'whatsapp_message': whatsapp_message,
+            'whatsapp_manual_url': delivery['whatsapp_manual_url'],
+            'sms_status': 'not_attempted' if sms_success is None else ('sent' if sms_success else 'failed'),
+            'sms_message': sms_message,
+            'pdf_path': report_path,
+            'pdf_url': rendered['pdf_url'],
+            'report_type': 'pdf' if rendered['pdf_generated'] else 'html',
+            'delivery_timings_ms': delivery.get('timings_ms'),
+        }
+
+    def amend_report(self, report_id, data, base_url, amended_by=None):
+        """Issue a corrected version of a stored report. Returns (status, body).
+
+        amended_by (the staff member issuing it) is required and stored with the version.
+
+        data: {"test_results": {test: corrected value, "" to remove it},
+               "patient_data": {...corrected fields}, "reason": "...",
+               "version": version being corrected (optional), "notify": true}
+        Only the changed tests are stored; the report is re-rendered from the
+        latest version plus the corrections and marked AMENDED.
+        """
+        versions = self.store.report_versions(report_id)
+        if not versions:
+            return 404, {'success': False, 'message': 'Report not found'}
+        current = versions[-1]
+        corrections = data.get('test_results') or {}
+        if not isinstance(corrections, dict):
+            return 400, {'success': False, 'message': 'test_results must map test name to corrected value'}
+        reason = str(data.get('reason') or '').strip()
+        if not reason:
+            return 400, {'success': False, 'message': 'A reason is required to amend a report'}
+        amended_by = str(amended_by or '').strip()
+        if not amended_by:
+            return 400, {'success': False, 'message': 'The person amending the report is required'}
+        if data.get('version') is not None and str(data['version']) != str(current['version']):
+            return 409, {
+                'success': False,
+                'message': f"Report has been amended since version {data['version']}",
+                'version': current['version'],
+            }
+
+        fields = REPORT_PATIENT_FIELDS
+        patient_data = {key: current[column] for key, column in fields.items()}
+        patient_data.update({
+            key: value for key, value in (data.get('patient_data') or {}).items() if key in fields
+        })
+
+        results = dict(current['test_results'])
+        results.update({test_name: '' if value is None else str(value).strip() for test_name, value in corrections.items()})
+        # Derived tests follow their corrected inputs unless they were corrected themselves
+        for test_name in self.derived_tests.by_name:
+            if test_name in results and test_name not in corrections and any(
+                input_name in corrections for input_name in self.derived_tests.inputs_for(test_name)
+            ):
+                results[test_name] = ''
+        results, calculated_tests = self.calculate_derived_tests(results)
+        results = {test_name: value for test_name, value in results.items() if value is not None and str(value).strip()}
+
+        previous = current['test_results']
+        changes = {
+            test_name: (previous.get(test_name), results.get(test_name))
+            for test_name in sorted(set(previous) | set(results))
+            if previous.get(test_name) != results.get(test_name)
+        }
+        patient_changed = any(patient_data[key] != current[column] for key, column in fields.items())
+        if not changes and not patient_changed:
+            return 400, {'success': False, 'message': 'Nothing to amend: the corrections match the current report'}
+
+        validation_error = self.validate_submission(patient_data)
+        if validation_error:
+            return 400, {'success': False, 'message': validation_error}
+        corrected = {test_name: new for test_name, (_, new) in changes.items() if new}
+        qc_blocked = self.qc_held_tests(corrected)
+        if qc_blocked:
+            metrics.inc("reports_held_total", endpoint='amend-report')
+            return 409, {'success': False, 'message': self.qc_hold_message(qc_blocked), 'qc_blocked': qc_blocked}
+
+        version = current['version'] + 1
+        amendment = {
+            'version': version,
+            'parent_report_id': versions[0]['id'],
+            'original_date': versions[0]['report_date'],
+            'reason': reason,
+            'amended_by': amended_by,
+            'changes': {test_name: old for test_name, (old, _) in changes.items()},
+            'results': results,
+            'report_ids': {v['id'] for v in versions},
+        }
+        rendered = self.render_report_files(
+            patient_data, results, base_url,
+            file_tag=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_v{version}", amendment=amendment,
+        )
+        if data.get('notify', True):
+            delivery = self.deliver_report_notifications(patient_data, rendered['pdf_url'])
+        else:
+            delivery = {'whatsapp_success': None, 'whatsapp_message': 'Not sent for this amendment.',
+                        'sms_success': None, 'sms_message': 'SMS not attempted.'}
+
+        row = self.build_completed_report_row(
+            patient_data, results, rendered['report_path'],
+            delivery['whatsapp_success'], delivery['whatsapp_message'],
+            delivery['sms_success'], delivery['sms_message'],
+        )
+        try:
+            with metrics.timer("db_write_seconds", operation="amend_report"):
+                stored = self.store.amend_report(
+                    report_id, row, changes, reason, expected_version=current['version'], amended_by=amended_by
+                )
+        except ValueError as e:
+            return 409, {'success': False, 'message': str(e)}
+        # Cohort statistics are cached in memory; drop them so corrected values are used
+        self.cohort_cache = cohort.ResultCache(self.store)
+        metrics.inc("reports_amended_total")
+        log.info("Report amended", extra={
+            'report_id': stored['report_id'],
+            'parent_report_id': stored['parent_report_id'],
+            'version': stored['version'],
+            'changed_tests': len(changes),
+            'amended_by': amended_by,
+        })
+
+        return 200, {
+            'success': True,
+            'message': f"Amended report issued (version {stored['version']})",
+            **stored,
+            'changes': [{'test': test_name, 'old': old, 'new': new} for test_name, (old, new) in changes.items()],
+            'calculated_tests': calculated_tests,
+            'critical_alerts': self.raise_critical_alerts(patient_data, corrected, base_url),
+            'whatsapp_status': row[9],
+            'sms_status': row[11],
+            'pdf_path': rendered['report_path'],
+            'pdf_url': rendered['pdf_url'],
+            'report_type': 'pdf' if rendered['pdf_generated'] else 'html',
+        }
+
+    def parse_batch_submissions(self):
+        """Read bulk submissions from a JSON array/object or an NDJSON stream"""
+        mimetype = (request.mimetype or '').lower()
+
+        if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            submissions = []
+            for line_no, raw_line in enumerate(request.stream, start=1):
+                line = raw_line.strip()
+                if not line:
+                    continue
+                try:
+                    submissions.append(json.loads(line))
+                except ValueError as e:
+                    submissions.append({'_parse_error': f'Line {line_no}: invalid JSON ({e})'})
+                if len(submissions) > self.batch_max_items:
+                    break
+        elif request.is_json:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                data = data.get('submissions')
+            if not isinstance(data, list):
+                return None, 'Expected a JSON array of submissions or {"submissions": [...]}'
+            submissions = data
+        else:
+            return None, 'Content-Type must be application/json or application/x-ndjson'
+
+        if not submissions:
+            return None, 'No submissions received'
+        return submissions, None
+
+    def process_report_batch(self, submissions, base_url, notify=True):
+        """Validate, render and store many submissions; return per-item statuses"""
+        results = [None] * len(submissions)
+        pending = []
+        alerts = {}
+        qc_blocked = set(self.qc_held_tests())
+
+        # Validate everything up front so bad items never reach the renderers
+        for index, item in enumerate(submissions):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'status': 'invalid', 'message': 'Submission must be a JSON object'}
+                continue
+            if '_parse_error' in item:
+                results[index] = {'index': index, 'status': 'invalid', 'message': item['_parse_error']}
+                continue
+
+            patient_data = item.get('patient_data') or {}
+            test_results, _ = self.calculate_derived_tests(item.get('test_results') or {}, item.get('calculate_tests'))
+            error = self.validate_submission(patient_data)
+            if not error and not isinstance(test_results, dict):
+                error = 'test_results must be an object'
+            error = error or self.validate_offered_tests(test_results)
+            if error:
+                results[index] = {'index': index, 'status': 'invalid', 'message': error}
+                continue
+            held = sorted(qc_blocked.intersection(name for name, value in test_results.items() if value))
+            if held:
+                metrics.inc("reports_held_total", endpoint="submit-reports")
+                results[index] = {'index': index, 'status': 'qc_hold', 'message': self.qc_hold_message(held),
+                                  'qc_blocked': held}
+                continue
+            pending.append((index, patient_data, test_results))
+            # notify only covers patient messages; critical values always reach the doctor
+            alerts[index] = self.raise_critical_alerts(patient_data, test_results, base_url)
+
+        batch_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        def process_item(index, patient_data, test_results):
+            try:
+                rendered = self.render_report_files(
+                    patient_data, test_results, base_url, file_tag=f"{batch_stamp}_{index + 1:04d}"
+                )
+                if notify:
+                    delivery = self.deliver_report_notifications(patient_data, rendered['pdf_url'])
+                else:
+                    delivery = {
+                        'whatsapp_success': None,
+                        'whatsapp_message': 'Notification skipped for batch import.',
+                        'sms_success': None,
+                        'sms_message': 'SMS not attempted.',
+                    }
+                return rendered, delivery
+            finally:
+                metrics.add_gauge("report_queue_depth", -1)
+
+        # Render (and notify) in parallel; the database is only touched below
+        rows = []
+        stored_indexes = []
+        metrics.add_gauge("report_queue_depth", len(pending))
+        with ThreadPoolExecutor(max_workers=self.batch_workers) as pool:
+            futures = []
+            for index, patient_data, test_results in pending:
+                task = process_item
+                if has_request_context():
+                    task = copy_current_request_context(process_item)
+                task = app_logging.bind_context(task)
+                futures.append((index, patient_data, test_results, pool.submit(task, index, patient_data, test_results)))
+
+            for index, patient_data, test_results, future in futures:
+                try:
+                    rendered, delivery = future.result()
+                except Exception as e:
+                    results[index] = {'index': index, 'status': 'error', 'message': f'Render failed: {e}',
+                                      'critical_alerts': alerts[index]}
+                    continue
+
+                row = self.build_completed_report_row(
+                    patient_data,
+                    test_results,
+                    rendered['report_path'],
+                    delivery['whatsapp_success'],
+                    delivery['whatsapp_message'],
+                    delivery['sms_success'],
+                    delivery['sms_message'],
+                )
+                rows.append(row)
+                stored_indexes.append(index)
+                results[index] = {
+                    'index': index,
+                    'status': 'stored',
+                    'patient_name': patient_data.get('name'),
+                    'pdf_url': rendered['pdf_url'],
+                    'report_type': 'pdf' if rendered['pdf_generated'] else 'html',
+                    'whatsapp_status': row[9],
+                    'sms_status': row[11],
+                    'critical_alerts': alerts[index],
+                }
+
+        # One transaction for the whole batch
+        db_success, db_error = self.store_completed_reports_batch(rows)
+        if not db_success:
+            for index in stored_indexes:
+                results[index]['status'] = 'error'
+                results[index]['message'] = f'Database error: {db_error}'
+        else:
+            metrics.inc("reports_submitted_total", len(rows), endpoint="submit-reports")
+
+        return results
+
+    @traced("send_sms")
     def send_sms_via_fast2sms(self, mobile_number, message):
         """Send SMS via Fast2SMS API."""
         if not self.fast2sms_enabled:
@@ -1945,87 +3212,112 @@ class PathologyTestsForm(TkBase):
             return False, "Fast2SMS API key is missing."
 
         try:
-            mobile_clean = re.sub(r"\D", "", str(mobile_number or ""))
-            if len(mobile_clean) == 12 and mobile_clean.startswith("91"):
-                mobile_clean = mobile_clean[2:]
-            if len(mobile_clean) == 11 and mobile_clean.startswith("0"):
-                mobile_clean = mobile_clean[1:]
-            if len(mobile_clean) != 10:
-                return False, "Invalid mobile number for Fast2SMS (expected 10 digits)."
-
-            url = "https://www.fast2sms.com/dev/bulkV2"
-            params = {
-                "message": message,
-                "language": self.fast2sms_language,
-                "route": self.fast2sms_route,
-                "numbers": mobile_clean,
-            }
-            headers = {
-                "cache-control": "no-cache",
-                "authorization": self.fast2sms_api_key,
-            }
+            mobile_clean, mobile_error = self._fast2sms_number(mobile_number)
+            if mobile_error:
+                return False, mobile_error
 
-            # Try primary request style first (header auth + query params).
-            response = requests.get(url, params=params, headers=headers, timeout=12)
+            url = self.fast2sms_api_url
+            params, headers = self._build_fast2sms_request(mobile_clean, message)
 
-            # Fallback for compatibility: some accounts/workflows expect authorization in query string.
-            if response.status_code in (401, 403):
-                params_with_auth = dict(params)
-                params_with_auth["authorization"] = self.fast2sms_api_key
-                fallback_headers = {"cache-control": "no-cache"}
-                response = requests.get(url, params=params_with_auth, headers=fallback_headers, timeout=12)
+            with metrics.timer("notification_api_seconds", provider="fast2sms"):
+                # Try primary request style first (header auth + query params).
+                response = self.http_session.get(url, params=params, headers=headers, timeout=12)
 
+                # Fallback for compatibility: some accounts/workflows expect authorization in query string.
+                if response.status_code in (401, 403):
+                    params_with_auth = dict(params)
+                    params_with_auth["authorization"] = self.fast2sms_api_key
+                    fallback_headers = {"cache-control": "no-cache"}
+                    response = self.http_session.get(url, params=params_with_auth, headers=fallback_headers, timeout=12)
+
+            if response.status_code >= 400:
+                self._record_notification("fast2sms", False, f"http_{response.status_code}")
             response.raise_for_status()
 
             try:
                 response_json = response.json()
             except Exception:
+                self._record_notification("fast2sms", False, "invalid_response")
                 return False, f"Fast2SMS returned non-JSON response: {response.text}"
 
-            return_flag = response_json.get("return")
-            is_success = return_flag is True or str(return_flag).strip().lower() == "true"
-            if is_success:
-                request_id = str(response_json.get("request_id", "")).strip()
-                if request_id:
-                    return True, f"SMS sent successfully via Fast2SMS (request_id: {request_id})"
-                return True, "SMS sent successfully via Fast2SMS."
-
-            error_text = response_json.get("message", "Unknown error")
-            if isinstance(error_text, list):
-                error_text = "; ".join(str(item) for item in error_text)
-            error_text = str(error_text)
-
-            code_hint = response_json.get("code")
-            if code_hint:
-                return False, f"Fast2SMS error [{code_hint}]: {error_text}"
-            return False, f"Fast2SMS error: {error_text}"
+            return self._parse_fast2sms_response(response_json)
 
+        except requests.exceptions.HTTPError as e:
+            return False, f"Fast2SMS API request failed: {str(e)}"
         except requests.exceptions.RequestException as e:
+            self._record_notification("fast2sms", False, "request_error")
             return False, f"Fast2SMS API request failed: {str(e)}"
         except Exception as e:
             return False, f"Error sending SMS via Fast2SMS: {str(e)}"
 
+    def _fast2sms_number(self, mobile_number):
+        """Normalize a mobile number to the 10 digits Fast2SMS expects."""
+        mobile_clean = re.sub(r"\D", "", str(mobile_number or ""))
+        if len(mobile_clean) == 12 and mobile_clean.startswith("91"):
+            mobile_clean = mobile_clean[2:]
+        if len(mobile_clean) == 11 and mobile_clean.startswith("0"):
+            mobile_clean = mobile_clean[1:]
+        if len(mobile_clean) != 10:
+            return None, "Invalid mobile number for Fast2SMS (expected 10 digits)."
+        return mobile_clean, None
+
+    def _build_fast2sms_request(self, mobile_clean, message):
+        """Query params and headers for a Fast2SMS bulkV2 call."""
+        params = {
+            "message": message,
+            "language": self.fast2sms_language,
+            "route": self.fast2sms_route,
+            "numbers": mobile_clean,
+        }
+        headers = {
+            "cache-control": "no-cache",
+            "authorization": self.fast2sms_api_key,
+        }
+        return params, headers
+
+    def _parse_fast2sms_response(self, response_json):
+        """Turn a Fast2SMS JSON reply into (success, message) and count it."""
+        return_flag = response_json.get("return")
+        is_success = return_flag is True or str(return_flag).strip().lower() == "true"
+        self._record_notification(
+            "fast2sms", is_success, "" if is_success else str(response_json.get("code") or "api_error")
+        )
+        if is_success:
+            request_id = str(response_json.get("request_id", "")).strip()
+            if request_id:
+                return True, f"SMS sent successfully via Fast2SMS (request_id: {request_id})"
+            return True, "SMS sent successfully via Fast2SMS."
+
+        error_text = response_json.get("message", "Unknown error")
+        if isinstance(error_text, list):
+            error_text = "; ".join(str(item) for item in error_text)
+        error_text = str(error_text)
+
+        code_hint = response_json.get("code")
+        if code_hint:
+            return False, f"Fast2SMS error [{code_hint}]: {error_text}"
+        return False, f"Fast2SMS error: {error_text}"
+
+    def _record_notification(self, provider, success, error_code=""):
+        """Count a notification attempt for /metrics"""
+        metrics.inc(
+            "notifications_total",
+            provider=provider,
+            outcome="success" if success else "failure",
+            error_code="" if success else (error_code or "unknown"),
+        )
+
     def validate_mobile_number(self, mobile_number):
         """Validate and normalize number for WhatsApp Cloud API."""
         try:
-            mobile_clean = re.sub(r"\D", "", str(mobile_number or ""))
-            if not mobile_clean:
+            if not re.sub(r"\D", "", str(mobile_number or "")):
                 return None, "Mobile number is required."
 
-            # Remove international prefix "00" if provided.
-            if mobile_clean.startswith("00"):
-                mobile_clean = mobile_clean[2:]
-
-            # Normalize common local format like 0XXXXXXXXXX.
-            if len(mobile_clean) == 11 and mobile_clean.startswith("0"):
-                mobile_clean = mobile_clean[1:]
-
-            # If only local 10-digit number is given, prepend configured country code.
-            if len(mobile_clean) == 10:
-                mobile_clean = f"{self.whatsapp_default_country_code}{mobile_clean}"
-
+            # Same normalization as the patient master index: drop "00"/"0"
+            # prefixes and prepend the country code to 10-digit local numbers.
             # Cloud API expects international format digits (typically 8-15 digits).
-            if not (8 <= len(mobile_clean) <= 15):
+            mobile_clean = normalize_mobile(mobile_number, self.whatsapp_default_country_code)
+            if not mobile_clean:
                 return None, (
                     "Invalid mobile number format. Use international format digits only, "
                     "for example 919876543210."
@@ -2041,6 +3333,7 @@ class PathologyTestsForm(TkBase):
         mobile_digits = re.sub(r"\D", "", str(mobile_number or ""))
         return f"https://wa.me/{mobile_digits}?text={encoded_message}"
 
+    @traced("send_whatsapp_message")
     def send_whatsapp_message(self, mobile_number, patient_data, report_url):
         """Send WhatsApp message with report link."""
         try:
@@ -2048,7 +3341,7 @@ class PathologyTestsForm(TkBase):
             if mobile_error:
                 return False, mobile_error
 
-            print(f"Preparing WhatsApp for: {formatted_mobile}")
+            log.info("Preparing WhatsApp message", extra={'mobile': formatted_mobile})
             message = self.create_whatsapp_message(patient_data, report_url)
 
             # Method 1: Cloud API (works in Render/server mode).
@@ -2069,7 +3362,7 @@ class PathologyTestsForm(TkBase):
                     if opened:
                         return True, "WhatsApp Web opened - please send manually"
                 except Exception as e:
-                    print(f"WhatsApp Web fallback failed: {e}")
+                    log.warning("WhatsApp Web fallback failed: %s", e)
 
                 # Method 3: WhatsApp desktop deep-link fallback.
                 try:
@@ -2088,19 +3381,22 @@ class PathologyTestsForm(TkBase):
                 return True, f"Report URL generated: {report_url}"
 
             # Server mode fallback: be explicit and fail.
-            config_hint = ""
-            if not self.whatsapp_phone_number_id or not self.whatsapp_access_token:
-                config_hint = " Configure WHATSAPP_PHONE_NUMBER_ID and WHATSAPP_ACCESS_TOKEN."
-            return False, (
-                f"{api_message}. WhatsApp Web/Desktop fallback is unavailable on server mode. "
-                f"{config_hint}".strip()
-            )
+            return False, self._server_mode_whatsapp_failure(api_message)
 
         except Exception as e:
             error_msg = f"WhatsApp preparation failed: {str(e)}"
-            print(f"WhatsApp error: {error_msg}")
+            log.exception("WhatsApp error")
             return False, error_msg
 
+    def _server_mode_whatsapp_failure(self, api_message):
+        config_hint = ""
+        if not self.whatsapp_phone_number_id or not self.whatsapp_access_token:
+            config_hint = " Configure WHATSAPP_PHONE_NUMBER_ID and WHATSAPP_ACCESS_TOKEN."
+        return (
+            f"{api_message}. WhatsApp Web/Desktop fallback is unavailable on server mode. "
+            f"{config_hint}".strip()
+        )
+
     def _extract_cloud_api_error(self, response):
         """Extract normalized error details from Cloud API response."""
         try:
@@ -2145,16 +3441,34 @@ class PathologyTestsForm(TkBase):
             params.append({"type": "text", "text": value or "-"})
         return params
 
+    @traced("whatsapp_template_api")
     def send_whatsapp_template_via_cloud_api(self, mobile_number, patient_data, report_url):
         """Send WhatsApp template via Meta Cloud API (for business-initiated messages)."""
         if not self.whatsapp_template_name:
             return False, "WHATSAPP_TEMPLATE_NAME is not configured"
 
+        url, headers, payload = self._build_whatsapp_template_request(mobile_number, patient_data, report_url)
+
+        try:
+            with metrics.timer("notification_api_seconds", provider="whatsapp_template"):
+                response = self.http_session.post(url, json=payload, headers=headers, timeout=20)
+        except Exception as e:
+            self._record_notification("whatsapp_template", False, "request_error")
+            return False, f"Template API request failed: {str(e)}"
+
+        return self._whatsapp_template_result(response)
+
+    def _whatsapp_messages_endpoint(self):
         url = f"{self.whatsapp_api_url}{self.whatsapp_phone_number_id}/messages"
         headers = {
             "Authorization": f"Bearer {self.whatsapp_access_token}",
             "Content-Type": "application/json",
         }
+        return url, headers
+
+    def _build_whatsapp_template_request(self, mobile_number, patient_data, report_url):
+        """URL, headers and payload for a Cloud API template message."""
+        url, headers = self._whatsapp_messages_endpoint()
         template_obj = {
             "name": self.whatsapp_template_name,
             "language": {"code": self.whatsapp_template_lang},
@@ -2174,51 +3488,45 @@ class PathologyTestsForm(TkBase):
             "type": "template",
             "template": template_obj,
         }
+        return url, headers, payload
 
-        try:
-            response = requests.post(url, json=payload, headers=headers, timeout=20)
-        except Exception as e:
-            return False, f"Template API request failed: {str(e)}"
-
+    def _whatsapp_template_result(self, response):
+        """Interpret a template API response as (success, message)."""
         if response.status_code in (200, 201):
+            self._record_notification("whatsapp_template", True)
             return True, f"WhatsApp template sent ({self.whatsapp_template_name})"
 
         error_code, error_message = self._extract_cloud_api_error(response)
+        self._record_notification("whatsapp_template", False, error_code or f"http_{response.status_code}")
         return False, (
             f"Template API error {response.status_code} "
             f"(code {error_code or 'n/a'}): {error_message}"
         )
 
+    @traced("whatsapp_text_api")
     def send_whatsapp_via_cloud_api(self, mobile_number, message, report_url=None, patient_data=None):
         """Send WhatsApp text via Meta Cloud API, with optional template fallback."""
         try:
             if not self.whatsapp_phone_number_id or not self.whatsapp_access_token:
                 return False, "WhatsApp Cloud API is not configured"
 
-            url = f"{self.whatsapp_api_url}{self.whatsapp_phone_number_id}/messages"
-            headers = {
-                "Authorization": f"Bearer {self.whatsapp_access_token}",
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "messaging_product": "whatsapp",
-                "to": mobile_number,
-                "type": "text",
-                "text": {
-                    "preview_url": True,
-                    "body": message,
-                },
-            }
+            url, headers = self._whatsapp_messages_endpoint()
+            payload = self._build_whatsapp_text_payload(mobile_number, message)
 
-            response = requests.post(url, json=payload, headers=headers, timeout=20)
+            try:
+                with metrics.timer("notification_api_seconds", provider="whatsapp_text"):
+                    response = self.http_session.post(url, json=payload, headers=headers, timeout=20)
+            except Exception:
+                self._record_notification("whatsapp_text", False, "request_error")
+                raise
             if response.status_code in (200, 201):
+                self._record_notification("whatsapp_text", True)
                 return True, "WhatsApp message sent via Cloud API"
 
             error_code, error_message = self._extract_cloud_api_error(response)
+            self._record_notification("whatsapp_text", False, error_code or f"http_{response.status_code}")
 
-            if self.whatsapp_template_name and self._should_try_template_fallback(
-                error_code, error_message
-            ):
+            if self._wants_template_fallback(error_code, error_message):
                 template_success, template_message = self.send_whatsapp_template_via_cloud_api(
                     mobile_number,
                     patient_data or {},
@@ -2231,27 +3539,47 @@ class PathologyTestsForm(TkBase):
                     f"Template fallback failed: {template_message}"
                 )
 
-            if error_code == "131030":
-                return False, (
-                    "Recipient number is not allowed for current WhatsApp test setup. "
-                    "Add the patient number as a test recipient in Meta dashboard. "
-                    f"Details: {error_message}"
-                )
+            return False, self._describe_cloud_api_error(response.status_code, error_code, error_message)
 
-            if error_code == "131026":
-                return False, (
-                    "Recipient number format is invalid for Cloud API. "
-                    "Use international digits only, for example 919876543210. "
-                    f"Details: {error_message}"
-                )
+        except Exception as e:
+            return False, f"Cloud API request failed: {str(e)}"
+
+    def _build_whatsapp_text_payload(self, mobile_number, message):
+        return {
+            "messaging_product": "whatsapp",
+            "to": mobile_number,
+            "type": "text",
+            "text": {
+                "preview_url": True,
+                "body": message,
+            },
+        }
 
-            return False, (
-                f"Cloud API error {response.status_code} "
-                f"(code {error_code or 'n/a'}): {error_message}"
+    def _wants_template_fallback(self, error_code, error_message):
+        return bool(self.whatsapp_template_name) and self._should_try_template_fallback(
+            error_code, error_message
+        )
+
+    def _describe_cloud_api_error(self, status_code, error_code, error_message):
+        """User-facing explanation of a failed Cloud API text message."""
+        if error_code == "131030":
+            return (
+                "Recipient number is not allowed for current WhatsApp test setup. "
+                "Add the patient number as a test recipient in Meta dashboard. "
+                f"Details: {error_message}"
             )
 
-        except Exception as e:
-            return False, f"Cloud API request failed: {str(e)}"
+        if error_code == "131026":
+            return (
+                "Recipient number format is invalid for Cloud API. "
+                "Use international digits only, for example 919876543210. "
+                f"Details: {error_message}"
+            )
+
+        return (
+            f"Cloud API error {status_code} "
+            f"(code {error_code or 'n/a'}): {error_message}"
+        )
 
     def show_message_dialog(self, patient_data, report_url):
         """Show dialog with message to copy"""
@@ -2340,14 +3668,15 @@ class PathologyTestsForm(TkBase):
         report_url = str(report_url or "").strip()
         return (
             f"Dear {patient_name}, your pathology report is ready. "
-            f"View it here: {report_url} - UJJIVAN Hospital"
+            f"View it here: {report_url} - {self.current_branch().name}"
         )
 
     def create_whatsapp_message(self, patient_data, report_url):
         """Create WhatsApp message content with patient messaging CTA"""
         report_url = str(report_url or "").strip()
         contact_url = f"{self.get_public_base_url()}/contact-hospital"
-        return f"""📬 *UJJIVAN HOSPITAL - PATHOLOGY REPORT*
+        branch = self.current_branch()
+        return f"""📬 *{branch.name.upper()} - PATHOLOGY REPORT*
 
 Dear {patient_data.get('name', 'Patient')},
 
@@ -2381,8 +3710,8 @@ Or visit our website to send a message: {contact_url}
 
 *Note:* This link is valid for 30 days. Contact hospital for queries.
 
-Thank you for choosing UJJIVAN Hospital.
-🏥 Vidyut Nagar, Gautam Budh Nagar, UP - 201008
+Thank you for choosing {branch.name}.
+🏥 {branch.address}
 """
 
     def start_flask_server(self):
@@ -2402,7 +3731,7 @@ Thank you for choosing UJJIVAN Hospital.
                 
                 self.flask_app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False, threaded=True)
             except Exception as e:
-                print(f"Flask server error: {e}")
+                log.exception("Flask server error")
                 if self.enable_gui and hasattr(self, "status_label"):
                     self.status_label.config(text=f"Server error: {e}")
         
@@ -2427,4 +3756,5 @@ if __name__ == "__main__":
     app = PathologyTestsForm(enable_gui=False, auto_start_server=False).flask_app
     app.run(host="0.0.0.0", port=10000, debug=True)
 else:
-    app = PathologyTestsForm(enable_gui=False, auto_start_server=False).flask_app
+    pathology_form = PathologyTestsForm(enable_gui=False, auto_start_server=False)
+    app = pathology_form.flask_app
@@ -1,42 +1,13 @@
-import sqlite3
+from datastore import PathologyStore
 
 
 def init_database():
-    conn = sqlite3.connect("hospital.db")
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_name TEXT NOT NULL,
-            opd_no TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            gender TEXT NOT NULL,
-            phone_number TEXT NOT NULL,
-            referred_by TEXT NOT NULL,
-            sample_date TEXT NOT NULL
-        )
-        """
-    )
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS test_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            test_name TEXT NOT NULL,
-            normal_range TEXT,
-            result_value TEXT NOT NULL,
-            category TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients (id)
-        )
-        """
-    )
-
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
+    # hospital.db is no longer used; consolidate_db.py imports any old rows
+    store = PathologyStore()
+    if store.applied_migrations:
+        print(f"Applied migrations: {', '.join(store.applied_migrations)}")
+    store.close()
+    print(f"Database initialized successfully! ({store.db_path})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""Prometheus-style metrics for the pathology system.
+
+Metrics live in process memory. When METRICS_MULTIPROC_DIR (or the
+prometheus_client compatible PROMETHEUS_MULTIPROC_DIR) is set, every process
+periodically snapshots its values to <dir>/metrics_<pid>.json and /metrics
+merges all snapshots, so the numbers add up across gunicorn workers.
+Counters and histograms of exited workers are kept; their gauges are dropped.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+import app_logging
+
+log = app_logging.get_logger("metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+# name -> (type, help, label names)
+METRIC_DEFINITIONS = {
+    "report_html_render_seconds": (
+        "histogram", "Time to render the report HTML.", ()),
+    "report_pdf_render_seconds": (
+        "histogram", "Time to render the report PDF, by engine.", ("engine",)),
+    "report_pdf_render_failures_total": (
+        "counter", "PDF render failures, by engine.", ("engine",)),
+    "report_pdf_bytes_total": (
+        "counter", "Bytes of report PDFs written, by engine.", ("engine",)),
+    "report_pdf_over_target_total": (
+        "counter", "Report PDFs larger than REPORT_PDF_TARGET_KB, by engine.", ("engine",)),
+    "report_pdf_html_fallback_total": (
+        "counter", "Reports saved as HTML because every PDF engine failed.", ()),
+    "notification_api_seconds": (
+        "histogram", "Latency of outbound notification API calls, by provider.", ("provider",)),
+    "notifications_total": (
+        "counter", "Notification attempts by provider, outcome and error code.",
+        ("provider", "outcome", "error_code")),
+    "db_write_seconds": (
+        "histogram", "Time spent writing to SQLite, by operation.", ("operation",)),
+    "db_read_seconds": (
+        "histogram", "Time spent on indexed SQLite lookups, by operation.", ("operation",)),
+    "reports_submitted_total": (
+        "counter", "Reports accepted, by endpoint.", ("endpoint",)),
+    "report_bundle_seconds": (
+        "histogram", "Time to render a multi-report bundle, by engine.", ("engine",)),
+    "reports_amended_total": (
+        "counter", "Amended report versions issued.", ()),
+    "reports_held_total": (
+        "counter", "Reports held back because an analyte failed QC, by endpoint.", ("endpoint",)),
+    "critical_alerts_total": (
+        "counter", "Critical-value alerts, by outcome.", ("outcome",)),
+    "critical_alert_latency_seconds": (
+        "histogram", "Time from report submission to a critical-value alert being sent.", ()),
+    "qc_runs_total": (
+        "counter", "Control runs recorded, by outcome.", ("status",)),
+    "report_queue_depth": (
+        "gauge", "Report jobs queued or in flight (render + notify).", ()),
+    "analyzer_queue_depth": (
+        "gauge", "Analyzer messages waiting for the batch writer.", ()),
+    "db_size_bytes": (
+        "gauge", "Size of the SQLite database file(s) on disk.", ()),
+}
+
+
+class MetricsRegistry:
+    def __init__(self, multiproc_dir=None, flush_interval=1.0, buckets=DEFAULT_BUCKETS):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._dirty = False
+        self._flusher = None
+        if self.multiproc_dir:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            atexit.register(self._flush_if_dirty)
+
+    @staticmethod
+    def _key(name, labels):
+        label_names = METRIC_DEFINITIONS[name][2]
+        return name, tuple(str(labels.get(label, "")) for label in label_names)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    def set_gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+        self._maybe_flush()
+
+    def add_gauge(self, name, amount, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            hist["buckets"][index] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # -- multiprocess snapshots -----------------------------------------
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[k[0], list(k[1]), v] for k, v in self._counters.items()],
+                "gauges": [[k[0], list(k[1]), v] for k, v in self._gauges.items()],
+                "histograms": [
+                    [k[0], list(k[1]), dict(v, buckets=list(v["buckets"]))]
+                    for k, v in self._histograms.items()
+                ],
+            }
+
+    def _maybe_flush(self):
+        """Mark the snapshot dirty; a background thread writes it out."""
+        if not self.multiproc_dir:
+            return
+        self._dirty = True
+        if self._flusher is None or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._flusher = threading.Thread(
+                        target=self._flush_loop, name="metrics-flush", daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_if_dirty()
+
+    def _flush_if_dirty(self):
+        if self._dirty:
+            self.flush()
+
+    def flush(self):
+        if not self.multiproc_dir:
+            return
+        self._dirty = False
+        path = os.path.join(self.multiproc_dir, f"metrics_{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Metrics snapshot failed: %s", e, extra={'path': path})
+
+    def reset_after_fork(self):
+        """Start a fresh per-process snapshot in a forked worker."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+        self._dirty = False
+        self._flusher = None
+
+    def _collect(self):
+        if not self.multiproc_dir:
+            return [self._snapshot()]
+
+        self.flush()
+        snapshots = []
+        for entry in os.scandir(self.multiproc_dir):
+            if not (entry.name.startswith("metrics_") and entry.name.endswith(".json")):
+                continue
+            try:
+                pid = int(entry.name[len("metrics_"):-len(".json")])
+                with open(entry.path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (ValueError, OSError):
+                continue
+            if not _pid_alive(pid):
+                snapshot["gauges"] = []
+            snapshots.append(snapshot)
+        return snapshots
+
+    # -- exposition -----------------------------------------------------
+
+    def render(self, extra_gauges=None):
+        """Return the Prometheus text exposition of all merged metrics.
+
+        extra_gauges ({name: value}) are process-independent values such as
+        database size, computed at scrape time instead of summed per worker.
+        """
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in self._collect():
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snapshot["gauges"]:
+                key = (name, tuple(labels))
+                gauges[key] = gauges.get(key, 0) + value
+            for name, labels, value in snapshot["histograms"]:
+                key = (name, tuple(labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = {
+                        "buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+                else:
+                    merged["buckets"] = [a + b for a, b in zip(merged["buckets"], value["buckets"])]
+                    merged["sum"] += value["sum"]
+                    merged["count"] += value["count"]
+        for name, value in (extra_gauges or {}).items():
+            gauges[(name, ())] = value
+
+        lines = []
+        for name, (metric_type, help_text, label_names) in METRIC_DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            source = {"counter": counters, "gauge": gauges, "histogram": histograms}[metric_type]
+            for (metric_name, label_values), value in sorted(source.items()):
+                if metric_name != name:
+                    continue
+                labels = list(zip(label_names, label_values))
+                if metric_type != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry(
+    multiproc_dir=(
+        os.getenv("METRICS_MULTIPROC_DIR", "").strip()
+        or os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+        or None
+    ),
+    flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0")),
+)
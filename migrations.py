@@ -0,0 +1,523 @@
+"""Versioned SQLite schema migrations.
+
+Every database keeps a schema_version table with one row per applied
+migration. On startup the only query needed is MAX(version). When migrations
+are pending, they run once, in order, each in its own transaction, under an
+exclusive lock file next to the database. Parallel gunicorn workers or a
+desktop app starting alongside the server therefore never apply the same
+ALTER TABLE twice.
+
+A migration is (version, name, steps). steps is a list of SQL statements or
+a callable taking the connection. Versions only ever grow; never edit a
+migration that has shipped, add a new one instead.
+
+    migrations.migrate(conn, db_path, migrations.PATHOLOGY_MIGRATIONS)
+"""
+import os
+import time
+import sqlite3
+
+import catalog
+import patient_index
+import result_trends
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+SCHEMA_VERSION_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def add_missing_columns(conn, table, columns):
+    """ALTER TABLE ... ADD COLUMN for each (name, definition) not yet present"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+# -- pathology_reports.db (hospital_system_final.py) ---------------------------
+
+def _pathology_baseline(conn):
+    # Reproduces what init_database used to do on every boot. Databases from
+    # before the SMS integration still get their missing columns here.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS form_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT,
+            patient_age TEXT,
+            patient_gender TEXT,
+            patient_mobile TEXT,
+            doctor_name TEXT,
+            opd_no TEXT,
+            sample_date TEXT,
+            selected_tests TEXT,
+            submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS completed_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT,
+            patient_age TEXT,
+            patient_gender TEXT,
+            patient_mobile TEXT,
+            doctor_name TEXT,
+            opd_no TEXT,
+            sample_date TEXT,
+            test_results TEXT,
+            pdf_path TEXT,
+            whatsapp_status TEXT,
+            whatsapp_error TEXT,
+            sms_status TEXT DEFAULT 'not_attempted',
+            sms_error TEXT,
+            report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    add_missing_columns(conn, "completed_reports", [
+        ("test_results", "TEXT"),
+        ("pdf_path", "TEXT"),
+        ("whatsapp_status", "TEXT"),
+        ("whatsapp_error", "TEXT"),
+        ("sms_status", "TEXT DEFAULT 'not_attempted'"),
+        ("sms_error", "TEXT"),
+    ])
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT,
+            patient_email TEXT,
+            patient_mobile TEXT,
+            subject TEXT,
+            message TEXT,
+            message_type TEXT,
+            status TEXT DEFAULT 'unread',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            replied_at TIMESTAMP,
+            reply_message TEXT
+        )
+    ''')
+
+
+def _patient_master_index(conn):
+    # Repeat visits get a new OPD number, so re-key patients on mobile + fuzzy
+    # name and let reports reference them directly.
+    add_missing_columns(conn, "patient_master", [("name_normalized", "TEXT")])
+    add_missing_columns(conn, "completed_reports", [("patient_id", "INTEGER REFERENCES patient_master (id)")])
+    patient_index.merge_duplicate_patients(conn)
+    main_db = conn.execute("PRAGMA database_list").fetchone()[2]
+    patient_index.link_completed_reports(conn, os.path.basename(main_db))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patient_master_name ON patient_master (name_normalized)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_completed_reports_patient ON completed_reports (patient_id, report_date)")
+
+
+def _result_series(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lab_results_trend ON lab_results (patient_id, test_name, result_date)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS result_series (
+            patient_id INTEGER NOT NULL REFERENCES patient_master (id),
+            test_name TEXT NOT NULL,
+            points TEXT NOT NULL,
+            last_value TEXT,
+            last_date TEXT,
+            PRIMARY KEY (patient_id, test_name)
+        )
+    ''')
+    result_trends.rebuild_series(conn)
+
+
+CATALOG_TABLES = ("catalog_categories", "catalog_tests", "catalog_ranges")
+
+
+def _test_catalog(conn):
+    # The catalog moves out of the code; seeded with what __init__ used to hard-code
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            display_order INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            category_id INTEGER NOT NULL REFERENCES catalog_categories (id),
+            unit TEXT,
+            normal_range TEXT,
+            display_order INTEGER NOT NULL DEFAULT 0,
+            active INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_ranges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER NOT NULL REFERENCES catalog_tests (id),
+            sex TEXT,
+            age_min REAL,
+            age_max REAL,
+            low REAL,
+            high REAL,
+            text TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_catalog_ranges_test ON catalog_ranges (test_id)")
+    # Bumped on every change so each worker's snapshot knows when to reload
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)")
+    for table in CATALOG_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    catalog.seed(conn)
+
+
+PATHOLOGY_MIGRATIONS = [
+    (1, "baseline", _pathology_baseline),
+    (2, "lookup_indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_completed_reports_mobile ON completed_reports (patient_mobile)",
+        "CREATE INDEX IF NOT EXISTS idx_completed_reports_opd ON completed_reports (opd_no)",
+        "CREATE INDEX IF NOT EXISTS idx_completed_reports_date ON completed_reports (report_date)",
+        "CREATE INDEX IF NOT EXISTS idx_patient_messages_status ON patient_messages (status, created_at)",
+    ]),
+    # hospital.db, data.db and database/pathology.db are folded into these by
+    # consolidate_db.py; the legacy tables above are left as they are.
+    (3, "unified_patients", [
+        '''
+        CREATE TABLE IF NOT EXISTS patient_master (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedupe_key TEXT NOT NULL UNIQUE,
+            patient_name TEXT,
+            mobile TEXT,
+            mobile_normalized TEXT,
+            opd_no TEXT,
+            age TEXT,
+            gender TEXT,
+            doctor_name TEXT,
+            first_seen TIMESTAMP,
+            last_seen TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_patient_master_mobile ON patient_master (mobile_normalized)",
+        "CREATE INDEX IF NOT EXISTS idx_patient_master_opd ON patient_master (opd_no)",
+        '''
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL REFERENCES patient_master (id),
+            report_id INTEGER REFERENCES completed_reports (id),
+            test_name TEXT NOT NULL,
+            result_value TEXT,
+            normal_range TEXT,
+            test_category TEXT,
+            result_date TEXT,
+            source TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_patient ON lab_results (patient_id, result_date)",
+        '''
+        CREATE TABLE IF NOT EXISTS import_sources (
+            source_db TEXT NOT NULL,
+            source_table TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            patient_id INTEGER REFERENCES patient_master (id),
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source_db, source_table, source_id)
+        )
+        ''',
+    ]),
+    (4, "patient_master_index", _patient_master_index),
+    (5, "result_series", _result_series),
+    # Filled by analytics.compact() on the next insert or /api/analytics call
+    (6, "analytics_rollups", [
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            day TEXT PRIMARY KEY,
+            reports INTEGER NOT NULL DEFAULT 0,
+            results INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_test_daily (
+            day TEXT NOT NULL,
+            test_name TEXT NOT NULL,
+            results INTEGER NOT NULL DEFAULT 0,
+            abnormal INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, test_name)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_delivery_daily (
+            day TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            reports INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, channel, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_doctor_daily (
+            day TEXT NOT NULL,
+            doctor_name TEXT NOT NULL,
+            reports INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, doctor_name)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_watermark (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    # Control runs and Westgard state, see qc.py
+    (7, "quality_control", [
+        '''
+        CREATE TABLE IF NOT EXISTS qc_state (
+            analyte TEXT NOT NULL,
+            level TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            mean REAL NOT NULL DEFAULT 0,
+            m2 REAL NOT NULL DEFAULT 0,
+            target_mean REAL,
+            target_sd REAL,
+            streak_mean INTEGER NOT NULL DEFAULT 0,
+            streak_1s INTEGER NOT NULL DEFAULT 0,
+            streak_2s INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'baseline',
+            last_run_at TIMESTAMP,
+            PRIMARY KEY (analyte, level)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_qc_state_status ON qc_state (status)",
+        '''
+        CREATE TABLE IF NOT EXISTS qc_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analyte TEXT NOT NULL,
+            operator TEXT,
+            status TEXT,
+            run_at TIMESTAMP NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS qc_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL REFERENCES qc_runs (id),
+            analyte TEXT NOT NULL,
+            level TEXT NOT NULL,
+            value REAL NOT NULL,
+            z_score REAL,
+            mean REAL,
+            sd REAL,
+            violations TEXT,
+            status TEXT NOT NULL,
+            operator TEXT,
+            run_at TIMESTAMP NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_qc_results_pair ON qc_results (analyte, level, id)",
+    ]),
+    # Set by delta_check when a result moved too far from the previous one
+    (8, "delta_flags", [
+        "ALTER TABLE lab_results ADD COLUMN delta_flag TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_delta ON lab_results (result_date) WHERE delta_flag IS NOT NULL",
+    ]),
+    # Critical-value alerts and their acknowledgements (critical_values.py)
+    (9, "critical_alerts", [
+        '''
+        CREATE TABLE IF NOT EXISTS critical_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ack_token TEXT NOT NULL UNIQUE,
+            patient_name TEXT,
+            patient_mobile TEXT,
+            opd_no TEXT,
+            doctor_name TEXT,
+            recipient TEXT,
+            test_name TEXT NOT NULL,
+            result_value TEXT,
+            reason TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            latency_ms REAL,
+            acknowledged_at TIMESTAMP,
+            acknowledged_by TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_critical_alerts_open ON critical_alerts (status, created_at)",
+    ]),
+    # Amended reports: a new completed_reports row per version, holding only the changed tests
+    (10, "report_versions", [
+        "ALTER TABLE completed_reports ADD COLUMN parent_report_id INTEGER REFERENCES completed_reports (id)",
+        "ALTER TABLE completed_reports ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE completed_reports ADD COLUMN amendment_reason TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_completed_reports_parent ON completed_reports (parent_report_id, version)",
+        '''
+        CREATE TABLE IF NOT EXISTS report_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER NOT NULL REFERENCES completed_reports (id),
+            test_name TEXT NOT NULL,
+            old_value TEXT,
+            new_value TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_report_changes_report ON report_changes (report_id)",
+    ]),
+    # Collection centres (branches.py). Existing rows belong to the main branch, id 1.
+    # patient_master stays shared so a patient's history follows them between branches.
+    (11, "branches", [
+        '''
+        CREATE TABLE IF NOT EXISTS branches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT NOT NULL UNIQUE,
+            name TEXT,
+            address TEXT,
+            phone TEXT,
+            email TEXT,
+            report_email TEXT,
+            whatsapp_phone_number_id TEXT,
+            whatsapp_access_token TEXT,
+            fast2sms_api_key TEXT,
+            hosts TEXT,
+            catalog TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "INSERT OR IGNORE INTO branches (id, code) VALUES (1, 'main')",
+        # Bumped on every change so each worker's in-memory copy knows when to reload
+        '''
+        CREATE TABLE IF NOT EXISTS branch_config_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO branch_config_generation (id, generation) VALUES (1, 1)",
+        *[
+            f'''
+            CREATE TRIGGER IF NOT EXISTS branches_{event.lower()} AFTER {event} ON branches
+            BEGIN
+                UPDATE branch_config_generation SET generation = generation + 1 WHERE id = 1;
+            END
+            '''
+            for event in ("INSERT", "UPDATE", "DELETE")
+        ],
+        *[
+            f"ALTER TABLE {table} ADD COLUMN branch_id INTEGER NOT NULL DEFAULT 1"
+            for table in ("completed_reports", "lab_results", "critical_alerts", "patient_messages")
+        ],
+        "CREATE INDEX IF NOT EXISTS idx_completed_reports_branch ON completed_reports (branch_id, report_date)",
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_branch ON lab_results (branch_id, test_name, result_date)",
+        "CREATE INDEX IF NOT EXISTS idx_critical_alerts_branch ON critical_alerts (branch_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_patient_messages_branch ON patient_messages (branch_id, status, created_at)",
+    ]),
+    (12, "test_catalog", _test_catalog),
+    (13, "paediatric_ranges", catalog.seed_age_bands),
+    # Who issued each amended version (the staff token's name)
+    (14, "report_amended_by", [
+        "ALTER TABLE completed_reports ADD COLUMN amended_by TEXT",
+    ]),
+]
+
+
+# -- runner ------------------------------------------------------------------------
+
+def current_version(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+class MigrationLock:
+    """Exclusive lock file shared by every process migrating the same database"""
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def migrate(conn, db_path, migrations):
+    """Apply pending migrations; returns the names of those applied (usually none)"""
+    latest = migrations[-1][0] if migrations else 0
+    if current_version(conn) >= latest:
+        return []
+
+    applied = []
+    with MigrationLock(f"{os.path.abspath(db_path)}.migrate.lock"):
+        conn.execute(SCHEMA_VERSION_SQL)
+        conn.commit()
+        # Another process may have finished while we waited for the lock
+        version = current_version(conn)
+        for number, name, steps in migrations:
+            if number <= version:
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if callable(steps):
+                    steps(conn)
+                else:
+                    for statement in steps:
+                        conn.execute(statement)
+                conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(f"{number:04d}_{name}")
+    return applied
+
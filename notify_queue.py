@@ -0,0 +1,77 @@
+"""Priority pool for outbound notifications.
+
+A drop-in for the ThreadPoolExecutor that used to send WhatsApp and SMS
+messages. Queued tasks run in priority order (CRITICAL before ROUTINE),
+FIFO within a priority. The reserved workers only ever take CRITICAL
+tasks, so a critical-value alert never waits behind a backlog of slow
+routine report notifications that has every general worker busy.
+"""
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+CRITICAL = 0
+ROUTINE = 10
+
+
+class PriorityExecutor:
+    def __init__(self, max_workers, reserved=1, thread_name_prefix="notify"):
+        self.max_workers = max(1, int(max_workers))
+        self.reserved = max(0, int(reserved))
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = []
+        for index in range(self.max_workers + self.reserved):
+            critical_only = index >= self.max_workers
+            name = f"{thread_name_prefix}-{'critical' if critical_only else 'worker'}_{index}"
+            thread = threading.Thread(target=self._worker, args=(critical_only,), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args, priority=ROUTINE, **kwargs):
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new notifications after shutdown")
+            heapq.heappush(self._queue, (priority, next(self._sequence), future, fn, args, kwargs))
+            self._condition.notify_all()
+        return future
+
+    def queued(self):
+        with self._condition:
+            return len(self._queue)
+
+    def _next_task(self, critical_only):
+        with self._condition:
+            while True:
+                if self._queue and (not critical_only or self._queue[0][0] <= CRITICAL):
+                    return heapq.heappop(self._queue)
+                if self._shutdown and not self._queue:
+                    return None
+                if self._shutdown and critical_only:
+                    return None
+                self._condition.wait()
+
+    def _worker(self, critical_only):
+        while True:
+            task = self._next_task(critical_only)
+            if task is None:
+                return
+            _, _, future, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
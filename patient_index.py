@@ -0,0 +1,127 @@
+"""Patient matching for the patient master index.
+
+A mobile number is frequently shared by a family, and repeat visitors get a
+new OPD number every time. A patient is therefore identified by normalized
+mobile number plus a fuzzy match on the name. Only the few records already
+stored under that mobile number are compared, and they are found through
+the mobile_normalized index.
+"""
+import os
+import re
+from difflib import SequenceMatcher
+
+NAME_MATCH_RATIO = float(os.getenv("PATIENT_NAME_MATCH_RATIO", "0.85"))
+
+_TITLES = {"mr", "mrs", "ms", "miss", "dr", "shri", "smt", "sh", "kumari", "master", "baby", "md"}
+
+
+def normalize_name(name):
+    """Lowercase letters only, titles dropped: 'Mr. ABHI  Kumar' -> 'abhi kumar'"""
+    words = re.sub(r"[^a-z ]+", " ", str(name or "").lower()).split()
+    return " ".join(word for word in words if word not in _TITLES)
+
+
+def name_similarity(a, b):
+    """0..1 similarity of two normalized names"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    a_words, b_words = a.split(), b.split()
+    # 'abhijeet' vs 'abhijeet pancholi': same first name, one adds a surname
+    if a_words[0] == b_words[0] and (set(a_words) <= set(b_words) or set(b_words) <= set(a_words)):
+        return 0.95
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def best_match(name_normalized, candidates):
+    """Pick the candidate (id, name_normalized, ...) whose name matches best, or None"""
+    best, best_score = None, NAME_MATCH_RATIO
+    for candidate in candidates:
+        score = name_similarity(name_normalized, candidate[1])
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def dedupe_key(mobile_normalized, name_normalized, opd_no=""):
+    if mobile_normalized:
+        return f"m:{mobile_normalized}|n:{name_normalized}"
+    opd = (opd_no or "").strip().upper()
+    if opd:
+        return f"o:{opd}|n:{name_normalized}"
+    return f"n:{name_normalized}"
+
+
+LINK_REPORTS_SQL = '''
+    UPDATE completed_reports SET patient_id = COALESCE(
+        (SELECT patient_id FROM import_sources
+         WHERE source_db = ? AND source_table = 'completed_reports' AND source_id = completed_reports.id),
+        (SELECT patient_id FROM lab_results WHERE report_id = completed_reports.id LIMIT 1)
+    )
+    WHERE patient_id IS NULL
+'''
+
+
+def link_completed_reports(conn, source_db):
+    """Fill completed_reports.patient_id for reports imported before the column existed"""
+    return conn.execute(LINK_REPORTS_SQL, (source_db,)).rowcount
+
+
+MERGED_FIELDS = ("patient_name", "mobile", "opd_no", "age", "gender", "doctor_name")
+
+
+def merge_duplicate_patients(conn):
+    """Re-key patient_master on mobile + fuzzy name and fold duplicates into the
+    oldest record, repointing lab_results, import_sources and completed_reports.
+    Returns the number of records removed."""
+    columns = ("id", "mobile_normalized", "first_seen", "last_seen") + MERGED_FIELDS
+    patients = [
+        dict(zip(columns, row))
+        for row in conn.execute(f"SELECT {', '.join(columns)} FROM patient_master ORDER BY id")
+    ]
+
+    # Cluster each mobile number's records (or same-name records without one)
+    clusters = {}
+    for patient in patients:
+        patient['name_normalized'] = normalize_name(patient['patient_name'])
+        group = patient['mobile_normalized'] or dedupe_key("", patient['name_normalized'], patient['opd_no'])
+        survivors = clusters.setdefault(group, [])
+        match = best_match(patient['name_normalized'], [(s, s['name_normalized']) for s in survivors])
+        if match is None:
+            patient['duplicates'] = []
+            survivors.append(patient)
+        else:
+            match[0]['duplicates'].append(patient)
+
+    removed = 0
+    # Temporary keys first so re-keying cannot trip the UNIQUE constraint
+    conn.execute("UPDATE patient_master SET dedupe_key = 'tmp:' || id")
+    for survivors in clusters.values():
+        for survivor in survivors:
+            merged = dict(survivor)
+            for duplicate in survivor['duplicates']:
+                for table in ("lab_results", "import_sources", "completed_reports"):
+                    conn.execute(f"UPDATE {table} SET patient_id = ? WHERE patient_id = ?",
+                                 (survivor['id'], duplicate['id']))
+                conn.execute("DELETE FROM patient_master WHERE id = ?", (duplicate['id'],))
+                removed += 1
+                # Newest details win; older records only fill gaps
+                newer = (duplicate['last_seen'] or '') > (merged['last_seen'] or '')
+                for field in MERGED_FIELDS:
+                    if duplicate[field] and (newer or not merged[field]):
+                        merged[field] = duplicate[field]
+                merged['first_seen'] = min(filter(None, (merged['first_seen'], duplicate['first_seen'])), default=None)
+                merged['last_seen'] = max(filter(None, (merged['last_seen'], duplicate['last_seen'])), default=None)
+
+            name_normalized = normalize_name(merged['patient_name'])
+            key = dedupe_key(merged['mobile_normalized'], name_normalized, merged['opd_no'])
+            if conn.execute("SELECT 1 FROM patient_master WHERE dedupe_key = ?", (key,)).fetchone():
+                key = f"{key}|{survivor['id']}"
+            conn.execute(f'''
+                UPDATE patient_master SET dedupe_key = ?, name_normalized = ?, first_seen = ?, last_seen = ?,
+                    {", ".join(f"{field} = ?" for field in MERGED_FIELDS)}
+                WHERE id = ?
+            ''', (key, name_normalized, merged['first_seen'], merged['last_seen'],
+                  *(merged[field] for field in MERGED_FIELDS), survivor['id']))
+    return removed
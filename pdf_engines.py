@@ -0,0 +1,420 @@
+"""PDF engines behind one registry: detected once, kept warm, routed by speed.
+
+    weasyprint   in-process, with the pdf_optimize size stages
+    wkhtmltopdf  a pool of long-lived `wkhtmltopdf --read-args-from-stdin`
+                 processes. Each job is one line of arguments, so Qt/WebKit
+                 starts once per worker instead of once per report
+
+Engines are detected when the registry is built. PDF_ENGINES lists the ones
+to use, in order of preference. Each job goes to the fastest healthy engine
+(lowest moving-average latency; engines not measured yet go first, in
+preference order) and falls through to the next one if it fails. An engine
+that fails PDF_ENGINE_MAX_FAILURES jobs in a row is skipped for
+PDF_ENGINE_COOLDOWN_SECONDS, then gets one job to prove itself again.
+PDF_ENGINE_ROUTING=ordered always uses the preference order instead.
+
+New engines subclass Engine and are added with @register:
+
+    @register
+    class PrinceEngine(Engine):
+        name = "prince"
+        def detect(self): ...            # -> (available, detail)
+        def render(self, html_content, output_path): ...
+"""
+import os
+import time
+import queue
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+import app_logging
+import pdf_optimize
+from metrics import registry as metrics
+
+try:
+    from weasyprint import HTML
+    WEASYPRINT_AVAILABLE = True
+    WEASYPRINT_ERROR = None
+except Exception as e:
+    WEASYPRINT_AVAILABLE = False
+    WEASYPRINT_ERROR = str(e)
+
+log = app_logging.get_logger("pdf_engines")
+
+PDF_ENGINES = os.getenv("PDF_ENGINES", "weasyprint,wkhtmltopdf")
+PDF_ENGINE_ROUTING = os.getenv("PDF_ENGINE_ROUTING", "fastest").strip().lower()
+PDF_ENGINE_MAX_FAILURES = max(1, int(os.getenv("PDF_ENGINE_MAX_FAILURES", "3")))
+PDF_ENGINE_COOLDOWN_SECONDS = float(os.getenv("PDF_ENGINE_COOLDOWN_SECONDS", "60"))
+PDF_ENGINE_TIMEOUT_SECONDS = float(os.getenv("PDF_ENGINE_TIMEOUT_SECONDS", "60"))
+WKHTMLTOPDF_WORKERS = max(1, int(os.getenv("WKHTMLTOPDF_WORKERS", "2")))
+# Restart a worker after this many jobs; long-lived WebKit processes grow
+WKHTMLTOPDF_MAX_JOBS = max(1, int(os.getenv("WKHTMLTOPDF_MAX_JOBS", "500")))
+
+WKHTMLTOPDF_PATHS = (
+    '/usr/bin/wkhtmltopdf',
+    '/usr/local/bin/wkhtmltopdf',
+    'C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe',
+    'C:/wkhtmltopdf/bin/wkhtmltopdf.exe',
+)
+
+# Weight of the newest job in the moving-average latency
+LATENCY_ALPHA = 0.2
+
+ENGINE_TYPES = {}
+
+
+def register(engine_class):
+    ENGINE_TYPES[engine_class.name] = engine_class
+    return engine_class
+
+
+class Engine:
+    """One way of turning report HTML into a PDF file"""
+
+    name = None
+
+    def detect(self):
+        """(available, detail) - called once, when the registry is built"""
+        raise NotImplementedError
+
+    def render(self, html_content, output_path):
+        """Write the PDF to output_path; raise on failure"""
+        raise NotImplementedError
+
+    def workers(self):
+        return None
+
+    def close(self):
+        pass
+
+
+@register
+class WeasyPrintEngine(Engine):
+    name = "weasyprint"
+
+    def detect(self):
+        return WEASYPRINT_AVAILABLE, "in-process" if WEASYPRINT_AVAILABLE else WEASYPRINT_ERROR
+
+    def render(self, html_content, output_path):
+        pdf_optimize.write_pdf(HTML(string=html_content, encoding='utf-8'), output_path)
+
+
+class ConversionError(RuntimeError):
+    """wkhtmltopdf could not convert a page; the worker itself is fine"""
+
+
+class _WkhtmltopdfWorker:
+    """One wkhtmltopdf process reading a conversion per stdin line.
+
+    Progress goes to stderr and each conversion ends with a "Done" or an
+    "Exit with code ..." line, which a reader thread hands to convert().
+    """
+
+    def __init__(self, binary):
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            [binary, "--read-args-from-stdin"],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace", bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_stderr, name="wkhtmltopdf-stderr", daemon=True).start()
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self._lines.put(line.strip())
+        self._lines.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def convert(self, args, timeout):
+        # Forward slashes and double quotes survive wkhtmltopdf's own argument splitting
+        self.process.stdin.write(" ".join(f'"{arg}"' for arg in args) + "\n")
+        self.process.stdin.flush()
+        self.jobs += 1
+        deadline = time.monotonic() + timeout
+        errors = []
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f"wkhtmltopdf did not finish within {timeout:.0f}s")
+            if line is None:
+                raise RuntimeError(f"wkhtmltopdf exited ({self.process.poll()}): {'; '.join(errors[-3:])}")
+            if line == "Done":
+                return
+            if line.startswith("Exit with code"):
+                raise ConversionError(line)
+            if line.startswith("Error"):
+                errors.append(line)
+
+    def close(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+@register
+class WkhtmltopdfEngine(Engine):
+    name = "wkhtmltopdf"
+
+    OPTIONS = (
+        "--page-size", "A4",
+        "--margin-top", "0.5in", "--margin-right", "0.5in",
+        "--margin-bottom", "0.5in", "--margin-left", "0.5in",
+        "--encoding", "UTF-8", "--no-outline",
+    )
+
+    def __init__(self, max_workers=WKHTMLTOPDF_WORKERS, timeout=PDF_ENGINE_TIMEOUT_SECONDS):
+        self.binary = None
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._pid = os.getpid()
+        self._scratch = None
+
+    def detect(self):
+        candidates = [os.getenv("WKHTMLTOPDF_PATH", "").strip(), shutil.which("wkhtmltopdf")] + list(WKHTMLTOPDF_PATHS)
+        binary = next((path for path in candidates if path and os.path.isfile(path)), None)
+        if not binary:
+            return False, "wkhtmltopdf not found"
+        try:
+            version = subprocess.run(
+                [binary, "--version"], capture_output=True, text=True, timeout=10
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError) as e:
+            return False, f"{binary}: {e}"
+        self.binary = binary
+        return True, version or binary
+
+    def _after_fork(self):
+        # Workers (and their pipes) belong to the process that started them
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue()
+                    self._started = 0
+                    self._scratch = None
+                    self._pid = os.getpid()
+
+    def _acquire(self):
+        self._after_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._started < self.max_workers:
+                self._started += 1
+                try:
+                    return _WkhtmltopdfWorker(self.binary)
+                except Exception:
+                    self._started -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no wkhtmltopdf worker free within {self.timeout:.0f}s")
+
+    def _release(self, worker, healthy):
+        if healthy and worker.alive() and worker.jobs < WKHTMLTOPDF_MAX_JOBS:
+            self._idle.put(worker)
+            return
+        # A worker that failed or timed out may be stuck mid-conversion
+        worker.close(kill=not healthy)
+        with self._lock:
+            self._started -= 1
+
+    def render(self, html_content, output_path):
+        self._after_fork()
+        if self._scratch is None or not os.path.isdir(self._scratch):
+            self._scratch = tempfile.mkdtemp(prefix="wkhtmltopdf-")
+        fd, source = tempfile.mkstemp(suffix=".html", dir=self._scratch)
+        target = source[:-5] + ".pdf"
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(html_content)
+            worker = self._acquire()
+            reusable = False
+            try:
+                worker.convert(
+                    self.OPTIONS + (
+                        "--image-dpi", str(pdf_optimize.REPORT_PDF_DPI),
+                        "--image-quality", str(pdf_optimize.REPORT_PDF_JPEG_QUALITY),
+                        source.replace(os.sep, "/"), target.replace(os.sep, "/"),
+                    ),
+                    self.timeout,
+                )
+                reusable = True
+            except ConversionError:
+                reusable = True
+                raise
+            finally:
+                self._release(worker, reusable)
+            if not os.path.exists(target) or os.path.getsize(target) == 0:
+                raise RuntimeError("wkhtmltopdf reported success but wrote no PDF")
+            shutil.move(target, output_path)
+        finally:
+            for path in (source, target):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def workers(self):
+        return {'started': self._started, 'idle': self._idle.qsize(), 'max': self.max_workers}
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        if self._scratch:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+
+
+class _EngineState:
+    def __init__(self, engine, preference, available, detail):
+        self.engine = engine
+        self.preference = preference
+        self.available = available
+        self.detail = detail
+        self.jobs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.latency = None
+        self.recent = deque(maxlen=200)
+        self.last_error = None
+
+    def healthy(self, now):
+        return self.unhealthy_until <= now
+
+
+class EngineRegistry:
+    """The configured engines, their health and latency"""
+
+    def __init__(self, names=PDF_ENGINES, routing=PDF_ENGINE_ROUTING, engine_types=None):
+        engine_types = engine_types or ENGINE_TYPES
+        self.routing = routing
+        self._lock = threading.Lock()
+        self._states = []
+        for preference, name in enumerate(n.strip().lower() for n in str(names or "").split(",") if n.strip()):
+            engine_class = engine_types.get(name)
+            if engine_class is None:
+                log.warning("Unknown PDF engine", extra={'engine': name})
+                continue
+            engine = engine_class()
+            try:
+                available, detail = engine.detect()
+            except Exception as e:
+                available, detail = False, str(e)
+            self._states.append(_EngineState(engine, preference, available, detail))
+        available = [state.engine.name for state in self._states if state.available]
+        if available:
+            log.info("PDF engines detected", extra={'engines': available, 'routing': self.routing})
+        else:
+            log.warning("No PDF engine available; reports will be saved as HTML", extra={
+                'engines': {state.engine.name: state.detail for state in self._states},
+            })
+        atexit.register(self.close)
+
+    def available(self):
+        return [state.engine.name for state in self._states if state.available]
+
+    def engine(self, name):
+        """The detected engine called name, or None"""
+        return next((state.engine for state in self._states if state.engine.name == name and state.available), None)
+
+    def _order(self):
+        now = time.monotonic()
+        states = [state for state in self._states if state.available]
+        if self.routing == "ordered":
+            key = lambda state: (not state.healthy(now), state.preference)
+        else:
+            key = lambda state: (
+                not state.healthy(now), state.latency is not None, state.latency or 0.0, state.preference
+            )
+        # Unhealthy engines stay at the end: better a late attempt than no PDF
+        return sorted(states, key=key)
+
+    def render(self, html_content, output_path):
+        """Render with the best engine, falling through on failure.
+
+        Returns the name of the engine that wrote the PDF, or None.
+        """
+        for state in self._order():
+            name = state.engine.name
+            started = time.perf_counter()
+            try:
+                with app_logging.span("pdf_engine", engine=name):
+                    state.engine.render(html_content, output_path)
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                metrics.inc("report_pdf_render_failures_total", engine=name)
+                with self._lock:
+                    state.jobs += 1
+                    state.failures += 1
+                    state.consecutive_failures += 1
+                    state.last_error = str(e)[:500]
+                    if state.consecutive_failures >= PDF_ENGINE_MAX_FAILURES:
+                        state.unhealthy_until = time.monotonic() + PDF_ENGINE_COOLDOWN_SECONDS
+                log.warning("PDF engine failed: %s", e, extra={
+                    'engine': name, 'seconds': round(elapsed, 3),
+                    'consecutive_failures': state.consecutive_failures,
+                })
+                continue
+            elapsed = time.perf_counter() - started
+            metrics.observe("report_pdf_render_seconds", elapsed, engine=name)
+            with self._lock:
+                state.jobs += 1
+                state.consecutive_failures = 0
+                state.unhealthy_until = 0.0
+                state.recent.append(elapsed)
+                state.latency = elapsed if state.latency is None else (
+                    LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * state.latency
+                )
+            return name
+        return None
+
+    def stats(self):
+        """Per-engine availability, health, latency and failures"""
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for state in sorted(self._states, key=lambda state: state.preference):
+                recent = sorted(state.recent)
+                rows.append({
+                    'engine': state.engine.name,
+                    'available': state.available,
+                    'detail': state.detail,
+                    'healthy': state.available and state.healthy(now),
+                    'retry_in_seconds': round(state.unhealthy_until - now, 1) if not state.healthy(now) else None,
+                    'jobs': state.jobs,
+                    'failures': state.failures,
+                    'consecutive_failures': state.consecutive_failures,
+                    'latency_ms': round(state.latency * 1000, 2) if state.latency is not None else None,
+                    'p50_ms': round(recent[len(recent) // 2] * 1000, 2) if recent else None,
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2) if recent else None,
+                    'last_error': state.last_error,
+                    'workers': state.engine.workers() if state.available else None,
+                })
+        return rows
+
+    def close(self):
+        for state in self._states:
+            try:
+                state.engine.close()
+            except Exception:
+                pass
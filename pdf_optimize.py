@@ -0,0 +1,195 @@
+"""Smaller report PDFs for sending over mobile data.
+
+Three stages keep a one-page report well under REPORT_PDF_TARGET_KB:
+
+    fonts        embed only the glyphs the report uses, without hinting
+                 tables ('Times New Roman' resolves to a full system serif)
+    images       letterhead logos downscaled to the size they are printed at
+                 (REPORT_PDF_DPI), reduced to a small palette, and cached on
+                 disk so each logo is optimized once; WeasyPrint also
+                 recompresses any other image
+    compression  compressed content streams. REPORT_PDF_VARIANT (for example
+                 "pdf/a-3b") writes an archival variant, which adds an ICC profile
+
+write_pdf() applies every stage. measure() renders the same report once per
+stage, so the savings of each one can be compared:
+
+    assets = AssetCache(BASE_DIR, os.path.join(DATA_DIR, "assets"))
+    for row in measure(html, assets):
+        print(row["stage"], row["bytes"], row["saved"])
+"""
+import io
+import os
+import math
+import base64
+import threading
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+REPORT_PDF_TARGET_KB = int(os.getenv("REPORT_PDF_TARGET_KB", "50"))
+REPORT_PDF_DPI = int(os.getenv("REPORT_PDF_DPI", "150"))
+REPORT_PDF_JPEG_QUALITY = int(os.getenv("REPORT_PDF_JPEG_QUALITY", "80"))
+REPORT_PDF_VARIANT = os.getenv("REPORT_PDF_VARIANT", "").strip().lower() or None
+# Logos are flat colours; a small palette looks the same and compresses far better
+LOGO_PALETTE_COLORS = int(os.getenv("REPORT_LOGO_COLORS", "64"))
+
+# "file:WIDTHxHEIGHT" in CSS pixels, as on the hospital letterhead (PO.HTML); "" for none
+REPORT_LOGOS = os.getenv("REPORT_LOGOS", "NTPC_Logo.svg.png:90x50,NTPC_50.png:100x90")
+
+STAGES = ("fonts", "images", "compression")
+
+
+def parse_logos(spec):
+    """"a.png:90x50,b.png:100x90" -> [("a.png", 90, 50), ...]"""
+    logos = []
+    for item in str(spec or "").split(","):
+        name, _, box = item.strip().rpartition(":")
+        try:
+            width, height = (int(part) for part in box.lower().split("x"))
+        except ValueError:
+            continue
+        if name:
+            logos.append((name, width, height))
+    return logos
+
+
+def pdf_options(stages=STAGES):
+    """WeasyPrint write_pdf options for the given optimization stages"""
+    options = {
+        'full_fonts': 'fonts' not in stages,
+        'hinting': 'fonts' not in stages,
+        'optimize_images': 'images' in stages,
+        'uncompressed_pdf': 'compression' not in stages,
+    }
+    if 'images' in stages:
+        options.update(dpi=REPORT_PDF_DPI, jpeg_quality=REPORT_PDF_JPEG_QUALITY)
+    if REPORT_PDF_VARIANT:
+        options['pdf_variant'] = REPORT_PDF_VARIANT
+    return options
+
+
+def write_pdf(document, target=None, stages=STAGES):
+    """document.write_pdf (an HTML or a rendered Document) with the stage options"""
+    options = pdf_options(stages)
+    try:
+        return document.write_pdf(target, **options)
+    except TypeError:
+        # WeasyPrint before 59 takes optimize_size / variant instead
+        legacy = tuple(stage for stage in ('fonts', 'images') if stage in stages)
+        return document.write_pdf(target, optimize_size=legacy, variant=options.get('pdf_variant'))
+
+
+def shrink_image(data, width, height):
+    """PNG bytes of an image fitted into width x height pixels with a small palette"""
+    with Image.open(io.BytesIO(data)) as source:
+        image = source.convert("RGBA")
+    image.thumbnail((width, height), Image.LANCZOS)
+    if image.getextrema()[3][0] == 255:
+        image = image.convert("RGB")
+    method = getattr(Image, "Quantize", Image).FASTOCTREE
+    image = image.quantize(colors=LOGO_PALETTE_COLORS, method=method)
+    output = io.BytesIO()
+    image.save(output, "PNG", optimize=True)
+    return output.getvalue()
+
+
+class AssetCache:
+    """Letterhead logos optimized once per source file, kept on disk and in memory.
+
+    Optimized logos are inlined as data: URIs so the saved HTML report and
+    the PDF need no base URL. Without Pillow the logos are left out rather
+    than inlining the full-size originals into every report.
+    """
+
+    def __init__(self, root_dir, cache_dir, logos=REPORT_LOGOS, dpi=REPORT_PDF_DPI):
+        self.root_dir = root_dir
+        self.cache_dir = cache_dir
+        self.logos = parse_logos(logos)
+        self.dpi = dpi
+        self._lock = threading.Lock()
+        self._uris = {}
+        # Optimized data: URI -> file: URI of its source, for measure()
+        self.originals = {}
+
+    def logo(self, name, width, height):
+        """data: URI of the logo at its printed size, or None"""
+        path = os.path.join(self.root_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not PIL_AVAILABLE:
+            return None
+        pixels = (math.ceil(width * self.dpi / 96), math.ceil(height * self.dpi / 96))
+        key = (path, stat.st_mtime_ns, stat.st_size, pixels)
+        uri = self._uris.get(key)
+        if uri:
+            return uri
+        with self._lock:
+            uri = self._uris.get(key)
+            if uri:
+                return uri
+            stem = os.path.splitext(os.path.basename(name))[0].replace('.', '_')
+            cached = os.path.join(
+                self.cache_dir, f"{stem}-{pixels[0]}x{pixels[1]}-{stat.st_mtime_ns}-{stat.st_size}.png"
+            )
+            try:
+                with open(cached, "rb") as f:
+                    data = f.read()
+            except OSError:
+                with open(path, "rb") as f:
+                    data = shrink_image(f.read(), *pixels)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                partial = f"{cached}.{os.getpid()}.tmp"
+                with open(partial, "wb") as f:
+                    f.write(data)
+                os.replace(partial, cached)
+            uri = "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+            self._uris[key] = uri
+            self.originals[uri] = "file://" + os.path.abspath(path)
+        return uri
+
+    def letterhead_html(self):
+        """<img> tags of the configured logos, or "" when there are none"""
+        images = []
+        for name, width, height in self.logos:
+            uri = self.logo(name, width, height)
+            if uri:
+                images.append(
+                    f'<img src="{uri}" alt="" style="max-width: {width}px; max-height: {height}px; margin: 0 10px;">'
+                )
+        return f'<div class="letterhead-logos">{"".join(images)}</div>' if images else ""
+
+    def unoptimized(self, html):
+        """The report with the original full-size logo files instead of the optimized ones"""
+        for uri, original in self.originals.items():
+            html = html.replace(uri, original)
+        return html
+
+
+def measure(html, assets=None, base_url=None):
+    """Size of the report PDF with no optimization, then after each stage in turn.
+
+    Returns [{stage, bytes, saved (vs the previous stage), percent_of_original}].
+    Needs WeasyPrint.
+    """
+    from weasyprint import HTML
+
+    rows, previous = [], None
+    for count in range(len(STAGES) + 1):
+        stages = STAGES[:count]
+        source = html if 'images' in stages or assets is None else assets.unoptimized(html)
+        size = len(write_pdf(HTML(string=source, base_url=base_url, encoding='utf-8'), stages=stages))
+        original = rows[0]['bytes'] if rows else size
+        rows.append({
+            'stage': stages[-1] if stages else 'original',
+            'bytes': size,
+            'saved': previous - size if previous is not None else 0,
+            'percent_of_original': round(100.0 * size / original, 1) if original else None,
+        })
+        previous = size
+    return rows
@@ -0,0 +1,293 @@
+"""Laboratory quality control: control runs, Westgard rules, Levey-Jennings charts.
+
+Each control material is an (analyte, level) pair; analytes are test names
+from the app's catalog. qc_state keeps one row per pair. The row holds the
+running count, mean and M2 (Welford), so mean and SD never need a rescan.
+It also holds three signed streak counters, so each rule is checked in
+constant time as a value arrives:
+
+    streak_mean  consecutive values on the same side of the mean   -> 10x
+    streak_1s    consecutive values beyond 1 SD on the same side   -> 4-1s
+    streak_2s    consecutive values beyond 2 SD on the same side   -> 2-2s
+
+1-2s and 1-3s need only the value itself. R-4s and the across-level 2-2s
+compare the levels measured in the same run.
+
+Until QC_MIN_RUNS accepted values exist (or a target mean/SD is set) a pair
+is in its baseline period: values only build the statistics. A rejected
+value never updates them. When a pair's latest run is rejected, reports
+containing that analyte are held (see hospital_system_final) until a
+passing run clears it.
+"""
+import os
+import math
+import json
+from html import escape
+from datetime import datetime
+
+QC_MIN_RUNS = int(os.getenv("QC_MIN_RUNS", "20"))
+QC_CHART_POINTS = int(os.getenv("QC_CHART_POINTS", "30"))
+
+# 1-2s is a warning; every other rule rejects the run
+WARNING_RULES = ("1-2s",)
+REJECTION_RULES = ("1-3s", "2-2s", "R-4s", "4-1s", "10x")
+
+_STATE_COLUMNS = (
+    "n", "mean", "m2", "target_mean", "target_sd", "streak_mean", "streak_1s", "streak_2s", "status",
+)
+
+
+def welford(n, mean, m2, value):
+    """One step of Welford's online mean/variance: returns (n, mean, m2)"""
+    n += 1
+    delta = value - mean
+    mean += delta / n
+    m2 += delta * (value - mean)
+    return n, mean, m2
+
+
+def _streak(previous, side):
+    """Extend a signed run of same-side values, or restart it"""
+    if side == 0:
+        return 0
+    if previous * side > 0:
+        return previous + side
+    return side
+
+
+def _sign(z, limit):
+    if z > limit:
+        return 1
+    if z < -limit:
+        return -1
+    return 0
+
+
+def control_limits(state):
+    """(mean, sd) used for z-scores, or None during the baseline period"""
+    if state['target_mean'] is not None and state['target_sd']:
+        return state['target_mean'], state['target_sd']
+    if state['n'] >= max(QC_MIN_RUNS, 2):
+        sd = math.sqrt(state['m2'] / (state['n'] - 1))
+        if sd > 0:
+            return state['mean'], sd
+    return None
+
+
+def evaluate(state, value):
+    """Check one control value against its pair's state.
+
+    Returns (z, violations) and updates the streak counters in state.
+    z is None during the baseline period.
+    """
+    limits = control_limits(state)
+    if limits is None:
+        return None, []
+    mean, sd = limits
+    z = (value - mean) / sd
+    state['streak_mean'] = _streak(state['streak_mean'], _sign(z, 0))
+    state['streak_1s'] = _streak(state['streak_1s'], _sign(z, 1))
+    state['streak_2s'] = _streak(state['streak_2s'], _sign(z, 2))
+
+    violations = []
+    if abs(z) > 3:
+        violations.append("1-3s")
+    elif abs(z) > 2:
+        violations.append("1-2s")
+    if abs(state['streak_2s']) >= 2:
+        violations.append("2-2s")
+    if abs(state['streak_1s']) >= 4:
+        violations.append("4-1s")
+    if abs(state['streak_mean']) >= 10:
+        violations.append("10x")
+    return z, violations
+
+
+def run_violations(z_by_level):
+    """Rules across the levels measured in one run: R-4s and 2-2s"""
+    scores = [z for z in z_by_level.values() if z is not None]
+    if len(scores) < 2:
+        return []
+    violations = []
+    high, low = max(scores), min(scores)
+    if high > 2 and low < -2 and high - low > 4:
+        violations.append("R-4s")
+    if sum(1 for z in scores if z > 2) >= 2 or sum(1 for z in scores if z < -2) >= 2:
+        violations.append("2-2s")
+    return violations
+
+
+def status_for(violations, z):
+    if z is None:
+        return "baseline"
+    if any(rule in REJECTION_RULES for rule in violations):
+        return "rejected"
+    return "warning" if violations else "accepted"
+
+
+def load_state(cur, analyte, level):
+    row = cur.execute(
+        f"SELECT {', '.join(_STATE_COLUMNS)} FROM qc_state WHERE analyte = ? AND level = ?",
+        (analyte, level),
+    ).fetchone()
+    if row is None:
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'target_mean': None, 'target_sd': None,
+                'streak_mean': 0, 'streak_1s': 0, 'streak_2s': 0, 'status': 'baseline'}
+    return dict(zip(_STATE_COLUMNS, row))
+
+
+def save_state(cur, analyte, level, state, run_at):
+    cur.execute(f'''
+        INSERT INTO qc_state (analyte, level, {', '.join(_STATE_COLUMNS)}, last_run_at)
+        VALUES (?, ?, {', '.join('?' for _ in _STATE_COLUMNS)}, ?)
+        ON CONFLICT(analyte, level) DO UPDATE SET
+            {', '.join(f"{column} = excluded.{column}" for column in _STATE_COLUMNS)},
+            last_run_at = excluded.last_run_at
+    ''', (analyte, level, *(state[column] for column in _STATE_COLUMNS), run_at))
+
+
+def record_run(cur, analyte, values, operator=None, run_at=None):
+    """Store one control run: values is {level: numeric value}.
+
+    Returns {'run_id', 'status', 'levels': {level: {...}}, 'violations'}.
+    """
+    run_at = run_at or datetime.now().isoformat(timespec="seconds")
+    cur.execute("INSERT INTO qc_runs (analyte, operator, run_at) VALUES (?, ?, ?)", (analyte, operator, run_at))
+    run_id = cur.lastrowid
+
+    states, evaluated = {}, {}
+    for level, value in values.items():
+        state = load_state(cur, analyte, level)
+        limits = control_limits(state)
+        z, violations = evaluate(state, value)
+        states[level] = state
+        evaluated[level] = {'value': value, 'z': z, 'violations': violations, 'limits': limits}
+
+    across = run_violations({level: item['z'] for level, item in evaluated.items()})
+    run_status = "accepted"
+    for level, item in evaluated.items():
+        state = states[level]
+        if across and item['z'] is not None:
+            item['violations'] = sorted(set(item['violations']) | set(across))
+        item['status'] = status_for(item['violations'], item['z'])
+        if item['status'] != "rejected":
+            state['n'], state['mean'], state['m2'] = welford(state['n'], state['mean'], state['m2'], item['value'])
+        state['status'] = item['status']
+        save_state(cur, analyte, level, state, run_at)
+        mean, sd = item.pop('limits') or (None, None)
+        cur.execute('''
+            INSERT INTO qc_results (run_id, analyte, level, value, z_score, mean, sd, violations, status, operator, run_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (run_id, analyte, level, item['value'], item['z'], mean, sd,
+              json.dumps(item['violations']), item['status'], operator, run_at))
+        if item['z'] is not None:
+            item['z'] = round(item['z'], 3)
+        if item['status'] == "rejected" or (item['status'] == "warning" and run_status != "rejected"):
+            run_status = item['status']
+        elif item['status'] == "baseline" and run_status == "accepted":
+            run_status = "baseline"
+    cur.execute("UPDATE qc_runs SET status = ? WHERE id = ?", (run_status, run_id))
+
+    return {
+        'run_id': run_id,
+        'analyte': analyte,
+        'status': run_status,
+        'violations': sorted({rule for item in evaluated.values() for rule in item['violations']}),
+        'levels': evaluated,
+    }
+
+
+def set_target(cur, analyte, level, mean, sd):
+    """Fix the control limits (manufacturer or lab-established); None clears them"""
+    state = load_state(cur, analyte, level)
+    state['target_mean'], state['target_sd'] = mean, sd
+    save_state(cur, analyte, level, state, datetime.now().isoformat(timespec="seconds"))
+
+
+def blocked_analytes(conn, test_names=None):
+    """Analytes whose latest control run on any level was rejected"""
+    rows = conn.execute("SELECT DISTINCT analyte FROM qc_state WHERE status = 'rejected'").fetchall()
+    blocked = {row[0] for row in rows}
+    if test_names is not None:
+        blocked &= set(test_names)
+    return sorted(blocked)
+
+
+def status_summary(conn):
+    summary = []
+    for row in conn.execute(f'''
+        SELECT analyte, level, {', '.join(_STATE_COLUMNS)}, last_run_at FROM qc_state ORDER BY analyte, level
+    '''):
+        analyte, level, *values, last_run_at = row
+        state = dict(zip(_STATE_COLUMNS, values))
+        limits = control_limits(state)
+        summary.append({
+            'analyte': analyte,
+            'level': level,
+            'status': state['status'],
+            'runs': state['n'],
+            'mean': round(limits[0], 4) if limits else None,
+            'sd': round(limits[1], 4) if limits else None,
+            'target': state['target_mean'] is not None,
+            'last_run_at': last_run_at,
+        })
+    return summary
+
+
+def chart_points(conn, analyte, level, limit=QC_CHART_POINTS):
+    """Latest control values for one pair, oldest first (via idx_qc_results_pair)"""
+    rows = conn.execute('''
+        SELECT run_at, value, z_score, status, violations FROM qc_results
+        WHERE analyte = ? AND level = ? ORDER BY id DESC LIMIT ?
+    ''', (analyte, level, int(limit))).fetchall()
+    return [
+        {'run_at': run_at, 'value': value, 'z': z, 'status': status, 'violations': json.loads(violations or "[]")}
+        for run_at, value, z, status, violations in reversed(rows)
+    ]
+
+
+_POINT_COLORS = {"accepted": "#003366", "baseline": "#7a8a99", "warning": "#e6a100", "rejected": "#c62828"}
+
+
+def levey_jennings_svg(points, mean, sd, title="", width=640, height=260):
+    """Levey-Jennings chart: values over runs against mean and +/-1, 2, 3 SD lines"""
+    left, right, top, bottom = 48, 12, 24, 28
+    plot_w, plot_h = width - left - right, height - top - bottom
+    if not sd:
+        values = [p['value'] for p in points] or [0.0]
+        mean = mean if mean is not None else sum(values) / len(values)
+        sd = (max(values) - min(values)) / 6 or 1.0
+
+    def y_of(value):
+        z = max(-4.0, min(4.0, (value - mean) / sd))
+        return top + plot_h / 2 - z * plot_h / 8
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="Arial, sans-serif" font-size="10">',
+        f'<rect x="0" y="0" width="{width}" height="{height}" fill="#ffffff"/>',
+    ]
+    if title:
+        parts.append(f'<text x="{left}" y="14" font-size="12" font-weight="bold">{escape(title)}</text>')
+    for k, color, dash in ((0, "#003366", ""), (1, "#9ab", "4,3"), (2, "#e6a100", "4,3"), (3, "#c62828", "4,3")):
+        for sign in ((1, -1) if k else (1,)):
+            y = y_of(mean + sign * k * sd)
+            label = "mean" if k == 0 else f"{'+' if sign > 0 else '-'}{k}SD"
+            dash_attr = f' stroke-dasharray="{dash}"' if dash else ""
+            parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{width - right}" y2="{y:.1f}" '
+                         f'stroke="{color}" stroke-width="1"{dash_attr}/>')
+            parts.append(f'<text x="4" y="{y + 3:.1f}" fill="{color}">{label}</text>')
+    if points:
+        step = plot_w / max(len(points) - 1, 1)
+        coords = [(left + i * step, y_of(p['value'])) for i, p in enumerate(points)]
+        parts.append('<polyline points="{}" fill="none" stroke="#555" stroke-width="1"/>'.format(
+            " ".join(f"{x:.1f},{y:.1f}" for x, y in coords)))
+        for (x, y), point in zip(coords, points):
+            color = _POINT_COLORS.get(point['status'], "#003366")
+            rules = ", ".join(point.get('violations') or [])
+            parts.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3.5" fill="{color}">'
+                         f'<title>{escape(point["run_at"])}: {point["value"]:g}{" (" + rules + ")" if rules else ""}</title></circle>')
+        parts.append(f'<text x="{left}" y="{height - 8}">{points[0]["run_at"][:10]}</text>')
+        parts.append(f'<text x="{width - right}" y="{height - 8}" text-anchor="end">{points[-1]["run_at"][:10]}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
@@ -1,28 +1,14 @@
 ﻿from flask import Flask, request, jsonify, send_file, send_from_directory
 import os
-import sqlite3
+from datastore import PathologyStore
 
 BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "data.db")
 
 app = Flask(__name__)
 
 # ---------- DATABASE ----------
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            test TEXT,
-            result TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-init_db()
+# Same unified database as hospital_system_final.py (data.db is imported by consolidate_db.py)
+store = PathologyStore()
 
 # ---------- WEB ----------
 @app.get("/")
@@ -36,23 +22,12 @@ def home():
 @app.post("/api/add-patient")
 def add_patient():
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO patients (name, test, result) VALUES (?, ?, ?)",
-        (data["name"], data["test"], data["result"])
-    )
-    conn.commit()
-    conn.close()
+    store.add_quick_result(data["name"], data["test"], data["result"])
     return jsonify({"status": "success"})
 
 @app.get("/api/patients")
 def get_patients():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM patients")
-    rows = c.fetchall()
-    conn.close()
+    rows = store.list_quick_results()
 
     return jsonify(rows)
 
@@ -0,0 +1,135 @@
+"""Many reports in one PDF: a doctor's referrals for the day, a ward print bundle.
+
+Rendering each report as its own document repeats the expensive parts for
+every patient: parsing the report CSS, loading fonts and embedding them (and
+the watermark) in every file. A bundle instead splits each report produced by
+generate_pdf_html into its stylesheet and body. The stylesheet is compiled
+once, one FontConfiguration is shared, and the bodies are laid out in chunks
+of REPORT_BUNDLE_CHUNK reports, one page-break-separated section each. The
+pages of all chunks are then written as a single PDF (with the pdf_optimize
+size stages), so fonts are embedded once. Chunking bounds the HTML held in
+memory and reports progress (pages per second) while a large bundle renders.
+
+Without WeasyPrint the bundle is one HTML file written chunk by chunk, with
+one <style> block and one watermark.
+
+    stats = render_bundle(report_htmls, "/path/Bundle_2025-11-04", progress=print)
+"""
+import os
+import re
+import time
+
+import pdf_optimize
+
+try:
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+    WEASYPRINT_AVAILABLE = True
+except Exception:
+    WEASYPRINT_AVAILABLE = False
+
+BUNDLE_CHUNK_REPORTS = max(1, int(os.getenv("REPORT_BUNDLE_CHUNK", "50")))
+BUNDLE_MAX_REPORTS = int(os.getenv("REPORT_BUNDLE_MAX_REPORTS", "1000"))
+
+# Each report starts on a new page; the watermark is added once per document
+BUNDLE_CSS = """
+.bundle-report { page-break-after: always; }
+.bundle-report:last-child { page-break-after: auto; }
+"""
+
+_STYLE_RE = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+_BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.S | re.I)
+_WATERMARK_RE = re.compile(r'\s*<div class="watermark">.*?</div>', re.S)
+
+
+def split_report(html):
+    """(css, body, watermark) of one generate_pdf_html document"""
+    css = "\n".join(_STYLE_RE.findall(html))
+    match = _BODY_RE.search(html)
+    body = match.group(1) if match else html
+    watermark = _WATERMARK_RE.search(body)
+    if watermark:
+        body = body[:watermark.start()] + body[watermark.end():]
+    return css, body, watermark.group(0).strip() if watermark else ""
+
+
+def _document(sections, watermark, css=None):
+    style = f"<style>{css}</style>" if css is not None else ""
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="UTF-8">{style}</head><body>{watermark}'
+        + "".join(f'<section class="bundle-report">{body}</section>' for body in sections)
+        + "</body></html>"
+    )
+
+
+def render_bundle(report_htmls, output_base, chunk_size=BUNDLE_CHUNK_REPORTS, progress=None, use_pdf=True):
+    """Render report documents (any iterable, consumed lazily) into one file.
+
+    Writes output_base + ".pdf" with WeasyPrint, else output_base + ".html".
+    progress(stats) is called after every chunk. Returns the final stats:
+    path, engine, reports, pages (PDF only), seconds, reports/pages per second.
+    """
+    engine = "weasyprint" if use_pdf and WEASYPRINT_AVAILABLE else "html"
+    path = f"{output_base}.{'pdf' if engine == 'weasyprint' else 'html'}"
+    started = time.perf_counter()
+    stats = {'path': path, 'engine': engine, 'reports': 0, 'pages': 0 if engine == 'weasyprint' else None}
+    state = {'css': None, 'stylesheets': None, 'watermark': ""}
+    documents = []
+    font_config = FontConfiguration() if engine == 'weasyprint' else None
+    html_file = open(path, "w", encoding="utf-8") if engine == 'html' else None
+
+    def update():
+        elapsed = time.perf_counter() - started
+        stats['seconds'] = round(elapsed, 3)
+        stats['reports_per_second'] = round(stats['reports'] / elapsed, 2) if elapsed else None
+        if stats['pages'] is not None:
+            stats['pages_per_second'] = round(stats['pages'] / elapsed, 2) if elapsed else None
+        if progress:
+            progress(dict(stats))
+
+    def flush(chunk):
+        if not chunk:
+            return
+        if engine == 'weasyprint':
+            # Stylesheet and fonts are shared; each chunk only lays out its bodies
+            document = HTML(string=_document(chunk, state['watermark']), encoding='utf-8').render(
+                stylesheets=state['stylesheets'], font_config=font_config
+            )
+            documents.append(document)
+            stats['pages'] += len(document.pages)
+        else:
+            html_file.write("".join(f'<section class="bundle-report">{body}</section>' for body in chunk))
+            html_file.flush()
+        stats['reports'] += len(chunk)
+        update()
+
+    try:
+        chunk = []
+        for html in report_htmls:
+            css, body, watermark = split_report(html)
+            if state['css'] is None:
+                state['css'], state['watermark'] = css + BUNDLE_CSS, watermark
+                if engine == 'weasyprint':
+                    state['stylesheets'] = [CSS(string=state['css'], font_config=font_config)]
+                else:
+                    html_file.write(_document([], watermark, state['css']).replace("</body></html>", ""))
+            chunk.append(body)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        flush(chunk)
+
+        if engine == 'weasyprint':
+            if documents:
+                pages = [page for document in documents for page in document.pages]
+                pdf_optimize.write_pdf(documents[0].copy(pages), path)
+        else:
+            if state['css'] is None:
+                html_file.write(_document([], "", BUNDLE_CSS).replace("</body></html>", ""))
+            html_file.write("</body></html>")
+    finally:
+        if html_file:
+            html_file.close()
+    stats['bytes'] = os.path.getsize(path) if os.path.exists(path) else 0
+    update()
+    return stats
@@ -0,0 +1,124 @@
+"""Per-patient, per-test result series.
+
+lab_results keeps every value. result_series keeps the latest
+SERIES_MAX_POINTS values of each (patient, test) as a small JSON list. It
+is updated in the same transaction as each lab_results insert, so a report
+render reads one row per test and never scans the patient's history.
+
+    points = [{"date": "2025-11-04", "value": 6.8, "text": "6.8 %", "report_id": 12}, ...]
+"""
+import os
+import re
+import json
+
+SERIES_MAX_POINTS = int(os.getenv("RESULT_SERIES_MAX_POINTS", "20"))
+
+# "12.5", "<0.5", "6.8 %", "140 mg/dl" are numeric; "1:80", "Positive" are not
+_NUMERIC_RE = re.compile(r"\s*[<>]?=?\s*([-+]?\d*\.?\d+)\s*(?:[a-zA-Z%/µ][\w/%^.µ]*)?\s*")
+
+
+def parse_numeric(value):
+    match = _NUMERIC_RE.fullmatch(str(value or ""))
+    return float(match.group(1)) if match else None
+
+
+def make_point(result_date, value, report_id=None):
+    return {"date": result_date, "value": parse_numeric(value), "text": str(value), "report_id": report_id}
+
+
+def add_point(points, point, max_points=SERIES_MAX_POINTS):
+    """Insert point in date order (imports can arrive out of order) and trim to the newest"""
+    points.append(point)
+    points.sort(key=lambda p: (p["date"] or "", p["report_id"] or 0))
+    return points[-max_points:]
+
+
+def append_results(cur, patient_id, rows):
+    """Update result_series for freshly inserted lab_results.
+
+    rows: (test_name, result_value, result_date, report_id)
+    """
+    for test_name, value, result_date, report_id in rows:
+        if value in (None, ""):
+            continue
+        existing = cur.execute(
+            "SELECT points FROM result_series WHERE patient_id = ? AND test_name = ?",
+            (patient_id, test_name),
+        ).fetchone()
+        points = add_point(json.loads(existing[0]) if existing else [], make_point(result_date, value, report_id))
+        cur.execute('''
+            INSERT INTO result_series (patient_id, test_name, points, last_value, last_date)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(patient_id, test_name) DO UPDATE SET
+                points = excluded.points, last_value = excluded.last_value, last_date = excluded.last_date
+        ''', (patient_id, test_name, json.dumps(points), points[-1]["text"], points[-1]["date"]))
+
+
+def refresh_series(cur, patient_id, test_names):
+    """Recompute a few of a patient's series after lab_results rows were corrected or moved"""
+    for test_name in test_names:
+        rows = cur.execute('''
+            SELECT result_value, result_date, report_id FROM lab_results
+            WHERE patient_id = ? AND test_name = ? AND result_value IS NOT NULL AND result_value != ''
+            ORDER BY result_date DESC, id DESC
+            LIMIT ?
+        ''', (patient_id, test_name, SERIES_MAX_POINTS)).fetchall()
+        if not rows:
+            cur.execute("DELETE FROM result_series WHERE patient_id = ? AND test_name = ?", (patient_id, test_name))
+            continue
+        points = [make_point(result_date, value, report_id) for value, result_date, report_id in reversed(rows)]
+        cur.execute('''
+            INSERT INTO result_series (patient_id, test_name, points, last_value, last_date)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(patient_id, test_name) DO UPDATE SET
+                points = excluded.points, last_value = excluded.last_value, last_date = excluded.last_date
+        ''', (patient_id, test_name, json.dumps(points), points[-1]["text"], points[-1]["date"]))
+
+
+def rebuild_series(conn):
+    """Recompute result_series from lab_results (migrations / repair)"""
+    conn.execute("DELETE FROM result_series")
+    rows = conn.execute('''
+        SELECT patient_id, test_name, result_value, result_date, report_id
+        FROM lab_results
+        WHERE result_value IS NOT NULL AND result_value != ''
+        ORDER BY patient_id, test_name, result_date, id
+    ''')
+    current, points = None, []
+
+    def flush():
+        if current and points:
+            conn.execute(
+                "INSERT INTO result_series (patient_id, test_name, points, last_value, last_date) VALUES (?, ?, ?, ?, ?)",
+                (*current, json.dumps(points), points[-1]["text"], points[-1]["date"]),
+            )
+
+    for patient_id, test_name, value, result_date, report_id in rows:
+        if (patient_id, test_name) != current:
+            flush()
+            current, points = (patient_id, test_name), []
+        points.append(make_point(result_date, value, report_id))
+        points = points[-SERIES_MAX_POINTS:]
+    flush()
+
+
+def sparkline_svg(values, width=90, height=22, color="#003366"):
+    """Inline SVG polyline of numeric values; the last (current) point is marked"""
+    values = [v for v in values if v is not None]
+    if len(values) < 2:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    step = (width - 6) / (len(values) - 1)
+    coords = [
+        (3 + i * step, height - 3 - (v - low) / span * (height - 6))
+        for i, v in enumerate(values)
+    ]
+    polyline = " ".join(f"{x:.1f},{y:.1f}" for x, y in coords)
+    last_x, last_y = coords[-1]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" style="vertical-align: middle;">'
+        f'<polyline points="{polyline}" fill="none" stroke="{color}" stroke-width="1.2"/>'
+        f'<circle cx="{last_x:.1f}" cy="{last_y:.1f}" r="2" fill="{color}"/></svg>'
+    )
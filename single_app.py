@@ -3,7 +3,7 @@ from tkinter import ttk, messagebox
 import webbrowser
 import os
 from datetime import datetime
-import sqlite3
+from datastore import PathologyStore
 import json
 import threading
 import time
@@ -14,6 +14,7 @@ from flask import render_template_string
 import base64
 import tempfile
 import urllib.parse
+import catalog
 
 # Try to import pdfkit, if not available we'll use alternative methods
 try:
@@ -69,78 +70,7 @@ class PathologyTestsForm(tk.Tk):
         self.current_selected_tests = []
         
         # Test normal ranges dictionary
-        self.normal_ranges = {
-            "Glucose (F)/RI": "70-110 mg/dl",
-            "Post Prandial / after 2 Hrs": "Up to 140 mg/dl",
-            "HbA1c": "4.5-6.5 %",
-            "Urea": "10-40 mg/dl",
-            "Creatinine": "0.6-1.4 mg/dl",
-            "S. Uric Acid": "2.8-7.0 mg/dl",
-            "BUN": "5-20 mg/dl",
-            "Cholesterol": "150-200 mg/dl",
-            "Triglyceride": "0-170 mg/dl",
-            "HDL": "30-96 (F)/30-70 (M) mg/dl",
-            "LDL": "<100 mg/dl",
-            "Bilirubin Total": "0.1-1.2 mg/dl",
-            "Bilirubin (Conjugated)": "0.0-0.3 mg/dl",
-            "Bilirubin (Unconjugated)": "0.1-1.0 mg/dl",
-            "SGOT/AST": "0-35 U/L",
-            "SGPT/ALT": "0-40 U/L",
-            "Alk. Phosphatase": "175-575 U/L",
-            "Total Protein": "6.5-8.0 gm/dl",
-            "Albumin": "3.5-5.0 gm/dl",
-            "Globulin": "2.3-3.5 gm/dl",
-            "A/G Ratio": "1.0-2.5",
-            "GGT": "8-60 U/L",
-            "S. Calcium": "8.8-11.0 mg/dl",
-            "S. Sodium": "138-148 meq/l",
-            "S. Potassium": "3.8-4.8 meq/l",
-            "Urine Protein (24 Hrs)": "24-120 mg/24 Hrs",
-            "Urine micro protein (albumin)": "28-150 mg/24 Hrs",
-            "CK-MB": "0-24 U/L",
-            "S. Phosphorous": "2.7-4.5 mg/dl",
-            "S. Amylase": "0-110 U/L",
-            "TROP-T": "Negative",
-            "Haemoglobin": "14-18 gm% (M)/12-15 gm% (F)",
-            "Total leukocyte count": "4000-10,000/cu mm",
-            "Differential WBC count - Polymorphs": "40-75%",
-            "Differential WBC count - Lymphocytes": "20-45%",
-            "Differential WBC count - Eosinophils": "1-6%",
-            "Differential WBC count - Monocytes": "0-10%",
-            "Differential WBC count - Basophiles": "0-1%",
-            "AEC": "40-500 No/cu mm",
-            "E.S.R. (Westergren)": "0-12 mm (F), 0-10 mm (M)",
-            "Platelet Count": "1.5-4.5 lac/cu mm",
-            "RBC Count": "F=3.5-5.0, M=4.2-5.5 million/cu mm",
-            "Reticulocyte count": "2-5% of RBC",
-            "Haematocrit/PCV": "M=39-49%, F=33-43%",
-            "MCV": "76-100 fl",
-            "MCH": "29.5 Â± 2.5 pg",
-            "MCHC": "32.5 Â± 2.5 gm/dl",
-            "Malaria Parasite": "Negative",
-            "BLOOD GROUP": "Rh = Positive/Negative",
-            "Bleeding Time": "2-7 Min.",
-            "Clotting Time": "6 Min.",
-            "Prothrombin Time": "10-14 Sec.",
-            "PERIPHERAL BLOOD SMEAR - RBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - WBC": "Normal morphology",
-            "PERIPHERAL BLOOD SMEAR - PLATELET": "Adequate",
-            "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE": "Negative",
-            "HbsAg": "Negative",
-            "HIV (1+2)": "Negative",
-            "HCV": "Negative",
-            "VDRL": "Non-reactive",
-            "ASO Titer": "<200 IU/ml",
-            "R.A. factor": "<20 IU/ml",
-            "CRP": "<6 mg/L",
-            "Gravindex (PREGNANCY)": "Negative",
-            "WIDAL TEST - S. Typhi, 'O'": "Negative (<1:80)",
-            "WIDAL TEST - S. Typhi, 'H'": "Negative (<1:160)",
-            "WIDAL TEST - S. Paratyphi, 'AH'": "Negative (<1:80)",
-            "WIDAL TEST - S. Paratyphi, 'BH'": "Negative (<1:80)",
-            "Dengue NS1": "Negative",
-            "Typhi Dot": "Negative"
-        }
+        self.normal_ranges = catalog.default_normal_ranges()
         
         # Start Flask server for handling form submissions
         self.flask_app = Flask(__name__)
@@ -162,7 +92,7 @@ class PathologyTestsForm(tk.Tk):
         info_label.pack(pady=(0,30))
 
         # Launch button
-        launch_btn = tk.Button(self, text="ðŸš€ Launch Web Application", 
+        launch_btn = tk.Button(self, text="🚀 Launch Web Application", 
                               fg="white", bg="#28a745", font=("Arial", 16, "bold"), 
                               command=self.launch_web_app, height=3, width=25)
         launch_btn.pack(pady=(0, 20))
@@ -173,90 +103,13 @@ class PathologyTestsForm(tk.Tk):
         self.status_label.pack(pady=(10,5))
 
         # Pathology tests data
-        self.tests = {
-            "BIOCHEMISTRY": [
-                "Glucose (F)/RI", "Post Prandial / after 2 Hrs", "HbA1c"
-            ],
-            "RENAL FUNCTION": [
-                "Urea", "Creatinine", "S. Uric Acid", "BUN"
-            ],
-            "LIPID PROFILE": [
-                "Cholesterol", "Triglyceride", "HDL", "LDL"
-            ],
-            "LIVER FUNCTION": [
-                "Bilirubin Total", "Bilirubin (Conjugated)", "Bilirubin (Unconjugated)", 
-                "SGOT/AST", "SGPT/ALT", "Alk. Phosphatase", "Total Protein", 
-                "Albumin", "Globulin", "A/G Ratio", "GGT"
-            ],
-            "ELECTROLYTES": [
-                "S. Calcium", "S. Sodium", "S. Potassium"
-            ],
-            "OTHER TESTS": [
-                "Urine Protein (24 Hrs)", "Urine micro protein (albumin)", 
-                "CK-MB", "S. Phosphorous", "S. Amylase", "TROP-T"
-            ],
-            "HAEMATOLOGY": [
-                "Haemoglobin", "Total leukocyte count", "Differential WBC count - Polymorphs",
-                "Differential WBC count - Lymphocytes", "Differential WBC count - Eosinophils",
-                "Differential WBC count - Monocytes", "Differential WBC count - Basophiles",
-                "AEC", "E.S.R. (Westergren)", "Platelet Count", "RBC Count", 
-                "Reticulocyte count", "Haematocrit/PCV", "MCV", "MCH", "MCHC",
-                "Malaria Parasite", "BLOOD GROUP", "Bleeding Time", "Clotting Time",
-                "Prothrombin Time", "PERIPHERAL BLOOD SMEAR - RBC", 
-                "PERIPHERAL BLOOD SMEAR - WBC", "PERIPHERAL BLOOD SMEAR - PLATELET",
-                "PERIPHERAL BLOOD SMEAR - HAEMOPARASITE"
-            ],
-            "SEROLOGY": [
-                "HbsAg", "HIV (1+2)", "HCV", "VDRL", "ASO Titer", "R.A. factor", 
-                "CRP", "Gravindex (PREGNANCY)", "WIDAL TEST - S. Typhi, 'O'",
-                "WIDAL TEST - S. Typhi, 'H'", "WIDAL TEST - S. Paratyphi, 'AH'",
-                "WIDAL TEST - S. Paratyphi, 'BH'", "Dengue NS1", "Typhi Dot"
-            ]
-        }
+        self.tests = catalog.default_tests()
 
     def init_database(self):
-        """Initialize SQLite database for storing reports"""
+        """Open the unified database through datastore.PathologyStore (migrated on open)"""
         try:
-            self.conn = sqlite3.connect('pathology_reports.db', check_same_thread=False)
-            self.cursor = self.conn.cursor()
-            
-            # Create table for form submissions
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS form_submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    selected_tests TEXT,
-                    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create table for completed reports
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS completed_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_name TEXT,
-                    patient_age TEXT,
-                    patient_gender TEXT,
-                    patient_mobile TEXT,
-                    doctor_name TEXT,
-                    opd_no TEXT,
-                    sample_date TEXT,
-                    test_results TEXT,
-                    pdf_path TEXT,
-                    whatsapp_status TEXT,
-                    whatsapp_error TEXT,
-                    report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            self.conn.commit()
-            print("Database initialized successfully")
+            self.store = PathologyStore()
+            print(f"Database initialized successfully ({self.store.db_path})")
             
         except Exception as e:
             print(f"Error initializing database: {e}")
@@ -356,7 +209,7 @@ class PathologyTestsForm(tk.Tk):
                     <p class="subtitle">Vidyut Nagar, Gautam Budh Nagar, Uttar Pradesh - 201008</p>
                     
                     <div class="form-section">
-                        <h3 style="color: #003366; margin-bottom: 20px;">ðŸ“‹ Generate Fillable Form</h3>
+                        <h3 style="color: #003366; margin-bottom: 20px;">📋 Generate Fillable Form</h3>
                         
                         <div class="patient-info-grid">
                             <div>
@@ -425,7 +278,7 @@ class PathologyTestsForm(tk.Tk):
                     </div>
 
                     <button class="btn-generate" onclick="generateFillableForm()">
-                        ðŸ“‹ Generate Fillable Form
+                        📋 Generate Fillable Form
                     </button>
                 </div>
             </div>
@@ -556,7 +409,7 @@ class PathologyTestsForm(tk.Tk):
                     with open(pdf_filepath, 'wb') as f:
                         f.write(pdf_bytes)
                     
-                    print(f"âœ… PDF saved to: {pdf_filepath}")
+                    print(f"✅ PDF saved to: {pdf_filepath}")
                     
                     # Generate view URL for the PDF
                     base_url = self.get_public_base_url()
@@ -622,7 +475,7 @@ class PathologyTestsForm(tk.Tk):
                     })
                     
             except Exception as e:
-                print(f"âŒ Error in form submission: {e}")
+                print(f"❌ Error in form submission: {e}")
                 import traceback
                 traceback.print_exc()
                 return jsonify({
@@ -646,7 +499,7 @@ class PathologyTestsForm(tk.Tk):
                 # Determine content type
                 if filename.lower().endswith('.pdf'):
                     mimetype = 'application/pdf'
-                    print(f"ðŸ“„ Serving PDF: {filename}")
+                    print(f"📄 Serving PDF: {filename}")
                     return send_from_directory(
                         directory, 
                         filename, 
@@ -675,11 +528,11 @@ class PathologyTestsForm(tk.Tk):
         """Start Flask server in a separate thread"""
         def run_flask():
             try:
-                print("ðŸš€ Starting Flask server on http://127.0.0.1:5000")
-                print("ðŸ“ Reports directory: reports/completed_reports/")
+                print("🚀 Starting Flask server on http://127.0.0.1:5000")
+                print("📁 Reports directory: reports/completed_reports/")
                 self.flask_app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False, threaded=True)
             except Exception as e:
-                print(f"âŒ Flask server error: {e}")
+                print(f"❌ Flask server error: {e}")
         
         self.flask_thread = threading.Thread(target=run_flask, daemon=True)
         self.flask_thread.start()
@@ -1080,12 +933,12 @@ class PathologyTestsForm(tk.Tk):
                 ("Reticulocyte count", "2-5% of RBC"),
                 ("Haematocrit/PCV", "M=39-49%, F=33-43%"),
                 ("MCV", "76-100 fl"),
-                ("MCH", "29.5 Â± 2.5 pg"),
-                ("MCHC", "32.5 Â± 2.5 gm/dl"),
+                ("MCH", "29.5 ± 2.5 pg"),
+                ("MCHC", "32.5 ± 2.5 gm/dl"),
                 ("Malaria Parasite", "-"),
                 ("BLOOD GROUP", "Rh = Positive/Negative"),
                 ("Bleeding Time", "2-7 Min. (Ivy's method)"),
-                ("Clotting Time", "6 Min. (Lee & White, 37Â°C)"),
+                ("Clotting Time", "6 Min. (Lee & White, 37°C)"),
                 ("Prothrombin Time", "10-14 Sec."),
                 ("PERIPHERAL BLOOD SMEAR - RBC", "-"),
                 ("PERIPHERAL BLOOD SMEAR - WBC", "-"),
@@ -1152,10 +1005,10 @@ class PathologyTestsForm(tk.Tk):
       Signature<br>(Pathologist)
     </div>
 
-    <!-- âœ… Submit Button -->
+    <!-- ✅ Submit Button -->
     <div class="d-grid gap-2 d-md-flex justify-content-md-end mt-4">
       <button type="button" class="btn btn-success me-md-2" onclick="submitForm()">
-        âœ… Submit & Send WhatsApp Report
+        ✅ Submit & Send WhatsApp Report
       </button>
       <button type="reset" class="btn btn-secondary">Clear Form</button>
     </div>
@@ -1214,16 +1067,16 @@ class PathologyTestsForm(tk.Tk):
       }})
       .then(data => {{
         if (data.success) {{
-          alert('âœ… Report submitted successfully!\\\\n\\\\n' + data.message + '\\\\n\\\\nWhatsApp Status: ' + data.whatsapp_message + '\\\\n\\\\nThe patient will receive this link to view their report:\\\\n' + data.pdf_url);
+          alert('✅ Report submitted successfully!\\\\n\\\\n' + data.message + '\\\\n\\\\nWhatsApp Status: ' + data.whatsapp_message + '\\\\n\\\\nThe patient will receive this link to view their report:\\\\n' + data.pdf_url);
           if (data.pdf_url) {{
             window.open(data.pdf_url, '_blank');
           }}
         }} else {{
-          alert('âŒ Error: ' + data.message);
+          alert('❌ Error: ' + data.message);
         }}
       }})
       .catch(error => {{
-        alert('âŒ Error submitting form: ' + error);
+        alert('❌ Error submitting form: ' + error);
         console.error('Error:', error);
       }});
     }}
@@ -1449,11 +1302,11 @@ class PathologyTestsForm(tk.Tk):
                     # Generate PDF
                     pdf_bytes = HTML(string=html_content, encoding='utf-8').write_pdf()
                     
-                    print("âœ… PDF generated successfully with WeasyPrint")
+                    print("✅ PDF generated successfully with WeasyPrint")
                     return True, pdf_bytes
                     
                 except Exception as e:
-                    print(f"âŒ WeasyPrint failed: {e}")
+                    print(f"❌ WeasyPrint failed: {e}")
             
             # Method 2: Try pdfkit
             if PDFKIT_AVAILABLE:
@@ -1499,11 +1352,11 @@ class PathologyTestsForm(tk.Tk):
                     # Clean up temp file
                     os.unlink(tmp_path)
                     
-                    print("âœ… PDF generated successfully with pdfkit")
+                    print("✅ PDF generated successfully with pdfkit")
                     return True, pdf_bytes
                     
                 except Exception as e:
-                    print(f"âŒ pdfkit failed: {e}")
+                    print(f"❌ pdfkit failed: {e}")
             
             # Method 3: Try alternative using xhtml2pdf (pure Python)
             try:
@@ -1515,19 +1368,19 @@ class PathologyTestsForm(tk.Tk):
                 pisa_status = pisa.CreatePDF(html_content, dest=pdf_bytes)
                 
                 if pisa_status.err:
-                    print("âŒ xhtml2pdf failed")
+                    print("❌ xhtml2pdf failed")
                     raise Exception("PDF generation failed")
                 
                 pdf_data = pdf_bytes.getvalue()
                 pdf_bytes.close()
                 
-                print("âœ… PDF generated successfully with xhtml2pdf")
+                print("✅ PDF generated successfully with xhtml2pdf")
                 return True, pdf_data
                 
             except ImportError:
-                print("âš ï¸ xhtml2pdf not available.")
+                print("⚠️ xhtml2pdf not available.")
             except Exception as e:
-                print(f"âŒ xhtml2pdf failed: {e}")
+                print(f"❌ xhtml2pdf failed: {e}")
             
             # Method 4: Try alternative using reportlab (basic PDF)
             try:
@@ -1551,43 +1404,26 @@ class PathologyTestsForm(tk.Tk):
                 pdf_data = pdf_bytes.getvalue()
                 pdf_bytes.close()
                 
-                print("âœ… Basic PDF generated with reportlab")
+                print("✅ Basic PDF generated with reportlab")
                 return True, pdf_data
                 
             except ImportError:
-                print("âš ï¸ reportlab not available.")
+                print("⚠️ reportlab not available.")
             except Exception as e:
-                print(f"âŒ reportlab failed: {e}")
+                print(f"❌ reportlab failed: {e}")
             
             # Method 5: Final fallback - generate HTML file only
-            print("âš ï¸ No PDF generation method available. Using HTML fallback.")
+            print("⚠️ No PDF generation method available. Using HTML fallback.")
             return False, None
             
         except Exception as e:
-            print(f"âŒ Error in PDF generation: {e}")
+            print(f"❌ Error in PDF generation: {e}")
             return False, None
 
     def store_report_in_database(self, patient_data, selected_tests):
         """Store form submission in database"""
         try:
-            selected_tests_json = json.dumps(selected_tests)
-            
-            self.cursor.execute('''
-                INSERT INTO form_submissions 
-                (patient_name, patient_age, patient_gender, patient_mobile, doctor_name, opd_no, sample_date, selected_tests)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                patient_data['name'],
-                patient_data['age'],
-                patient_data['gender'],
-                patient_data['mobile'],
-                patient_data['doctor'],
-                patient_data['opd_no'],
-                patient_data['sample_date'],
-                selected_tests_json
-            ))
-            
-            self.conn.commit()
+            self.store.insert_form_submission(patient_data, selected_tests)
             print("Form submission stored in database")
             
         except Exception as e:
@@ -1596,14 +1432,8 @@ class PathologyTestsForm(tk.Tk):
     def store_completed_report(self, patient_data, test_results, pdf_path, whatsapp_success, whatsapp_message):
         """Store completed report in database with WhatsApp status"""
         try:
-            test_results_json = json.dumps(test_results)
             whatsapp_status = "sent" if whatsapp_success else "failed"
-            
-            self.cursor.execute('''
-                INSERT INTO completed_reports 
-                (patient_name, patient_age, patient_gender, patient_mobile, doctor_name, opd_no, sample_date, test_results, pdf_path, whatsapp_status, whatsapp_error)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            row = (
                 patient_data.get('name', ''),
                 patient_data.get('age', ''),
                 patient_data.get('gender', ''),
@@ -1611,18 +1441,24 @@ class PathologyTestsForm(tk.Tk):
                 patient_data.get('doctor', ''),
                 patient_data.get('opd_no', ''),
                 patient_data.get('sample_date', ''),
-                test_results_json,
+                json.dumps(test_results),
                 pdf_path,
                 whatsapp_status,
-                whatsapp_message
-            ))
-            
-            self.conn.commit()
-            print(f"âœ… Completed report stored in database. WhatsApp: {whatsapp_status}")
+                whatsapp_message,
+                "not_attempted",
+                None,
+            )
+            # Registers the patient and results like every other entry point
+            self.store.insert_completed_reports(
+                [row],
+                self.normal_ranges,
+                {test: category for category, tests in self.tests.items() for test in tests},
+            )
+            print(f"✅ Completed report stored in database. WhatsApp: {whatsapp_status}")
             return True
             
         except Exception as e:
-            print(f"âŒ Error storing completed report: {e}")
+            print(f"❌ Error storing completed report: {e}")
             return False
 
     def validate_mobile_number(self, mobile_number):
@@ -1650,7 +1486,7 @@ class PathologyTestsForm(tk.Tk):
             if mobile_error:
                 return False, f"Mobile number error: {mobile_error}"
             
-            print(f"ðŸ“± Attempting to send WhatsApp to: {formatted_mobile}")
+            print(f"📱 Attempting to send WhatsApp to: {formatted_mobile}")
             
             # Method 1: WhatsApp Business API
             api_success, api_message = self.send_whatsapp_api(formatted_mobile, patient_data, pdf_url)
@@ -1667,7 +1503,7 @@ class PathologyTestsForm(tk.Tk):
             
         except Exception as e:
             error_msg = f"WhatsApp sending failed: {str(e)}"
-            print(f"âŒ {error_msg}")
+            print(f"❌ {error_msg}")
             return False, error_msg
 
     def send_whatsapp_api(self, mobile_number, patient_data, pdf_url):
@@ -1700,7 +1536,7 @@ class PathologyTestsForm(tk.Tk):
             response = requests.post(url, json=payload, headers=headers)
             
             if response.status_code == 200:
-                print("âœ… WhatsApp message sent via API!")
+                print("✅ WhatsApp message sent via API!")
                 return True, "WhatsApp message sent via Business API"
             else:
                 return False, f"API Error: {response.status_code} - {response.text}"
@@ -1723,7 +1559,7 @@ class PathologyTestsForm(tk.Tk):
             # Open in browser
             webbrowser.open(whatsapp_url)
             
-            print("âœ… WhatsApp Web opened. Please send manually.")
+            print("✅ WhatsApp Web opened. Please send manually.")
             return True, "WhatsApp Web opened - please send manually"
             
         except Exception as e:
@@ -1734,12 +1570,12 @@ class PathologyTestsForm(tk.Tk):
         try:
             message_body = self.create_whatsapp_message(patient_data, pdf_url)
             
-            print(f"ðŸ“± Message ready for {mobile_number}:")
+            print(f"📱 Message ready for {mobile_number}:")
             print("="*50)
             print(message_body)
             print("="*50)
-            print(f"ðŸ“„ Report URL that will be sent to patient: {pdf_url}")
-            print("\nâœ… The patient can click this link to view/download their report.")
+            print(f"📄 Report URL that will be sent to patient: {pdf_url}")
+            print("\n✅ The patient can click this link to view/download their report.")
             
             # Show message box with the URL
             messagebox.showinfo("Report Ready", 
@@ -1758,20 +1594,20 @@ class PathologyTestsForm(tk.Tk):
         """Create WhatsApp message content with user-friendly URL"""
         pdf_url = str(pdf_url or "").strip()
         return f"""
-ðŸ”¬ *UJJIVAN HOSPITAL - PATHOLOGY REPORT*
+🔬 *UJJIVAN HOSPITAL - PATHOLOGY REPORT*
 
 Dear {patient_data.get('name', 'Patient')},
 
 Your pathology test report is ready for viewing.
 
 *Patient Details:*
-â€¢ Name: {patient_data.get('name', '')}
-â€¢ Age: {patient_data.get('age', '')}
-â€¢ Gender: {patient_data.get('gender', '')}
-â€¢ Doctor: {patient_data.get('doctor', '')}
-â€¢ Sample Date: {patient_data.get('sample_date', '')}
+• Name: {patient_data.get('name', '')}
+• Age: {patient_data.get('age', '')}
+• Gender: {patient_data.get('gender', '')}
+• Doctor: {patient_data.get('doctor', '')}
+• Sample Date: {patient_data.get('sample_date', '')}
 
-ðŸ“„ *View Your Report Online:*
+📄 *View Your Report Online:*
 {pdf_url}
 
 *Instructions:*
@@ -1785,7 +1621,7 @@ Your pathology test report is ready for viewing.
 *Note:* This link is valid for 30 days. Contact hospital for queries.
 
 Thank you for choosing UJJIVAN Hospital.
-ðŸ“ Vidyut Nagar, Gautam Budh Nagar, UP - 201008
+📍 Vidyut Nagar, Gautam Budh Nagar, UP - 201008
 """
 
     def send_sms_fast2sms(self, mobile_number, message):
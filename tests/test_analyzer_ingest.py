@@ -0,0 +1,168 @@
+"""Analyzer ingestion against recorded HL7 and ASTM captures (tests/fixtures/analyzer)."""
+import os
+import sys
+import socket
+import threading
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import analyzer_ingest  # noqa: E402
+from analyzer_ingest import ACK, NAK, AnalyteMapper, AnalyzerStreamParser, AnalyzerTCPServer  # noqa: E402
+
+FIXTURES = os.path.join(ROOT_DIR, "tests", "fixtures", "analyzer")
+
+TESTS = {
+    "BIOCHEMISTRY": ["Glucose (F)/RI", "Urea", "Creatinine"],
+}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def mapper():
+    return AnalyteMapper(TESTS, {})
+
+
+def replay(mapper, data, chunk_size=None):
+    messages = []
+    parser = AnalyzerStreamParser(mapper, messages.append)
+    replies = []
+    step = chunk_size or len(data)
+    for start in range(0, len(data), step):
+        replies += parser.feed(data[start:start + step])
+    parser.close()
+    return parser, messages, replies
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 7])
+def test_hl7_oru_message(mapper, chunk_size):
+    _, messages, replies = replay(mapper, fixture("oru_r01.hl7"), chunk_size)
+
+    assert len(messages) == 1
+    message = messages[0]
+    assert message["protocol"] == "hl7"
+    assert message["test_results"] == {"Glucose (F)/RI": "112", "Creatinine": "1.0"}
+    assert message["unmapped"] == ["XYZ"]
+    assert message["patient_data"]["name"] == "Ravi Sharma"
+    assert message["patient_data"]["gender"] == "Male"
+    assert message["patient_data"]["doctor"] == "Anil Mehta"
+    assert message["patient_data"]["sample_date"] == "2025-11-04"
+    assert len(replies) == 1 and b"MSA|AA|MSG00001" in replies[0]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 5])
+def test_astm_record_split_across_etb_frames(mapper, chunk_size):
+    parser, messages, replies = replay(mapper, fixture("astm_etb_split.astm"), chunk_size)
+
+    assert len(messages) == 1
+    assert messages[0]["protocol"] == "astm"
+    assert messages[0]["test_results"] == {"Urea": "28", "Creatinine": "1.1"}
+    assert messages[0]["patient_data"]["name"] == "Sunita Devi"
+    assert messages[0]["patient_data"]["age"] == "35"
+    # ENQ and both frames acknowledged
+    assert replies == [ACK, ACK, ACK]
+    assert parser.bad_frames == 0
+
+
+def test_astm_bad_checksum_is_refused_and_resend_accepted(mapper):
+    parser, messages, replies = replay(mapper, fixture("astm_bad_checksum.astm"))
+
+    assert replies == [ACK, NAK, ACK, ACK]
+    assert parser.bad_frames == 1
+    assert len(messages) == 1
+    assert messages[0]["test_results"] == {"Urea": "31"}
+
+
+def test_astm_repeated_frame_is_not_applied_twice(mapper):
+    data = fixture("astm_etb_split.astm")
+    first_frame_end = data.index(b"\r\n") + 2
+    # The sender missed our ACK and sent frame 1 again
+    repeated = data[:first_frame_end] + data[1:first_frame_end] + data[first_frame_end:]
+    _, messages, replies = replay(mapper, repeated)
+
+    assert replies == [ACK, ACK, ACK, ACK]
+    assert messages[0]["test_results"] == {"Urea": "28", "Creatinine": "1.1"}
+
+
+class CollectingWriter:
+    def __init__(self):
+        self.messages = []
+        self.received = threading.Event()
+
+    def submit(self, message):
+        self.messages.append(message)
+        self.received.set()
+
+
+def test_mllp_loopback_acknowledges_message(mapper):
+    writer = CollectingWriter()
+    server = AnalyzerTCPServer(("127.0.0.1", 0), mapper, writer, idle_timeout=5)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.create_connection(server.server_address, timeout=5) as conn:
+            conn.sendall(fixture("oru_r01.hl7"))
+            ack = b""
+            while not ack.endswith(bytes([analyzer_ingest.FS, analyzer_ingest.CR])):
+                chunk = conn.recv(4096)
+                assert chunk, "connection closed before the ACK"
+                ack += chunk
+        assert ack.startswith(bytes([analyzer_ingest.VT]))
+        assert b"|ACK^R01|" in ack
+        assert b"MSA|AA|MSG00001" in ack
+        assert writer.received.wait(5)
+        assert writer.messages[0]["test_results"]["Creatinine"] == "1.0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FakeForm:
+    def __init__(self, qc_blocked=()):
+        self.qc_blocked = list(qc_blocked)
+        self.stored = []
+        self.alerts = []
+
+    def qc_held_tests(self, test_results=None):
+        return self.qc_blocked
+
+    def build_completed_report_row(self, patient_data, test_results, *status):
+        return (patient_data["name"], dict(test_results))
+
+    def store_completed_reports_batch(self, rows):
+        self.stored += rows
+        return True, None
+
+    def get_public_base_url(self):
+        return "https://lab.example"
+
+    def raise_critical_alerts(self, patient_data, test_results, base_url):
+        self.alerts.append((patient_data["name"], base_url))
+
+
+def analyzer_message(name, test_results):
+    return {"protocol": "astm", "patient_data": {"name": name}, "test_results": test_results, "unmapped": []}
+
+
+def test_writer_holds_results_on_qc_failed_analytes():
+    form = FakeForm(qc_blocked=["Urea"])
+    writer = analyzer_ingest.ResultBatchWriter(form)
+    batch = [
+        analyzer_message("Held Patient", {"Urea": "28", "Creatinine": "1.1"}),
+        analyzer_message("Clear Patient", {"Creatinine": "0.9"}),
+    ]
+    for message in batch:
+        writer.submit(message)
+    writer._write([writer.queue.get_nowait() for _ in batch])
+
+    assert form.stored == [("Clear Patient", {"Creatinine": "0.9"})]
+    assert writer.stored == 1
+    assert writer.skipped == 1
+    assert writer.queue.unfinished_tasks == 0
+    assert form.alerts == [("Clear Patient", "https://lab.example")]
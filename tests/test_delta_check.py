@@ -0,0 +1,102 @@
+"""Delta checks against the patient's previous result (delta_check.py)."""
+import os
+import sys
+import json
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import delta_check  # noqa: E402
+from datastore import PathologyStore  # noqa: E402
+
+RULES = {
+    "Urea": {"percent": 100, "hours": 72},
+    "Haemoglobin": {"absolute": 2.0, "hours": 72},
+    "Creatinine": {"percent": 50, "absolute": 0.3, "hours": 48},
+    "TROP-T": {"percent": 50, "hours": 24},
+}
+
+
+def points(*values):
+    """Series points from (date, value, report_id) tuples, oldest first"""
+    return [{"date": date, "value": value, "text": str(value), "report_id": report_id}
+            for date, value, report_id in values]
+
+
+def test_percent_threshold():
+    series = points(("2025-11-03", 20.0, 1))
+    flag = delta_check.check("Urea", "40", "2025-11-04", series, RULES)
+    assert flag['percent'] == 100.0
+    assert flag['threshold'] == "100%"
+    assert delta_check.check("Urea", "39", "2025-11-04", series, RULES) is None
+
+
+def test_absolute_threshold():
+    series = points(("2025-11-03", 12.0, 1))
+    flag = delta_check.check("Haemoglobin", "9.9", "2025-11-04", series, RULES)
+    assert flag['change'] == -2.1
+    assert flag['threshold'] == "2"
+    assert delta_check.check("Haemoglobin", "10.5", "2025-11-04", series, RULES) is None
+
+
+def test_either_threshold_flags():
+    series = points(("2025-11-03", 1.0, 1))
+    # 30% is under the percent rule, but 0.3 mg/dl meets the absolute one
+    assert delta_check.check("Creatinine", "1.3", "2025-11-04", series, RULES)['threshold'] == "0.3"
+    assert delta_check.check("Creatinine", "2.0", "2025-11-04", series, RULES)['threshold'] == "50% or 0.3"
+
+
+def test_date_only_window_counts_whole_days():
+    flag = delta_check.check("TROP-T", "0.5", "2025-11-04", points(("2025-11-03", 0.1, 1)), RULES)
+    assert flag['hours'] == 24.0
+    assert delta_check.check("TROP-T", "0.5", "2025-11-04", points(("2025-11-02", 0.1, 1)), RULES) is None
+
+
+def test_timestamps_use_the_real_interval():
+    series = points(("2025-11-03 08:00:00", 0.1, 1))
+    assert delta_check.check("TROP-T", "0.5", "2025-11-04 10:00:00", series, RULES) is None
+    assert delta_check.check("TROP-T", "0.5", "2025-11-04 07:00:00", series, RULES)['hours'] == 23.0
+
+
+def test_previous_point_skips_later_and_non_numeric_results():
+    series = points(("2025-11-01", 20.0, 1), ("2025-11-02", None, 2), ("2025-11-05", 80.0, 3))
+    assert delta_check.previous_point(series, "2025-11-03")['report_id'] == 1
+    assert delta_check.check("Urea", "41", "2025-11-03", series, RULES)['previous'] == 20.0
+
+
+def test_untracked_test_is_not_checked():
+    assert delta_check.check("Glucose", "400", "2025-11-04", points(("2025-11-03", 90.0, 1)), RULES) is None
+
+
+def report_row(name, results, sample_date):
+    return (name, "45", "Male", "9800000000", "Dr A", None, sample_date,
+            json.dumps(results), None, "not_attempted", None, "not_attempted", None)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PathologyStore(str(tmp_path / "delta.db"))
+    yield store
+    store.close()
+
+
+def delta_flags(store, report_id):
+    return dict(store.conn.execute(
+        "SELECT test_name, delta_flag FROM lab_results WHERE report_id = ?", (report_id,)
+    ).fetchall())
+
+
+def test_stored_report_is_flagged_against_the_previous_report(store):
+    store.insert_completed_reports([report_row("Ravi Sharma", {"Urea": "20"}, "2025-11-03")])
+    report_id, = store.insert_completed_reports([report_row("Ravi Sharma", {"Urea": "45"}, "2025-11-04")])
+    assert delta_flags(store, report_id)["Urea"].startswith("+125% vs 20")
+
+
+def test_amendment_is_not_compared_with_the_value_it_corrects(store):
+    report_id, = store.insert_completed_reports([report_row("Ravi Sharma", {"Urea": "20"}, "2025-11-04")])
+    amended = store.amend_report(
+        report_id, report_row("Ravi Sharma", {"Urea": "60"}, "2025-11-04"), {"Urea": ("20", "60")}, "typo"
+    )
+    assert delta_flags(store, amended['report_id']) == {"Urea": None}
@@ -0,0 +1,105 @@
+"""Calculated tests from the formula engine (derived_tests.py)."""
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from derived_tests import DEFAULT_FORMULAS, Formula, FormulaEngine  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    return FormulaEngine(DEFAULT_FORMULAS)
+
+
+def test_red_cell_indices(engine):
+    results, calculated = engine.apply({"Haemoglobin": "14", "Haematocrit/PCV": "42", "RBC Count": "4.5"})
+    assert results["MCV"] == "93.3"
+    assert results["MCH"] == "31.1"
+    assert results["MCHC"] == "33.3"
+    assert sorted(calculated) == ["MCH", "MCHC", "MCV"]
+
+
+def test_ldl_friedewald(engine):
+    results, _ = engine.apply({"Cholesterol": "200", "HDL": "50", "Triglyceride": "150"})
+    assert results["LDL"] == "120"
+    results, _ = engine.apply({"Cholesterol": "200", "HDL": "50", "Triglyceride": "399"})
+    assert results["LDL"] == "70"
+
+
+def test_ldl_not_calculated_from_triglycerides_of_400_or_more(engine):
+    results, calculated = engine.apply({"Cholesterol": "200", "HDL": "50", "Triglyceride": "400"})
+    assert "LDL" not in results
+    assert "LDL" not in calculated
+
+
+def test_globulin_and_ag_ratio(engine):
+    results, calculated = engine.apply({"Total Protein": "7.0 g/dl", "Albumin": "4.0"})
+    assert results["Globulin"] == "3.00"
+    # A/G Ratio runs after the Globulin it depends on
+    assert results["A/G Ratio"] == "1.33"
+    assert calculated == ["Globulin", "A/G Ratio"]
+
+
+def test_bun(engine):
+    assert engine.apply({"Urea": "30"})[0]["BUN"] == "14.0"
+
+
+def test_missing_input_leaves_the_test_out(engine):
+    results, calculated = engine.apply({"Albumin": "4.0"})
+    assert results == {"Albumin": "4.0"}
+    assert calculated == []
+
+
+def test_staff_entered_values_are_kept(engine):
+    results, calculated = engine.apply({"Total Protein": "7.0", "Albumin": "4.0", "Globulin": "2.5"})
+    assert results["Globulin"] == "2.5"
+    assert results["A/G Ratio"] == "1.60"
+    assert calculated == ["A/G Ratio"]
+
+
+def test_staff_entered_zero_is_kept(engine):
+    results, calculated = engine.apply({"Total Protein": "7.0", "Albumin": "4.0", "Globulin": 0})
+    assert results["Globulin"] == 0
+    assert "Globulin" not in calculated
+    # 4.0 / 0 cannot be calculated, so the ratio is left out rather than failing
+    assert "A/G Ratio" not in results
+
+
+def test_blank_value_is_calculated(engine):
+    results, calculated = engine.apply({"Total Protein": "7.0", "Albumin": "4.0", "Globulin": " "})
+    assert results["Globulin"] == "3.00"
+    assert "Globulin" in calculated
+
+
+def test_only_limits_the_tests_calculated(engine):
+    results, calculated = engine.apply({"Urea": "30", "Total Protein": "7.0", "Albumin": "4.0"}, only={"BUN"})
+    assert calculated == ["BUN"]
+    assert "Globulin" not in results
+
+
+@pytest.mark.parametrize("formula", [
+    "__import__('os').system('true')",
+    "{Urea}.real",
+    "{Urea}[0]",
+    "[{Urea}]",
+    "{Urea} if {Albumin} else 1",
+    "(lambda: 1)()",
+    "open('x')",
+    "Urea / 2",
+])
+def test_formulas_outside_the_whitelist_are_rejected(formula):
+    with pytest.raises(ValueError):
+        Formula("Bad", formula)
+
+
+def test_whitelisted_functions_are_allowed():
+    assert Formula("Capped", "min({Urea}, 100)").evaluate({"Urea": 150.0}) == "100.00"
+
+
+def test_dependency_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        FormulaEngine({"A": {"formula": "{B} + 1"}, "B": {"formula": "{A} + 1"}})
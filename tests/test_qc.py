@@ -0,0 +1,117 @@
+"""Westgard rules and the QC release hold (qc.py)."""
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import qc  # noqa: E402
+from datastore import PathologyStore  # noqa: E402
+
+
+def target_state(mean=100.0, sd=10.0):
+    return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'target_mean': mean, 'target_sd': sd,
+            'streak_mean': 0, 'streak_1s': 0, 'streak_2s': 0, 'status': 'baseline'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PathologyStore(str(tmp_path / "qc.db"))
+    yield store
+    store.close()
+
+
+def test_baseline_period_only_builds_statistics(store, monkeypatch):
+    monkeypatch.setattr(qc, "QC_MIN_RUNS", 3)
+    for value in (98.0, 100.0, 102.0):
+        run = store.record_qc_run("Urea", {"L1": value}, "asha")
+        assert run['status'] == "baseline"
+        assert run['levels']["L1"]['z'] is None
+        assert run['violations'] == []
+
+    # Three accepted values: mean 100, SD 2
+    run = store.record_qc_run("Urea", {"L1": 107.0}, "asha")
+    assert run['levels']["L1"]['z'] == 3.5
+    assert run['status'] == "rejected"
+    assert run['violations'] == ["1-3s"]
+
+
+def test_1_3s_rejects_and_1_2s_warns():
+    state = target_state()
+    assert qc.evaluate(state, 131.0) == (3.1, ["1-3s"])
+    z, violations = qc.evaluate(target_state(), 125.0)
+    assert violations == ["1-2s"]
+    assert qc.status_for(violations, z) == "warning"
+
+
+def test_2_2s_within_one_level():
+    state = target_state()
+    assert qc.evaluate(state, 121.0)[1] == ["1-2s"]
+    z, violations = qc.evaluate(state, 122.0)
+    assert "2-2s" in violations
+    assert qc.status_for(violations, z) == "rejected"
+
+
+def test_2_2s_needs_the_same_side():
+    state = target_state()
+    qc.evaluate(state, 121.0)
+    assert "2-2s" not in qc.evaluate(state, 79.0)[1]
+
+
+def test_2_2s_across_levels():
+    assert qc.run_violations({"L1": 2.4, "L2": 2.1}) == ["2-2s"]
+    assert qc.run_violations({"L1": 2.4, "L2": 1.9}) == []
+
+
+def test_r_4s_across_levels():
+    assert qc.run_violations({"L1": 2.5, "L2": -2.1}) == ["R-4s"]
+    # One level only: nothing to compare
+    assert qc.run_violations({"L1": 3.5, "L2": None}) == []
+
+
+def test_4_1s():
+    state = target_state()
+    for _ in range(3):
+        assert "4-1s" not in qc.evaluate(state, 115.0)[1]
+    assert qc.evaluate(state, 115.0)[1] == ["4-1s"]
+
+
+def test_10x():
+    state = target_state()
+    for _ in range(9):
+        assert "10x" not in qc.evaluate(state, 105.0)[1]
+    assert qc.evaluate(state, 105.0)[1] == ["10x"]
+
+
+def test_across_level_violation_rejects_the_run(store):
+    for level in ("L1", "L2"):
+        store.set_qc_target("Urea", level, 100.0, 10.0)
+    run = store.record_qc_run("Urea", {"L1": 124.0, "L2": 79.0}, "asha")
+    assert run['status'] == "rejected"
+    assert run['violations'] == ["1-2s", "R-4s"]
+
+
+def test_rejected_value_does_not_update_statistics(store):
+    store.set_qc_target("Urea", "L1", 100.0, 10.0)
+    store.record_qc_run("Urea", {"L1": 101.0}, "asha")
+    store.record_qc_run("Urea", {"L1": 140.0}, "asha")
+
+    with store.transaction() as cur:
+        state = qc.load_state(cur, "Urea", "L1")
+    assert state['status'] == "rejected"
+    assert state['n'] == 1
+    assert state['mean'] == 101.0
+
+
+def test_passing_run_clears_the_release_hold(store):
+    store.set_qc_target("Urea", "L1", 100.0, 10.0)
+    store.set_qc_target("Creatinine", "L1", 1.0, 0.1)
+    store.record_qc_run("Urea", {"L1": 140.0}, "asha")
+    store.record_qc_run("Creatinine", {"L1": 1.0}, "asha")
+    assert store.qc_blocked() == ["Urea"]
+    assert store.qc_blocked(["Creatinine"]) == []
+
+    assert store.record_qc_run("Urea", {"L1": 100.0}, "asha")['status'] == "accepted"
+    assert store.qc_blocked() == []